@@ -1,32 +1,117 @@
 import os
+import hmac
 import jwt
+import time
+import logging
 from fastapi import HTTPException, Header, Request, Depends
 from pydantic import BaseModel
 from typing import Optional
-from dotenv import load_dotenv
-from clerk_backend_api import Clerk
-from supabase import create_client, Client
+from supabase import Client
+from starlette.concurrency import run_in_threadpool
+from app.clients import clients
+from app.services.cache import LRUCache
+from app.services.single_flight import SingleFlight
+from app import metrics
+from app.metrics import CLERK, SUPABASE_AUTH, timed
+from app.resilience import Hedge, hedged, clerk_breaker, supabase_auth_breaker, upstream_unavailable
 
-# Load environment variables
-load_dotenv()
-
-# Initialize Clerk SDK
-clerk = Clerk(bearer_auth=os.getenv("CLERK_SECRET_KEY"))
-
-# Initialize Supabase client with service role key for admin operations
-supabase_url = os.getenv("SUPABASE_URL")
-supabase_service_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-supabase: Client = create_client(supabase_url, supabase_service_key)
+logger = logging.getLogger(__name__)
 
 class AuthenticatedUser(BaseModel):
     supabase_user_id: str
     clerk_user_id: str
     email: str
     user_metadata: dict
+    # Only the service role can write app_metadata; users can edit user_metadata
+    app_metadata: dict = {}
+
+# Requests authenticating at the same moment (a page load fires several)
+# share the Clerk and Supabase admin calls instead of repeating them
+session_lookups = SingleFlight("clerk_session")
+user_lookups = SingleFlight("supabase_users")
+
+# While Clerk or the Supabase auth admin API is unhealthy, sessions Clerk
+# confirmed and the user list Supabase returned within the grace period are
+# used instead of failing every request
+SESSION_GRACE_SECONDS = float(os.getenv("CLERK_SESSION_GRACE_S", "300"))
+USERS_GRACE_SECONDS = float(os.getenv("SUPABASE_USERS_GRACE_S", "300"))
+_verified_sessions = LRUCache(max_entries=10000, ttl_seconds=SESSION_GRACE_SECONDS)
+_last_users = {"users": None, "fetched_at": 0.0}
+
+session_hedge = Hedge("clerk_sessions_get")
+users_hedge = Hedge("supabase_list_users")
+
+stale_auth = metrics.Counter(
+    "stale_auth_used_total", "Requests authenticated from data kept for an unhealthy upstream", ("kind",)
+)
+
+class AuthUnavailable(HTTPException):
+    """Clerk or Supabase auth is down and nothing recent enough to fall back on"""
+
+    def __init__(self, service: str):
+        super().__init__(
+            status_code=503,
+            detail=f"Authentication is temporarily unavailable ({service}), please retry shortly",
+            headers={"Retry-After": "5"}
+        )
 
 def get_supabase_client() -> Client:
     """Dependency to get Supabase client"""
-    return supabase
+    return clients.supabase()
+
+async def _get_session(session_id: str):
+    return await session_lookups.do(session_id, lambda: clerk_breaker.call(lambda: hedged(
+        session_hedge, lambda: run_in_threadpool(
+            lambda: timed(CLERK, "sessions.get", clients.clerk().sessions.get, session_id=session_id)
+        )
+    )))
+
+async def _session_user_id(session_id: str) -> Optional[str]:
+    """
+    Clerk user id for an active session. When Clerk is unavailable, falls
+    back to a session it confirmed within the grace period; raises
+    AuthUnavailable if there is none.
+    """
+    try:
+        session_response = await _get_session(session_id)
+    except Exception as e:
+        if not upstream_unavailable(e):
+            raise
+        clerk_user_id = _verified_sessions.get(session_id)
+        if clerk_user_id is None:
+            raise AuthUnavailable(CLERK)
+        stale_auth.inc("session")
+        logger.warning("Clerk unavailable (%s), accepting recently verified session %s", e, session_id)
+        return clerk_user_id
+    if session_response and session_response.user_id:
+        _verified_sessions.set(session_id, session_response.user_id)
+        return session_response.user_id
+    return None
+
+async def _verify_token(token: str):
+    return await clerk_breaker.call(lambda: run_in_threadpool(
+        lambda: timed(CLERK, "verify_token", clients.clerk().jwt_templates.verify_token, token)
+    ))
+
+async def _list_users():
+    # The full user list is the same for every caller, so all share one call
+    try:
+        users = await user_lookups.do("list_users", lambda: supabase_auth_breaker.call(lambda: hedged(
+            users_hedge, lambda: run_in_threadpool(
+                lambda: timed(SUPABASE_AUTH, "list_users", clients.supabase().auth.admin.list_users)
+            )
+        )))
+    except Exception as e:
+        if not upstream_unavailable(e):
+            raise
+        if _last_users["users"] is None or time.monotonic() - _last_users["fetched_at"] > USERS_GRACE_SECONDS:
+            raise AuthUnavailable(SUPABASE_AUTH)
+        stale_auth.inc("users")
+        logger.warning("Supabase auth unavailable (%s), using the user list from %.0fs ago",
+                       e, time.monotonic() - _last_users["fetched_at"])
+        return _last_users["users"]
+    _last_users["users"], _last_users["fetched_at"] = users, time.monotonic()
+    return users
 
 async def get_current_user(authorization: str = Header(None)) -> AuthenticatedUser:
     """
@@ -41,17 +126,21 @@ async def get_current_user(authorization: str = Header(None)) -> AuthenticatedUs
         # Verify the token with Clerk SDK
         try:
             # Use Clerk's JWT verification which handles all token types
-            jwt_payload = clerk.jwt_templates.verify_token(token)
+            jwt_payload = await _verify_token(token)
             clerk_user_id = jwt_payload.get("sub")
             
             if not clerk_user_id:
                 raise HTTPException(status_code=401, detail="Invalid token: no user ID found")
                 
+        except HTTPException:
+            raise
         except Exception as e:
+            if upstream_unavailable(e):
+                raise AuthUnavailable(CLERK)
             raise HTTPException(status_code=401, detail=f"Token verification failed: {str(e)}")
         
         # Find user in Supabase Auth by clerk_user_id
-        users_response = supabase.auth.admin.list_users()
+        users_response = await _list_users()
         
         for user in users_response:
             if user.user_metadata and user.user_metadata.get("clerk_user_id") == clerk_user_id:
@@ -59,7 +148,8 @@ async def get_current_user(authorization: str = Header(None)) -> AuthenticatedUs
                     supabase_user_id=user.id,
                     clerk_user_id=clerk_user_id,
                     email=user.email,
-                    user_metadata=user.user_metadata
+                    user_metadata=user.user_metadata,
+                    app_metadata=getattr(user, "app_metadata", None) or {}
                 )
         
         raise HTTPException(status_code=404, detail="User not found in Supabase")
@@ -74,91 +164,85 @@ async def get_current_user_from_cookies(request: Request) -> AuthenticatedUser:
     Extract and verify user from Clerk session cookies using sessions.get
     """
     try:
-        print(f"🔍 AUTH DEBUG: Available cookies: {list(request.cookies.keys())}")
-        
         # Try multiple session cookies in order of preference
         session_cookies = ["__session", "__session_r9XL5wDY", "__session_SriKaHsP", "__clerk_session"]
         clerk_user_id = None
         last_error = None
+        unavailable = None
         
         for cookie_name in session_cookies:
             session_token = request.cookies.get(cookie_name)
             if not session_token:
                 continue
                 
-            print(f"🔍 AUTH DEBUG: Trying {cookie_name} cookie")
-            
             try:
                 # Extract session ID from JWT token
-                print(f"🔍 AUTH DEBUG: Attempting to decode JWT token (length: {len(session_token)})")
                 decoded_token = jwt.decode(session_token, options={"verify_signature": False})
                 session_id = decoded_token.get("sid")
-                print(f"🔍 AUTH DEBUG: Extracted session_id: {session_id}")
                 
                 if not session_id:
-                    print(f"❌ AUTH DEBUG: No session ID found in {cookie_name}")
+                    logger.debug("No session ID in %s cookie", cookie_name)
                     continue
                 
                 # Use Clerk sessions.get to retrieve session details
-                print(f"🔍 AUTH DEBUG: Calling clerk.sessions.get with session_id: {session_id}")
-                session_response = clerk.sessions.get(session_id=session_id)
-                print(f"🔍 AUTH DEBUG: Session response received: {bool(session_response)}")
+                clerk_user_id = await _session_user_id(session_id)
                 
-                if session_response and session_response.user_id:
-                    clerk_user_id = session_response.user_id
-                    print(f"✅ AUTH DEBUG: Successfully got clerk_user_id: {clerk_user_id} from {cookie_name}")
+                if clerk_user_id:
+                    logger.debug("Session %s from %s cookie belongs to %s", session_id, cookie_name, clerk_user_id)
                     break
                 else:
-                    print(f"❌ AUTH DEBUG: Invalid session response from {cookie_name}")
+                    logger.debug("Invalid session response for %s cookie", cookie_name)
                     
+            except AuthUnavailable as e:
+                unavailable = e
+                continue
             except Exception as e:
-                print(f"❌ AUTH DEBUG: Session verification failed for {cookie_name}: {str(e)}")
+                logger.info("Session verification failed for %s cookie: %s", cookie_name, str(e))
                 last_error = str(e)
                 continue
         
+        if not clerk_user_id and unavailable is not None:
+            # Clerk couldn't say either way; don't tell the client its session expired
+            raise unavailable
+        
         if not clerk_user_id:
-            print("🔄 AUTH DEBUG: All sessions expired, falling back to JWT verification")
+            logger.info("No active session in cookies, falling back to JWT verification")
             # Fallback to JWT verification for expired sessions
             try:
                 session_token = request.cookies.get("__session")
                 if session_token:
-                    jwt_payload = clerk.jwt_templates.verify_token(session_token)
+                    jwt_payload = await _verify_token(session_token)
                     clerk_user_id = jwt_payload.get("sub")
-                    print(f"✅ AUTH DEBUG: JWT fallback successful, user_id: {clerk_user_id}")
+                    logger.debug("JWT fallback verified %s", clerk_user_id)
                 else:
                     raise Exception("No session token for JWT fallback")
             except Exception as jwt_error:
-                print(f"❌ AUTH DEBUG: JWT fallback also failed: {str(jwt_error)}")
+                if upstream_unavailable(jwt_error):
+                    raise AuthUnavailable(CLERK)
+                logger.info("JWT fallback failed: %s", str(jwt_error))
                 error_msg = f"All authentication methods failed. Sessions expired. Please log in again."
                 raise HTTPException(status_code=401, detail=error_msg)
         
         # Find corresponding Supabase user
-        users_response = supabase.auth.admin.list_users()
-        print(f"🔍 AUTH DEBUG: Looking for Clerk user ID {clerk_user_id} in Supabase users")
-        print(f"🔍 AUTH DEBUG: Found {len(users_response)} users in Supabase")
+        users_response = await _list_users()
         
-        # Log all users for debugging
-        for i, user in enumerate(users_response):
-            print(f"🔍 AUTH DEBUG: Supabase User #{i+1}:")
-            print(f"🔍 AUTH DEBUG:   - ID: {user.id}")
-            print(f"🔍 AUTH DEBUG:   - Email: {user.email}")
-            print(f"🔍 AUTH DEBUG:   - Metadata: {user.user_metadata}")
-            
+        for user in users_response:
             if user.user_metadata:
                 stored_clerk_id = user.user_metadata.get("clerk_user_id")
-                print(f"🔍 AUTH DEBUG:   - Stored Clerk ID: {stored_clerk_id}")
-                print(f"🔍 AUTH DEBUG:   - Matches current Clerk ID: {stored_clerk_id == clerk_user_id}")
                 
                 if stored_clerk_id == clerk_user_id:
-                    print(f"✅ AUTH DEBUG: Found matching user! Supabase ID: {user.id}, Clerk ID: {clerk_user_id}")
+                    logger.debug("Clerk user %s is Supabase user %s", clerk_user_id, user.id)
                     return AuthenticatedUser(
                         supabase_user_id=user.id,
                         clerk_user_id=clerk_user_id,
                         email=user.email,
-                        user_metadata=user.user_metadata
+                        user_metadata=user.user_metadata,
+                        app_metadata=getattr(user, "app_metadata", None) or {}
                     )
         
-        print(f"❌ AUTH DEBUG: No matching user found in Supabase for Clerk ID: {clerk_user_id}")
+        logger.warning(
+            "No Supabase user for Clerk user %s among %d users", clerk_user_id, len(users_response)
+        )
         raise HTTPException(
             status_code=404, 
             detail="User not found in Supabase. Please contact support."
@@ -171,3 +255,14 @@ async def get_current_user_from_cookies(request: Request) -> AuthenticatedUser:
             status_code=500, 
             detail=f"Authentication error: {str(e)}"
         )
+
+def require_admin(authorization: str = Header(None)):
+    """
+    Guard for operator endpoints: "Authorization: Bearer <ADMIN_TOKEN>".
+    They are off entirely while ADMIN_TOKEN is unset.
+    """
+    admin_token = os.getenv("ADMIN_TOKEN")
+    if not admin_token:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled")
+    if not hmac.compare_digest(authorization or "", f"Bearer {admin_token}"):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
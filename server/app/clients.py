@@ -0,0 +1,122 @@
+import os
+import time
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+import httpx
+from supabase import Client
+
+from app.metrics import InstrumentedSupabase
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+def _http_client(name: str, http2: bool) -> httpx.Client:
+    """
+    Keep-alive pool for one upstream. Every SDK client talking to that
+    upstream shares it, so a worker holds one set of warm connections per
+    host instead of one per SDK object.
+    """
+    max_connections = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "40"))
+    return httpx.Client(
+        http2=http2 and HTTP2_AVAILABLE,
+        timeout=httpx.Timeout(float(os.getenv("UPSTREAM_TIMEOUT_S", "30")), connect=5.0),
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=int(os.getenv("UPSTREAM_MAX_KEEPALIVE", str(max_connections))),
+            keepalive_expiry=float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY_S", "90")),
+        ),
+        headers={"user-agent": f"server/{name}"},
+    )
+
+
+class ClientRegistry:
+    """
+    The worker's Clerk and Supabase clients. Each is built on first use (so
+    importing the app stays cheap and a worker that never authenticates
+    never builds them), shared by every caller, and closed by close() when
+    the app shuts down.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients: Dict[str, Any] = {}
+        self._pools: Dict[str, httpx.Client] = {}
+        self.build_ms: Dict[str, float] = {}
+
+    def _get(self, name: str, build):
+        client = self._clients.get(name)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(name)
+                if client is None:
+                    started = time.perf_counter()
+                    client = self._clients[name] = build()
+                    self.build_ms[name] = round((time.perf_counter() - started) * 1000, 1)
+                    logger.info("Built %s client in %s ms", name, self.build_ms[name])
+        return client
+
+    def _pool(self, name: str, http2: bool) -> httpx.Client:
+        if name not in self._pools:
+            self._pools[name] = _http_client(name, http2)
+        return self._pools[name]
+
+    def supabase(self) -> Client:
+        """Service-role Supabase client; table queries are timed for /metrics"""
+        def build():
+            from supabase import create_client
+            from supabase.lib.client_options import SyncClientOptions
+            return InstrumentedSupabase(create_client(
+                os.getenv("SUPABASE_URL"),
+                os.getenv("SUPABASE_SERVICE_ROLE_KEY"),
+                options=SyncClientOptions(
+                    httpx_client=self._pool("supabase", http2=True),
+                    # A service-role key has no session to refresh or keep
+                    auto_refresh_token=False,
+                    persist_session=False,
+                ),
+            ))
+        return self._get("supabase", build)
+
+    def clerk(self):
+        """Clerk backend SDK"""
+        def build():
+            from clerk_backend_api import Clerk
+            return Clerk(
+                bearer_auth=os.getenv("CLERK_SECRET_KEY"),
+                client=self._pool("clerk", http2=False),
+                timeout_ms=int(os.getenv("CLERK_TIMEOUT_MS", "10000")),
+            )
+        return self._get("clerk", build)
+
+    def override(self, **clients):
+        """
+        Use the given objects instead of building clients, e.g.
+        override(supabase=fake, clerk=fake) in benchmarks.
+        """
+        with self._lock:
+            self._clients.update(clients)
+
+    def close(self):
+        with self._lock:
+            pools, self._pools = self._pools, {}
+            self._clients.clear()
+        for pool in pools.values():
+            pool.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "built": sorted(self._clients),
+            "build_ms": dict(self.build_ms),
+            "pools": sorted(self._pools),
+        }
+
+
+clients = ClientRegistry()
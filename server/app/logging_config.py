@@ -0,0 +1,169 @@
+import os
+import sys
+import copy
+import json
+import queue
+import atexit
+import random
+import logging
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, TextIO
+
+from app import metrics
+
+log_records_dropped = metrics.Counter(
+    "log_records_dropped_total", "Log records dropped because the log queue was full"
+)
+
+# Attributes every LogRecord has; anything else came in through extra={...}
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+# Arguments that can't change between the logging call and the listener thread formatting the message
+_IMMUTABLE = (str, int, float, bool, type(None), bytes)
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: ts, level, logger, message, any extra={...}
+    fields, and exc when there is a traceback.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        extra = {key: value for key, value in record.__dict__.items() if key not in _RECORD_FIELDS}
+        return f"{line} {json.dumps(extra, default=str)}" if extra else line
+
+
+class DebugSampler(logging.Filter):
+    """
+    Lets through only a fraction of DEBUG records, so debug logging can stay
+    on for a hot module without writing a line per request.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or self.rate >= 1 or random.random() < self.rate
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """
+    Hands records to the listener thread without formatting them: the message
+    is built there, unless an argument is mutable and could change by then.
+    Never blocks; when the queue is full the record is dropped and counted.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        if record.args and not all(isinstance(arg, _IMMUTABLE) for arg in (
+            record.args.values() if isinstance(record.args, dict) else record.args
+        )):
+            record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            # Tracebacks hold frames; render them now and let the frames go
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_records_dropped.inc()
+
+
+def _parse_levels(spec: str) -> Dict[str, str]:
+    levels = {}
+    for item in spec.split(","):
+        if "=" in item:
+            name, level = item.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+_listener: Optional[QueueListener] = None
+
+
+def configure_logging(
+    level: Optional[str] = None,
+    levels: Optional[str] = None,
+    fmt: Optional[str] = None,
+    debug_sample_rate: Optional[float] = None,
+    stream: Optional[TextIO] = None,
+    use_queue: bool = True,
+):
+    """
+    Route every logger through one handler on the root logger. Settings come
+    from the arguments or the environment:
+
+    - LOG_LEVEL: root level (INFO)
+    - LOG_LEVELS: per-logger levels, e.g. "app.auth=DEBUG,app.routers.flows=WARNING"
+    - LOG_FORMAT: json (default) or text
+    - LOG_DEBUG_SAMPLE_RATE: fraction of DEBUG records kept (1.0)
+    - LOG_QUEUE_SIZE: records buffered for the writer thread (10000)
+
+    Records are written by a QueueListener thread, so a request never waits
+    on stdout. Calling this again replaces the previous setup.
+    """
+    global _listener
+    shutdown_logging()
+
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    levels = _parse_levels(levels if levels is not None else os.getenv("LOG_LEVELS", ""))
+    fmt = (fmt or os.getenv("LOG_FORMAT", "json")).lower()
+    if debug_sample_rate is None:
+        debug_sample_rate = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0"))
+
+    writer = logging.StreamHandler(stream or sys.stdout)
+    writer.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+    if use_queue:
+        handler: logging.Handler = _NonBlockingQueueHandler(queue.Queue(int(os.getenv("LOG_QUEUE_SIZE", "10000"))))
+        _listener = QueueListener(handler.queue, writer)
+        _listener.start()
+    else:
+        handler = writer
+    handler.addFilter(DebugSampler(debug_sample_rate))
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+    for name, logger_level in levels.items():
+        logging.getLogger(name).setLevel(logger_level)
+
+
+def shutdown_logging():
+    """Flush what is queued and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
@@ -1,13 +1,66 @@
-from fastapi import FastAPI
+import os
+import hmac
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+from app.logging_config import configure_logging
+
+load_dotenv()
+
+# Before the routers are imported, so anything they log at import time is formatted too
+configure_logging()
+
+from fastapi import FastAPI, Depends, Header, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
 from app.routers.users import router as users_router
 from app.routers.chat import router as chat_router
 from app.routers.flows import router as flow_router
 from app.routers.docs import router as docs_router
 from app.routers.links import router as links_router
+from app.routers.folders import router as folders_router
+from app.routers.images import router as images_router
 from app.routers.projects import router as projects_router
+from app.routers.admin import router as admin_router
+from app.auth import get_current_user_from_cookies, AuthenticatedUser
+from app.services.row_cache import row_cache_stats
+from app.services.invalidation_bus import invalidation_bus
+from app.services.single_flight import single_flight_stats
+from app import metrics
+from app.profiling import SlowRequestMiddleware
+from app.rate_limit import RateLimitMiddleware, limit_user
+from app.clients import clients
+from app.services.claude_service import close_claude_service
+from app.services.storage_backend import close_storage_backend
+from app.services.image_service import close_image_processor
+from app.services.clerk_webhook_service import clerk_webhooks
+from app.services.blob_store import blob_collector
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Startup only starts the invalidation bus, the Clerk webhook worker and
+    the blob collector; the Clerk, Supabase, Claude and Postgres clients
+    and the image workers are started on first use. Shutdown closes whichever were.
+    """
+    await invalidation_bus.start()
+    await clerk_webhooks.start()
+    await blob_collector.start()
+    try:
+        yield
+    finally:
+        await blob_collector.stop()
+        await clerk_webhooks.stop()
+        await invalidation_bus.stop()
+        await close_claude_service()
+        await close_storage_backend()
+        close_image_processor()
+        await run_in_threadpool(clients.close)
+
+app = FastAPI(lifespan=lifespan)
 
-app = FastAPI()
+# Inside CORS, so a 429 carries CORS headers and the browser can read Retry-After
+app.add_middleware(RateLimitMiddleware)
 
 # Add CORS middleware
 app.add_middleware(
@@ -16,16 +69,55 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allows all methods
     allow_headers=["*"],  # Allows all headers
+    expose_headers=["Retry-After"],
 )
 
-# Include routes
+app.add_middleware(SlowRequestMiddleware)
+
+# Outermost, so the timings include CORS and everything under it
+if metrics.metrics_enabled():
+    app.add_middleware(metrics.MetricsMiddleware)
+
+# Include routes; signed-in routes also draw from the verified user's rate limit buckets
 app.include_router(users_router)
-app.include_router(chat_router, prefix="/api/chat", tags=["chat"])
-app.include_router(flow_router, prefix="/api/flows", tags=["flows"])
-app.include_router(docs_router, prefix="/api/docs", tags=["docs"])
-app.include_router(links_router, prefix="/api/links", tags=["links"])
-app.include_router(projects_router, prefix="/api/projects", tags=["projects"])
+app.include_router(chat_router, prefix="/api/chat", tags=["chat"], dependencies=[Depends(limit_user)])
+app.include_router(flow_router, prefix="/api/flows", tags=["flows"], dependencies=[Depends(limit_user)])
+app.include_router(docs_router, prefix="/api/docs", tags=["docs"], dependencies=[Depends(limit_user)])
+app.include_router(links_router, prefix="/api/links", tags=["links"], dependencies=[Depends(limit_user)])
+app.include_router(folders_router, prefix="/api/folders", tags=["folders"], dependencies=[Depends(limit_user)])
+app.include_router(images_router, prefix="/api/images", tags=["images"], dependencies=[Depends(limit_user)])
+app.include_router(projects_router, prefix="/api/projects", tags=["projects"], dependencies=[Depends(limit_user)])
+app.include_router(admin_router, prefix="/api/admin", tags=["admin"])
 
 @app.get("/")
 def read_root():
-    return {"message": "Welcome to FastAPI!"}
\ No newline at end of file
+    return {"message": "Welcome to FastAPI!"}
+
+@app.get("/api/cache/stats", dependencies=[Depends(limit_user)])
+def cache_stats(current_user: AuthenticatedUser = Depends(get_current_user_from_cookies)):
+    """
+    Hit/miss stats for the document, link and project row caches on this
+    worker, what the invalidation bus has sent and received, and how many
+    reads were shared through single-flight, and which upstream clients
+    have been built
+    """
+    return {
+        "message": "Cache stats retrieved successfully",
+        "row_cache": row_cache_stats(),
+        "invalidation_bus": invalidation_bus.stats(),
+        "single_flight": single_flight_stats(),
+        "clients": clients.stats()
+    }
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics_scrape(authorization: str = Header(None)):
+    """
+    Prometheus scrape endpoint: per-route latency and in-flight requests, and
+    latency and outcome of every Clerk, Supabase and Postgres call, for this
+    worker. Set METRICS_TOKEN to require "Authorization: Bearer <token>".
+    """
+    token = os.getenv("METRICS_TOKEN")
+    if token and not hmac.compare_digest(authorization or "", f"Bearer {token}"):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
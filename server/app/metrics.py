@@ -0,0 +1,296 @@
+import os
+import time
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Upstream services
+CLERK = "clerk"
+SUPABASE_AUTH = "supabase_auth"
+SUPABASE_TABLE = "supabase_table"
+POSTGRES = "postgres"
+
+_registry: List["_Metric"] = []
+
+# Seconds the current request has spent waiting on upstream calls
+_upstream_seconds: ContextVar[Optional[List[float]]] = ContextVar("upstream_seconds", default=None)
+# Each upstream call of the current request, while something is tracing it
+_upstream_calls: ContextVar[Optional[list]] = ContextVar("upstream_calls", default=None)
+MAX_TRACED_CALLS = 200
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_labels(self.label_names, key)} {value}" for key, value in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def add(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def set(self, *labels: str, value: float):
+        with self._lock:
+            self._values[labels] = value
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_labels(self.label_names, key)} {value}" for key, value in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+        # Per label set: [count per bucket (+Inf last)], sum, count
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def _samples(self):
+        with self._lock:
+            items = [(key, list(series[0]), series[1], series[2]) for key, series in self._series.items()]
+        lines = []
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {count}")
+        return lines
+
+
+http_requests = Counter(
+    "http_requests_total", "HTTP requests by route and status code", ("method", "route", "status")
+)
+http_duration = Histogram(
+    "http_request_duration_seconds", "Time from request start to the end of the response body", ("method", "route")
+)
+http_upstream = Histogram(
+    "http_request_upstream_seconds", "Time a request spent waiting on Clerk, Supabase and Postgres", ("method", "route")
+)
+http_in_flight = Gauge("http_requests_in_flight", "Requests currently being handled", ("method",))
+upstream_requests = Counter(
+    "upstream_requests_total", "Calls to Clerk, Supabase and Postgres", ("service", "operation", "target", "outcome")
+)
+upstream_duration = Histogram(
+    "upstream_request_duration_seconds", "Latency of calls to Clerk, Supabase and Postgres",
+    ("service", "operation", "target")
+)
+
+
+class upstream:
+    """
+    Times an upstream call and charges it to the request being handled:
+
+        with upstream(POSTGRES, "select", "docs"):
+            ...
+    """
+
+    __slots__ = ("labels", "started")
+
+    def __init__(self, service: str, operation: str, target: str = ""):
+        self.labels = (service, operation, target)
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        upstream_duration.observe(elapsed, *self.labels)
+        upstream_requests.inc(*self.labels, "ok" if exc_type is None else "error")
+        spent = _upstream_seconds.get()
+        if spent is not None:
+            spent[0] += elapsed
+        calls = _upstream_calls.get()
+        if calls is not None and len(calls) < MAX_TRACED_CALLS:
+            calls.append((*self.labels, self.started, elapsed, exc_type is None))
+        return False
+
+
+def trace_upstream_calls(calls: list):
+    """
+    Append (service, operation, target, started, seconds, ok) to calls for
+    every upstream call made in the current context from now on. Returns a
+    token for stop_tracing_upstream_calls.
+    """
+    return _upstream_calls.set(calls)
+
+
+def stop_tracing_upstream_calls(token):
+    _upstream_calls.reset(token)
+
+
+def timed(service: str, operation: str, fn, *args, **kwargs):
+    """
+    Call fn under upstream(); handy for run_in_threadpool.
+    """
+    with upstream(service, operation):
+        return fn(*args, **kwargs)
+
+
+_QUERY_OPERATIONS = {"select", "insert", "upsert", "update", "delete"}
+
+
+class _TimedQuery:
+    """
+    Wraps a postgrest-py request builder so execute() is timed, labeled with
+    the table and the operation picked earlier in the chain.
+    """
+
+    __slots__ = ("_builder", "_table", "_operation")
+
+    def __init__(self, builder, table: str, operation: str = "select"):
+        self._builder = builder
+        self._table = table
+        self._operation = operation
+
+    def execute(self, *args, **kwargs):
+        with upstream(SUPABASE_TABLE, self._operation, self._table):
+            return self._builder.execute(*args, **kwargs)
+
+    def __getattr__(self, name):
+        attr = getattr(self._builder, name)
+        if not callable(attr):
+            return attr
+
+        def chained(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            operation = name if name in _QUERY_OPERATIONS else self._operation
+            return _TimedQuery(result, self._table, operation)
+        return chained
+
+
+class InstrumentedSupabase:
+    """
+    Supabase client whose table queries are timed. Everything else (auth,
+    storage) passes through to the wrapped client untouched.
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    def table(self, name: str) -> _TimedQuery:
+        return _TimedQuery(self._client.table(name), name)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+class MetricsMiddleware:
+    """
+    Records per-route latency and status, in-flight counts, and how much of
+    each request went to upstream calls. Routes are labeled by their path
+    template (/api/docs/get/{doc_id}), so label sets stay bounded. The router
+    leaves the matched route in the scope, so it is read once the request is
+    done rather than matched again up front; in-flight counts are therefore
+    per method only.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = "500"
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        spent = [0.0]
+        token = _upstream_seconds.set(spent)
+        http_in_flight.add(method)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            route = getattr(scope.get("route"), "path", "unmatched")
+            http_duration.observe(elapsed, method, route)
+            http_upstream.observe(spent[0], method, route)
+            http_requests.inc(method, route, status)
+            http_in_flight.add(method, amount=-1)
+            _upstream_seconds.reset(token)
+
+
+def metrics_enabled() -> bool:
+    return os.getenv("METRICS_ENABLED", "1").lower() not in ("0", "false", "no")
+
+
+def render() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,335 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+# Where a thread is parked rather than working: left out of profiles unless asked for
+_IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+}
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+_labels: Dict[Any, str] = {}
+
+
+def _frame_label(code) -> str:
+    label = _labels.get(code)
+    if label is None:
+        path = code.co_filename
+        for prefix in sorted((p for p in sys.path if p), key=len, reverse=True):
+            if path.startswith(prefix + os.sep):
+                path = path[len(prefix) + 1:]
+                break
+        label = _labels[code] = f"{code.co_name} ({path}:{code.co_firstlineno})"
+    return label
+
+
+def _is_idle(frame) -> bool:
+    code = frame.f_code
+    return (os.path.basename(code.co_filename), code.co_name) in _IDLE_FRAMES
+
+
+def fold(frames) -> str:
+    """
+    Frames outermost first, as one line of Brendan Gregg's collapsed stack
+    format (what flamegraph.pl, speedscope and inferno read).
+    """
+    return ";".join(_frame_label(frame.f_code) for frame in frames)
+
+
+def _thread_frames(frame) -> List[Any]:
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+def _await_chain(coro) -> List[Any]:
+    """
+    Frames of a suspended coroutine and everything it is awaiting, outermost
+    first. A suspended frame has no f_back, so Task.get_stack() only ever
+    sees the outermost one.
+    """
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None) or getattr(coro, "ag_frame", None)
+        if frame is None:
+            break
+        frames.append(frame)
+        coro = (
+            getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None) or getattr(coro, "ag_await", None)
+        )
+    return frames
+
+
+def render_folded(samples: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in samples.most_common())
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of every thread at a fixed interval from a background
+    thread, with sys._current_frames(), so the code being profiled runs
+    untouched. Stacks are rooted at the thread name.
+    """
+
+    def __init__(self, interval: float = 0.01, include_idle: bool = False):
+        self.interval = interval
+        self.include_idle = include_idle
+        self.samples: Counter = Counter()
+        self.sweeps = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.samples
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me or (not self.include_idle and _is_idle(frame)):
+                    continue
+                thread = names.get(ident, str(ident)).replace(";", ":")
+                self.samples[f"{thread};{fold(_thread_frames(frame))}"] += 1
+            self.sweeps += 1
+
+
+class _Request:
+    __slots__ = ("method", "path", "started", "task", "loop_thread", "calls", "samples", "loop_samples", "ignored")
+
+    def __init__(self, method: str, path: str, task: Optional[asyncio.Task]):
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.task = task
+        self.loop_thread = threading.get_ident()
+        self.calls: list = []
+        self.samples: Counter = Counter()
+        self.loop_samples: Counter = Counter()
+        self.ignored = False
+
+
+_current_request: ContextVar[Optional[_Request]] = ContextVar("slow_request", default=None)
+
+
+class SlowRequestCapture:
+    """
+    Keeps the last few requests slower than SLOW_REQUEST_MS (default 1000,
+    0 turns capture off), each with:
+
+    - samples: where the request's task was, folded, sampled every
+      SLOW_REQUEST_SAMPLE_MS once the request has run for half the threshold
+    - loop_samples: what the event loop thread was running at those moments,
+      which is some other request's code when the loop is being blocked
+    - upstream_calls: every Clerk, Supabase and Postgres call it made
+
+    Streaming responses (chat) are long by design and never captured.
+    """
+
+    def __init__(self):
+        self.threshold = _env_float("SLOW_REQUEST_MS", 1000.0) / 1000
+        self.interval = _env_float("SLOW_REQUEST_SAMPLE_MS", 10.0) / 1000
+        self.captured: Deque[Dict[str, Any]] = deque(maxlen=int(_env_float("SLOW_REQUEST_KEEP", 50)))
+        self.finished = 0
+        self._active: Dict[int, _Request] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._wake = threading.Event()
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold > 0
+
+    def begin(self, method: str, path: str) -> _Request:
+        request = _Request(method, path, asyncio.current_task())
+        with self._lock:
+            self._active[id(request)] = request
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._watch, name="slow-request-sampler", daemon=True)
+                self._thread.start()
+        return request
+
+    def end(self, request: _Request, route: str, status: str, streaming: bool):
+        elapsed = time.perf_counter() - request.started
+        with self._lock:
+            del self._active[id(request)]
+        if streaming or request.ignored or elapsed < self.threshold:
+            return
+        record = {
+            "method": request.method,
+            "path": request.path,
+            "route": route,
+            "status": int(status),
+            "duration_ms": round(elapsed * 1000, 1),
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+            "upstream_ms": round(sum(call[4] for call in request.calls) * 1000, 1),
+            "upstream_calls": [
+                {
+                    "service": service,
+                    "operation": operation,
+                    "target": target,
+                    "start_ms": round((started - request.started) * 1000, 1),
+                    "duration_ms": round(seconds * 1000, 1),
+                    "ok": ok,
+                }
+                for service, operation, target, started, seconds, ok in request.calls
+            ],
+            "samples": render_folded(request.samples),
+            "loop_samples": render_folded(request.loop_samples),
+        }
+        self.captured.append(record)
+        logger.warning(
+            "Slow request %s %s took %s ms (%s ms in %d upstream calls)",
+            request.method, request.path, record["duration_ms"], record["upstream_ms"], len(request.calls),
+            extra={"route": route, "duration_ms": record["duration_ms"], "upstream_ms": record["upstream_ms"]}
+        )
+
+    def _watch(self):
+        me = threading.get_ident()
+        while True:
+            # Parked in Event.wait, so profiles count this thread as idle
+            self._wake.wait(self.interval)
+            now = time.perf_counter()
+            # Sampled under the lock, so end() never sees a request's samples change
+            with self._lock:
+                due = [r for r in self._active.values() if now - r.started >= self.threshold / 2]
+                if not due:
+                    continue
+                frames = sys._current_frames()
+                for request in due:
+                    if request.task is not None:
+                        try:
+                            request.samples[fold(_await_chain(request.task.get_coro()))] += 1
+                        except Exception:
+                            # The coroutine chain changed under us; skip this tick
+                            pass
+                    loop_frame = frames.get(request.loop_thread)
+                    if loop_frame is not None and request.loop_thread != me:
+                        request.loop_samples[fold(_thread_frames(loop_frame))] += 1
+
+    def ignore_current(self):
+        """
+        Leave the request being handled out of the capture: it is slow on
+        purpose (a profile run).
+        """
+        request = _current_request.get()
+        if request is not None:
+            request.ignored = True
+
+    def recent(self, limit: int = 50) -> List[Dict[str, Any]]:
+        return list(self.captured)[-limit:][::-1]
+
+    def clear(self):
+        self.captured.clear()
+
+
+slow_requests = SlowRequestCapture()
+
+
+class SlowRequestMiddleware:
+    """
+    Feeds SlowRequestCapture: tracks each request's task and upstream calls
+    and hands the finished request over with its route and status.
+    """
+
+    def __init__(self, app, capture: SlowRequestCapture = slow_requests):
+        self.app = app
+        self.capture = capture
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if not self.capture.enabled:
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                self.capture.finished += 1
+            return
+
+        request = self.capture.begin(scope["method"], scope["path"])
+        status, streaming = "500", False
+
+        async def send_and_watch(message):
+            nonlocal status, streaming
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+                streaming = any(
+                    name.lower() == b"content-type" and value.startswith(b"text/event-stream")
+                    for name, value in message.get("headers", ())
+                )
+            await send(message)
+
+        token = metrics.trace_upstream_calls(request.calls)
+        current = _current_request.set(request)
+        try:
+            await self.app(scope, receive, send_and_watch)
+        finally:
+            _current_request.reset(current)
+            metrics.stop_tracing_upstream_calls(token)
+            self.capture.finished += 1
+            self.capture.end(request, getattr(scope.get("route"), "path", "unmatched"), status, streaming)
+
+
+_profile_lock = asyncio.Lock()
+
+
+async def profile(
+    seconds: float, requests: int = 0, interval: float = 0.01, include_idle: bool = False
+) -> Tuple[Counter, Dict[str, Any]]:
+    """
+    Sample every thread for up to seconds, or until requests more requests
+    have finished if that comes first. One profile runs at a time.
+    """
+    if _profile_lock.locked():
+        raise RuntimeError("A profile is already running")
+    slow_requests.ignore_current()
+    async with _profile_lock:
+        profiler = SamplingProfiler(interval, include_idle)
+        finished_before = slow_requests.finished
+        started = time.perf_counter()
+        profiler.start()
+        try:
+            deadline = started + seconds
+            while time.perf_counter() < deadline:
+                if requests and slow_requests.finished - finished_before >= requests:
+                    break
+                await asyncio.sleep(min(0.05, max(0.0, deadline - time.perf_counter())))
+        finally:
+            samples = profiler.stop()
+        return samples, {
+            "seconds": round(time.perf_counter() - started, 3),
+            "requests": slow_requests.finished - finished_before,
+            "sweeps": profiler.sweeps,
+            "interval_ms": interval * 1000,
+        }
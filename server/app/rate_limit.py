@@ -0,0 +1,436 @@
+import os
+import json
+import base64
+import math
+import time
+import logging
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from fastapi import Depends, HTTPException, Request
+
+from app import metrics
+from app.auth import get_current_user_from_cookies, AuthenticatedUser
+from app.services.cache import LRUCache
+
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:
+    redis_asyncio = None
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+KB = 1024
+MB = 1024 * KB
+
+WRITE_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+
+# The cookies app.auth reads a Clerk session from, in the same order
+SESSION_COOKIES = ("__session", "__session_r9XL5wDY", "__session_SriKaHsP", "__clerk_session")
+
+rate_limited = metrics.Counter(
+    "rate_limited_requests_total", "Requests rejected with 429, by the bucket that ran out", ("bucket",)
+)
+body_rejected = metrics.Counter(
+    "request_body_rejected_total", "Requests rejected with 413, by route rule", ("rule",)
+)
+rate_limit_errors = metrics.Counter(
+    "rate_limit_backend_errors_total", "Rate limit checks let through because the shared backend failed"
+)
+
+
+class Rule:
+    """
+    A route's own bucket: rate requests per second per user with up to
+    burst at once, and the largest request body it accepts.
+    """
+
+    __slots__ = ("name", "methods", "prefix", "rate", "burst", "max_body_bytes")
+
+    def __init__(self, name: str, methods: Sequence[str], prefix: str, rate: float, burst: int, max_body_bytes: int):
+        self.name = name
+        self.methods = tuple(methods)
+        self.prefix = prefix
+        self.rate = rate
+        self.burst = burst
+        self.max_body_bytes = max_body_bytes
+
+    def matches(self, method: str, path: str) -> bool:
+        return method in self.methods and path.startswith(self.prefix)
+
+
+# First match wins. Each client gets one bucket per rule, and every /api
+# request also draws from the client's overall bucket. Every client at one
+# address also shares a larger copy of those buckets, and the same buckets
+# are kept again per verified user once auth has run (limit_user).
+DEFAULT_RULES = (
+    Rule("flows.save", ["POST"], "/api/flows/save", rate=1, burst=5, max_body_bytes=8 * MB),
+    Rule("flows.ops", ["POST"], "/api/flows/ops", rate=5, burst=20, max_body_bytes=1 * MB),
+    Rule("docs.update", ["PUT"], "/api/docs/update/", rate=2, burst=10, max_body_bytes=2 * MB),
+    Rule("docs.bulk", WRITE_METHODS, "/api/docs/bulk/", rate=1, burst=10, max_body_bytes=8 * MB),
+    Rule("links.bulk", WRITE_METHODS, "/api/links/bulk/", rate=1, burst=10, max_body_bytes=8 * MB),
+    Rule("projects.bulk", WRITE_METHODS, "/api/projects/bulk/", rate=1, burst=10, max_body_bytes=8 * MB),
+    Rule("projects.import", ["POST"], "/api/projects/import", rate=0.1, burst=3, max_body_bytes=32 * MB),
+    Rule("images.upload", ["POST"], "/api/images/upload", rate=0.5, burst=20, max_body_bytes=25 * MB),
+    Rule("chat", ["POST"], "/api/chat/", rate=0.5, burst=5, max_body_bytes=256 * KB),
+    # A board loads every image's thumbnail at once; these only read cached rows and files
+    Rule("images.view", ["GET"], "/api/images/view/", rate=0, burst=0, max_body_bytes=16 * KB),
+    # Operator endpoints have their own token and are never limited
+    Rule("admin", WRITE_METHODS, "/api/admin/", rate=0, burst=0, max_body_bytes=1 * MB),
+    Rule("writes", WRITE_METHODS, "/api/", rate=5, burst=20, max_body_bytes=1 * MB),
+    Rule("signup", ["POST"], "/users/signup", rate=0.2, burst=5, max_body_bytes=16 * KB),
+)
+
+USER_RULE = "user"
+DEFAULT_USER_RATE = 20
+DEFAULT_USER_BURST = 100
+# An address's shared buckets hold this many clients' worth of tokens, so a
+# few users behind one NAT are not limited as one
+DEFAULT_ADDRESS_FACTOR = 4
+
+
+def _parse_overrides(spec: str) -> Dict[str, Tuple[float, int]]:
+    """RATE_LIMIT_RULES="flows.save=2/10,user=50/200": rate per second / burst"""
+    overrides = {}
+    for item in spec.split(","):
+        if "=" in item:
+            name, limit = item.split("=", 1)
+            rate, _, burst = limit.partition("/")
+            overrides[name.strip()] = (float(rate), int(burst or math.ceil(float(rate))))
+    return overrides
+
+
+class _LocalBackend:
+    """
+    Buckets in this process. With several workers each keeps its own, so a
+    user gets up to the limit per worker.
+    """
+
+    name = "local"
+
+    def __init__(self, max_keys: int):
+        self.buckets = LRUCache(max_entries=max_keys)
+        self._lock = threading.Lock()
+
+    async def take(self, buckets: List[Tuple[str, float, int]]) -> Tuple[bool, float, Optional[str]]:
+        now = time.monotonic()
+        with self._lock:
+            states = []
+            for key, rate, burst in buckets:
+                tokens, updated = self.buckets.get(key) or (burst, now)
+                states.append(min(burst, tokens + (now - updated) * rate))
+            for (key, rate, _), tokens in zip(buckets, states):
+                if tokens < 1:
+                    return False, (1 - tokens) / rate, key
+            for (key, rate, burst), tokens in zip(buckets, states):
+                # Once full again the entry is the same as a missing one
+                self.buckets.set(key, (tokens - 1, now), ttl_seconds=burst / rate)
+        return True, 0.0, None
+
+    def stats(self):
+        return {"keys": len(self.buckets), "max_keys": self.buckets.max_entries, "evictions": self.buckets.evictions}
+
+
+# Same refill-then-take as _LocalBackend, for every bucket of the request at
+# once, on the Redis server's clock so hosts with skewed clocks agree
+_TAKE_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local tokens = {}
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[2 * i - 1])
+    local burst = tonumber(ARGV[2 * i])
+    local state = redis.call('HMGET', key, 'tokens', 'updated')
+    local current = tonumber(state[1]) or burst
+    local updated = tonumber(state[2]) or now
+    current = math.min(burst, current + math.max(0, now - updated) * rate)
+    if current < 1 then
+        return {0, tostring((1 - current) / rate), key}
+    end
+    tokens[i] = current
+end
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[2 * i - 1])
+    local burst = tonumber(ARGV[2 * i])
+    redis.call('HSET', key, 'tokens', tokens[i] - 1, 'updated', now)
+    redis.call('PEXPIRE', key, math.ceil(burst / rate * 1000) + 1000)
+end
+return {1, '0', ''}
+"""
+
+
+class _RedisBackend:
+    """
+    Buckets in Redis, shared by every worker, so the limits hold across the
+    whole deployment.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str):
+        if redis_asyncio is None:
+            raise RuntimeError("RATE_LIMIT_URL is set but the redis package is not installed")
+        self.client = redis_asyncio.from_url(url)
+        self.script = self.client.register_script(_TAKE_SCRIPT)
+
+    async def take(self, buckets: List[Tuple[str, float, int]]) -> Tuple[bool, float, Optional[str]]:
+        args = []
+        for _, rate, burst in buckets:
+            args += [rate, burst]
+        allowed, retry_after, key = await self.script(keys=[key for key, _, _ in buckets], args=args)
+        key = key.decode() if isinstance(key, bytes) else key
+        return bool(allowed), float(retry_after), key or None
+
+    def stats(self):
+        return {}
+
+
+class RateLimiter:
+    """
+    Token buckets per identity: one per route rule and one across all /api
+    requests. Buckets live in this process, or in Redis when RATE_LIMIT_URL
+    is set. If Redis fails the request is let through and counted; the
+    limiter never fails a request on its own.
+
+    - RATE_LIMIT_ENABLED: 0 turns limiting off (body size caps stay) (1)
+    - RATE_LIMIT_RULES: per-rule overrides, e.g. "flows.save=2/10,user=50/200"
+    - RATE_LIMIT_ADDRESS_FACTOR: an address's buckets over a client's (4)
+    - RATE_LIMIT_MAX_KEYS: buckets kept in memory per worker (100000)
+    """
+
+    def __init__(self, rules: Sequence[Rule] = DEFAULT_RULES, backend=None):
+        self.enabled = os.getenv("RATE_LIMIT_ENABLED", "1").lower() not in ("0", "false", "no")
+        overrides = _parse_overrides(os.getenv("RATE_LIMIT_RULES", ""))
+        self.rules = []
+        for rule in rules:
+            rate, burst = overrides.get(rule.name, (rule.rate, rule.burst))
+            self.rules.append(Rule(rule.name, rule.methods, rule.prefix, rate, burst, rule.max_body_bytes))
+        self.user_rate, self.user_burst = overrides.get(USER_RULE, (DEFAULT_USER_RATE, DEFAULT_USER_BURST))
+        self.address_factor = float(os.getenv("RATE_LIMIT_ADDRESS_FACTOR", str(DEFAULT_ADDRESS_FACTOR)))
+        self.backend = backend or _default_backend()
+        self.limited = 0
+        self.errors = 0
+
+    def match(self, method: str, path: str) -> Optional[Rule]:
+        for rule in self.rules:
+            if rule.matches(method, path):
+                return rule
+        return None
+
+    async def check(
+        self, identity: str, path: str, rule: Optional[Rule], address: Optional[str] = None
+    ) -> Tuple[bool, float, str]:
+        """
+        Take a token from each of the request's buckets, or from none of
+        them. With an address, its shared buckets are taken too. Returns
+        whether the request may go ahead and, if not, how many seconds until
+        it could and which bucket ran out.
+        """
+        limits = []
+        if rule is not None and rule.rate > 0:
+            limits.append((rule.name, rule.rate, rule.burst))
+        if path.startswith("/api/") and self.user_rate > 0 and not (rule is not None and rule.rate <= 0):
+            limits.append((USER_RULE, self.user_rate, self.user_burst))
+        buckets = [(f"ratelimit:{name}:{identity}", rate, burst) for name, rate, burst in limits]
+        if address is not None:
+            factor = self.address_factor
+            buckets += [
+                (f"ratelimit:{name}:address:{address}", rate * factor, max(1, int(burst * factor)))
+                for name, rate, burst in limits
+            ]
+        if not self.enabled or not buckets:
+            return True, 0.0, ""
+        try:
+            allowed, retry_after, key = await self.backend.take(buckets)
+        except Exception as e:
+            self.errors += 1
+            rate_limit_errors.inc()
+            logger.warning("Rate limit backend failed, letting the request through: %s", e)
+            return True, 0.0, ""
+        if allowed:
+            return True, 0.0, ""
+        self.limited += 1
+        bucket = key.split(":")[1]
+        rate_limited.inc(bucket)
+        return False, retry_after, bucket
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "backend": self.backend.name,
+            "limited": self.limited,
+            "errors": self.errors,
+            **self.backend.stats(),
+        }
+
+
+def _default_backend():
+    url = os.getenv("RATE_LIMIT_URL")
+    if url:
+        return _RedisBackend(url)
+    return _LocalBackend(int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000")))
+
+
+def _cookies(scope) -> Dict[str, str]:
+    for name, value in scope["headers"]:
+        if name == b"cookie":
+            cookies = {}
+            for item in value.decode("latin-1").split(";"):
+                key, _, morsel = item.strip().partition("=")
+                cookies[key] = morsel
+            return cookies
+    return {}
+
+
+def client_address(scope) -> str:
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+def request_identity(scope) -> str:
+    """
+    Who a request counts against before auth has run: the client address,
+    plus the Clerk user its session token claims to be. The claim is read
+    without verifying it, so it only splits one address's buckets between
+    the users behind it. Rotating it gets a client fresh buckets of its
+    own, so the middleware also takes from the address's shared buckets,
+    which no claim changes. Deciding here keeps a rejected request from
+    ever reaching Clerk; limit_user applies the per-user buckets once the
+    token is verified.
+    """
+    identity = client_address(scope)
+    token = None
+    for name, value in scope["headers"]:
+        if name == b"authorization" and value.startswith(b"Bearer "):
+            token = value[7:].decode("latin-1")
+            break
+    if token is None:
+        cookies = _cookies(scope)
+        token = next((cookies[name] for name in SESSION_COOKIES if cookies.get(name)), None)
+    if token:
+        try:
+            # Only the payload is needed, so skip PyJWT and its header checks
+            payload = token.split(".")[1]
+            claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+            subject = claims.get("sub") or claims.get("sid")
+            if subject:
+                return f"{identity}:{subject}"
+        except (IndexError, ValueError, AttributeError):
+            pass
+    return identity
+
+
+def _retry_after(seconds: float) -> str:
+    return str(max(1, math.ceil(seconds)))
+
+
+async def limit_user(
+    request: Request,
+    current_user: AuthenticatedUser = Depends(get_current_user_from_cookies)
+):
+    """
+    Router dependency: take from the verified user's buckets. FastAPI runs
+    the auth dependency once per request, so routes that also depend on it
+    don't verify the session twice.
+    """
+    path = request.scope["path"]
+    rule = rate_limiter.match(request.method, path)
+    allowed, retry_after, bucket = await rate_limiter.check(f"user:{current_user.supabase_user_id}", path, rule)
+    if not allowed:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Too many requests ({bucket} limit), retry in {retry_after:.1f}s",
+            headers={"Retry-After": _retry_after(retry_after)}
+        )
+
+
+class BodyTooLarge(HTTPException):
+    """
+    Raised from the request's receive channel, so the route's own body
+    parsing turns it into a 413 like any other HTTPException
+    """
+
+    def __init__(self, limit: int):
+        super().__init__(status_code=413, detail=f"Request body is larger than {limit} bytes")
+
+
+async def _reject(send, status: int, detail: str, headers: Sequence[Tuple[bytes, bytes]] = ()):
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), *headers],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class RateLimitMiddleware:
+    """
+    Rejects a request before it reaches auth or a route when its body is
+    over the route's cap (413) or its client is out of tokens (429, with
+    Retry-After). A declared Content-Length is checked up front; a chunked
+    body is counted as it is read.
+    """
+
+    def __init__(self, app, limiter: Optional[RateLimiter] = None):
+        self.app = app
+        self.limiter = limiter or rate_limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        rule = self.limiter.match(scope["method"], path)
+        if rule is not None:
+            for name, value in scope["headers"]:
+                if name == b"content-length" and value.isdigit() and int(value) > rule.max_body_bytes:
+                    body_rejected.inc(rule.name)
+                    error = BodyTooLarge(rule.max_body_bytes)
+                    await _reject(send, error.status_code, error.detail)
+                    return
+
+        allowed, retry_after, bucket = await self.limiter.check(
+            request_identity(scope), path, rule, address=client_address(scope)
+        )
+        if not allowed:
+            await _reject(
+                send, 429, f"Too many requests ({bucket} limit), retry in {retry_after:.1f}s",
+                [(b"retry-after", _retry_after(retry_after).encode())]
+            )
+            return
+
+        if rule is None:
+            await self.app(scope, receive, send)
+            return
+
+        received = 0
+        started = False
+
+        async def counted_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > rule.max_body_bytes:
+                    body_rejected.inc(rule.name)
+                    raise BodyTooLarge(rule.max_body_bytes)
+            return message
+
+        async def tracked_send(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, counted_receive, tracked_send)
+        except BodyTooLarge as e:
+            # Only reaches here if nothing below turned it into a response
+            if not started:
+                await _reject(send, e.status_code, e.detail)
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,232 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+import httpx
+
+from app import metrics
+from app.metrics import CLERK, SUPABASE_AUTH
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+breaker_state = metrics.Gauge(
+    "circuit_breaker_state", "Circuit breaker state: 0 closed, 1 half-open, 2 open", ("breaker",)
+)
+breaker_rejected = metrics.Counter(
+    "circuit_breaker_rejected_total", "Calls failed fast because the breaker was open", ("breaker",)
+)
+hedged_calls = metrics.Counter(
+    "hedged_calls_total", "Reads that sent a second attempt, and which attempt answered first", ("read", "winner")
+)
+
+_breakers: List["CircuitBreaker"] = []
+_hedges: List["Hedge"] = []
+
+
+class CircuitOpen(Exception):
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} is unavailable (circuit open, retry in {retry_after:.1f}s)")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def upstream_unavailable(error: BaseException) -> bool:
+    """
+    Whether an upstream call failed because the upstream is unhealthy
+    (timeout, connection error, 5xx, 429) rather than because it answered
+    no (an unknown session, a bad token). Only the former trips a breaker or
+    justifies falling back to stale data.
+    """
+    if isinstance(error, (CircuitOpen, TimeoutError, ConnectionError, httpx.TransportError)):
+        return True
+    # Clerk SDK errors carry status_code, Supabase auth errors status;
+    # supabase_auth reports network failures as AuthRetryableError
+    if type(error).__name__ == "AuthRetryableError":
+        return True
+    status = getattr(error, "status_code", None) or getattr(error, "status", None)
+    return isinstance(status, int) and (status >= 500 or status == 429)
+
+
+class CircuitBreaker:
+    """
+    Fails calls to an upstream fast once it looks down. After
+    failure_threshold consecutive failures (see upstream_unavailable; a call
+    slower than timeout counts too) the breaker opens and calls raise
+    CircuitOpen without being made. After reset_seconds one probe call is let
+    through: success closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float, timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.timeout = timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opened = 0
+        self.rejected = 0
+        self._probing = False
+        self._lock = threading.Lock()
+        breaker_state.set(name, value=0)
+        _breakers.append(self)
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            logger.warning("Circuit breaker %s: %s -> %s", self.name, self.state, state)
+            self.state = state
+            breaker_state.set(self.name, value=_STATE_VALUES[state])
+
+    def _before(self):
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            remaining = self.opened_at + self.reset_seconds - time.monotonic()
+            if self.state == OPEN and remaining <= 0:
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            self.rejected += 1
+            breaker_rejected.inc(self.name)
+            raise CircuitOpen(self.name, max(remaining, 0.0))
+
+    def _after(self, error: Optional[BaseException]):
+        with self._lock:
+            self._probing = False
+            if error is None or not upstream_unavailable(error):
+                self.failures = 0
+                self._set_state(CLOSED)
+                return
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.opened += 1
+                self.opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    async def call(self, fn: Callable[[], Awaitable[T]]) -> T:
+        self._before()
+        try:
+            result = await asyncio.wait_for(fn(), self.timeout)
+        except asyncio.CancelledError:
+            # The caller went away; says nothing about the upstream
+            with self._lock:
+                self._probing = False
+            raise
+        except BaseException as e:
+            self._after(e)
+            raise
+        self._after(None)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
+
+
+class Hedge:
+    """
+    Latency of one idempotent read, to decide when to hedge it: a call still
+    running after the recent p-th percentile is probably stuck on a bad
+    connection or a slow upstream node, and a second attempt usually
+    finishes first. The delay stays within [min_ms, max_ms].
+    """
+
+    def __init__(self, name: str, percentile: float = 95, min_ms: float = 50, max_ms: float = 1000, window: int = 200):
+        self.name = name
+        self.percentile = percentile
+        self.min_delay = min_ms / 1000
+        self.max_delay = max_ms / 1000
+        self.samples = deque(maxlen=window)
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_won = 0
+        _hedges.append(self)
+
+    def delay(self) -> float:
+        if len(self.samples) < 20:
+            return self.max_delay
+        ordered = sorted(self.samples)
+        value = ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))]
+        return min(self.max_delay, max(self.min_delay, value))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "hedged": self.hedged,
+            "hedge_won": self.hedge_won,
+            "delay_ms": round(self.delay() * 1000, 1),
+        }
+
+
+async def hedged(hedge: Hedge, fn: Callable[[], Awaitable[T]]) -> T:
+    """
+    Run an idempotent read; if it hasn't answered after hedge.delay(), start
+    a second attempt and return whichever succeeds first. Only for reads:
+    both attempts may reach the upstream.
+    """
+    hedge.calls += 1
+    started = time.perf_counter()
+    first = asyncio.ensure_future(fn())
+    done, _ = await asyncio.wait({first}, timeout=hedge.delay())
+    if done:
+        if first.exception() is None:
+            hedge.samples.append(time.perf_counter() - started)
+        return first.result()
+
+    hedge.hedged += 1
+    second = asyncio.ensure_future(fn())
+    attempts = {first, second}
+    error: Optional[BaseException] = None
+    try:
+        while attempts:
+            done, attempts = await asyncio.wait(attempts, return_when=asyncio.FIRST_COMPLETED)
+            for attempt in done:
+                if attempt.exception() is None:
+                    hedge.samples.append(time.perf_counter() - started)
+                    winner = "hedge" if attempt is second else "first"
+                    if attempt is second:
+                        hedge.hedge_won += 1
+                    hedged_calls.inc(hedge.name, winner)
+                    return attempt.result()
+                error = attempt.exception()
+        raise error
+    finally:
+        # A read still running in a worker thread finishes there; nobody waits for it
+        for attempt in attempts:
+            attempt.cancel()
+
+
+def resilience_stats() -> Dict[str, Any]:
+    return {
+        "breakers": {breaker.name: breaker.stats() for breaker in _breakers},
+        "hedges": {hedge.name: hedge.stats() for hedge in _hedges},
+    }
+
+
+_failure_threshold = int(os.getenv("UPSTREAM_BREAKER_FAILURES", "5"))
+_reset_seconds = float(os.getenv("UPSTREAM_BREAKER_RESET_S", "10"))
+
+clerk_breaker = CircuitBreaker(
+    CLERK, _failure_threshold, _reset_seconds, float(os.getenv("CLERK_CALL_TIMEOUT_S", "3"))
+)
+supabase_auth_breaker = CircuitBreaker(
+    SUPABASE_AUTH, _failure_threshold, _reset_seconds, float(os.getenv("SUPABASE_AUTH_CALL_TIMEOUT_S", "5"))
+)
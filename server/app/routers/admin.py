@@ -0,0 +1,108 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+import logging
+from app.auth import require_admin
+from app.profiling import profile, render_folded, slow_requests
+from app.services.clerk_webhook_service import clerk_webhooks
+from app.resilience import resilience_stats
+from app.services.blob_store import blob_collector
+from app.services.storage_backend import get_storage_backend, StorageBackend
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["admin"], dependencies=[Depends(require_admin)])
+
+MAX_PROFILE_SECONDS = 300
+
+@router.post("/profile", response_class=PlainTextResponse)
+async def run_profile(
+    seconds: float = Query(10.0, gt=0, le=MAX_PROFILE_SECONDS),
+    requests: int = Query(0, ge=0, description="stop after this many requests finish (0: run for seconds)"),
+    interval_ms: float = Query(10.0, ge=1, le=1000),
+    include_idle: bool = Query(False, description="keep samples of threads parked waiting for work")
+):
+    """
+    Sample every thread of this worker for a while and return the stacks in
+    collapsed format, one "frame;frame;frame count" line each, ready for
+    flamegraph.pl or speedscope
+    """
+    try:
+        samples, summary = await profile(seconds, requests, interval_ms / 1000, include_idle)
+        logger.info(f"Profile finished: {summary}")
+        return PlainTextResponse(
+            render_folded(samples),
+            headers={f"X-Profile-{key.replace('_', '-').title()}": str(value) for key, value in summary.items()}
+        )
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to profile: {str(e)}")
+
+@router.get("/slow-requests")
+async def list_slow_requests(limit: int = Query(20, ge=1, le=200)):
+    """
+    Most recent requests slower than SLOW_REQUEST_MS on this worker, with
+    their stack samples and upstream calls
+    """
+    return {
+        "message": "Slow requests retrieved successfully",
+        "threshold_ms": slow_requests.threshold * 1000,
+        "slow_requests": slow_requests.recent(limit)
+    }
+
+@router.delete("/slow-requests")
+async def clear_slow_requests():
+    """Forget the slow requests captured so far"""
+    slow_requests.clear()
+    return {"message": "Slow requests cleared successfully"}
+
+@router.get("/upstreams")
+async def upstream_health():
+    """
+    Circuit breaker state for Clerk and the Supabase auth admin API on this
+    worker, and how often their reads were hedged
+    """
+    return {"message": "Upstream health retrieved successfully", **resilience_stats()}
+
+@router.get("/clerk-webhooks")
+async def clerk_webhook_stats(failed_limit: int = Query(20, ge=0, le=200)):
+    """
+    Clerk webhook queue depth, what this worker has processed, and the most
+    recent events that ran out of attempts
+    """
+    try:
+        return {"message": "Clerk webhook queue retrieved successfully", **await clerk_webhooks.stats(failed_limit)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get Clerk webhook queue: {str(e)}")
+
+@router.post("/clerk-webhooks/{event_id}/retry")
+async def retry_clerk_webhook(event_id: str):
+    """Queue a failed Clerk webhook event again"""
+    try:
+        if not await clerk_webhooks.retry(event_id):
+            raise HTTPException(status_code=404, detail="No failed event with this id")
+        return {"message": "Clerk webhook queued for retry successfully", "event_id": event_id}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to retry Clerk webhook: {str(e)}")
+
+@router.get("/blobs")
+async def blob_stats():
+    """Blob garbage collector settings and what it has reclaimed on this worker"""
+    return {"message": "Blob collector retrieved successfully", **blob_collector.stats()}
+
+@router.post("/blobs/gc")
+async def collect_blobs(
+    grace_s: float = Query(None, ge=0, description="collect blobs unreferenced for this long (default BLOB_GC_GRACE_S)"),
+    storage: StorageBackend = Depends(get_storage_backend)
+):
+    """Delete unreferenced blobs now rather than at the next scheduled run"""
+    try:
+        result = await blob_collector.collect(storage, grace_s)
+        return {"message": "Blobs collected successfully", **result}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to collect blobs: {str(e)}")
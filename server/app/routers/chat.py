@@ -1,34 +1,419 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import json
+import math
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from typing import List, Dict, Any, Optional, Callable, Awaitable, AsyncIterator
 from pydantic import BaseModel
+import logging
 from app.auth import get_current_user_from_cookies, AuthenticatedUser
+from app.services.claude_service import get_claude_service, ClaudeService, ChatStream, stream_stats
+from app.services.conversation_data_service import get_conversation_data_service, ConversationDataService
+from app.services.conversation_context_service import (
+    get_conversation_context_service,
+    ConversationContextService,
+    ContextWindow,
+    estimate_tokens,
+)
+from app.services.retrieval_service import get_retrieval_service, RetrievalService, retrieval_cache_stats
+from app.services.response_cache_service import get_response_cache, SemanticResponseCache, CachedResponse
+from app.services.chat_scheduler import get_chat_scheduler, ChatScheduler
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(tags=["chat"])
 
+SYSTEM_PROMPT = (
+    "You are the assistant inside a visual project board. Help the user reason "
+    "about and organize the documents and links in their project."
+)
+
+PROJECT_CONTEXT_HEADING = (
+    "Relevant excerpts from the user's project. Cite them by their [number] "
+    "when you use them:"
+)
+
 class ChatRequest(BaseModel):
     prompt: str
     project_id: str
 
+class ChatContinueRequest(BaseModel):
+    project_id: str
+    conversation_id: Optional[str] = None
+    prompt: Optional[str] = None
+    conversation_history: List[str] = []
+
+def history_to_messages(history: List[str]) -> List[Dict[str, str]]:
+    """
+    Convert the client's flat history (oldest first, latest user turn last)
+    into alternating Messages API turns that start with a user message.
+    """
+    messages = []
+    role = "user"
+    for text in reversed(history):
+        messages.append({"role": role, "content": text})
+        role = "assistant" if role == "user" else "user"
+    messages.reverse()
+    while messages and messages[0]["role"] != "user":
+        messages.pop(0)
+    return messages
+
+def _sse(event: str, data: Dict) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+
+async def _sse_events(
+    request: Request,
+    stream: ChatStream,
+    project_id: str,
+    extra: Dict[str, Any],
+    on_complete: Optional[Callable[[str, ChatStream], Awaitable[None]]]
+) -> AsyncIterator[bytes]:
+    """
+    Forward model tokens as server-sent events, stopping the upstream
+    request as soon as the client goes away.
+    """
+    parts = []
+    try:
+        yield _sse("start", extra)
+        async for text in stream:
+            if await request.is_disconnected():
+                logger.info(f"Chat client disconnected for project {project_id}, cancelling stream")
+                await stream.aclose(cancelled=True)
+                return
+            parts.append(text)
+            yield _sse("token", {"text": text})
+        yield _sse("done", {"wait_for_human": True, **extra, **stream.metrics()})
+    except asyncio.CancelledError:
+        await stream.aclose(cancelled=True)
+        raise
+    except Exception as e:
+        logger.error(f"Chat stream failed for project {project_id}: {str(e)}")
+        yield _sse("error", {"detail": f"Failed to process chat: {str(e)}"})
+    finally:
+        await stream.aclose()
+        if on_complete and parts:
+            await on_complete("".join(parts), stream)
+
+async def _respond(
+    request: Request,
+    window: ContextWindow,
+    project_id: str,
+    claude: ClaudeService,
+    extra: Optional[Dict[str, Any]] = None,
+    on_complete: Optional[Callable[[str, ChatStream], Awaitable[None]]] = None
+):
+    """
+    Stream the reply as SSE when the client asks for text/event-stream,
+    otherwise collect it into the AgentConversationResponse shape.
+    on_complete receives the reply text and its stream once the model is done.
+    """
+    if not window.messages:
+        raise HTTPException(status_code=422, detail="Conversation must contain a user message")
+
+    extra = {"project_id": project_id, "prompt_tokens": window.prompt_tokens, **(extra or {})}
+    stream = claude.stream(window.messages, system=window.system, max_tokens=window.max_output_tokens)
+
+    if "text/event-stream" in request.headers.get("accept", ""):
+        return StreamingResponse(
+            _sse_events(request, stream, project_id, extra, on_complete),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+    parts = []
+    try:
+        async for text in stream:
+            parts.append(text)
+    finally:
+        await stream.aclose()
+
+    model_response = "".join(parts)
+    if on_complete and model_response:
+        await on_complete(model_response, stream)
+
+    return {
+        "wait_for_human": True,
+        "model_response": model_response,
+        **extra,
+        "metrics": stream.metrics()
+    }
+
+async def _respond_cached(request: Request, cached: CachedResponse, extra: Dict[str, Any]):
+    """
+    Answer from the response cache, in the same shape as a model reply.
+    """
+    extra = {**extra, "cache_hit": True}
+    metrics = {"ttft_ms": 0, "tokens": 0, "tokens_per_sec": None, "stop_reason": "cache_hit"}
+
+    if "text/event-stream" in request.headers.get("accept", ""):
+        async def events():
+            yield _sse("start", extra)
+            yield _sse("token", {"text": cached.response})
+            yield _sse("done", {"wait_for_human": True, **extra, **metrics})
+
+        return StreamingResponse(
+            events(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+    return {
+        "wait_for_human": True,
+        "model_response": cached.response,
+        **extra,
+        "metrics": metrics
+    }
+
+async def _add_project_context(
+    window: ContextWindow,
+    project_id: str,
+    prompt: str,
+    current_user: AuthenticatedUser,
+    retrieval: RetrievalService,
+    context: ConversationContextService,
+    conversation_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Retrieve project excerpts for the prompt into the window's system text
+    and return the citation fields for the response.
+    """
+    retrieved = await run_in_threadpool(
+        retrieval.retrieve,
+        project_id,
+        prompt,
+        current_user,
+        context.budget.max_retrieval_tokens,
+        conversation_id
+    )
+    window.add_context(PROJECT_CONTEXT_HEADING, retrieved.text, retrieved.tokens)
+    return {"citations": retrieved.citations, "retrieval_cached": retrieved.cached}
+
+async def _respond_in_conversation(
+    request: Request,
+    conversation: Dict[str, Any],
+    prompt: str,
+    current_user: AuthenticatedUser,
+    conversations: ConversationDataService,
+    context: ConversationContextService,
+    retrieval: RetrievalService,
+    response_cache: SemanticResponseCache,
+    claude: ClaudeService
+):
+    """
+    Store the user's turn, build a budgeted context window from the stored
+    conversation and store the reply when it completes. Opening questions
+    are answered from the semantic response cache when possible.
+    """
+    tokens = context.check_message(prompt)
+    # The conversation store is on the synchronous supabase client
+    await run_in_threadpool(conversations.append_message, conversation, "user", prompt, tokens, current_user)
+
+    summarized_count = conversation.get("summarized_count") or 0
+    messages = await run_in_threadpool(
+        conversations.get_messages, conversation, current_user, from_seq=summarized_count
+    )
+    summary = conversation.get("summary")
+    window, rolled_off = await context.build(SYSTEM_PROMPT, messages, summary)
+    if rolled_off:
+        context.summarize_in_background(
+            conversation["id"], summary, messages[:rolled_off],
+            lambda new_summary: run_in_threadpool(
+                conversations.update_summary, conversation, new_summary, summarized_count + rolled_off,
+                current_user, summarized_count
+            )
+        )
+
+    def store_reply(text: str):
+        try:
+            conversations.append_message(conversation, "assistant", text, estimate_tokens(text), current_user)
+        except Exception as e:
+            logger.error(f"Failed to store reply for conversation {conversation['id']}: {str(e)}")
+
+    # Only replies to an opening question are reusable; later turns depend on history
+    cacheable = len(window.messages) == 1 and not summary and not rolled_off
+    # Before retrieval reads the project, so a reply is never cached under a newer version
+    cache_version = response_cache.version(conversation["project_id"])
+    if cacheable:
+        cached = await response_cache.lookup(current_user, conversation["project_id"], prompt, cache_version)
+        if cached is not None:
+            await run_in_threadpool(store_reply, cached.response)
+            return await _respond_cached(
+                request,
+                cached,
+                {"project_id": conversation["project_id"], "prompt_tokens": window.prompt_tokens, "conversation_id": conversation["id"]}
+            )
+
+    citations = await _add_project_context(
+        window, conversation["project_id"], prompt, current_user, retrieval, context, conversation["id"]
+    )
+
+    async def on_complete(text: str, stream: ChatStream):
+        await run_in_threadpool(store_reply, text)
+        if cacheable and not stream.error and not stream.cancelled:
+            await response_cache.store(
+                current_user, conversation["project_id"], prompt, text, stream.duration_s, cache_version
+            )
+
+    return await _respond(
+        request,
+        window,
+        conversation["project_id"],
+        claude,
+        extra={"conversation_id": conversation["id"], "cache_hit": False, **citations},
+        on_complete=on_complete
+    )
+
+def _chat_weight(user: AuthenticatedUser) -> float:
+    """
+    Fair-share weight for a user; defaults to 1 unless set in their
+    app_metadata, which only the service role can write.
+    """
+    try:
+        weight = float((user.app_metadata or {}).get("chat_weight", 1.0))
+    except (TypeError, ValueError):
+        return 1.0
+    return weight if math.isfinite(weight) and weight > 0 else 1.0
+
+async def _scheduled(scheduler: ChatScheduler, current_user: AuthenticatedUser, handler: Callable[[], Awaitable[Any]]):
+    """
+    Run a chat handler in a fair-share slot. A streamed reply keeps the slot
+    until the stream ends; anything else releases it on return.
+    """
+    ticket = await scheduler.acquire(current_user.supabase_user_id, _chat_weight(current_user))
+    try:
+        response = await handler()
+    except BaseException:
+        scheduler.release(ticket)
+        raise
+
+    if isinstance(response, StreamingResponse):
+        response.body_iterator = scheduler.release_after(ticket, response.body_iterator)
+    else:
+        scheduler.release(ticket)
+    return response
+
+@router.post("/chat-start")
+async def chat_start(
+    request: Request,
+    chat_data: ChatRequest,
+    current_user: AuthenticatedUser = Depends(get_current_user_from_cookies),
+    claude: ClaudeService = Depends(get_claude_service),
+    conversations: ConversationDataService = Depends(get_conversation_data_service),
+    context: ConversationContextService = Depends(get_conversation_context_service),
+    retrieval: RetrievalService = Depends(get_retrieval_service),
+    response_cache: SemanticResponseCache = Depends(get_response_cache),
+    scheduler: ChatScheduler = Depends(get_chat_scheduler)
+):
+    """
+    Start a new stored conversation with a single prompt
+    """
+    async def handle():
+        try:
+            context.check_message(chat_data.prompt)
+            conversation = await run_in_threadpool(
+                conversations.create_conversation,
+                project_id=chat_data.project_id,
+                user=current_user
+            )
+
+            return await _respond_in_conversation(
+                request, conversation, chat_data.prompt, current_user, conversations, context, retrieval, response_cache, claude
+            )
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Failed to process chat: {str(e)}"
+            )
+
+    return await _scheduled(scheduler, current_user, handle)
+
+@router.post("/chat-continue")
+async def chat_continue(
+    request: Request,
+    chat_data: ChatContinueRequest,
+    current_user: AuthenticatedUser = Depends(get_current_user_from_cookies),
+    claude: ClaudeService = Depends(get_claude_service),
+    conversations: ConversationDataService = Depends(get_conversation_data_service),
+    context: ConversationContextService = Depends(get_conversation_context_service),
+    retrieval: RetrievalService = Depends(get_retrieval_service),
+    response_cache: SemanticResponseCache = Depends(get_response_cache),
+    scheduler: ChatScheduler = Depends(get_chat_scheduler)
+):
+    """
+    Continue a conversation. With a conversation_id only the new prompt is
+    needed; otherwise the client's history is budgeted and sent as-is.
+    """
+    async def handle():
+        try:
+            if chat_data.conversation_id:
+                prompt = chat_data.prompt or (chat_data.conversation_history[-1] if chat_data.conversation_history else None)
+                if not prompt:
+                    raise HTTPException(status_code=422, detail="A prompt is required to continue a conversation")
+
+                conversation = await run_in_threadpool(
+                    conversations.get_conversation,
+                    conversation_id=chat_data.conversation_id,
+                    user=current_user
+                )
+                if conversation["project_id"] != chat_data.project_id:
+                    raise HTTPException(status_code=404, detail="Conversation not found in this project")
+
+                return await _respond_in_conversation(
+                    request, conversation, prompt, current_user, conversations, context, retrieval, response_cache, claude
+                )
+
+            history = chat_data.conversation_history + ([chat_data.prompt] if chat_data.prompt else [])
+            window = await context.build_from_history(SYSTEM_PROMPT, history_to_messages(history))
+            citations = {}
+            if history:
+                citations = await _add_project_context(
+                    window, chat_data.project_id, history[-1], current_user, retrieval, context
+                )
+
+            return await _respond(request, window, chat_data.project_id, claude, extra=citations)
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Failed to process chat: {str(e)}"
+            )
+
+    return await _scheduled(scheduler, current_user, handle)
+
 @router.post("/chat")
 async def chat(
+    request: Request,
     chat_data: ChatRequest,
-    current_user: AuthenticatedUser = Depends(get_current_user_from_cookies)
+    current_user: AuthenticatedUser = Depends(get_current_user_from_cookies),
+    claude: ClaudeService = Depends(get_claude_service),
+    conversations: ConversationDataService = Depends(get_conversation_data_service),
+    context: ConversationContextService = Depends(get_conversation_context_service),
+    retrieval: RetrievalService = Depends(get_retrieval_service),
+    response_cache: SemanticResponseCache = Depends(get_response_cache),
+    scheduler: ChatScheduler = Depends(get_chat_scheduler)
 ):
     """
     Send a chat message and get a response
     """
-    try:
-        # Mock response - not calling any actual chat service
-        return {
-            "message": "Chat response generated successfully",
-            "response": f"This is a mock response to your message: '{chat_data.prompt}' for project {chat_data.project_id}",
-            "user_id": current_user.user_id,
-            "project_id": chat_data.project_id
-        }
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Failed to process chat: {str(e)}"
-        )
+    return await chat_start(request, chat_data, current_user, claude, conversations, context, retrieval, response_cache, scheduler)
+
+@router.get("/stats")
+async def chat_stats(
+    current_user: AuthenticatedUser = Depends(get_current_user_from_cookies)
+):
+    """
+    Time-to-first-token and throughput stats for model streams on this worker
+    """
+    return {
+        "message": "Chat stats retrieved successfully",
+        "stats": stream_stats.snapshot(),
+        "retrieval": retrieval_cache_stats(),
+        "response_cache": get_response_cache().stats(),
+        "scheduler": get_chat_scheduler().stats()
+    }
@@ -1,9 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from typing import Optional, Dict, Any
-from pydantic import BaseModel
+from typing import Optional, Dict, Any, List
+from pydantic import BaseModel, Field
 from supabase import Client
 from app.auth import get_current_user_from_cookies, get_supabase_client, AuthenticatedUser
 from app.services.docs_data_service import get_docs_data_service, DocsDataService
+from app.services.bulk import bulk_response, MAX_BULK_ITEMS
 
 router = APIRouter(tags=["docs"])
 
@@ -16,6 +17,18 @@ class DocumentUpdate(BaseModel):
     doc_name: Optional[str] = None
     content: Optional[str] = None
 
+class DocumentBulkCreate(BaseModel):
+    documents: List[DocumentCreate] = Field(..., min_length=1, max_length=MAX_BULK_ITEMS)
+
+class DocumentBulkUpdateItem(DocumentUpdate):
+    id: str
+
+class DocumentBulkUpdate(BaseModel):
+    documents: List[DocumentBulkUpdateItem] = Field(..., min_length=1, max_length=MAX_BULK_ITEMS)
+
+class DocumentBulkDelete(BaseModel):
+    doc_ids: List[str] = Field(..., min_length=1, max_length=MAX_BULK_ITEMS)
+
 @router.post("/create")
 async def create_document(
     doc_data: DocumentCreate,
@@ -26,7 +39,7 @@ async def create_document(
     Create a new document for the authenticated user
     """
     try:
-        result = docs_service.create_document(
+        result = await docs_service.create_document(
             project_id=doc_data.project_id,
             doc_name=doc_data.doc_name,
             content=doc_data.content,
@@ -57,7 +70,7 @@ async def update_document(
     Update an existing document for the authenticated user
     """
     try:
-        result = docs_service.update_document(
+        result = await docs_service.update_document(
             doc_id=doc_id,
             doc_name=doc_data.doc_name,
             content=doc_data.content,
@@ -87,7 +100,7 @@ async def get_document(
     Get a document by ID for the authenticated user
     """
     try:
-        result = docs_service.get_document(
+        result = await docs_service.get_document(
             doc_id=doc_id,
             user=current_user
         )
@@ -115,7 +128,7 @@ async def delete_document(
     Delete a document for the authenticated user
     """
     try:
-        result = docs_service.delete_document(
+        result = await docs_service.delete_document(
             doc_id=doc_id,
             user=current_user
         )
@@ -131,4 +144,79 @@ async def delete_document(
         raise HTTPException(
             status_code=500,
             detail=f"Failed to delete document: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+@router.post("/bulk/create")
+async def create_documents(
+    bulk_data: DocumentBulkCreate,
+    current_user: AuthenticatedUser = Depends(get_current_user_from_cookies),
+    docs_service: DocsDataService = Depends(get_docs_data_service)
+):
+    """
+    Create many documents for the authenticated user in one request
+    """
+    try:
+        results = await docs_service.create_documents(
+            items=[item.model_dump() for item in bulk_data.documents],
+            user=current_user
+        )
+        
+        return bulk_response(results, "Documents", "created")
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to create documents: {str(e)}"
+        )
+
+@router.put("/bulk/update")
+async def update_documents(
+    bulk_data: DocumentBulkUpdate,
+    current_user: AuthenticatedUser = Depends(get_current_user_from_cookies),
+    docs_service: DocsDataService = Depends(get_docs_data_service)
+):
+    """
+    Update many documents for the authenticated user in one request
+    """
+    try:
+        results = await docs_service.update_documents(
+            items=[item.model_dump() for item in bulk_data.documents],
+            user=current_user
+        )
+        
+        return bulk_response(results, "Documents", "updated")
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to update documents: {str(e)}"
+        )
+
+@router.post("/bulk/delete")
+async def delete_documents(
+    bulk_data: DocumentBulkDelete,
+    current_user: AuthenticatedUser = Depends(get_current_user_from_cookies),
+    docs_service: DocsDataService = Depends(get_docs_data_service)
+):
+    """
+    Delete many documents for the authenticated user in one request
+    """
+    try:
+        results = await docs_service.delete_documents(
+            doc_ids=bulk_data.doc_ids,
+            user=current_user
+        )
+        
+        return bulk_response(results, "Documents", "deleted")
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to delete documents: {str(e)}"
+        )
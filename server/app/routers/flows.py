@@ -1,48 +1,97 @@
 import json
+import logging
 from fastapi import APIRouter, Depends, HTTPException, status, Request
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Literal, Union, Annotated
 from pydantic import BaseModel, Field
 from uuid import UUID
 from datetime import datetime
-from supabase import Client
-from app.auth import get_current_user, get_current_user_from_cookies, get_supabase_client, AuthenticatedUser
+from app.auth import get_current_user, get_current_user_from_cookies, AuthenticatedUser
+from app.services.project_version import project_versions, FLOW
+from app.services.board_ops_service import get_board_ops_service, BoardOpsService, MAX_OPS, FLOW_WRITE_ATTEMPTS
+from app.services.storage_backend import get_storage_backend, StorageBackend
+from app.services.folders_data_service import FoldersDataService
+from app.services.row_cache import document_cache, link_cache
+from app.services.single_flight import SingleFlight
+
+# Set up logging
+logger = logging.getLogger(__name__)
 
 router = APIRouter(tags=["flows"])
 
+flow_reads = SingleFlight("load_flow")
+
 class FlowSave(BaseModel):
     project_id: str  # Accept any string as project identifier
     flow_state: Dict[str, Any]
 
+class Position(BaseModel):
+    x: float
+    y: float
+
+class CreateDocOp(BaseModel):
+    op: Literal["create_doc"]
+    ref: Optional[str] = None  # Placeholder id later ops in the batch can refer to
+    position: Position
+    title: str = "Untitled Document"
+    content: str = ""
+
+class CreateLinkOp(BaseModel):
+    op: Literal["create_link"]
+    ref: Optional[str] = None
+    position: Position
+    url: str
+    name: str = ""
+
+class CreateFolderOp(BaseModel):
+    op: Literal["create_folder"]
+    ref: Optional[str] = None
+    position: Position
+    title: str = "New Folder"
+
+class MoveOp(BaseModel):
+    op: Literal["move"]
+    node_id: str
+    position: Position
+
+class GroupOp(BaseModel):
+    op: Literal["group"]
+    node_id: str
+    folder_id: Optional[str] = None  # None moves the node out of its folder
+
+class DeleteOp(BaseModel):
+    op: Literal["delete"]
+    node_id: str
+
+BoardOp = Annotated[
+    Union[CreateDocOp, CreateLinkOp, CreateFolderOp, MoveOp, GroupOp, DeleteOp],
+    Field(discriminator="op")
+]
+
+class BoardOps(BaseModel):
+    project_id: str
+    ops: List[BoardOp] = Field(..., max_length=MAX_OPS)
+    base_version: Optional[int] = None  # Reject the batch if the stored flow version has moved past this
+
 @router.post("/save")
 async def save_flow(
     request: Request,
     current_user: AuthenticatedUser = Depends(get_current_user_from_cookies),
-    supabase: Client = Depends(get_supabase_client)
+    storage: StorageBackend = Depends(get_storage_backend)
 ):
     """
     Save a flow state to the database after verifying user authentication
     """
-    print(f"🚀 FLOWS DEBUG: save_flow endpoint called")
-    
-    # Debug raw request body and manually parse
+    # Parse the body by hand so validation errors get a readable detail
     try:
         body = await request.body()
-        print(f"🚀 FLOWS DEBUG: Raw request body: {body.decode('utf-8')}")
-        
-        # Parse JSON manually to see what we're getting
         body_json = json.loads(body.decode('utf-8'))
-        print(f"🚀 FLOWS DEBUG: Parsed JSON: {body_json}")
-        
-        # Try to validate with Pydantic
         flow_data = FlowSave(**body_json)
-        print(f"🚀 FLOWS DEBUG: Successfully validated flow_data: {flow_data}")
         
     except json.JSONDecodeError as e:
-        print(f"❌ FLOWS DEBUG: JSON decode error: {e}")
+        logger.info("Rejected flow save with invalid JSON: %s", str(e))
         raise HTTPException(status_code=422, detail=f"Invalid JSON: {str(e)}")
     except Exception as e:
-        print(f"❌ FLOWS DEBUG: Validation error: {e}")
-        print(f"❌ FLOWS DEBUG: Error type: {type(e)}")
+        logger.info("Rejected flow save: %s: %s", type(e).__name__, str(e))
         if "uuid_parsing" in str(e).lower():
             raise HTTPException(
                 status_code=422, 
@@ -50,9 +99,13 @@ async def save_flow(
             )
         raise HTTPException(status_code=422, detail=f"Validation error: {str(e)}")
     
-    print(f"🚀 FLOWS DEBUG: flow_data project_id: {flow_data.project_id}")
-    print(f"🚀 FLOWS DEBUG: flow_data flow_state: {flow_data.flow_state}")
-    print(f"🚀 FLOWS DEBUG: current_user: {current_user.clerk_user_id if current_user else 'None'}")
+    logger.debug(
+        "Saving flow for project %s: %d nodes, %d edges, %d bytes",
+        flow_data.project_id,
+        len(flow_data.flow_state.get("nodes") or []),
+        len(flow_data.flow_state.get("edges") or []),
+        len(body)
+    )
     
     try:
         # Prepare the flow record
@@ -61,61 +114,65 @@ async def save_flow(
             "project_id": str(flow_data.project_id),
             "flow_state": flow_data.flow_state,
         }
-        print(f"🚀 FLOWS DEBUG: Prepared flow_record: {flow_record}")
         
-        # Check if a flow already exists for this user and project
-        print(f"🚀 FLOWS DEBUG: Checking for existing flow...")
-        try:
-            existing_flow = supabase.table("flows").select("id").eq(
-                "user_id", current_user.supabase_user_id
-            ).eq(
-                "project_id", str(flow_data.project_id)
-            ).execute()
-            print(f"🚀 FLOWS DEBUG: Existing flow query result: {existing_flow}")
-        except Exception as db_error:
-            print(f"❌ FLOWS DEBUG: Database query error: {db_error}")
-            print(f"❌ FLOWS DEBUG: Error type: {type(db_error)}")
-            raise HTTPException(status_code=500, detail=f"Database error: {str(db_error)}")
-        
-        if existing_flow.data:
-            # Update existing flow
-            print(f"🚀 FLOWS DEBUG: Updating existing flow with ID: {existing_flow.data[0]['id']}")
+        # The stored version only moves forward: each write is conditional on
+        # the version it read, and a save that lost the race reads again
+        for attempt in range(FLOW_WRITE_ATTEMPTS):
+            # Check if a flow already exists for this user and project
             try:
-                response = supabase.table("flows").update(flow_record).eq(
-                    "id", existing_flow.data[0]["id"]
-                ).execute()
-                print(f"🚀 FLOWS DEBUG: Update response: {response}")
-            except Exception as update_error:
-                print(f"❌ FLOWS DEBUG: Update error: {update_error}")
-                print(f"❌ FLOWS DEBUG: Update error type: {type(update_error)}")
-                raise HTTPException(status_code=500, detail=f"Update error: {str(update_error)}")
+                existing_flow = await storage.select(
+                    "flows",
+                    {"user_id": current_user.supabase_user_id, "project_id": str(flow_data.project_id)},
+                    columns="id, version"
+                )
+            except Exception as db_error:
+                logger.error("Looking up flow for project %s failed: %s", flow_data.project_id, str(db_error))
+                raise HTTPException(status_code=500, detail=f"Database error: {str(db_error)}")
             
-            return {
-                "message": "Flow updated successfully",
-                "flow_id": existing_flow.data[0]["id"],
-                "user_id": current_user.supabase_user_id
-            }
-        else:
-            # Create new flow
-            print(f"🚀 FLOWS DEBUG: Creating new flow...")
-            flow_record["created_at"] = datetime.utcnow().isoformat()
-            try:
-                response = supabase.table("flows").insert(flow_record).execute()
-                print(f"🚀 FLOWS DEBUG: Insert response: {response}")
-            except Exception as insert_error:
-                print(f"❌ FLOWS DEBUG: Insert error: {insert_error}")
-                print(f"❌ FLOWS DEBUG: Insert error type: {type(insert_error)}")
-                raise HTTPException(status_code=500, detail=f"Insert error: {str(insert_error)}")
-            
-            if response.data:
+            if existing_flow:
+                # Update existing flow
+                current_version = existing_flow[0].get("version") or 0
+                try:
+                    response = await storage.update(
+                        "flows",
+                        {**flow_record, "version": current_version + 1},
+                        {"id": existing_flow[0]["id"], "version": current_version}
+                    )
+                except Exception as update_error:
+                    logger.error("Updating flow %s failed: %s", existing_flow[0]["id"], str(update_error))
+                    raise HTTPException(status_code=500, detail=f"Update error: {str(update_error)}")
+                if not response:
+                    continue
+                
+                project_versions.bump(flow_data.project_id, FLOW)
                 return {
-                    "message": "Flow saved successfully",
-                    "flow_id": response.data[0]["id"],
-                    "user_id": current_user.supabase_user_id
+                    "message": "Flow updated successfully",
+                    "flow_id": existing_flow[0]["id"],
+                    "user_id": current_user.supabase_user_id,
+                    "version": current_version + 1
                 }
             else:
-                print(f"❌ FLOWS DEBUG: No data in insert response: {response}")
-                raise HTTPException(status_code=400, detail="Failed to save flow - no data returned")
+                # Create new flow
+                flow_record["created_at"] = datetime.utcnow().isoformat()
+                try:
+                    response = await storage.insert("flows", [{**flow_record, "version": 1}])
+                except Exception as insert_error:
+                    logger.error("Creating flow for project %s failed: %s", flow_data.project_id, str(insert_error))
+                    raise HTTPException(status_code=500, detail=f"Insert error: {str(insert_error)}")
+                
+                if response:
+                    project_versions.bump(flow_data.project_id, FLOW)
+                    return {
+                        "message": "Flow saved successfully",
+                        "flow_id": response[0]["id"],
+                        "user_id": current_user.supabase_user_id,
+                        "version": 1
+                    }
+                else:
+                    logger.error("Creating flow for project %s returned no row", flow_data.project_id)
+                    raise HTTPException(status_code=400, detail="Failed to save flow - no data returned")
+        
+        raise HTTPException(status_code=409, detail="Flow is being saved concurrently; please retry")
                 
     except HTTPException:
         raise
@@ -125,53 +182,88 @@ async def save_flow(
             detail=f"Failed to save flow: {str(e)}"
         )
 
+@router.post("/ops")
+async def apply_board_ops(
+    ops_data: BoardOps,
+    current_user: AuthenticatedUser = Depends(get_current_user_from_cookies),
+    board_ops: BoardOpsService = Depends(get_board_ops_service),
+    storage: StorageBackend = Depends(get_storage_backend)
+):
+    """
+    Apply a batch of board operations to the flow, docs and links in one request
+    """
+    try:
+        result = await board_ops.apply(
+            project_id=ops_data.project_id,
+            ops=[op.model_dump() for op in ops_data.ops],
+            user=current_user,
+            base_version=ops_data.base_version
+        )
+
+        # Deleted rows may be cached as docs or links; ids are unique across both
+        for cache in (document_cache, link_cache):
+            await cache.invalidate_many(current_user.supabase_user_id, result["deleted"])
+        await FoldersDataService(storage).release_items(result["deleted"], current_user)
+
+        return {
+            "message": "Board updated successfully",
+            **result
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to apply board operations: {str(e)}"
+        )
+
 @router.get("/load/{project_id}")
 async def load_flow(
     project_id: str,
     current_user: AuthenticatedUser = Depends(get_current_user_from_cookies),
-    supabase: Client = Depends(get_supabase_client)
+    storage: StorageBackend = Depends(get_storage_backend)
 ):
     """
     Load a flow state from the database for the authenticated user and project
     """
-    print(f"🔍 FLOWS DEBUG: load_flow called with project_id={project_id}")
-    print(f"🔍 FLOWS DEBUG: current_user={current_user.clerk_user_id if current_user else 'None'}")
-    print(f"🔍 FLOWS DEBUG: supabase_user_id={current_user.supabase_user_id if current_user else 'None'}")
-    
     try:
-        print(f"🔍 FLOWS DEBUG: Checking if flows table exists...")
-        try:
-            # Try to get table info first to check if table exists
-            tables = supabase.table("flows").select("*").limit(1).execute()
-            print(f"🔍 FLOWS DEBUG: Flows table check result: {tables}")
-        except Exception as table_error:
-            print(f"❌ FLOWS DEBUG: Error checking flows table: {table_error}")
-            print(f"❌ FLOWS DEBUG: Error type: {type(table_error)}")
-            raise HTTPException(
-                status_code=500,
-                detail=f"Database error: The flows table might not exist. Error: {str(table_error)}"
+        async def read_flow():
+            try:
+                # Try to get table info first to check if table exists
+                await storage.select("flows", {}, columns="id", limit=1)
+            except Exception as table_error:
+                logger.error("Checking the flows table failed: %s", str(table_error))
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"Database error: The flows table might not exist. Error: {str(table_error)}"
+                )
+            
+            # Get the flow for this user and project
+            return await storage.select(
+                "flows",
+                {"user_id": current_user.supabase_user_id, "project_id": str(project_id)}
             )
         
-        # Get the flow for this user and project
-        print(f"🔍 FLOWS DEBUG: Querying flow for user_id={current_user.supabase_user_id}, project_id={project_id}")
-        response = supabase.table("flows").select("*").eq(
-            "user_id", current_user.supabase_user_id
-        ).eq(
-            "project_id", str(project_id)
-        ).execute()
-        print(f"🔍 FLOWS DEBUG: Query response: {response}")
+        # Identical loads in flight at once (several tabs, refetch on focus)
+        # share one read. This worker's flow counter is part of the key, so a
+        # load that starts after a save never joins one that started before it.
+        # The version returned to clients is the one stored with the flow.
+        cache_version = project_versions.get(project_id, FLOW)
+        response = await flow_reads.do((current_user.supabase_user_id, project_id, cache_version), read_flow)
         
-        if response.data:
-            flow = response.data[0]
-            print(f"✅ FLOWS DEBUG: Flow found with id={flow['id']}")
+        if response:
+            flow = response[0]
+            logger.debug("Loaded flow %s for project %s", flow["id"], project_id)
             return {
                 "message": "Flow loaded successfully",
                 "flow_id": flow["id"],
                 "project_id": flow["project_id"],
                 "flow_state": flow["flow_state"],
+                "version": flow.get("version") or 0,
             }
         else:
-            print(f"ℹ️ FLOWS DEBUG: No flow found for this project, returning empty state")
+            logger.debug("No flow for project %s yet, returning empty state", project_id)
             # Return empty flow state if no flow exists
             return {
                 "message": "No existing flow found, returning empty state",
@@ -179,16 +271,14 @@ async def load_flow(
                     "nodes": [],
                     "edges": [],
                     "viewport": {"x": 0, "y": 0, "zoom": 1}
-                }
+                },
+                "version": 0
             }
             
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ FLOWS DEBUG: Exception in load_flow: {e}")
-        print(f"❌ FLOWS DEBUG: Exception type: {type(e)}")
-        import traceback
-        print(f"❌ FLOWS DEBUG: Traceback: {traceback.format_exc()}")
+        logger.exception("Loading flow for project %s failed", project_id)
         raise HTTPException(
             status_code=500, 
             detail=f"Failed to load flow: {str(e)}"
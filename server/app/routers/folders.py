@@ -0,0 +1,270 @@
+from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional, List, Literal
+from pydantic import BaseModel, Field
+import logging
+from app.auth import get_current_user_from_cookies, AuthenticatedUser
+from app.services.folders_data_service import get_folders_data_service, FoldersDataService
+from app.services.bulk import MAX_BULK_ITEMS
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["folders"])
+
+class FolderCreate(BaseModel):
+    project_id: str
+    title: str = "New Folder"
+    parent_id: Optional[str] = None
+    id: Optional[str] = None  # Keep the id the board already uses for the folder node
+
+class FolderUpdate(BaseModel):
+    title: str
+
+class FolderMove(BaseModel):
+    parent_id: Optional[str] = None  # None moves the folder to the top of the project
+
+class FolderItem(BaseModel):
+    item_id: str
+    item_type: Literal["doc", "link"]
+
+class FolderItemsAdd(BaseModel):
+    items: List[FolderItem] = Field(..., min_length=1, max_length=MAX_BULK_ITEMS)
+
+class FolderItemsRemove(BaseModel):
+    item_ids: List[str] = Field(..., min_length=1, max_length=MAX_BULK_ITEMS)
+
+@router.post("/create")
+async def create_folder(
+    folder_data: FolderCreate,
+    current_user: AuthenticatedUser = Depends(get_current_user_from_cookies),
+    folders_service: FoldersDataService = Depends(get_folders_data_service)
+):
+    """
+    Create a folder, optionally inside another folder, for the authenticated user
+    """
+    try:
+        result = await folders_service.create_folder(
+            project_id=folder_data.project_id,
+            title=folder_data.title,
+            user=current_user,
+            parent_id=folder_data.parent_id,
+            folder_id=folder_data.id
+        )
+
+        return {
+            "message": "Folder created successfully",
+            "folder": result
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to create folder: {str(e)}"
+        )
+
+@router.get("/list/{project_id}")
+async def list_folders(
+    project_id: str,
+    current_user: AuthenticatedUser = Depends(get_current_user_from_cookies),
+    folders_service: FoldersDataService = Depends(get_folders_data_service)
+):
+    """
+    List every folder of a project with its item counts
+    """
+    try:
+        result = await folders_service.list_folders(project_id=project_id, user=current_user)
+
+        return {
+            "message": "Folders retrieved successfully",
+            "folders": result
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to retrieve folders: {str(e)}"
+        )
+
+@router.get("/get/{folder_id}")
+async def get_folder(
+    folder_id: str,
+    recursive: bool = True,
+    current_user: AuthenticatedUser = Depends(get_current_user_from_cookies),
+    folders_service: FoldersDataService = Depends(get_folders_data_service)
+):
+    """
+    Get a folder with its subfolders and items, the whole subtree unless recursive=false
+    """
+    try:
+        result = await folders_service.get_folder_contents(
+            folder_id=folder_id,
+            user=current_user,
+            recursive=recursive
+        )
+
+        return {
+            "message": "Folder retrieved successfully",
+            **result
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to retrieve folder: {str(e)}"
+        )
+
+@router.put("/update/{folder_id}")
+async def update_folder(
+    folder_id: str,
+    folder_data: FolderUpdate,
+    current_user: AuthenticatedUser = Depends(get_current_user_from_cookies),
+    folders_service: FoldersDataService = Depends(get_folders_data_service)
+):
+    """
+    Rename a folder for the authenticated user
+    """
+    try:
+        result = await folders_service.rename_folder(
+            folder_id=folder_id,
+            title=folder_data.title,
+            user=current_user
+        )
+
+        return {
+            "message": "Folder updated successfully",
+            "folder": result
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to update folder: {str(e)}"
+        )
+
+@router.post("/move/{folder_id}")
+async def move_folder(
+    folder_id: str,
+    move_data: FolderMove,
+    current_user: AuthenticatedUser = Depends(get_current_user_from_cookies),
+    folders_service: FoldersDataService = Depends(get_folders_data_service)
+):
+    """
+    Move a folder and everything in it under another folder, or to the top of the project
+    """
+    try:
+        result = await folders_service.move_folder(
+            folder_id=folder_id,
+            parent_id=move_data.parent_id,
+            user=current_user
+        )
+
+        return {
+            "message": "Folder moved successfully",
+            "folder": result
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to move folder: {str(e)}"
+        )
+
+@router.delete("/delete/{folder_id}")
+async def delete_folder(
+    folder_id: str,
+    delete_items: bool = False,
+    current_user: AuthenticatedUser = Depends(get_current_user_from_cookies),
+    folders_service: FoldersDataService = Depends(get_folders_data_service)
+):
+    """
+    Delete a folder and its subfolders; their docs and links move up a level unless delete_items=true
+    """
+    try:
+        result = await folders_service.delete_folder(
+            folder_id=folder_id,
+            user=current_user,
+            delete_items=delete_items
+        )
+
+        return {
+            "message": "Folder deleted successfully",
+            **result
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to delete folder: {str(e)}"
+        )
+
+@router.post("/items/{folder_id}")
+async def add_folder_items(
+    folder_id: str,
+    items_data: FolderItemsAdd,
+    current_user: AuthenticatedUser = Depends(get_current_user_from_cookies),
+    folders_service: FoldersDataService = Depends(get_folders_data_service)
+):
+    """
+    Put docs and links into a folder, taking them out of their current folder
+    """
+    try:
+        result = await folders_service.add_items(
+            folder_id=folder_id,
+            items=[(item.item_type, item.item_id) for item in items_data.items],
+            user=current_user
+        )
+
+        return {
+            "message": "Folder items added successfully",
+            "folder": result
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to add folder items: {str(e)}"
+        )
+
+@router.post("/items/{folder_id}/remove")
+async def remove_folder_items(
+    folder_id: str,
+    items_data: FolderItemsRemove,
+    current_user: AuthenticatedUser = Depends(get_current_user_from_cookies),
+    folders_service: FoldersDataService = Depends(get_folders_data_service)
+):
+    """
+    Take docs and links out of a folder
+    """
+    try:
+        result = await folders_service.remove_items(
+            folder_id=folder_id,
+            item_ids=items_data.item_ids,
+            user=current_user
+        )
+
+        return {
+            "message": "Folder items removed successfully",
+            "folder": result
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to remove folder items: {str(e)}"
+        )
@@ -0,0 +1,194 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, Query
+from fastapi.responses import FileResponse
+from typing import Optional
+import logging
+from app.auth import get_current_user_from_cookies, AuthenticatedUser
+from app.services.image_service import get_image_service, ImageService, pick_variant, media_type, ORIGINAL
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["images"])
+
+# Variant files never change once written, so browsers may keep them
+IMMUTABLE = "private, max-age=31536000, immutable"
+
+@router.post("/upload")
+async def upload_image(
+    request: Request,
+    project_id: str,
+    filename: str = "image",
+    current_user: AuthenticatedUser = Depends(get_current_user_from_cookies),
+    image_service: ImageService = Depends(get_image_service)
+):
+    """
+    Upload an image (the raw file as the request body) and create its display variants
+    """
+    content_type = request.headers.get("content-type", "")
+    if not content_type.startswith("image/"):
+        raise HTTPException(status_code=415, detail="Upload the image file itself with an image/* content type")
+
+    try:
+        result = await image_service.upload_image(
+            project_id=project_id,
+            filename=filename,
+            content_type=content_type,
+            data=await request.body(),
+            user=current_user
+        )
+
+        return {
+            "message": "Image uploaded successfully",
+            "image": result
+        }
+
+    except HTTPException as he:
+        logger.info("Image upload rejected: %s", he.detail)
+        raise
+    except Exception as e:
+        logger.error("Unexpected error in upload_image: %s", e, exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to upload image: {str(e)}"
+        )
+
+@router.get("/list/{project_id}")
+async def list_images(
+    project_id: str,
+    current_user: AuthenticatedUser = Depends(get_current_user_from_cookies),
+    image_service: ImageService = Depends(get_image_service)
+):
+    """
+    List a project's images with their dimensions and available variants
+    """
+    try:
+        result = await image_service.list_images(project_id=project_id, user=current_user)
+
+        return {
+            "message": "Images retrieved successfully",
+            "images": result
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to retrieve images: {str(e)}"
+        )
+
+@router.get("/get/{image_id}")
+async def get_image(
+    image_id: str,
+    current_user: AuthenticatedUser = Depends(get_current_user_from_cookies),
+    image_service: ImageService = Depends(get_image_service)
+):
+    """
+    Get an image's metadata (dimensions, EXIF fields, variants)
+    """
+    try:
+        result = await image_service.get_image(image_id=image_id, user=current_user)
+
+        return {
+            "message": "Image retrieved successfully",
+            "image": result
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to retrieve image: {str(e)}"
+        )
+
+@router.get("/view/{image_id}")
+async def view_image(
+    image_id: str,
+    width: Optional[float] = Query(None, gt=0, allow_inf_nan=False),
+    zoom: float = Query(1.0, gt=0, allow_inf_nan=False),
+    dpr: float = Query(1.0, gt=0, allow_inf_nan=False),
+    current_user: AuthenticatedUser = Depends(get_current_user_from_cookies),
+    image_service: ImageService = Depends(get_image_service)
+):
+    """
+    Serve the smallest variant that covers the node's on-screen size: width in canvas units, times zoom and dpr
+    """
+    try:
+        image = await image_service.get_image(image_id=image_id, user=current_user)
+        variant = pick_variant(image["variants"], width, zoom, dpr)
+        return FileResponse(
+            image_service.path(image, variant["name"]),
+            media_type="image/webp",
+            headers={"Cache-Control": "private, max-age=86400", "X-Image-Variant": variant["name"]}
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to load image: {str(e)}"
+        )
+
+@router.get("/view/{image_id}/{variant}")
+async def view_image_variant(
+    image_id: str,
+    variant: str,
+    current_user: AuthenticatedUser = Depends(get_current_user_from_cookies),
+    image_service: ImageService = Depends(get_image_service)
+):
+    """
+    Serve one named variant (or the original upload as "original")
+    """
+    try:
+        image = await image_service.get_image(image_id=image_id, user=current_user)
+        if variant == ORIGINAL:
+            # Downloaded, never rendered in place: the bytes are the uploader's
+            return FileResponse(
+                image_service.path(image, ORIGINAL),
+                media_type=media_type(image),
+                filename=image.get("filename") or "image",
+                content_disposition_type="attachment",
+                headers={"Cache-Control": IMMUTABLE, "X-Content-Type-Options": "nosniff"}
+            )
+        if variant not in {v["name"] for v in image["variants"]}:
+            raise HTTPException(status_code=404, detail="Image variant not found")
+        return FileResponse(
+            image_service.path(image, variant),
+            media_type="image/webp",
+            headers={"Cache-Control": IMMUTABLE}
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to load image: {str(e)}"
+        )
+
+@router.delete("/delete/{image_id}")
+async def delete_image(
+    image_id: str,
+    current_user: AuthenticatedUser = Depends(get_current_user_from_cookies),
+    image_service: ImageService = Depends(get_image_service)
+):
+    """
+    Delete an image for the authenticated user
+    """
+    try:
+        result = await image_service.delete_image(image_id=image_id, user=current_user)
+
+        return {
+            "message": "Image deleted successfully",
+            "deleted": result
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to delete image: {str(e)}"
+        )
@@ -1,13 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from typing import Optional, Dict, Any
-from pydantic import BaseModel
+from typing import Optional, Dict, Any, List
+from pydantic import BaseModel, Field
 from supabase import Client
 import logging
 from app.auth import get_current_user_from_cookies, get_supabase_client, AuthenticatedUser
 from app.services.links_data_service import get_links_data_service, LinksDataService
+from app.services.bulk import bulk_response, MAX_BULK_ITEMS
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Set up logging
 logger = logging.getLogger(__name__)
 
 router = APIRouter(tags=["links"])
@@ -21,6 +21,18 @@ class LinkUpdate(BaseModel):
     url: Optional[str] = None
     string: Optional[str] = None
 
+class LinkBulkCreate(BaseModel):
+    links: List[LinkCreate] = Field(..., min_length=1, max_length=MAX_BULK_ITEMS)
+
+class LinkBulkUpdateItem(LinkUpdate):
+    id: str
+
+class LinkBulkUpdate(BaseModel):
+    links: List[LinkBulkUpdateItem] = Field(..., min_length=1, max_length=MAX_BULK_ITEMS)
+
+class LinkBulkDelete(BaseModel):
+    link_ids: List[str] = Field(..., min_length=1, max_length=MAX_BULK_ITEMS)
+
 @router.post("/create")
 async def create_link(
     link_data: LinkCreate,
@@ -31,24 +43,20 @@ async def create_link(
     Create a new link for the authenticated user
     """
     try:
-        logger.info(f"Creating link for user {current_user.supabase_user_id}")
-        logger.debug(f"Link data: {link_data}")
-        
-        result = links_service.create_link(
+        result = await links_service.create_link(
             project_id=link_data.project_id,
             url=link_data.url,
             string=link_data.string,
             user=current_user
         )
         
-        logger.info(f"Link created successfully: {result}")
         return {
             "message": "Link created successfully",
             "link": result
         }
         
     except HTTPException as he:
-        logger.error(f"HTTP Exception in create_link: {he.detail}")
+        logger.info("Link creation rejected: %s", he.detail)
         raise
     except Exception as e:
         logger.error(f"Unexpected error in create_link: {str(e)}", exc_info=True)
@@ -68,7 +76,7 @@ async def update_link(
     Update an existing link for the authenticated user
     """
     try:
-        result = links_service.update_link(
+        result = await links_service.update_link(
             link_id=link_id,
             url=link_data.url,
             string=link_data.string,
@@ -98,7 +106,7 @@ async def get_link(
     Get a link by ID for the authenticated user
     """
     try:
-        result = links_service.get_link(
+        result = await links_service.get_link(
             link_id=link_id,
             user=current_user
         )
@@ -126,7 +134,7 @@ async def delete_link(
     Delete a link for the authenticated user
     """
     try:
-        result = links_service.delete_link(
+        result = await links_service.delete_link(
             link_id=link_id,
             user=current_user
         )
@@ -142,4 +150,79 @@ async def delete_link(
         raise HTTPException(
             status_code=500,
             detail=f"Failed to delete link: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+@router.post("/bulk/create")
+async def create_links(
+    bulk_data: LinkBulkCreate,
+    current_user: AuthenticatedUser = Depends(get_current_user_from_cookies),
+    links_service: LinksDataService = Depends(get_links_data_service)
+):
+    """
+    Create many links for the authenticated user in one request
+    """
+    try:
+        results = await links_service.create_links(
+            items=[item.model_dump() for item in bulk_data.links],
+            user=current_user
+        )
+        
+        return bulk_response(results, "Links", "created")
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to create links: {str(e)}"
+        )
+
+@router.put("/bulk/update")
+async def update_links(
+    bulk_data: LinkBulkUpdate,
+    current_user: AuthenticatedUser = Depends(get_current_user_from_cookies),
+    links_service: LinksDataService = Depends(get_links_data_service)
+):
+    """
+    Update many links for the authenticated user in one request
+    """
+    try:
+        results = await links_service.update_links(
+            items=[item.model_dump() for item in bulk_data.links],
+            user=current_user
+        )
+        
+        return bulk_response(results, "Links", "updated")
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to update links: {str(e)}"
+        )
+
+@router.post("/bulk/delete")
+async def delete_links(
+    bulk_data: LinkBulkDelete,
+    current_user: AuthenticatedUser = Depends(get_current_user_from_cookies),
+    links_service: LinksDataService = Depends(get_links_data_service)
+):
+    """
+    Delete many links for the authenticated user in one request
+    """
+    try:
+        results = await links_service.delete_links(
+            link_ids=bulk_data.link_ids,
+            user=current_user
+        )
+        
+        return bulk_response(results, "Links", "deleted")
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to delete links: {str(e)}"
+        )
@@ -1,10 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import Optional, Dict, Any
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from typing import Optional, Dict, Any, List
+from pydantic import BaseModel, Field
 from supabase import Client
 import logging
 from app.auth import get_current_user_from_cookies, get_supabase_client, AuthenticatedUser
 from app.services.projects_data_service import get_project_data_service, ProjectDataService
+from app.services.bulk import bulk_response, MAX_BULK_ITEMS
+from app.services.project_archive_service import (
+    get_project_archive_service,
+    ProjectArchiveService,
+    ARCHIVE_MEDIA_TYPE,
+)
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -17,6 +25,21 @@ class ProjectCreate(BaseModel):
 class ProjectUpdate(BaseModel):
     project_name: str
 
+class ProjectBulkCreate(BaseModel):
+    projects: List[ProjectCreate] = Field(..., min_length=1, max_length=MAX_BULK_ITEMS)
+
+class ProjectBulkUpdateItem(ProjectUpdate):
+    id: str
+
+class ProjectBulkUpdate(BaseModel):
+    projects: List[ProjectBulkUpdateItem] = Field(..., min_length=1, max_length=MAX_BULK_ITEMS)
+
+class ProjectBulkDelete(BaseModel):
+    project_ids: List[str] = Field(..., min_length=1, max_length=MAX_BULK_ITEMS)
+
+class ProjectClone(BaseModel):
+    project_name: Optional[str] = None
+
 @router.post("/create")
 async def create_project(
     project_data: ProjectCreate,
@@ -26,24 +49,23 @@ async def create_project(
     """
     Create a new project for the authenticated user
     """
-    logger.info(f"POST /create - Creating project: {project_data.project_name} for user: {current_user.supabase_user_id}")
     try:
-        result = projects_service.create_project(
+        result = await projects_service.create_project(
             project_name=project_data.project_name,
             user=current_user
         )
         
-        logger.info(f"POST /create - Project created successfully: {result.get('id', 'unknown')}")
+        logger.info("Created project %s for user %s", result.get("id", "unknown"), current_user.supabase_user_id)
         return {
             "message": "Project created successfully",
             "project": result
         }
         
     except HTTPException as e:
-        logger.error(f"POST /create - HTTPException: {e.detail}")
+        logger.error("POST /create - HTTPException: %s", e.detail)
         raise
     except Exception as e:
-        logger.error(f"POST /create - Exception: {str(e)}")
+        logger.error("POST /create - Exception: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Failed to create project: {str(e)}"
@@ -59,25 +81,25 @@ async def update_project(
     """
     Update an existing project for the authenticated user
     """
-    logger.info(f"PUT /update/{project_id} - Updating project: {project_data.project_name} for user: {current_user.supabase_user_id}")
+    logger.info("PUT /update/%s - Updating project: %s for user: %s", project_id, project_data.project_name, current_user.supabase_user_id)
     try:
-        result = projects_service.update_project(
+        result = await projects_service.update_project(
             project_id=project_id,
             project_name=project_data.project_name,
             user=current_user
         )
         
-        logger.info(f"PUT /update/{project_id} - Project updated successfully")
+        logger.info("PUT /update/%s - Project updated successfully", project_id)
         return {
             "message": "Project updated successfully",
             "project": result
         }
         
     except HTTPException as e:
-        logger.error(f"PUT /update/{project_id} - HTTPException: {e.detail}")
+        logger.error("PUT /update/%s - HTTPException: %s", project_id, e.detail)
         raise
     except Exception as e:
-        logger.error(f"PUT /update/{project_id} - Exception: {str(e)}")
+        logger.error("PUT /update/%s - Exception: %s", project_id, e)
         raise HTTPException(
             status_code=500,
             detail=f"Failed to update project: {str(e)}"
@@ -92,24 +114,24 @@ async def get_project(
     """
     Get a project by ID for the authenticated user
     """
-    logger.info(f"GET /get/{project_id} - Getting project for user: {current_user.supabase_user_id}")
+    logger.info("GET /get/%s - Getting project for user: %s", project_id, current_user.supabase_user_id)
     try:
-        result = projects_service.get_project(
+        result = await projects_service.get_project(
             project_id=project_id,
             user=current_user
         )
         
-        logger.info(f"GET /get/{project_id} - Project retrieved successfully")
+        logger.info("GET /get/%s - Project retrieved successfully", project_id)
         return {
             "message": "Project retrieved successfully",
             "project": result
         }
         
     except HTTPException as e:
-        logger.error(f"GET /get/{project_id} - HTTPException: {e.detail}")
+        logger.error("GET /get/%s - HTTPException: %s", project_id, e.detail)
         raise
     except Exception as e:
-        logger.error(f"GET /get/{project_id} - Exception: {str(e)}")
+        logger.error("GET /get/%s - Exception: %s", project_id, e)
         raise HTTPException(
             status_code=500,
             detail=f"Failed to retrieve project: {str(e)}"
@@ -123,21 +145,21 @@ async def get_user_projects(
     """
     Get all projects for the authenticated user
     """
-    logger.info(f"GET /list - Getting all projects for user: {current_user.supabase_user_id}")
+    logger.info("GET /list - Getting all projects for user: %s", current_user.supabase_user_id)
     try:
-        result = projects_service.get_user_projects(user=current_user)
+        result = await projects_service.get_user_projects(user=current_user)
         
-        logger.info(f"GET /list - Retrieved {len(result)} projects for user")
+        logger.info("GET /list - Retrieved %d projects for user", len(result))
         return {
             "message": "Projects retrieved successfully",
             "projects": result
         }
         
     except HTTPException as e:
-        logger.error(f"GET /list - HTTPException: {e.detail}")
+        logger.error("GET /list - HTTPException: %s", e.detail)
         raise
     except Exception as e:
-        logger.error(f"GET /list - Exception: {str(e)}")
+        logger.error("GET /list - Exception: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Failed to retrieve projects: {str(e)}"
@@ -152,25 +174,209 @@ async def delete_project(
     """
     Delete a project for the authenticated user
     """
-    logger.info(f"DELETE /delete/{project_id} - Deleting project for user: {current_user.supabase_user_id}")
+    logger.info("DELETE /delete/%s - Deleting project for user: %s", project_id, current_user.supabase_user_id)
     try:
-        result = projects_service.delete_project(
+        result = await projects_service.delete_project(
             project_id=project_id,
             user=current_user
         )
         
-        logger.info(f"DELETE /delete/{project_id} - Project deleted successfully")
+        logger.info("DELETE /delete/%s - Project deleted successfully", project_id)
         return {
             "message": "Project deleted successfully",
             "deleted": result
         }
         
     except HTTPException as e:
-        logger.error(f"DELETE /delete/{project_id} - HTTPException: {e.detail}")
+        logger.error("DELETE /delete/%s - HTTPException: %s", project_id, e.detail)
         raise
     except Exception as e:
-        logger.error(f"DELETE /delete/{project_id} - Exception: {str(e)}")
+        logger.error("DELETE /delete/%s - Exception: %s", project_id, e)
         raise HTTPException(
             status_code=500,
             detail=f"Failed to delete project: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+@router.post("/bulk/create")
+async def create_projects(
+    bulk_data: ProjectBulkCreate,
+    current_user: AuthenticatedUser = Depends(get_current_user_from_cookies),
+    projects_service: ProjectDataService = Depends(get_project_data_service)
+):
+    """
+    Create many projects for the authenticated user in one request
+    """
+    try:
+        results = await projects_service.create_projects(
+            items=[item.model_dump() for item in bulk_data.projects],
+            user=current_user
+        )
+        
+        return bulk_response(results, "Projects", "created")
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to create projects: {str(e)}"
+        )
+
+@router.put("/bulk/update")
+async def update_projects(
+    bulk_data: ProjectBulkUpdate,
+    current_user: AuthenticatedUser = Depends(get_current_user_from_cookies),
+    projects_service: ProjectDataService = Depends(get_project_data_service)
+):
+    """
+    Update many projects for the authenticated user in one request
+    """
+    try:
+        results = await projects_service.update_projects(
+            items=[item.model_dump() for item in bulk_data.projects],
+            user=current_user
+        )
+        
+        return bulk_response(results, "Projects", "updated")
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to update projects: {str(e)}"
+        )
+
+@router.post("/bulk/delete")
+async def delete_projects(
+    bulk_data: ProjectBulkDelete,
+    current_user: AuthenticatedUser = Depends(get_current_user_from_cookies),
+    projects_service: ProjectDataService = Depends(get_project_data_service)
+):
+    """
+    Delete many projects for the authenticated user in one request
+    """
+    try:
+        results = await projects_service.delete_projects(
+            project_ids=bulk_data.project_ids,
+            user=current_user
+        )
+        
+        return bulk_response(results, "Projects", "deleted")
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to delete projects: {str(e)}"
+        )
+
+@router.get("/export/{project_id}")
+async def export_project(
+    project_id: str,
+    current_user: AuthenticatedUser = Depends(get_current_user_from_cookies),
+    archive_service: ProjectArchiveService = Depends(get_project_archive_service)
+):
+    """
+    Stream a project's flow, docs and links as a compressed archive
+    """
+    logger.info("GET /export/%s - Exporting project for user: %s", project_id, current_user.supabase_user_id)
+    try:
+        project = await run_in_threadpool(
+            archive_service.get_project,
+            project_id=project_id,
+            user=current_user
+        )
+
+        return StreamingResponse(
+            archive_service.export_project(project=project, user=current_user),
+            media_type=ARCHIVE_MEDIA_TYPE,
+            headers={"Content-Disposition": f'attachment; filename="project-{project_id}.ndjson.gz"'}
+        )
+
+    except HTTPException as e:
+        logger.error("GET /export/%s - HTTPException: %s", project_id, e.detail)
+        raise
+    except Exception as e:
+        logger.error("GET /export/%s - Exception: %s", project_id, e)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to export project: {str(e)}"
+        )
+
+@router.post("/import")
+async def import_project(
+    request: Request,
+    project_name: Optional[str] = None,
+    current_user: AuthenticatedUser = Depends(get_current_user_from_cookies),
+    archive_service: ProjectArchiveService = Depends(get_project_archive_service)
+):
+    """
+    Create a new project from an archive streamed in the request body
+    """
+    logger.info("POST /import - Importing project for user: %s", current_user.supabase_user_id)
+    try:
+        result = await archive_service.import_project(
+            chunks=request.stream(),
+            user=current_user,
+            project_name=project_name
+        )
+
+        logger.info("POST /import - Imported project %s with %d docs and %d links", result['project'].get('id', 'unknown'), result['docs'], result['links'])
+        return {
+            "message": "Project imported successfully",
+            **result
+        }
+
+    except HTTPException as e:
+        logger.error("POST /import - HTTPException: %s", e.detail)
+        raise
+    except Exception as e:
+        logger.error("POST /import - Exception: %s", e)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to import project: {str(e)}"
+        )
+
+@router.post("/{project_id}/clone")
+async def clone_project(
+    project_id: str,
+    clone_data: Optional[ProjectClone] = None,
+    current_user: AuthenticatedUser = Depends(get_current_user_from_cookies),
+    archive_service: ProjectArchiveService = Depends(get_project_archive_service)
+):
+    """
+    Duplicate a project with its flow, docs and links for the authenticated user
+    """
+    logger.info("POST /%s/clone - Cloning project for user: %s", project_id, current_user.supabase_user_id)
+    try:
+        project = await run_in_threadpool(
+            archive_service.get_project,
+            project_id=project_id,
+            user=current_user
+        )
+
+        # Many round trips on the synchronous client; keep them off the event loop
+        result = await run_in_threadpool(
+            archive_service.clone_project,
+            project=project,
+            user=current_user,
+            project_name=clone_data.project_name if clone_data else None
+        )
+
+        logger.info("POST /%s/clone - Cloned to %s with %d docs and %d links", project_id, result['project'].get('id', 'unknown'), result['docs'], result['links'])
+        return {
+            "message": "Project cloned successfully",
+            **result
+        }
+
+    except HTTPException as e:
+        logger.error("POST /%s/clone - HTTPException: %s", project_id, e.detail)
+        raise
+    except Exception as e:
+        logger.error("POST /%s/clone - Exception: %s", project_id, e)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to clone project: {str(e)}"
+        )
@@ -2,23 +2,16 @@ from fastapi import APIRouter, HTTPException, Header, Request
 from pydantic import BaseModel
 import os
 import json
-from dotenv import load_dotenv
-from clerk_backend_api import Clerk
-from supabase import create_client, Client
+import hashlib
+import logging
+from app.clients import clients
+from app.services.clerk_webhook_service import clerk_webhooks, verify_svix_signature, InvalidSignature, HANDLED_EVENTS
+from app.metrics import CLERK, SUPABASE_AUTH, timed
 
-# Load environment variables from .env file
-load_dotenv()
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/users", tags=["users"])
 
-# Initialize Clerk SDK
-clerk = Clerk(bearer_auth=os.getenv("CLERK_SECRET_KEY"))
-
-# Initialize Supabase client with service role key for admin operations
-supabase_url = os.getenv("SUPABASE_URL")
-supabase_service_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-supabase: Client = create_client(supabase_url, supabase_service_key)
-
 class SignupRequest(BaseModel):
     username: str
     password: str
@@ -28,13 +21,14 @@ def signup_user(request: SignupRequest):
     """Manual signup endpoint (if needed)"""
     try:
         # Create user in Clerk
-        clerk_user = clerk.users.create_user(
+        clerk_user = timed(
+            CLERK, "users.create_user", clients.clerk().users.create_user,
             email_address=[request.username],
             password=request.password
         )
         
         # Create user in Supabase Auth using admin client
-        auth_response = supabase.auth.admin.create_user({
+        auth_response = timed(SUPABASE_AUTH, "create_user", clients.supabase().auth.admin.create_user, {
             "email": request.username,
             "password": request.password,
             "user_metadata": {
@@ -57,104 +51,43 @@ def signup_user(request: SignupRequest):
 async def clerk_webhook(request: Request):
     """
     Webhook endpoint to handle Clerk events
-    This will be called by Clerk after user operations
+    This will be called by Clerk after user operations. The event is
+    verified and queued here, and applied to Supabase in the background,
+    so Clerk gets its answer before its delivery timeout.
     """
+    # Get the raw body
+    body = await request.body()
+
     try:
-        # Get the raw body
-        body = await request.body()
-        
-        # Verify webhook signature (recommended for production)
+        # Verify the Svix signature; unsigned events are only taken when a
+        # local setup opts in explicitly, since they rewrite user accounts
         webhook_secret = os.getenv("CLERK_WEBHOOK_SECRET")
         if webhook_secret:
-            # In production, add proper signature verification here
-            # svix library can be used for this
-            pass
-        
+            event_id = verify_svix_signature(webhook_secret, request.headers, body)
+        elif os.getenv("CLERK_WEBHOOK_INSECURE", "0").lower() in ("1", "true", "yes"):
+            event_id = request.headers.get("svix-id") or hashlib.sha256(body).hexdigest()
+        else:
+            logger.error("Rejected Clerk webhook: CLERK_WEBHOOK_SECRET is not set")
+            raise HTTPException(status_code=503, detail="Webhook signing secret is not configured")
+    except InvalidSignature as e:
+        raise HTTPException(status_code=401, detail=f"Invalid webhook signature: {str(e)}")
+
+    try:
         # Parse the webhook payload
         payload = json.loads(body)
         event_type = payload.get("type")
-        
-        if event_type == "user.created":
-            user_data = payload.get("data")
-            
-            # Extract user information from Clerk webhook
-            clerk_user_id = user_data.get("id")
-            
-            # Safely extract email from email_addresses array
-            email_addresses = user_data.get("email_addresses", [])
-            email = None
-            if email_addresses and len(email_addresses) > 0:
-                email = email_addresses[0].get("email_address")
-            
-            first_name = user_data.get("first_name")
-            last_name = user_data.get("last_name")
-            
-            if not email:
-                print(f"Warning: No email found for Clerk user {clerk_user_id}, skipping Supabase user creation")
-                return {"message": "Webhook received but no email found, skipped user creation"}
-            
-            # Create user in Supabase Auth using admin client
-            auth_response = supabase.auth.admin.create_user({
-                "email": email,
-                "email_confirm": True,  # Auto-confirm since they signed up via Clerk
-                "user_metadata": {
-                    "clerk_user_id": clerk_user_id,
-                    "first_name": first_name,
-                    "last_name": last_name,
-                    "created_via": "clerk"
-                }
-            })
-            
-            print(f"Created Supabase user: {auth_response.user.id} for Clerk user: {clerk_user_id}")
-            return {"message": "User created in Supabase successfully", "supabase_user_id": auth_response.user.id}
-        
-        elif event_type == "user.updated":
-            user_data = payload.get("data")
-            clerk_user_id = user_data.get("id")
-            
-            # Find the Supabase user by clerk_user_id in metadata
-            users_response = supabase.auth.admin.list_users()
-            supabase_user = None
-            
-            for user in users_response:
-                if user.user_metadata and user.user_metadata.get("clerk_user_id") == clerk_user_id:
-                    supabase_user = user
-                    break
-            
-            if supabase_user:
-                # Update user metadata in Supabase
-                supabase.auth.admin.update_user_by_id(
-                    supabase_user.id,
-                    {
-                        "user_metadata": {
-                            **supabase_user.user_metadata,
-                            "first_name": user_data.get("first_name"),
-                            "last_name": user_data.get("last_name")
-                        }
-                    }
-                )
-                return {"message": "User updated in Supabase successfully"}
-            else:
-                return {"message": "User not found in Supabase"}
-        
-        elif event_type == "user.deleted":
-            user_data = payload.get("data")
-            clerk_user_id = user_data.get("id")
-            
-            # Find and delete the Supabase user
-            users_response = supabase.auth.admin.list_users()
-            
-            for user in users_response:
-                if user.user_metadata and user.user_metadata.get("clerk_user_id") == clerk_user_id:
-                    supabase.auth.admin.delete_user(user.id)
-                    return {"message": "User deleted from Supabase successfully"}
-            
-            return {"message": "User not found in Supabase"}
-        
-        return {"message": f"Webhook received: {event_type}"}
-    
+        if event_type not in HANDLED_EVENTS:
+            return {"message": f"Webhook received: {event_type}"}
+
+        # A redelivery of an event we already have is acknowledged and dropped
+        queued = await clerk_webhooks.enqueue(event_id, payload)
+        return {
+            "message": "Webhook queued successfully" if queued else "Webhook already received",
+            "event_id": event_id
+        }
+
     except Exception as e:
-        print(f"Webhook error: {str(e)}")
+        logger.exception("Clerk webhook failed")
         raise HTTPException(status_code=400, detail=f"Webhook processing failed: {str(e)}")
 
 @router.get("/verify")
@@ -171,7 +104,7 @@ def verify_user(authorization: str = Header(None)):
         # Verify the token with Clerk SDK
         try:
             # Use Clerk's JWT verification which handles all token types
-            jwt_payload = clerk.jwt_templates.verify_token(token)
+            jwt_payload = timed(CLERK, "verify_token", clients.clerk().jwt_templates.verify_token, token)
             clerk_user_id = jwt_payload.get("sub")
             
             if not clerk_user_id:
@@ -181,7 +114,7 @@ def verify_user(authorization: str = Header(None)):
             raise HTTPException(status_code=401, detail=f"Token verification failed: {str(e)}")
         
         # Find user in Supabase Auth by clerk_user_id
-        users_response = supabase.auth.admin.list_users()
+        users_response = timed(SUPABASE_AUTH, "list_users", clients.supabase().auth.admin.list_users)
         
         for user in users_response:
             if user.user_metadata and user.user_metadata.get("clerk_user_id") == clerk_user_id:
@@ -0,0 +1,425 @@
+import os
+import time
+import uuid
+import socket
+import shutil
+import asyncio
+import hashlib
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional, Dict, Any, List
+from fastapi import Depends
+from starlette.concurrency import run_in_threadpool
+import logging
+
+from ..auth import AuthenticatedUser
+from .. import metrics
+from ..clients import clients
+from .storage_backend import get_storage_backend, StorageBackend
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+BLOBS = "blobs"
+BLOB_REFS = "blob_refs"
+WORKER_LEASES = "worker_leases"
+
+GC_LEASE = "blob_gc"
+
+blob_puts = metrics.Counter(
+    "blob_puts_total", "Uploads stored as a new blob or resolved to an existing one", ("outcome",)
+)
+blobs_collected = metrics.Counter("blobs_collected_total", "Blobs deleted after their last reference went away")
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _age_seconds(timestamp: Optional[str]) -> float:
+    if not timestamp:
+        return float("inf")
+    return time.time() - datetime.fromisoformat(str(timestamp).replace("Z", "+00:00")).timestamp()
+
+
+class LocalBlobBackend:
+    """
+    Blob files on the local filesystem, fanned out by digest prefix
+    (ab/cd/abcd...). Files derived from a blob (image variants, extracted
+    text) sit in a directory next to it and go when it goes. Writes land
+    in a temporary file first, so a reader never sees half a blob.
+    """
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def path(self, digest: str, name: Optional[str] = None) -> Path:
+        if len(digest) != 64 or any(c not in "0123456789abcdef" for c in digest):
+            raise ValueError(f"Invalid blob digest: {digest!r}")
+        base = self.root / digest[:2] / digest[2:4] / digest
+        if name is None:
+            return base
+        if "/" in name or name.startswith("."):
+            raise ValueError(f"Invalid derived file name: {name!r}")
+        return base.with_name(f"{digest}.d") / name
+
+    def _write(self, path: Path, data: bytes):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        temporary.write_bytes(data)
+        os.replace(temporary, path)
+
+    def put(self, digest: str, data: bytes) -> bool:
+        """Store a blob unless it is already there; True if it was written"""
+        path = self.path(digest)
+        written = not (path.exists() and path.stat().st_size == len(data))
+        if written:
+            self._write(path, data)
+        # Stamped with the precise time either way (file times are coarser),
+        # so a collection that just dropped the row keeps the file
+        now = time.time()
+        try:
+            os.utime(path, (now, now))
+        except FileNotFoundError:
+            self._write(path, data)
+            written = True
+        return written
+
+    def put_derived(self, digest: str, name: str, data: bytes):
+        self._write(self.path(digest, name), data)
+
+    def delete(self, digest: str, unless_written_since: Optional[float] = None) -> bool:
+        """
+        Remove a blob and its derived files; with unless_written_since, keep
+        them if the blob was written or touched since then. True if removed.
+        """
+        path = self.path(digest)
+        if unless_written_since is not None:
+            try:
+                if path.stat().st_mtime >= unless_written_since:
+                    return False
+            except FileNotFoundError:
+                pass
+        path.unlink(missing_ok=True)
+        shutil.rmtree(path.with_name(f"{digest}.d"), ignore_errors=True)
+        return True
+
+
+_local_backend: Optional[LocalBlobBackend] = None
+
+
+def blob_backend() -> LocalBlobBackend:
+    global _local_backend
+    if _local_backend is None:
+        _local_backend = LocalBlobBackend(os.getenv("BLOB_DIR", "media/blobs"))
+    return _local_backend
+
+
+# Recounts of one blob's references are applied one at a time on this worker
+_blob_locks: Dict[str, asyncio.Lock] = {}
+
+
+def _blob_lock(digest: str) -> asyncio.Lock:
+    return _blob_locks.setdefault(digest, asyncio.Lock())
+
+
+class BlobStore:
+    """
+    Content-addressed storage for uploaded files. A blob is keyed by the
+    SHA-256 of its bytes, so the same file uploaded into any number of
+    projects is stored, and processed, once. Tables:
+
+    - blobs: sha256, size, content_type, ref_count, referenced_at and
+      derived, the results of processing the blob (image variants and
+      metadata today, extracted text later) keyed by kind
+    - blob_refs: one row per thing using a blob (owner_type, owner_id and
+      the project it is in, so deleting a project releases them at once)
+
+    ref_count caches the number of blob_refs rows. Garbage collection
+    deletes blobs that have had no references for longer than a grace
+    period. Every upload and every recount moves referenced_at, and a blob
+    is only deleted if its row still has the ref_count and referenced_at
+    the collector read, so one that is uploaded again in the meantime
+    stays; blob_refs' foreign key refuses the delete outright once a
+    reference exists. Its files go only if the row did, and not if an
+    upload wrote them again after the row was deleted.
+    """
+
+    def __init__(self, storage: StorageBackend, backend: Optional[LocalBlobBackend] = None):
+        self.storage = storage
+        self.backend = backend or blob_backend()
+
+    @staticmethod
+    def digest(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def path(self, digest: str, name: Optional[str] = None) -> Path:
+        return self.backend.path(digest, name)
+
+    async def get(self, digest: str) -> Optional[Dict[str, Any]]:
+        """
+        The blob's row, if one is stored. Nothing keeps it from being
+        collected until put or add_ref.
+        """
+        rows = await self.storage.select(BLOBS, {"sha256": digest})
+        return rows[0] if rows else None
+
+    async def put(self, data: bytes, content_type: Optional[str] = None, digest: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Store data unless an identical blob exists and return the blob's row.
+        Reference it with add_ref before relying on it. Pass digest when the
+        caller has already hashed data.
+        """
+        if digest is None:
+            # hashlib releases the GIL, so a large upload hashes off the event loop in parallel
+            digest = await run_in_threadpool(self.digest, data)
+        # Refreshing referenced_at keeps a known blob from being collected;
+        # if it matches nothing the blob is new, or was just collected
+        rows = await self.storage.update(BLOBS, {"referenced_at": _now()}, {"sha256": digest})
+        if rows:
+            blob = rows[0]
+        else:
+            try:
+                blob = (await self.storage.insert(BLOBS, [{
+                    "sha256": digest,
+                    "size": len(data),
+                    "content_type": content_type,
+                    "ref_count": 0,
+                    "referenced_at": _now(),
+                    "derived": {},
+                }]))[0]
+            except Exception:
+                # The same file arriving twice at once; the other insert won
+                rows = await self.storage.select(BLOBS, {"sha256": digest})
+                if not rows:
+                    raise
+                blob = rows[0]
+
+        # Even for a known blob, so a file lost on disk is restored by the next upload
+        written = await run_in_threadpool(self.backend.put, digest, data)
+        blob_puts.inc("stored" if written else "deduplicated")
+        return blob
+
+    async def put_derived(self, digest: str, kind: str, value: Dict[str, Any], files: Dict[str, bytes]):
+        """
+        Record what processing a blob produced (value under derived[kind])
+        and store the files it produced alongside the blob.
+        """
+        def write():
+            for name, data in files.items():
+                self.backend.put_derived(digest, name, data)
+        await run_in_threadpool(write)
+        rows = await self.storage.select(BLOBS, {"sha256": digest}, columns="derived")
+        derived = dict((rows[0].get("derived") if rows else None) or {})
+        derived[kind] = value
+        await self.storage.update(BLOBS, {"derived": derived}, {"sha256": digest})
+
+    async def _recount(self, digest: str):
+        async with _blob_lock(digest):
+            refs = await self.storage.select(BLOB_REFS, {"sha256": digest}, columns="id")
+            await self.storage.update(BLOBS, {"ref_count": len(refs), "referenced_at": _now()}, {"sha256": digest})
+
+    async def add_ref(self, digest: str, owner_type: str, owner_id: str, project_id: str, user: AuthenticatedUser):
+        await self.storage.insert(BLOB_REFS, [{
+            "sha256": digest,
+            "owner_type": owner_type,
+            "owner_id": str(owner_id),
+            "project_id": str(project_id),
+            "user_id": user.supabase_user_id,
+        }])
+        await self._recount(digest)
+
+    async def release(self, owner_type: str, owner_ids: List[str], user: AuthenticatedUser) -> List[str]:
+        """
+        Drop the references held by deleted owners; returns the digests they
+        referenced. The blobs themselves go at the next collection.
+        """
+        if not owner_ids:
+            return []
+        return await self._release({
+            "owner_type": owner_type, "owner_id": [str(owner_id) for owner_id in owner_ids],
+            "user_id": user.supabase_user_id,
+        })
+
+    async def project_digests(self, project_ids: List[str], user: AuthenticatedUser) -> List[str]:
+        """
+        The blobs referenced in projects about to be deleted. Read before the
+        delete: its cascade removes their references without telling us.
+        """
+        if not project_ids:
+            return []
+        rows = await self.storage.select(BLOB_REFS, {
+            "project_id": [str(project_id) for project_id in project_ids], "user_id": user.supabase_user_id
+        }, columns="sha256")
+        return list(dict.fromkeys(row["sha256"] for row in rows))
+
+    async def release_projects(self, project_ids: List[str], digests: List[str], user: AuthenticatedUser) -> List[str]:
+        """
+        Drop every reference held in deleted projects and recount digests,
+        what project_digests returned for them, which the cascade has usually
+        already left with fewer references.
+        """
+        if not project_ids:
+            return []
+        released = await self._release({
+            "project_id": [str(project_id) for project_id in project_ids], "user_id": user.supabase_user_id
+        })
+        remaining = [digest for digest in dict.fromkeys(digests) if digest not in released]
+        for digest in remaining:
+            await self._recount(digest)
+        return released + remaining
+
+    async def _release(self, filters: Dict[str, Any]) -> List[str]:
+        rows = await self.storage.delete(BLOB_REFS, filters)
+        digests = list(dict.fromkeys(row["sha256"] for row in rows))
+        for digest in digests:
+            await self._recount(digest)
+        return digests
+
+    async def collect_garbage(self, grace_seconds: float) -> Dict[str, Any]:
+        """
+        Delete blobs with no references left that were last referenced more
+        than grace_seconds ago. Each delete is conditional on the row being
+        unchanged since it was read, and the files go only with the row.
+        """
+        candidates = await self.storage.select(BLOBS, {"ref_count": 0}, columns="sha256, size, referenced_at")
+        candidates = [blob for blob in candidates if _age_seconds(blob.get("referenced_at")) > grace_seconds]
+        if not candidates:
+            return {"collected": 0, "bytes": 0}
+
+        referenced = await self.storage.select(
+            BLOB_REFS, {"sha256": [blob["sha256"] for blob in candidates]}, columns="sha256"
+        )
+        still_used = {row["sha256"] for row in referenced}
+        collected, freed = 0, 0
+        for blob in candidates:
+            digest = blob["sha256"]
+            if digest in still_used:
+                await self._recount(digest)
+                continue
+            started = time.time()
+            try:
+                deleted = await self.storage.delete(BLOBS, {
+                    "sha256": digest, "ref_count": 0, "referenced_at": blob["referenced_at"]
+                })
+            except Exception as e:
+                # blob_refs' foreign key: a reference was added since the read
+                logger.info("Kept blob %s: %s", digest, e)
+                continue
+            if not deleted:
+                # Uploaded or recounted since the read
+                continue
+            collected += 1
+            if await run_in_threadpool(self.backend.delete, digest, started):
+                freed += blob.get("size") or 0
+            else:
+                logger.info("Kept the files of blob %s: uploaded again while it was collected", digest)
+        blobs_collected.inc(amount=collected)
+        logger.info("Collected %d unreferenced blobs (%d bytes)", collected, freed)
+        return {"collected": collected, "bytes": freed}
+
+
+class BlobCollector:
+    """
+    Runs BlobStore.collect_garbage every BLOB_GC_INTERVAL_S seconds (3600;
+    0 turns it off) for blobs unreferenced for BLOB_GC_GRACE_S (3600).
+    Every worker starts one, but only the one holding the blob_gc row of
+    worker_leases collects; the lease lasts two intervals, so another
+    worker takes over after its holder stops.
+    """
+
+    def __init__(self):
+        self.interval = float(os.getenv("BLOB_GC_INTERVAL_S", "3600"))
+        self.grace_seconds = float(os.getenv("BLOB_GC_GRACE_S", "3600"))
+        self.lease_seconds = max(self.interval, 60) * 2
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.skipped = 0
+        self.runs = 0
+        self.collected = 0
+        self.bytes_freed = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def collect(self, storage: Optional[StorageBackend] = None, grace_seconds: Optional[float] = None) -> Dict[str, Any]:
+        storage = storage or get_storage_backend(clients.supabase())
+        result = await BlobStore(storage).collect_garbage(
+            self.grace_seconds if grace_seconds is None else grace_seconds
+        )
+        self.runs += 1
+        self.collected += result["collected"]
+        self.bytes_freed += result["bytes"]
+        return result
+
+    async def hold_lease(self, storage: StorageBackend) -> bool:
+        """
+        Take the collector lease, or renew it if this worker holds it. The
+        write is conditional on the lease row as read, so of two workers
+        racing for an expired lease only one gets it.
+        """
+        expires_at = datetime.fromtimestamp(time.time() + self.lease_seconds, timezone.utc).isoformat()
+        rows = await storage.select(WORKER_LEASES, {"name": GC_LEASE})
+        if not rows:
+            try:
+                return bool(await storage.insert(WORKER_LEASES, [{
+                    "name": GC_LEASE, "holder": self.holder, "expires_at": expires_at
+                }]))
+            except Exception:
+                # Another worker created it first
+                if not await storage.select(WORKER_LEASES, {"name": GC_LEASE}):
+                    raise
+                return False
+        lease = rows[0]
+        if lease["holder"] != self.holder and _age_seconds(lease["expires_at"]) < 0:
+            return False
+        return bool(await storage.update(
+            WORKER_LEASES, {"holder": self.holder, "expires_at": expires_at},
+            {"name": GC_LEASE, "holder": lease["holder"], "expires_at": lease["expires_at"]}
+        ))
+
+    async def start(self):
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            task, self._task = self._task, None
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                storage = get_storage_backend(clients.supabase())
+                if await self.hold_lease(storage):
+                    await self.collect(storage)
+                else:
+                    self.skipped += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Blob garbage collection failed")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None,
+            "interval_s": self.interval,
+            "grace_s": self.grace_seconds,
+            "runs": self.runs,
+            "skipped": self.skipped,
+            "collected": self.collected,
+            "bytes_freed": self.bytes_freed,
+        }
+
+
+blob_collector = BlobCollector()
+
+
+# Dependency function to get BlobStore instance
+def get_blob_store(storage: StorageBackend = Depends(get_storage_backend)) -> BlobStore:
+    """
+    Dependency function to provide BlobStore instance.
+    """
+    return BlobStore(storage)
@@ -0,0 +1,479 @@
+import copy
+import uuid
+import asyncio
+import weakref
+from datetime import date
+from typing import Optional, Dict, Any, List, Tuple
+from fastapi import Depends, HTTPException
+import logging
+from collections import defaultdict
+
+from ..auth import AuthenticatedUser
+from .flow_state import remap_flow_state
+from .storage_backend import get_storage_backend, StorageBackend
+from .folders_data_service import FoldersDataService, FOLDERS
+from .project_version import project_versions, CONTENT, FLOW
+
+logger = logging.getLogger(__name__)
+
+MAX_OPS = 500
+
+# How often a flow write that lost a race with another writer is retried
+FLOW_WRITE_ATTEMPTS = 3
+
+DOC_NODE = "docsNode"
+LINK_NODE = "linkNode"
+FOLDER_NODE = "folderNode"
+
+EMPTY_FLOW_STATE = {"nodes": [], "edges": [], "viewport": {"x": 0, "y": 0, "zoom": 1}}
+
+# Batches for the same project are applied one at a time on this worker, so
+# they rarely conflict; across workers the stored flow version decides. A
+# lock is dropped once no batch holds or waits on it.
+_project_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def _project_lock(project_id: str) -> asyncio.Lock:
+    lock = _project_locks.get(str(project_id))
+    if lock is None:
+        lock = _project_locks[str(project_id)] = asyncio.Lock()
+    return lock
+
+
+def _grouped_to(node: Optional[Dict[str, Any]]) -> Optional[str]:
+    folder_id = ((node or {}).get("data") or {}).get("groupedToFolder")
+    return str(folder_id) if folder_id else None
+
+
+def _folder_item(node: Dict[str, Any]) -> Optional[Tuple[str, str]]:
+    """
+    The (item_type, item_id) a doc or link node stands for in folder_items.
+    """
+    data = node.get("data") or {}
+    if node.get("type") == DOC_NODE and data.get("docId"):
+        return "doc", str(data["docId"])
+    if node.get("type") == LINK_NODE and data.get("linkId"):
+        return "link", str(data["linkId"])
+    return None
+
+
+class _FlowConflict(Exception):
+    """The flow's stored version moved between reading and writing it"""
+
+
+class _BoardEditor:
+    """
+    Applies ops to an in-memory copy of a flow_state and collects the doc and
+    link rows they create or delete. Nothing is written here, so a batch with
+    any invalid op is rejected before the database is touched.
+
+    Created nodes use their ref as a placeholder id until the rows are inserted.
+    """
+
+    def __init__(self, flow_state: Optional[Dict[str, Any]]):
+        self.state = copy.deepcopy(flow_state or EMPTY_FLOW_STATE)
+        self.nodes: Dict[str, Dict[str, Any]] = {
+            str(node["id"]): node for node in self.state.get("nodes", []) if node.get("id") is not None
+        }
+        self.new_docs: Dict[str, Dict[str, Any]] = {}
+        self.new_links: Dict[str, Dict[str, Any]] = {}
+        self.new_folders: Dict[str, str] = {}
+        self.deleted_docs: List[str] = []
+        self.deleted_links: List[str] = []
+        self.removed_nodes = set()
+        self._index = 0
+        self._op = ""
+
+    def _fail(self, detail: str):
+        raise HTTPException(status_code=422, detail=f"Operation {self._index} ({self._op}): {detail}")
+
+    def _node(self, node_id: str) -> Dict[str, Any]:
+        node = self.nodes.get(str(node_id))
+        if node is None:
+            self._fail(f"node {node_id} not found")
+        return node
+
+    def _new_ref(self, ref: Optional[str]) -> str:
+        ref = str(ref) if ref else f"new-{self._index}"
+        if ref in self.nodes or ref in self.removed_nodes:
+            self._fail(f"ref {ref} is already in use")
+        return ref
+
+    def _add_node(self, ref: str, node_type: str, position: Dict[str, float], data: Dict[str, Any]):
+        self.nodes[ref] = {
+            "id": ref,
+            "type": node_type,
+            "position": position,
+            "data": {**data, "createdAt": date.today().isoformat()},
+        }
+
+    def _ungroup(self, node: Dict[str, Any]):
+        data = node.setdefault("data", {})
+        folder = self.nodes.get(data.get("groupedToFolder"))
+        if folder is not None:
+            grouped = folder.setdefault("data", {}).get("groupedNodes") or []
+            folder["data"]["groupedNodes"] = [n for n in grouped if n != node["id"]]
+        data.pop("groupedToFolder", None)
+        node["hidden"] = False
+
+    def create_doc(self, ref, position, title="Untitled Document", content="", **_):
+        ref = self._new_ref(ref)
+        self.new_docs[ref] = {"doc_name": title, "content": content}
+        self._add_node(ref, DOC_NODE, position, {"title": title, "content": content, "docId": ref})
+        return ref
+
+    def create_link(self, ref, position, url, name="", **_):
+        ref = self._new_ref(ref)
+        self.new_links[ref] = {"url": url, "name": name}
+        self._add_node(ref, LINK_NODE, position, {"url": url, "string": name, "linkId": ref})
+        return ref
+
+    def create_folder(self, ref, position, title="New Folder", **_):
+        ref = self._new_ref(ref)
+        # Ids are assigned here so the folder's row can share the node's id
+        self.new_folders[ref] = str(uuid.uuid4())
+        self._add_node(ref, FOLDER_NODE, position, {"title": title, "groupedNodes": []})
+        return ref
+
+    def move(self, node_id, position, **_):
+        self._node(node_id)["position"] = position
+
+    def group(self, node_id, folder_id=None, **_):
+        """
+        Move a node into a folder, or out of any folder when folder_id is None.
+        """
+        node = self._node(node_id)
+        if folder_id is None:
+            self._ungroup(node)
+            return
+
+        folder = self._node(folder_id)
+        if folder.get("type") != FOLDER_NODE:
+            self._fail(f"node {folder_id} is not a folder")
+        # Walk up from the target folder; reaching the node means the node
+        # contains the folder, and grouping would hide both in a cycle
+        ancestor, seen = folder, set()
+        while ancestor is not None and ancestor["id"] not in seen:
+            if ancestor["id"] == node["id"]:
+                self._fail(f"node {node_id} contains folder {folder_id}")
+            seen.add(ancestor["id"])
+            ancestor = self.nodes.get((ancestor.get("data") or {}).get("groupedToFolder"))
+
+        self._ungroup(node)
+        grouped = folder.setdefault("data", {}).get("groupedNodes") or []
+        if node["id"] not in grouped:
+            grouped = grouped + [node["id"]]
+        folder["data"]["groupedNodes"] = grouped
+        node["data"]["groupedToFolder"] = folder["id"]
+        node["hidden"] = True
+
+    def delete(self, node_id, **_):
+        node = self._node(node_id)
+        node_id = node["id"]
+        data = node.get("data") or {}
+
+        self._ungroup(node)
+        for grouped_id in data.get("groupedNodes") or []:
+            grouped = self.nodes.get(grouped_id)
+            if grouped is not None:
+                self._ungroup(grouped)
+
+        if node_id in self.new_docs or node_id in self.new_links or node_id in self.new_folders:
+            # Created earlier in this batch, so there is no row to delete
+            self.new_docs.pop(node_id, None)
+            self.new_links.pop(node_id, None)
+            self.new_folders.pop(node_id, None)
+        elif node.get("type") == DOC_NODE and data.get("docId"):
+            self.deleted_docs.append(str(data["docId"]))
+        elif node.get("type") == LINK_NODE and data.get("linkId"):
+            self.deleted_links.append(str(data["linkId"]))
+
+        del self.nodes[node_id]
+        self.removed_nodes.add(node_id)
+
+    def apply(self, index: int, op: Dict[str, Any]) -> Optional[str]:
+        self._index, self._op = index, op.get("op", "")
+        handler = {
+            "create_doc": self.create_doc,
+            "create_link": self.create_link,
+            "create_folder": self.create_folder,
+            "move": self.move,
+            "group": self.group,
+            "delete": self.delete,
+        }.get(self._op)
+        if handler is None:
+            self._fail("unknown operation")
+        fields = {key: value for key, value in op.items() if key != "op"}
+        return handler(**fields)
+
+    def result(self) -> Dict[str, Any]:
+        edges = [
+            edge for edge in self.state.get("edges", [])
+            if edge.get("source") not in self.removed_nodes and edge.get("target") not in self.removed_nodes
+        ]
+        return {**self.state, "nodes": list(self.nodes.values()), "edges": edges}
+
+
+class BoardOpsService:
+    """
+    Service class for applying a batch of board operations (create doc, link
+    or folder nodes, move, group, delete) to a project's flow and its docs and
+    links as one unit: one bulk insert per table, one flow write and one bulk
+    delete per table. StorageBackend has no multi-table transactions, so a
+    failing step undoes the steps before it.
+
+    flows.version is the board version clients see. The flow write is
+    conditional on the version read, so a batch never overwrites a change
+    made meanwhile on any worker.
+
+    Folder nodes the batch creates, groups or deletes are then mirrored
+    into the folder rows (FoldersDataService), keyed by the node's id.
+    """
+
+    def __init__(self, storage: StorageBackend):
+        self.storage = storage
+
+    async def _check_project(self, project_id: str, user: AuthenticatedUser):
+        rows = await self.storage.select(
+            "projects", {"id": project_id, "user_id": user.supabase_user_id}, columns="id"
+        )
+        if not rows:
+            raise HTTPException(status_code=404, detail="Project not found")
+
+    async def _get_flow(self, project_id: str, user: AuthenticatedUser) -> Optional[Dict[str, Any]]:
+        rows = await self.storage.select(
+            "flows", {"user_id": user.supabase_user_id, "project_id": project_id},
+            columns="id, flow_state, version"
+        )
+        return rows[0] if rows else None
+
+    async def _write_flow(self, flow: Optional[Dict[str, Any]], project_id: str, flow_state: Dict[str, Any],
+                          user: AuthenticatedUser, expected_version: int) -> Dict[str, Any]:
+        """
+        Write flow_state as version expected_version + 1, only if the stored
+        flow is still at expected_version.
+        """
+        if flow:
+            rows = await self.storage.update(
+                "flows",
+                {"flow_state": flow_state, "version": expected_version + 1},
+                {"id": flow["id"], "version": expected_version}
+            )
+            if not rows:
+                raise _FlowConflict()
+            return rows[0]
+        rows = await self.storage.insert("flows", [{
+            "user_id": user.supabase_user_id,
+            "project_id": project_id,
+            "flow_state": flow_state,
+            "version": expected_version + 1,
+        }])
+        if not rows:
+            raise HTTPException(status_code=500, detail="Failed to create flow")
+        return rows[0]
+
+    async def _fetch_rows(self, table: str, ids: List[str], user: AuthenticatedUser) -> List[Dict[str, Any]]:
+        if not ids:
+            return []
+        return await self.storage.select(table, {"id": ids, "user_id": user.supabase_user_id})
+
+    async def _insert_rows(self, table: str, pending: Dict[str, Dict[str, Any]], project_id: str,
+                           user: AuthenticatedUser) -> Dict[str, str]:
+        """
+        Insert the rows created by a batch in one statement and return ref -> id.
+        """
+        if not pending:
+            return {}
+        rows = [{**row, "project_id": project_id, "user_id": user.supabase_user_id} for row in pending.values()]
+        inserted = await self.storage.insert(table, rows)
+        if len(inserted) != len(rows):
+            raise HTTPException(status_code=500, detail=f"Failed to create {table}")
+        return {ref: str(row["id"]) for ref, row in zip(pending, inserted)}
+
+    async def _delete_rows(self, table: str, ids: List[str], user: AuthenticatedUser):
+        if ids:
+            await self.storage.delete(table, {"id": ids, "user_id": user.supabase_user_id})
+
+    async def _sync_folders(self, project_id: str, before: Optional[Dict[str, Any]], after: Dict[str, Any],
+                            user: AuthenticatedUser):
+        """
+        Bring the folder rows in line with the folder nodes: create rows for
+        new folders, move folders and items whose groupedToFolder changed,
+        and delete rows of deleted folders once their contents have moved
+        out, as they do on the board.
+        """
+        old = {str(n["id"]): n for n in (before or {}).get("nodes", []) if n.get("id") is not None}
+        new = {str(n["id"]): n for n in after.get("nodes", []) if n.get("id") is not None}
+        folder_nodes = {i for i, n in new.items() if n.get("type") == FOLDER_NODE}
+        regrouped = {i: _grouped_to(n) for i, n in new.items() if _grouped_to(n) != _grouped_to(old.get(i))}
+        deleted = [i for i, n in old.items() if n.get("type") == FOLDER_NODE and i not in new]
+        involved = (folder_nodes - set(old)) | (folder_nodes & set(regrouped)) | set(deleted) | {
+            folder_id for folder_id in regrouped.values() if folder_id
+        }
+        if not involved:
+            return
+
+        folders = FoldersDataService(self.storage)
+        rows = await self.storage.select(
+            FOLDERS, {"id": list(involved), "user_id": user.supabase_user_id}, columns="id"
+        )
+        existing = {str(row["id"]) for row in rows}
+        # Folders drawn before their rows were kept (or new in this batch) get one now
+        for folder_id in sorted((involved & folder_nodes) - existing):
+            title = (new[folder_id].get("data") or {}).get("title") or "New Folder"
+            await folders.create_folder(project_id, title, user, folder_id=folder_id)
+            if _grouped_to(new[folder_id]):
+                regrouped[folder_id] = _grouped_to(new[folder_id])
+
+        def depth(folder_id: str) -> int:
+            seen = set()
+            while folder_id and folder_id not in seen:
+                seen.add(folder_id)
+                folder_id = _grouped_to(new.get(folder_id))
+            return len(seen)
+
+        # Out to the top first, then parents before children, so no move
+        # passes through a state the board never had
+        moves = [(i, parent) for i, parent in regrouped.items() if i in folder_nodes]
+        for folder_id, parent_id in sorted(moves, key=lambda m: (m[1] is not None, depth(m[0]))):
+            await folders.move_folder(folder_id, parent_id, user)
+
+        added: Dict[str, List[Tuple[str, str]]] = defaultdict(list)
+        removed: Dict[str, List[str]] = defaultdict(list)
+        for node_id, folder_id in regrouped.items():
+            item = _folder_item(new[node_id])
+            if item is None:
+                continue
+            if folder_id:
+                added[folder_id].append(item)
+            elif _grouped_to(old.get(node_id)) in existing:
+                removed[_grouped_to(old[node_id])].append(item[1])
+        for folder_id, items in added.items():
+            await folders.add_items(folder_id, items, user)
+        for folder_id, item_ids in removed.items():
+            await folders.remove_items(folder_id, item_ids, user)
+
+        for folder_id in deleted:
+            if folder_id in existing:
+                await folders.delete_folder(folder_id, user)
+
+    async def _undo(self, step: str, action):
+        try:
+            await action()
+        except Exception as e:
+            logger.error("Failed to roll back board ops step '%s': %s", step, e)
+
+    async def apply(
+        self,
+        project_id: str,
+        ops: List[Dict[str, Any]],
+        user: AuthenticatedUser,
+        base_version: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Apply a batch of ops and return the new flow_state, the ids assigned
+        to created nodes (keyed by ref) and the new board version. When
+        base_version is given and the board has moved on, nothing is applied.
+        """
+        if len(ops) > MAX_OPS:
+            raise HTTPException(status_code=413, detail=f"At most {MAX_OPS} operations per batch")
+
+        project_id = str(project_id)
+        async with _project_lock(project_id):
+            try:
+                await self._check_project(project_id, user)
+                for attempt in range(FLOW_WRITE_ATTEMPTS):
+                    try:
+                        return await self._apply_once(project_id, ops, user, base_version)
+                    except _FlowConflict:
+                        # Without a base version the caller wants the batch applied
+                        # to whatever the board is now, so read it again
+                        if base_version is not None:
+                            break
+                        logger.info("Board ops for project %s lost a race with another write; retrying", project_id)
+                raise HTTPException(status_code=409, detail="Board has changed; reload and retry")
+
+            except HTTPException:
+                raise
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+    async def _apply_once(
+        self,
+        project_id: str,
+        ops: List[Dict[str, Any]],
+        user: AuthenticatedUser,
+        base_version: Optional[int]
+    ) -> Dict[str, Any]:
+        flow = await self._get_flow(project_id, user)
+        previous_state = flow["flow_state"] if flow else None
+        version = (flow.get("version") or 0) if flow else 0
+        if base_version is not None and base_version != version:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Board has changed (version {version}, expected {base_version}); reload and retry"
+            )
+
+        editor = _BoardEditor(previous_state)
+        refs = [editor.apply(i, op) for i, op in enumerate(ops)]
+        refs = [ref for ref in refs if ref is not None]
+
+        deleted_docs = await self._fetch_rows("docs", editor.deleted_docs, user)
+        deleted_links = await self._fetch_rows("links", editor.deleted_links, user)
+
+        undo = []
+        try:
+            id_map = dict(editor.new_folders)
+            for table, pending in (("docs", editor.new_docs), ("links", editor.new_links)):
+                ids = await self._insert_rows(table, pending, project_id, user)
+                if ids:
+                    undo.append((f"insert {table}", lambda t=table, i=list(ids.values()): self._delete_rows(t, i, user)))
+                id_map.update(ids)
+
+            flow_state = remap_flow_state(editor.result(), id_map)
+            written = await self._write_flow(flow, project_id, flow_state, user, version)
+            if flow:
+                undo.append(("write flow", lambda: self._write_flow(written, project_id, previous_state, user, version + 1)))
+            else:
+                undo.append(("create flow", lambda: self.storage.delete("flows", {"id": written["id"]})))
+
+            for table, rows in (("docs", deleted_docs), ("links", deleted_links)):
+                await self._delete_rows(table, [row["id"] for row in rows], user)
+                if rows:
+                    undo.append((f"delete {table}", lambda t=table, r=rows: self.storage.insert(t, r)))
+        except Exception:
+            for step, action in reversed(undo):
+                await self._undo(step, action)
+            raise
+
+        try:
+            await self._sync_folders(project_id, previous_state, flow_state, user)
+        except Exception as e:
+            # The board is written either way; a folder left without a row
+            # gets one the next time a batch touches it
+            logger.warning("Failed to sync folder rows for project %s: %s", project_id, e)
+
+        # This worker's counters only key caches now; the stored version is the board's
+        if editor.new_docs or editor.new_links or deleted_docs or deleted_links:
+            project_versions.bump(project_id, CONTENT)
+        project_versions.bump(project_id, FLOW)
+
+        logger.info(
+            "Applied %d board ops to project %s: %d nodes created, %d rows deleted",
+            len(ops), project_id, len(id_map), len(deleted_docs) + len(deleted_links)
+        )
+        return {
+            "flow_id": written["id"],
+            "flow_state": flow_state,
+            "created": {ref: id_map[ref] for ref in refs if ref in id_map},
+            "deleted": [str(row["id"]) for row in deleted_docs + deleted_links],
+            "version": version + 1,
+        }
+
+
+# Dependency function to get BoardOpsService instance
+def get_board_ops_service(storage: StorageBackend = Depends(get_storage_backend)) -> BoardOpsService:
+    """
+    Dependency function to provide BoardOpsService instance.
+    """
+    return BoardOpsService(storage)
@@ -0,0 +1,118 @@
+import json
+import asyncio
+from typing import Dict, Any, List, Union, Callable, Awaitable, Tuple
+from fastapi import HTTPException
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAX_BULK_ITEMS = 500
+
+# Distinct UPDATE statements one bulk update keeps in flight
+UPDATE_CONCURRENCY = 8
+
+
+def item_ok(index: int, key: str, row: Dict[str, Any]) -> Dict[str, Any]:
+    return {"index": index, "ok": True, key: row}
+
+
+def item_error(index: int, status_code: int, detail: str) -> Dict[str, Any]:
+    return {"index": index, "ok": False, "status_code": status_code, "error": detail}
+
+
+def bulk_response(results: List[Dict[str, Any]], noun: str, verb: str) -> Dict[str, Any]:
+    """
+    Wrap per-item results in the usual response shape, with counts so a
+    client can tell a partial failure apart at a glance.
+    """
+    failed = sum(1 for result in results if not result["ok"])
+    if failed == 0:
+        message = f"{noun} {verb} successfully"
+    elif failed == len(results):
+        message = f"No {noun.lower()} {verb}"
+    else:
+        message = f"{noun} partially {verb}"
+    return {
+        "message": message,
+        "results": results,
+        "succeeded": len(results) - failed,
+        "failed": failed,
+    }
+
+
+async def run_isolated(
+    rows: List[Dict[str, Any]],
+    run: Callable[[List[Dict[str, Any]]], Awaitable[List[Dict[str, Any]]]]
+) -> List[Union[Dict[str, Any], Exception]]:
+    """
+    Run a statement for all rows at once. If it fails, run it row by row so
+    one bad item only fails itself; each slot holds the row or the error.
+    """
+    if not rows:
+        return []
+    try:
+        written = await run(rows)
+        if len(written) == len(rows):
+            return written
+        raise RuntimeError(f"Expected {len(rows)} rows back, got {len(written)}")
+    except Exception as e:
+        if len(rows) == 1:
+            return [e]
+        logger.warning("Bulk statement failed for %d rows, retrying one at a time: %s", len(rows), e)
+
+    results: List[Union[Dict[str, Any], Exception]] = []
+    for row in rows:
+        try:
+            written = await run([row])
+            results.append(written[0] if written else RuntimeError("No data returned"))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+async def update_grouped(
+    changes: Dict[str, Dict[str, Any]],
+    run: Callable[[Dict[str, Any], List[str]], Awaitable[List[Dict[str, Any]]]]
+) -> Dict[str, Union[Dict[str, Any], Exception]]:
+    """
+    Apply per-id column changes with one UPDATE per distinct set of changes,
+    setting only those columns. Never inserts: ids whose row is gone (or not
+    the caller's) are simply missing from the result. A failed group is
+    retried id by id so one bad item only fails itself.
+    """
+    groups: Dict[str, Tuple[Dict[str, Any], List[str]]] = {}
+    for item_id, values in changes.items():
+        key = json.dumps(values, sort_keys=True, default=str)
+        groups.setdefault(key, (values, []))[1].append(item_id)
+
+    slots = asyncio.Semaphore(UPDATE_CONCURRENCY)
+
+    async def run_group(values: Dict[str, Any], ids: List[str]):
+        async with slots:
+            return await run(values, ids)
+
+    outcomes = await asyncio.gather(
+        *(run_group(values, ids) for values, ids in groups.values()), return_exceptions=True
+    )
+    results: Dict[str, Union[Dict[str, Any], Exception]] = {}
+    for (values, ids), outcome in zip(groups.values(), outcomes):
+        if not isinstance(outcome, Exception):
+            results.update((str(row["id"]), row) for row in outcome)
+            continue
+        if len(ids) == 1:
+            results[ids[0]] = outcome
+            continue
+        logger.warning("Bulk update failed for %d rows, retrying one at a time: %s", len(ids), str(outcome))
+        for item_id in ids:
+            try:
+                results.update((str(row["id"]), row) for row in await run(values, [item_id]))
+            except Exception as e:
+                results[item_id] = e
+    return results
+
+
+def error_result(index: int, error: Exception) -> Dict[str, Any]:
+    if isinstance(error, HTTPException):
+        return item_error(index, error.status_code, str(error.detail))
+    return item_error(index, 500, f"Database error: {str(error)}")
+
@@ -0,0 +1,196 @@
+import os
+import math
+import time
+import heapq
+import asyncio
+from collections import deque
+from typing import Optional, Dict, Any, List, AsyncIterator
+from fastapi import HTTPException
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class _Ticket:
+    __slots__ = ("user_id", "tag", "seq", "future", "enqueued_at", "started_at", "released", "cancelled")
+
+    def __init__(self, user_id: str, tag: float, seq: int, future: asyncio.Future):
+        self.user_id = user_id
+        self.tag = tag
+        self.seq = seq
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+        self.started_at: Optional[float] = None
+        self.released = False
+        self.cancelled = False
+
+    def __lt__(self, other: "_Ticket") -> bool:
+        return (self.tag, self.seq) < (other.tag, other.seq)
+
+
+class ChatScheduler:
+    """
+    Weighted fair queuing for chat requests. Each user's requests are tagged
+    with a virtual finish time that advances by 1/weight per request, and the
+    lowest tag runs next, so a user flooding the queue only delays their own
+    requests. A global cap bounds concurrent model work; full queues are shed
+    with 429 and a Retry-After estimate.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        max_queue_per_user: Optional[int] = None,
+        max_queue_total: Optional[int] = None,
+        queue_timeout_s: Optional[float] = None,
+    ):
+        self.max_concurrency = max_concurrency or int(os.getenv("CHAT_MAX_CONCURRENCY", "8"))
+        self.max_queue_per_user = max_queue_per_user or int(os.getenv("CHAT_MAX_QUEUE_PER_USER", "8"))
+        self.max_queue_total = max_queue_total or int(os.getenv("CHAT_MAX_QUEUE", "200"))
+        self.queue_timeout_s = queue_timeout_s or float(os.getenv("CHAT_QUEUE_TIMEOUT_S", "30"))
+
+        self._heap: List[_Ticket] = []
+        self._seq = 0
+        self._virtual_time = 0.0
+        self._last_tag: Dict[str, float] = {}
+        self._queued: Dict[str, int] = {}
+        self.active = 0
+
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._waits_ms: deque = deque(maxlen=2000)
+        self._service_s: deque = deque(maxlen=200)
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(self._queued.values())
+
+    def _retry_after(self) -> int:
+        """
+        Seconds until a queued request would likely start: queue length times
+        the recent average service time, spread over the concurrency cap.
+        """
+        avg_service = sum(self._service_s) / len(self._service_s) if self._service_s else 1.0
+        return max(1, math.ceil(avg_service * (self.queue_depth + 1) / self.max_concurrency))
+
+    def _reject(self, reason: str):
+        self.rejected += 1
+        retry_after = self._retry_after()
+        raise HTTPException(
+            status_code=429,
+            detail=f"Chat is busy ({reason}). Please retry in {retry_after}s.",
+            headers={"Retry-After": str(retry_after)}
+        )
+
+    def _dispatch(self):
+        while self.active < self.max_concurrency and self._heap:
+            ticket = heapq.heappop(self._heap)
+            if ticket.cancelled:
+                continue
+            self._queued[ticket.user_id] -= 1
+            if not self._queued[ticket.user_id]:
+                del self._queued[ticket.user_id]
+            self._virtual_time = max(self._virtual_time, ticket.tag)
+            self._start(ticket)
+            ticket.future.set_result(ticket)
+
+    def _start(self, ticket: _Ticket):
+        self.active += 1
+        self.admitted += 1
+        ticket.started_at = time.perf_counter()
+        self._waits_ms.append((ticket.started_at - ticket.enqueued_at) * 1000)
+
+    async def acquire(self, user_id: str, weight: float = 1.0) -> _Ticket:
+        """
+        Wait for a slot. Raises 429 when the user's or the global queue is full,
+        or when the wait exceeds the queue timeout.
+        """
+        if self._queued.get(user_id, 0) >= self.max_queue_per_user:
+            self._reject("too many queued requests for this user")
+        if self.queue_depth >= self.max_queue_total:
+            self._reject("queue full")
+
+        tag = max(self._virtual_time, self._last_tag.get(user_id, 0.0)) + 1.0 / max(weight, 0.01)
+        self._last_tag[user_id] = tag
+        self._seq += 1
+        ticket = _Ticket(user_id, tag, self._seq, asyncio.get_running_loop().create_future())
+
+        if self.active < self.max_concurrency and not self._heap:
+            self._virtual_time = max(self._virtual_time, tag)
+            self._start(ticket)
+            return ticket
+
+        heapq.heappush(self._heap, ticket)
+        self._queued[user_id] = self._queued.get(user_id, 0) + 1
+        self._dispatch()
+        try:
+            return await asyncio.wait_for(asyncio.shield(ticket.future), timeout=self.queue_timeout_s)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if ticket.future.done():
+                # Started just as we gave up; hand the slot back
+                self.release(ticket)
+            else:
+                ticket.cancelled = True
+                self._queued[user_id] -= 1
+                if not self._queued[user_id]:
+                    del self._queued[user_id]
+            if isinstance(e, asyncio.TimeoutError):
+                self.timed_out += 1
+                self._reject("timed out waiting for a slot")
+            raise
+
+    def release(self, ticket: _Ticket):
+        if ticket.released or ticket.started_at is None:
+            return
+        ticket.released = True
+        self.active -= 1
+        self._service_s.append(time.perf_counter() - ticket.started_at)
+        if len(self._last_tag) > 10000:
+            # Users whose tags are behind the virtual clock are equivalent to new users
+            self._last_tag = {u: t for u, t in self._last_tag.items() if t > self._virtual_time}
+        self._dispatch()
+
+    async def release_after(self, ticket: _Ticket, body: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        """
+        Wrap a streaming body so the slot is held until the stream ends.
+        """
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            self.release(ticket)
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self._waits_ms)
+
+        def pct(p: float) -> Optional[float]:
+            return round(waits[min(len(waits) - 1, int(p / 100 * len(waits)))], 2) if waits else None
+
+        return {
+            "active": self.active,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": self.queue_depth,
+            "queued_users": len(self._queued),
+            "max_user_queue_depth": max(self._queued.values(), default=0),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "wait_ms_p50": pct(50),
+            "wait_ms_p99": pct(99),
+            "wait_ms_max": round(waits[-1], 2) if waits else None,
+        }
+
+
+_chat_scheduler: Optional[ChatScheduler] = None
+
+
+# Dependency function to get the shared ChatScheduler instance
+def get_chat_scheduler() -> ChatScheduler:
+    """
+    Dependency function to provide the per-worker ChatScheduler.
+    """
+    global _chat_scheduler
+    if _chat_scheduler is None:
+        _chat_scheduler = ChatScheduler()
+    return _chat_scheduler
@@ -0,0 +1,456 @@
+import os
+import json
+import uuid
+import random
+import asyncio
+import time
+import threading
+from typing import Optional, Dict, Any, List, AsyncIterator, Tuple
+import httpx
+import logging
+
+logger = logging.getLogger(__name__)
+
+ANTHROPIC_VERSION = "2023-06-01"
+DEFAULT_MODEL = "claude-3-5-haiku-latest"
+DEFAULT_MAX_TOKENS = 1024
+
+# Overloaded / rate limited / transient upstream failures worth retrying
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504, 529}
+RETRY_EXCEPTIONS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError, httpx.PoolTimeout)
+# Failures before the request left this process; safe to retry any call
+CONNECT_EXCEPTIONS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+BACKOFF_BASE_S = 0.5
+BACKOFF_MAX_S = 20.0
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# One concurrency limit per API key, shared by every ClaudeService using that key
+_key_limits: Dict[str, asyncio.Semaphore] = {}
+
+
+class ClaudeServiceError(Exception):
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"Model API error {status_code}: {message}")
+        self.status_code = status_code
+
+
+class ChatStreamStats:
+    """
+    Running latency stats for model streams: time-to-first-token and tokens/sec.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.streams = 0
+        self.errors = 0
+        self.cancelled = 0
+        self.tokens = 0
+        self.ttft_ms_total = 0.0
+        self.ttft_ms_max = 0.0
+        self.stream_seconds_total = 0.0
+
+    def record(self, stream: "ChatStream"):
+        with self._lock:
+            self.streams += 1
+            if stream.error:
+                self.errors += 1
+            if stream.cancelled:
+                self.cancelled += 1
+            self.tokens += stream.tokens
+            self.stream_seconds_total += stream.duration_s
+            if stream.ttft_ms is not None:
+                self.ttft_ms_total += stream.ttft_ms
+                self.ttft_ms_max = max(self.ttft_ms_max, stream.ttft_ms)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "streams": self.streams,
+                "errors": self.errors,
+                "cancelled": self.cancelled,
+                "tokens": self.tokens,
+                "avg_ttft_ms": round(self.ttft_ms_total / self.streams, 2) if self.streams else None,
+                "max_ttft_ms": round(self.ttft_ms_max, 2),
+                "avg_tokens_per_sec": round(self.tokens / self.stream_seconds_total, 2) if self.stream_seconds_total else None,
+            }
+
+
+stream_stats = ChatStreamStats()
+
+
+class ChatStream:
+    """
+    Async iterator over the text deltas of one streamed model response.
+    Timing fields are filled in as the stream progresses.
+    """
+
+    def __init__(self, service: "ClaudeService", payload: Dict[str, Any]):
+        self._service = service
+        self._payload = payload
+        self._iterator: Optional[AsyncIterator[str]] = None
+        self.started_at = time.perf_counter()
+        self.ttft_ms: Optional[float] = None
+        self.duration_s = 0.0
+        self.tokens = 0
+        self.stop_reason: Optional[str] = None
+        self.error: Optional[str] = None
+        self.cancelled = False
+        self.retries = 0
+        self._closed = False
+
+    @property
+    def tokens_per_sec(self) -> Optional[float]:
+        return round(self.tokens / self.duration_s, 2) if self.duration_s else None
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "ttft_ms": round(self.ttft_ms, 2) if self.ttft_ms is not None else None,
+            "tokens": self.tokens,
+            "tokens_per_sec": self.tokens_per_sec,
+            "stop_reason": self.stop_reason,
+            "retries": self.retries,
+        }
+
+    def __aiter__(self):
+        if self._iterator is None:
+            self._iterator = self._run()
+        return self
+
+    async def __anext__(self) -> str:
+        return await self._iterator.__anext__()
+
+    async def aclose(self, cancelled: bool = False):
+        """
+        Stop the stream early, closing the upstream request.
+        """
+        if cancelled:
+            self.cancelled = True
+        if self._iterator is not None:
+            await self._iterator.aclose()
+        self._finish()
+
+    def _finish(self):
+        if self._closed:
+            return
+        self._closed = True
+        self.duration_s = time.perf_counter() - self.started_at
+        stream_stats.record(self)
+
+    async def _open(self) -> httpx.Response:
+        """
+        Open the upstream stream. 429/5xx responses and connection failures
+        are retried with backoff; nothing has been yielded yet at this point.
+        """
+        service = self._service
+        attempt = 0
+        while True:
+            request = service.client.build_request(
+                "POST", "/v1/messages", json=self._payload, headers=service.headers
+            )
+            try:
+                response = await service.client.send(request, stream=True)
+            except RETRY_EXCEPTIONS as e:
+                if attempt >= service.max_retries:
+                    raise ClaudeServiceError(503, f"Model API unreachable: {str(e)}")
+                await asyncio.sleep(service.backoff(attempt))
+                attempt += 1
+                self.retries += 1
+                continue
+
+            if response.status_code == 200:
+                return response
+
+            body = await response.aread()
+            await response.aclose()
+            if response.status_code in RETRY_STATUSES and attempt < service.max_retries:
+                delay = service.backoff(attempt, response.headers.get("retry-after"))
+                logger.warning(f"Model API returned {response.status_code}, retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                attempt += 1
+                self.retries += 1
+                continue
+            raise ClaudeServiceError(response.status_code, body.decode("utf-8", "replace"))
+
+    async def _run(self) -> AsyncIterator[str]:
+        usage_tokens = None
+        try:
+            async with self._service.limit:
+                response = await self._open()
+                try:
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        event = json.loads(line[5:])
+                        event_type = event.get("type")
+
+                        if event_type == "content_block_delta":
+                            text = event.get("delta", {}).get("text")
+                            if not text:
+                                continue
+                            if self.ttft_ms is None:
+                                self.ttft_ms = (time.perf_counter() - self.started_at) * 1000
+                            self.tokens += 1
+                            yield text
+                        elif event_type == "message_delta":
+                            self.stop_reason = event.get("delta", {}).get("stop_reason")
+                            usage_tokens = event.get("usage", {}).get("output_tokens", usage_tokens)
+                        elif event_type == "error":
+                            raise ClaudeServiceError(500, event.get("error", {}).get("message", "Stream error"))
+                        elif event_type == "message_stop":
+                            break
+                finally:
+                    await response.aclose()
+
+            if usage_tokens:
+                self.tokens = usage_tokens
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        except Exception as e:
+            self.error = str(e) or type(e).__name__
+            raise
+        finally:
+            self._finish()
+
+
+class BackgroundBatcher:
+    """
+    Collects background model jobs (summaries, metadata extraction) for up to
+    flush_ms and submits them together through the Message Batches API, so
+    they don't compete with interactive chat for the per-key concurrency.
+    """
+
+    def __init__(self, service: "ClaudeService", max_batch: int = 100, flush_ms: float = 250, poll_s: float = 2.0):
+        self.service = service
+        self.max_batch = max_batch
+        self.flush_s = flush_ms / 1000
+        self.poll_s = poll_s
+        self._pending: List[Tuple[str, Dict[str, Any], asyncio.Future]] = []
+        self._wake: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._batches: set = set()
+        self.batches_submitted = 0
+        self.jobs_submitted = 0
+
+    async def submit(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Queue one Messages API request and wait for its result message.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((uuid.uuid4().hex, params, future))
+        if self._wake is None:
+            self._wake = asyncio.Event()
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+        if len(self._pending) >= self.max_batch:
+            self._wake.set()
+        return await future
+
+    async def _flush_loop(self):
+        while self._pending:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_s)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            jobs, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            task = asyncio.create_task(self._run_batch(jobs))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _run_batch(self, jobs: List[Tuple[str, Dict[str, Any], asyncio.Future]]):
+        futures = {custom_id: future for custom_id, _, future in jobs}
+        try:
+            batch = await self.service.request("POST", "/v1/messages/batches", json={
+                "requests": [{"custom_id": custom_id, "params": params} for custom_id, params, _ in jobs]
+            })
+            self.batches_submitted += 1
+            self.jobs_submitted += len(jobs)
+
+            while batch.get("processing_status") != "ended":
+                await asyncio.sleep(self.poll_s)
+                batch = await self.service.request("GET", f"/v1/messages/batches/{batch['id']}")
+
+            async with self.service.client.stream("GET", batch["results_url"], headers=self.service.headers) as response:
+                async for line in response.aiter_lines():
+                    if not line.strip():
+                        continue
+                    item = json.loads(line)
+                    future = futures.pop(item.get("custom_id"), None)
+                    if future is None or future.done():
+                        continue
+                    result = item.get("result", {})
+                    if result.get("type") == "succeeded":
+                        future.set_result(result["message"])
+                    else:
+                        future.set_exception(ClaudeServiceError(500, f"Batch job {result.get('type')}: {result.get('error')}"))
+
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(ClaudeServiceError(500, "Batch job missing from results"))
+        except Exception as e:
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(e)
+
+
+class ClaudeService:
+    """
+    Client for the Anthropic Messages API with streaming responses.
+    Point CLAUDE_API_URL at a local fake model server for development.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        model: Optional[str] = None,
+        max_tokens: Optional[int] = None,
+    ):
+        self.api_key = api_key or os.getenv("ANTHROPIC_API_KEY", "")
+        self.base_url = base_url or os.getenv("CLAUDE_API_URL", "https://api.anthropic.com")
+        self.model = model or os.getenv("CLAUDE_MODEL", DEFAULT_MODEL)
+        self.max_tokens = max_tokens or int(os.getenv("CLAUDE_MAX_TOKENS", DEFAULT_MAX_TOKENS))
+        self.max_retries = int(os.getenv("CLAUDE_MAX_RETRIES", "4"))
+        self.headers = {
+            "x-api-key": self.api_key,
+            "anthropic-version": ANTHROPIC_VERSION,
+            "content-type": "application/json",
+        }
+        max_concurrency = int(os.getenv("CLAUDE_MAX_CONCURRENCY", "16"))
+        self.limit = _key_limits.setdefault(self.api_key, asyncio.Semaphore(max_concurrency))
+        # Persistent pool; HTTP/2 multiplexes concurrent streams over few connections
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            http2=HTTP2_AVAILABLE,
+            timeout=httpx.Timeout(60.0, connect=5.0, pool=30.0),
+            limits=httpx.Limits(
+                max_connections=max_concurrency,
+                max_keepalive_connections=max_concurrency,
+                keepalive_expiry=120.0
+            ),
+        )
+        self.batcher = BackgroundBatcher(self)
+
+    def backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """
+        Delay before retry number attempt+1: the server's retry-after when
+        given, otherwise exponential backoff with full jitter.
+        """
+        if retry_after:
+            try:
+                return min(float(retry_after), BACKOFF_MAX_S)
+            except ValueError:
+                pass
+        return random.uniform(0, min(BACKOFF_MAX_S, BACKOFF_BASE_S * (2 ** attempt)))
+
+    async def request(self, method: str, path: str, json: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Non-streaming API call. Idempotent methods get the same retry policy
+        as streams; anything else (creating a batch) is only retried when it
+        never reached the server, so a retry cannot create it twice.
+        """
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            try:
+                response = await self.client.request(method, path, json=json, headers=self.headers)
+            except RETRY_EXCEPTIONS as e:
+                if attempt >= self.max_retries or not (idempotent or isinstance(e, CONNECT_EXCEPTIONS)):
+                    raise ClaudeServiceError(503, f"Model API unreachable: {str(e)}")
+                await asyncio.sleep(self.backoff(attempt))
+                attempt += 1
+                continue
+
+            if response.status_code < 400:
+                return response.json()
+            if idempotent and response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                await asyncio.sleep(self.backoff(attempt, response.headers.get("retry-after")))
+                attempt += 1
+                continue
+            raise ClaudeServiceError(response.status_code, response.text)
+
+    def stream(
+        self,
+        messages: List[Dict[str, str]],
+        system: Optional[str] = None,
+        max_tokens: Optional[int] = None,
+    ) -> ChatStream:
+        """
+        Start a streamed completion. Iterate the result for text deltas.
+        """
+        payload = {
+            "model": self.model,
+            "max_tokens": max_tokens or self.max_tokens,
+            "messages": messages,
+            "stream": True,
+        }
+        if system:
+            payload["system"] = system
+        return ChatStream(self, payload)
+
+    async def complete(
+        self,
+        messages: List[Dict[str, str]],
+        system: Optional[str] = None,
+        max_tokens: Optional[int] = None,
+    ) -> str:
+        """
+        Run a completion to the end and return the full text.
+        """
+        parts = []
+        async for text in self.stream(messages, system=system, max_tokens=max_tokens):
+            parts.append(text)
+        return "".join(parts)
+
+    async def background(
+        self,
+        messages: List[Dict[str, str]],
+        system: Optional[str] = None,
+        max_tokens: Optional[int] = None,
+    ) -> str:
+        """
+        Run a completion as a batched background job and return its text.
+        Use for work that is not on a request path.
+        """
+        params = {
+            "model": self.model,
+            "max_tokens": max_tokens or self.max_tokens,
+            "messages": messages,
+        }
+        if system:
+            params["system"] = system
+        message = await self.batcher.submit(params)
+        return "".join(block.get("text", "") for block in message.get("content", []) if block.get("type") == "text")
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+_claude_service: Optional[ClaudeService] = None
+
+
+# Dependency function to get the shared ClaudeService instance
+def get_claude_service() -> ClaudeService:
+    """
+    Dependency function to provide a shared ClaudeService so connections are reused.
+    """
+    global _claude_service
+    if _claude_service is None:
+        _claude_service = ClaudeService()
+    return _claude_service
+
+
+async def close_claude_service():
+    """Close the shared ClaudeService's connections, if it was ever created"""
+    global _claude_service
+    if _claude_service is not None:
+        await _claude_service.aclose()
+        _claude_service = None
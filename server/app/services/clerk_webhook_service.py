@@ -0,0 +1,496 @@
+import os
+import json
+import time
+import hmac
+import base64
+import random
+import sqlite3
+import asyncio
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Mapping, Optional
+
+from starlette.concurrency import run_in_threadpool
+from supabase_auth.errors import AuthApiError
+
+from app import metrics
+from app.clients import clients
+from app.metrics import SUPABASE_AUTH, timed
+from app.services.invalidation_bus import invalidation_bus, USER
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+USER_CREATED = "user.created"
+USER_UPDATED = "user.updated"
+USER_DELETED = "user.deleted"
+HANDLED_EVENTS = (USER_CREATED, USER_UPDATED, USER_DELETED)
+
+# Event states
+PENDING = "pending"
+PROCESSING = "processing"
+DONE = "done"
+FAILED = "failed"
+
+# Svix rejects deliveries whose timestamp is further than this from now
+SIGNATURE_TOLERANCE_SECONDS = 300
+LIST_USERS_PAGE_SIZE = 1000
+
+webhook_events = metrics.Counter(
+    "clerk_webhook_events_total", "Clerk webhook events by type and outcome", ("type", "outcome")
+)
+
+
+class InvalidSignature(Exception):
+    pass
+
+
+def verify_svix_signature(secret: str, headers: Mapping[str, str], body: bytes, now: Optional[float] = None) -> str:
+    """
+    Check a Clerk webhook the way Svix signs it: HMAC-SHA256 over
+    "{svix-id}.{svix-timestamp}.{body}" with the base64 part of the
+    whsec_ secret, matched against any v1 signature in svix-signature.
+    Returns the svix-id, which is the same on every retry of an event.
+    """
+    event_id = headers.get("svix-id")
+    timestamp = headers.get("svix-timestamp")
+    signatures = headers.get("svix-signature")
+    if not event_id or not timestamp or not signatures:
+        raise InvalidSignature("Missing Svix headers")
+    try:
+        sent_at = int(timestamp)
+    except ValueError:
+        raise InvalidSignature("Invalid Svix timestamp")
+    if abs((now if now is not None else time.time()) - sent_at) > SIGNATURE_TOLERANCE_SECONDS:
+        raise InvalidSignature("Svix timestamp outside the allowed window")
+
+    key = base64.b64decode(secret[len("whsec_"):] if secret.startswith("whsec_") else secret)
+    signed = f"{event_id}.{timestamp}.".encode() + body
+    expected = base64.b64encode(hmac.new(key, signed, hashlib.sha256).digest()).decode()
+    for candidate in signatures.split():
+        version, _, signature = candidate.partition(",")
+        if version == "v1" and hmac.compare_digest(signature, expected):
+            return event_id
+    raise InvalidSignature("No matching Svix signature")
+
+
+class WebhookStore:
+    """
+    Received events in a local SQLite file, one row per event id, so a
+    redelivered event is a no-op and nothing accepted is lost if the worker
+    restarts. Every worker process on the host can share the file: claiming
+    a batch happens in a write transaction, so each event goes to one of them.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._db is None:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            # Fsync every commit: a 200 sent to Clerk means the event is on disk
+            db.execute("PRAGMA synchronous=FULL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS clerk_webhook_events (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    event_id TEXT NOT NULL UNIQUE,
+                    event_type TEXT NOT NULL,
+                    clerk_user_id TEXT,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    claimed_at REAL,
+                    received_at REAL NOT NULL,
+                    finished_at REAL,
+                    result TEXT
+                )
+            """)
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS clerk_webhook_events_status ON clerk_webhook_events (status, next_attempt_at)"
+            )
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS clerk_webhook_events_user ON clerk_webhook_events (clerk_user_id, status)"
+            )
+            self._db = db
+        return self._db
+
+    def enqueue(self, event_id: str, event_type: str, clerk_user_id: Optional[str], payload: str) -> bool:
+        """Store an event; False if one with this id was already received"""
+        now = time.time()
+        with self._lock:
+            cursor = self._connection().execute(
+                "INSERT OR IGNORE INTO clerk_webhook_events "
+                "(event_id, event_type, clerk_user_id, payload, next_attempt_at, received_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (event_id, event_type, clerk_user_id, payload, now, now),
+            )
+            return cursor.rowcount == 1
+
+    def claim(self, limit: int, lease_seconds: float) -> List[Dict[str, Any]]:
+        """
+        Take up to limit events that are due, oldest first. An event waits
+        while an earlier one for the same Clerk user is unfinished, so a
+        user's events apply in the order they were received. Events claimed
+        by a worker that died are taken again once their lease runs out.
+        """
+        now = time.time()
+        with self._lock:
+            db = self._connection()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = db.execute("""
+                    SELECT * FROM clerk_webhook_events AS e
+                    WHERE ((e.status = 'pending' AND e.next_attempt_at <= ?)
+                           OR (e.status = 'processing' AND e.claimed_at <= ?))
+                      AND NOT EXISTS (
+                          SELECT 1 FROM clerk_webhook_events AS earlier
+                          WHERE earlier.clerk_user_id = e.clerk_user_id
+                            AND earlier.status IN ('pending', 'processing')
+                            AND earlier.seq < e.seq
+                      )
+                    ORDER BY e.seq
+                    LIMIT ?
+                """, (now, now - lease_seconds, limit)).fetchall()
+                db.executemany(
+                    "UPDATE clerk_webhook_events SET status = 'processing', claimed_at = ?, attempts = attempts + 1 "
+                    "WHERE seq = ?",
+                    [(now, row["seq"]) for row in rows],
+                )
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        return [{**dict(row), "attempts": row["attempts"] + 1} for row in rows]
+
+    def complete(self, event_id: str, result: str):
+        with self._lock:
+            self._connection().execute(
+                "UPDATE clerk_webhook_events SET status = 'done', finished_at = ?, result = ? WHERE event_id = ?",
+                (time.time(), result, event_id),
+            )
+
+    def fail(self, event_id: str, error: str, retry_at: Optional[float]):
+        """Schedule another attempt at retry_at, or give up when it is None"""
+        with self._lock:
+            if retry_at is None:
+                self._connection().execute(
+                    "UPDATE clerk_webhook_events SET status = 'failed', finished_at = ?, result = ? WHERE event_id = ?",
+                    (time.time(), error, event_id),
+                )
+            else:
+                self._connection().execute(
+                    "UPDATE clerk_webhook_events SET status = 'pending', next_attempt_at = ?, claimed_at = NULL, "
+                    "result = ? WHERE event_id = ?",
+                    (retry_at, error, event_id),
+                )
+
+    def retry(self, event_id: str) -> bool:
+        """Put a failed event back in the queue"""
+        with self._lock:
+            cursor = self._connection().execute(
+                "UPDATE clerk_webhook_events SET status = 'pending', attempts = 0, next_attempt_at = ?, "
+                "finished_at = NULL WHERE event_id = ? AND status = 'failed'",
+                (time.time(), event_id),
+            )
+            return cursor.rowcount == 1
+
+    def purge(self, older_than: float) -> int:
+        """Forget events that finished before older_than"""
+        with self._lock:
+            cursor = self._connection().execute(
+                "DELETE FROM clerk_webhook_events WHERE status = 'done' AND finished_at < ?", (older_than,)
+            )
+            return cursor.rowcount
+
+    def counts(self) -> Dict[str, Any]:
+        with self._lock:
+            db = self._connection()
+            counts = {status: count for status, count in db.execute(
+                "SELECT status, COUNT(*) FROM clerk_webhook_events GROUP BY status"
+            )}
+            oldest = db.execute(
+                "SELECT MIN(received_at) FROM clerk_webhook_events WHERE status IN ('pending', 'processing')"
+            ).fetchone()[0]
+        return {
+            **{status: counts.get(status, 0) for status in (PENDING, PROCESSING, DONE, FAILED)},
+            "oldest_pending_seconds": round(time.time() - oldest, 1) if oldest else 0,
+        }
+
+    def failed(self, limit: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT event_id, event_type, clerk_user_id, attempts, received_at, finished_at, result "
+                "FROM clerk_webhook_events WHERE status = 'failed' ORDER BY seq DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+def _is_permanent(error: Exception) -> bool:
+    # Supabase rejected the request itself (e.g. the email is taken); retrying won't help
+    return isinstance(error, AuthApiError) and 400 <= (error.status or 0) < 500 and error.status not in (408, 429)
+
+
+def _supabase_users_by_clerk_id(wanted: Iterable[str]) -> Dict[str, Any]:
+    """
+    One pass over the Supabase user list, page by page, for every Clerk
+    user a batch touches; stops as soon as all of them have been seen.
+    """
+    wanted = set(wanted)
+    found: Dict[str, Any] = {}
+    page = 1
+    while wanted - found.keys():
+        users = timed(
+            SUPABASE_AUTH, "list_users", clients.supabase().auth.admin.list_users,
+            page=page, per_page=LIST_USERS_PAGE_SIZE
+        )
+        for user in users:
+            clerk_user_id = (user.user_metadata or {}).get("clerk_user_id")
+            if clerk_user_id in wanted:
+                found[clerk_user_id] = user
+        if len(users) < LIST_USERS_PAGE_SIZE:
+            break
+        page += 1
+    return found
+
+
+def _create_user(data: Dict[str, Any], users: Dict[str, Any]) -> str:
+    clerk_user_id = data.get("id")
+    if clerk_user_id in users:
+        # Created by an earlier attempt of this event that didn't get to record it
+        return f"Supabase user {users[clerk_user_id].id} already exists"
+
+    email_addresses = data.get("email_addresses") or []
+    email = email_addresses[0].get("email_address") if email_addresses else None
+    if not email:
+        logger.warning("No email for Clerk user %s, skipping Supabase user creation", clerk_user_id)
+        return "No email found, skipped user creation"
+
+    auth_response = timed(SUPABASE_AUTH, "create_user", clients.supabase().auth.admin.create_user, {
+        "email": email,
+        "email_confirm": True,  # Auto-confirm since they signed up via Clerk
+        "user_metadata": {
+            "clerk_user_id": clerk_user_id,
+            "first_name": data.get("first_name"),
+            "last_name": data.get("last_name"),
+            "created_via": "clerk"
+        }
+    })
+    users[clerk_user_id] = auth_response.user
+    logger.info("Created Supabase user %s for Clerk user %s", auth_response.user.id, clerk_user_id)
+    return f"Created Supabase user {auth_response.user.id}"
+
+
+def _update_user(data: Dict[str, Any], users: Dict[str, Any]) -> str:
+    supabase_user = users.get(data.get("id"))
+    if supabase_user is None:
+        return "User not found in Supabase"
+    user_metadata = {
+        **(supabase_user.user_metadata or {}),
+        "first_name": data.get("first_name"),
+        "last_name": data.get("last_name")
+    }
+    timed(
+        SUPABASE_AUTH, "update_user_by_id", clients.supabase().auth.admin.update_user_by_id,
+        supabase_user.id, {"user_metadata": user_metadata}
+    )
+    supabase_user.user_metadata = user_metadata
+    # Every worker drops what it cached for this user
+    invalidation_bus.publish(USER, supabase_user.id)
+    return f"Updated Supabase user {supabase_user.id}"
+
+
+def _delete_user(data: Dict[str, Any], users: Dict[str, Any]) -> str:
+    supabase_user = users.pop(data.get("id"), None)
+    if supabase_user is None:
+        return "User not found in Supabase"
+    timed(SUPABASE_AUTH, "delete_user", clients.supabase().auth.admin.delete_user, supabase_user.id)
+    invalidation_bus.publish(USER, supabase_user.id)
+    return f"Deleted Supabase user {supabase_user.id}"
+
+
+_HANDLERS = {USER_CREATED: _create_user, USER_UPDATED: _update_user, USER_DELETED: _delete_user}
+
+
+class ClerkWebhookQueue:
+    """
+    Clerk user events are stored when they arrive and applied to Supabase
+    by a background task in each worker, in batches, retrying with backoff.
+
+    - CLERK_WEBHOOK_QUEUE_PATH: SQLite file for the queue (clerk_webhooks.sqlite3)
+    - CLERK_WEBHOOK_BATCH_SIZE: events claimed per batch (50)
+    - CLERK_WEBHOOK_CONCURRENCY: events of a batch applied at once (8)
+    - CLERK_WEBHOOK_MAX_ATTEMPTS: attempts before an event is marked failed (8)
+    - CLERK_WEBHOOK_RETRY_BASE_S / CLERK_WEBHOOK_RETRY_MAX_S: backoff (2 / 600)
+    - CLERK_WEBHOOK_POLL_S: how often to look for due retries and events
+      received by other workers (1)
+    - CLERK_WEBHOOK_RETENTION_DAYS: how long finished events are kept for
+      deduplication (7)
+    """
+
+    def __init__(self):
+        self.batch_size = int(os.getenv("CLERK_WEBHOOK_BATCH_SIZE", "50"))
+        self.concurrency = int(os.getenv("CLERK_WEBHOOK_CONCURRENCY", "8"))
+        self.max_attempts = int(os.getenv("CLERK_WEBHOOK_MAX_ATTEMPTS", "8"))
+        self.retry_base = float(os.getenv("CLERK_WEBHOOK_RETRY_BASE_S", "2"))
+        self.retry_max = float(os.getenv("CLERK_WEBHOOK_RETRY_MAX_S", "600"))
+        self.poll_interval = float(os.getenv("CLERK_WEBHOOK_POLL_S", "1"))
+        self.lease_seconds = float(os.getenv("CLERK_WEBHOOK_LEASE_S", "300"))
+        self.retention_seconds = float(os.getenv("CLERK_WEBHOOK_RETENTION_DAYS", "7")) * 86400
+        self.store: Optional[WebhookStore] = None
+        self.batches = 0
+        self.processed = 0
+        self.retried = 0
+        self.failed = 0
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._last_purge = 0.0
+
+    def _store(self) -> WebhookStore:
+        if self.store is None:
+            self.store = WebhookStore(os.getenv("CLERK_WEBHOOK_QUEUE_PATH", "clerk_webhooks.sqlite3"))
+        return self.store
+
+    async def enqueue(self, event_id: str, payload: Dict[str, Any]) -> bool:
+        """Store an event for processing; False if it was already received"""
+        event_type = payload.get("type")
+        clerk_user_id = (payload.get("data") or {}).get("id")
+        queued = await run_in_threadpool(
+            self._store().enqueue, event_id, event_type, clerk_user_id, json.dumps(payload)
+        )
+        webhook_events.inc(event_type, "queued" if queued else "duplicate")
+        if queued and self._wake is not None:
+            self._wake.set()
+        return queued
+
+    async def start(self):
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            task, self._task = self._task, None
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        if self.store is not None:
+            self.store.close()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                while True:
+                    events = await run_in_threadpool(self._store().claim, self.batch_size, self.lease_seconds)
+                    if not events:
+                        break
+                    # Shielded: a shutdown mid-batch still records what was applied
+                    await asyncio.shield(self.process_batch(events))
+                if time.time() - self._last_purge > 3600:
+                    self._last_purge = time.time()
+                    await run_in_threadpool(self._store().purge, time.time() - self.retention_seconds)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Clerk webhook queue failed")
+
+    async def process_batch(self, events: List[Dict[str, Any]]):
+        """
+        Apply a batch of claimed events. One user-list pass serves every
+        event in it, then the events run concurrently: a batch never holds
+        two events for the same Clerk user. Each event succeeds, is retried
+        later, or fails on its own.
+        """
+        self.batches += 1
+        try:
+            users = await run_in_threadpool(_supabase_users_by_clerk_id, [
+                event["clerk_user_id"] for event in events if event["clerk_user_id"]
+            ])
+        except Exception as e:
+            for event in events:
+                await run_in_threadpool(self._failed, event, e)
+            return
+
+        limit = asyncio.Semaphore(self.concurrency)
+
+        async def apply(event):
+            async with limit:
+                await run_in_threadpool(self._apply, event, users)
+
+        await asyncio.gather(*(apply(event) for event in events))
+
+    def _apply(self, event: Dict[str, Any], users: Dict[str, Any]):
+        try:
+            data = json.loads(event["payload"]).get("data") or {}
+            result = _HANDLERS[event["event_type"]](data, users)
+        except Exception as e:
+            self._failed(event, e)
+            return
+        self._store().complete(event["event_id"], result)
+        self.processed += 1
+        webhook_events.inc(event["event_type"], "processed")
+
+    def _failed(self, event: Dict[str, Any], error: Exception):
+        store = self._store()
+        attempts = event["attempts"]
+        if _is_permanent(error) or attempts >= self.max_attempts:
+            store.fail(event["event_id"], str(error), None)
+            self.failed += 1
+            webhook_events.inc(event["event_type"], "failed")
+            logger.error(
+                "Clerk webhook %s (%s) failed after %s attempts: %s",
+                event["event_id"], event["event_type"], attempts, error
+            )
+            return
+        delay = min(self.retry_max, self.retry_base * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+        store.fail(event["event_id"], str(error), time.time() + delay)
+        self.retried += 1
+        webhook_events.inc(event["event_type"], "retried")
+        logger.warning(
+            "Clerk webhook %s (%s) attempt %s failed, retrying in %.1fs: %s",
+            event["event_id"], event["event_type"], attempts, delay, error
+        )
+
+    async def retry(self, event_id: str) -> bool:
+        retried = await run_in_threadpool(self._store().retry, event_id)
+        if retried and self._wake is not None:
+            self._wake.set()
+        return retried
+
+    async def stats(self, failed_limit: int = 20) -> Dict[str, Any]:
+        store = self._store()
+        counts = await run_in_threadpool(store.counts)
+        return {
+            "queue": counts,
+            "worker": {
+                "running": self._task is not None,
+                "batches": self.batches,
+                "processed": self.processed,
+                "retried": self.retried,
+                "failed": self.failed,
+            },
+            "failed_events": await run_in_threadpool(store.failed, failed_limit),
+        }
+
+
+clerk_webhooks = ClerkWebhookQueue()
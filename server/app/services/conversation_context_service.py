@@ -0,0 +1,239 @@
+import os
+import asyncio
+from typing import Optional, Dict, Any, List, Tuple, Callable, Awaitable
+from fastapi import Depends, HTTPException
+import logging
+
+from .claude_service import get_claude_service, ClaudeService
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_SYSTEM_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an "
+    "assistant about their project board. Merge the new turns into the existing "
+    "summary. Keep facts, decisions, names and open questions; drop pleasantries. "
+    "Reply with the updated summary only."
+)
+
+
+# Conversations with a summary job in flight on this worker, so turns that keep
+# rolling off while one runs are not submitted again
+_summarizing: Dict[str, asyncio.Task] = {}
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate (~4 characters per token) used for budgeting.
+    """
+    return max(1, (len(text) + 3) // 4) if text else 0
+
+
+def _to_turns(messages: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """
+    Strip stored messages down to role/content, merging consecutive messages
+    with the same role (e.g. after a reply was cancelled before any text).
+    """
+    turns: List[Dict[str, str]] = []
+    for m in messages:
+        if turns and turns[-1]["role"] == m["role"]:
+            turns[-1] = {"role": m["role"], "content": f"{turns[-1]['content']}\n\n{m['content']}"}
+        else:
+            turns.append({"role": m["role"], "content": m["content"]})
+    return turns
+
+
+class ContextBudget:
+    """
+    Per-request token limits for the prompt sent to the model.
+    """
+
+    def __init__(
+        self,
+        max_history_tokens: Optional[int] = None,
+        max_message_tokens: Optional[int] = None,
+        max_summary_tokens: Optional[int] = None,
+        max_output_tokens: Optional[int] = None,
+    ):
+        self.max_history_tokens = max_history_tokens or int(os.getenv("CHAT_MAX_HISTORY_TOKENS", "6000"))
+        self.max_message_tokens = max_message_tokens or int(os.getenv("CHAT_MAX_MESSAGE_TOKENS", "4000"))
+        self.max_summary_tokens = max_summary_tokens or int(os.getenv("CHAT_MAX_SUMMARY_TOKENS", "512"))
+        self.max_output_tokens = max_output_tokens or int(os.getenv("CHAT_MAX_OUTPUT_TOKENS", "1024"))
+        self.max_retrieval_tokens = int(os.getenv("CHAT_MAX_RETRIEVAL_TOKENS", "2000"))
+        # Rolled-off turns stay in the prompt until their summary is stored,
+        # up to this many tokens, so a failing summarizer cannot grow it forever
+        self.max_pending_tokens = int(os.getenv("CHAT_MAX_PENDING_TOKENS", str(self.max_history_tokens)))
+        # When history overflows, roll off down to this fraction of the budget so
+        # the summary is recomputed every few turns rather than on every turn
+        self.rolloff_target = 0.6
+
+
+class ContextWindow:
+    """
+    The prompt to send for one request: system text, recent turns and their size.
+    """
+
+    def __init__(self, system: str, messages: List[Dict[str, str]], prompt_tokens: int, max_output_tokens: int):
+        self.system = system
+        self.messages = messages
+        self.prompt_tokens = prompt_tokens
+        self.max_output_tokens = max_output_tokens
+
+    def add_context(self, heading: str, text: str, tokens: int):
+        """
+        Append a block of reference material to the system prompt.
+        """
+        if text:
+            self.system = f"{self.system}\n\n{heading}\n{text}"
+            self.prompt_tokens += tokens + estimate_tokens(heading)
+
+
+class ConversationContextService:
+    """
+    Keeps conversation prompts within a token budget. Recent turns are sent
+    verbatim; turns that roll off are folded into a stored running summary
+    by a background task, so requests never wait for it. Until the summary
+    is stored, rolled-off turns are still sent verbatim.
+    """
+
+    def __init__(self, claude: ClaudeService, budget: Optional[ContextBudget] = None):
+        self.claude = claude
+        self.budget = budget or ContextBudget()
+
+    def check_message(self, content: str) -> int:
+        """
+        Count a new user message, rejecting it if it alone exceeds the budget.
+        """
+        tokens = estimate_tokens(content)
+        if tokens > self.budget.max_message_tokens:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Message is too long ({tokens} tokens, limit {self.budget.max_message_tokens})"
+            )
+        return tokens
+
+    def _rolloff_index(self, messages: List[Dict[str, Any]]) -> int:
+        """
+        Index of the first message to keep verbatim. Messages before it roll
+        off into the summary. The kept window always starts with a user turn.
+        """
+        total = sum(m["tokens"] for m in messages)
+        if total <= self.budget.max_history_tokens:
+            return 0
+
+        target = int(self.budget.max_history_tokens * self.budget.rolloff_target)
+        kept = 0
+        index = len(messages)
+        while index > 0 and kept + messages[index - 1]["tokens"] <= target:
+            index -= 1
+            kept += messages[index]["tokens"]
+        # Always keep the latest turn, even if it is larger than the target
+        index = min(index, len(messages) - 1)
+        while index < len(messages) - 1 and messages[index]["role"] != "user":
+            index += 1
+        return index
+
+    def _pending_index(self, messages: List[Dict[str, Any]], rolled_off: int) -> int:
+        """
+        Index of the first rolled-off message still sent verbatim because its
+        summary has not been stored yet: the newest that fit in
+        max_pending_tokens, starting with a user turn.
+        """
+        pending = 0
+        index = rolled_off
+        while index > 0 and pending + messages[index - 1]["tokens"] <= self.budget.max_pending_tokens:
+            index -= 1
+            pending += messages[index]["tokens"]
+        while index < rolled_off and messages[index]["role"] != "user":
+            index += 1
+        return index
+
+    async def _summarize(
+        self,
+        conversation_id: str,
+        summary: Optional[str],
+        messages: List[Dict[str, Any]],
+        persist: Callable[[str], Awaitable[Any]]
+    ):
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+        prompt = f"Existing summary:\n{summary or '(none)'}\n\nNew turns:\n{transcript}"
+        try:
+            # The normal request path, not a batch: the turns are missing from
+            # the summary until this lands, and batches can take hours
+            summary = await self.claude.complete(
+                [{"role": "user", "content": prompt}],
+                system=SUMMARY_SYSTEM_PROMPT,
+                max_tokens=self.budget.max_summary_tokens
+            )
+            await persist(summary)
+        except Exception as e:
+            # Nothing is stored, so the same turns roll off and are summarized again next time
+            logger.warning("Summary of conversation %s failed: %s", conversation_id, e)
+
+    def summarize_in_background(
+        self,
+        conversation_id: str,
+        summary: Optional[str],
+        messages: List[Dict[str, Any]],
+        persist: Callable[[str], Awaitable[Any]]
+    ) -> bool:
+        """
+        Fold messages into summary as a background task and hand the result
+        to persist. Returns False if one is already running for the
+        conversation on this worker.
+        """
+        if conversation_id in _summarizing:
+            return False
+        task = asyncio.create_task(self._summarize(conversation_id, summary, messages, persist))
+        _summarizing[conversation_id] = task
+        task.add_done_callback(lambda _: _summarizing.pop(conversation_id, None))
+        return True
+
+    async def build(
+        self,
+        system: str,
+        messages: List[Dict[str, Any]],
+        summary: Optional[str] = None,
+    ) -> Tuple[ContextWindow, int]:
+        """
+        Build the context window for a request from the unsummarized messages
+        (each with role, content and tokens) and the stored summary. Returns
+        (window, rolled_off) where rolled_off is how many leading messages
+        did not fit; the caller has them summarized when it is non-zero.
+        They stay in the window, within max_pending_tokens, until it has.
+        """
+        rolled_off = self._rolloff_index(messages)
+        kept = messages[self._pending_index(messages, rolled_off):]
+        if summary:
+            system = f"{system}\n\nSummary of the earlier conversation:\n{summary}"
+
+        window = ContextWindow(
+            system=system,
+            messages=_to_turns(kept),
+            prompt_tokens=estimate_tokens(system) + sum(m["tokens"] for m in kept),
+            max_output_tokens=self.budget.max_output_tokens
+        )
+        return window, rolled_off
+
+    async def build_from_history(self, system: str, history: List[Dict[str, str]]) -> ContextWindow:
+        """
+        Budget a client-supplied history with no stored conversation. Older
+        turns are truncated rather than summarized, since nothing is cached.
+        """
+        messages = [{**m, "tokens": estimate_tokens(m["content"])} for m in history]
+        if messages:
+            self.check_message(messages[-1]["content"])
+        kept = messages[self._rolloff_index(messages):]
+        return ContextWindow(
+            system=system,
+            messages=_to_turns(kept),
+            prompt_tokens=estimate_tokens(system) + sum(m["tokens"] for m in kept),
+            max_output_tokens=self.budget.max_output_tokens
+        )
+
+
+# Dependency function to get ConversationContextService instance
+def get_conversation_context_service(claude: ClaudeService = Depends(get_claude_service)) -> ConversationContextService:
+    """
+    Dependency function to provide ConversationContextService instance.
+    """
+    return ConversationContextService(claude)
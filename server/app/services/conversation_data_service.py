@@ -0,0 +1,145 @@
+from typing import Optional, Dict, Any, List
+from fastapi import Depends, HTTPException
+from supabase import Client
+
+from ..auth import get_supabase_client, AuthenticatedUser
+
+class ConversationDataService:
+    """
+    Service class for storing chat conversations and their messages using Supabase.
+    Each message gets a sequence number and its token count is stored once on write.
+    Tables are defined in migrations/001_conversations.sql.
+    """
+
+    def __init__(self, supabase_client: Client = Depends(get_supabase_client)):
+        self.supabase = supabase_client
+
+    def create_conversation(self, project_id: str, user: AuthenticatedUser) -> Dict[str, Any]:
+        """
+        Create a new, empty conversation for a project.
+        """
+        try:
+            response = self.supabase.table("conversations").insert({
+                "project_id": project_id,
+                "user_id": user.supabase_user_id,
+                "message_count": 0,
+                "total_tokens": 0,
+                "summary": None,
+                "summarized_count": 0
+            }).execute()
+
+            if not response.data:
+                raise HTTPException(status_code=500, detail="Failed to create conversation")
+
+            return response.data[0]
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+    def get_conversation(self, conversation_id: str, user: AuthenticatedUser) -> Dict[str, Any]:
+        """
+        Get a conversation by its ID.
+        """
+        try:
+            response = self.supabase.table("conversations").select("*").eq("id", conversation_id).eq("user_id", user.supabase_user_id).execute()
+
+            if not response.data:
+                raise HTTPException(status_code=404, detail="Conversation not found")
+
+            return response.data[0]
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+    def get_messages(self, conversation: Dict[str, Any], user: AuthenticatedUser, from_seq: int = 0) -> List[Dict[str, Any]]:
+        """
+        Get a conversation's messages in order, starting at a sequence number.
+        """
+        try:
+            response = self.supabase.table("conversation_messages").select("*").eq(
+                "conversation_id", conversation["id"]
+            ).eq(
+                "user_id", user.supabase_user_id
+            ).gte("seq", from_seq).order("seq").execute()
+
+            return response.data if response.data else []
+
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+    def append_message(
+        self,
+        conversation: Dict[str, Any],
+        role: str,
+        content: str,
+        tokens: int,
+        user: AuthenticatedUser
+    ) -> Dict[str, Any]:
+        """
+        Append a message and bump the conversation's running counters.
+        The sequence number and counters are allocated in the database
+        (append_conversation_message), so concurrent turns cannot collide;
+        the passed conversation dict is refreshed from what it returns.
+        """
+        try:
+            response = self.supabase.rpc("append_conversation_message", {
+                "p_conversation_id": conversation["id"],
+                "p_user_id": user.supabase_user_id,
+                "p_role": role,
+                "p_content": content,
+                "p_tokens": tokens
+            }).execute()
+
+            if not response.data:
+                raise HTTPException(status_code=500, detail="Failed to store message")
+
+            conversation["message_count"] = response.data["message_count"]
+            conversation["total_tokens"] = response.data["total_tokens"]
+            return response.data["message"]
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+    def update_summary(
+        self,
+        conversation: Dict[str, Any],
+        summary: Optional[str],
+        summarized_count: int,
+        user: AuthenticatedUser,
+        previous_count: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Store the rolling summary and how many messages it covers. With
+        previous_count, only if the stored summary still covers that many,
+        so a summary computed from an older state never overwrites a newer one.
+        """
+        try:
+            query = self.supabase.table("conversations").update({
+                "summary": summary,
+                "summarized_count": summarized_count
+            }).eq("id", conversation["id"]).eq("user_id", user.supabase_user_id)
+            if previous_count is not None:
+                query = query.eq("summarized_count", previous_count)
+            response = query.execute()
+
+            if response.data:
+                conversation["summary"] = summary
+                conversation["summarized_count"] = summarized_count
+            return conversation
+
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+
+# Dependency function to get ConversationDataService instance
+def get_conversation_data_service(supabase_client: Client = Depends(get_supabase_client)) -> ConversationDataService:
+    """
+    Dependency function to provide ConversationDataService instance.
+    """
+    return ConversationDataService(supabase_client)
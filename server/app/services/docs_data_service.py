@@ -1,19 +1,26 @@
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from fastapi import Depends, HTTPException
-from supabase import Client
 
-from ..auth import get_supabase_client, AuthenticatedUser
+from ..auth import AuthenticatedUser
+from .project_version import project_versions
+from .storage_backend import get_storage_backend, StorageBackend
+from .bulk import run_isolated, update_grouped, item_ok, item_error, error_result
+from .row_cache import document_cache
+from .folders_data_service import FoldersDataService
+from .single_flight import SingleFlight
+
+document_reads = SingleFlight("get_document")
 
 class DocsDataService:
     """
-    Service class for handling basic document CRUD operations using Supabase.
-    Leverages the Supabase client from auth.py for consistency.
+    Service class for handling basic document CRUD operations on the
+    configured storage backend (PostgREST or asyncpg).
     """
     
-    def __init__(self, supabase_client: Client = Depends(get_supabase_client)):
-        self.supabase = supabase_client
+    def __init__(self, storage: StorageBackend):
+        self.storage = storage
     
-    def create_document(
+    async def create_document(
         self, 
         project_id: str, 
         doc_name: str, 
@@ -25,24 +32,25 @@ class DocsDataService:
         """
         try:
             # Insert document into database
-            response = self.supabase.table("docs").insert({
+            rows = await self.storage.insert("docs", [{
                 "project_id": project_id,
                 "doc_name": doc_name,
                 "content": content,
                 "user_id": user.supabase_user_id
-            }).execute()
+            }])
             
-            if not response.data:
+            if not rows:
                 raise HTTPException(status_code=500, detail="Failed to create document")
                 
-            return response.data[0]
+            project_versions.bump(rows[0]["project_id"])
+            return rows[0]
             
         except HTTPException:
             raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
     
-    def update_document(
+    async def update_document(
         self, 
         doc_id: str, 
         doc_name: Optional[str] = None, 
@@ -64,45 +72,63 @@ class DocsDataService:
             if not update_data:
                 raise HTTPException(status_code=400, detail="No update data provided")
             
-            response = self.supabase.table("docs").update(update_data).eq("id", doc_id).eq("user_id", user.supabase_user_id).execute()
+            rows = await self.storage.update("docs", update_data, {"id": doc_id, "user_id": user.supabase_user_id})
             
-            if not response.data:
+            if not rows:
                 raise HTTPException(status_code=404, detail="Document not found or update failed")
                 
-            return response.data[0]
+            await document_cache.invalidate(user.supabase_user_id, doc_id)
+            project_versions.bump(rows[0]["project_id"])
+            return rows[0]
             
         except HTTPException:
             raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
     
-    def get_document(self, doc_id: str, user: AuthenticatedUser) -> Dict[str, Any]:
+    async def get_document(self, doc_id: str, user: AuthenticatedUser) -> Dict[str, Any]:
         """
-        Get a document by its ID.
+        Get a document by its ID, served from the row cache when possible.
         """
         try:
-            response = self.supabase.table("docs").select("*").eq("id", doc_id).eq("user_id", user.supabase_user_id).execute()
+            cached = await document_cache.get(user.supabase_user_id, doc_id)
+            if cached is not None:
+                return cached
+            
+            generation = document_cache.generation()
+            # Identical misses in flight at once share one query. The generation
+            # is part of the key, so a read starting after a doc write never
+            # joins one that started before it.
+            rows = await document_reads.do(
+                (user.supabase_user_id, doc_id, generation),
+                lambda: self.storage.select("docs", {"id": doc_id, "user_id": user.supabase_user_id})
+            )
             
-            if not response.data:
+            if not rows:
                 raise HTTPException(status_code=404, detail="Document not found")
                 
-            return response.data[0]
+            await document_cache.set(user.supabase_user_id, doc_id, rows[0], generation)
+            return rows[0]
             
         except HTTPException:
             raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
     
-    def delete_document(self, doc_id: str, user: AuthenticatedUser) -> bool:
+    async def delete_document(self, doc_id: str, user: AuthenticatedUser) -> bool:
         """
         Delete a document by its ID.
         """
         try:
-            response = self.supabase.table("docs").delete().eq("id", doc_id).eq("user_id", user.supabase_user_id).execute()
+            rows = await self.storage.delete("docs", {"id": doc_id, "user_id": user.supabase_user_id})
             
-            if not response.data:
+            if not rows:
                 raise HTTPException(status_code=404, detail="Document not found")
                 
+            await document_cache.invalidate(user.supabase_user_id, doc_id)
+            for row in rows:
+                project_versions.bump(row["project_id"])
+            await FoldersDataService(self.storage).release_items([doc_id], user)
             return True
             
         except HTTPException:
@@ -110,10 +136,84 @@ class DocsDataService:
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
+    async def create_documents(self, items: List[Dict[str, Any]], user: AuthenticatedUser) -> List[Dict[str, Any]]:
+        """
+        Create many documents with a single insert. Returns one result per item.
+        """
+        rows = [{
+            "project_id": item["project_id"],
+            "doc_name": item["doc_name"],
+            "content": item["content"],
+            "user_id": user.supabase_user_id
+        } for item in items]
+        written = await run_isolated(rows, lambda batch: self.storage.insert("docs", batch))
+        for project_id in {row["project_id"] for row in written if not isinstance(row, Exception)}:
+            project_versions.bump(project_id)
+        return [
+            error_result(index, row) if isinstance(row, Exception) else item_ok(index, "document", row)
+            for index, row in enumerate(written)
+        ]
+    
+    async def update_documents(self, items: List[Dict[str, Any]], user: AuthenticatedUser) -> List[Dict[str, Any]]:
+        """
+        Apply per-item changes, updating only the changed columns with one
+        statement per distinct change. Returns one result per item; several
+        changes to the same document are merged.
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+        merged: Dict[str, Dict[str, Any]] = {}
+        positions: Dict[str, List[int]] = {}
+        for index, item in enumerate(items):
+            item_id = str(item["id"])
+            changes = {"doc_name": item.get("doc_name"), "content": item.get("content")}
+            changes = {column: value for column, value in changes.items() if value is not None}
+            if not changes:
+                results[index] = item_error(index, 400, "No update data provided")
+            else:
+                merged[item_id] = {**merged.get(item_id, {}), **changes}
+                positions.setdefault(item_id, []).append(index)
+
+        written = await update_grouped(
+            merged,
+            lambda values, ids: self.storage.update("docs", values, {"id": ids, "user_id": user.supabase_user_id})
+        )
+        await document_cache.invalidate_many(user.supabase_user_id, merged)
+        for item_id, indexes in positions.items():
+            row = written.get(item_id)
+            for index in indexes:
+                if row is None:
+                    results[index] = item_error(index, 404, "Document not found or update failed")
+                elif isinstance(row, Exception):
+                    results[index] = error_result(index, row)
+                else:
+                    results[index] = item_ok(index, "document", row)
+        for project_id in {row["project_id"] for row in written.values() if not isinstance(row, Exception)}:
+            project_versions.bump(project_id)
+        return results
+    
+    async def delete_documents(self, doc_ids: List[str], user: AuthenticatedUser) -> List[Dict[str, Any]]:
+        """
+        Delete many documents with a single statement. Returns one result per id.
+        """
+        ids = [str(doc_id) for doc_id in doc_ids]
+        try:
+            deleted = await self.storage.delete("docs", {"id": list(dict.fromkeys(ids)), "user_id": user.supabase_user_id})
+        except Exception as e:
+            return [error_result(index, e) for index in range(len(ids))]
+
+        for project_id in {row["project_id"] for row in deleted}:
+            project_versions.bump(project_id)
+        found = {str(row["id"]) for row in deleted}
+        await document_cache.invalidate_many(user.supabase_user_id, found)
+        await FoldersDataService(self.storage).release_items(list(found), user)
+        return [
+            item_ok(index, "id", item_id) if item_id in found else item_error(index, 404, "Document not found")
+            for index, item_id in enumerate(ids)
+        ]
 
 # Dependency function to get DocsDataService instance
-def get_docs_data_service(supabase_client: Client = Depends(get_supabase_client)) -> DocsDataService:
+def get_docs_data_service(storage: StorageBackend = Depends(get_storage_backend)) -> DocsDataService:
     """
     Dependency function to provide DocsDataService instance.
     """
-    return DocsDataService(supabase_client)
\ No newline at end of file
+    return DocsDataService(storage)
\ No newline at end of file
@@ -0,0 +1,118 @@
+import os
+import re
+import math
+import hashlib
+from typing import Dict, List, Optional
+import logging
+
+from .cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+LOCAL_DIMENSIONS = 512
+GEMINI_MODEL = "text-embedding-004"
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by do does for from has have how i in is it its "
+    "me my of on or our so that the their them there they this to was we what "
+    "when where which who why will with you your".split()
+)
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _normalize(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(v * v for v in vector))
+    return [v / norm for v in vector] if norm else vector
+
+
+def cosine(a: List[float], b: List[float]) -> float:
+    """
+    Cosine similarity of two normalized vectors.
+    """
+    return sum(x * y for x, y in zip(a, b))
+
+
+class EmbeddingService:
+    """
+    Text embeddings for retrieval. Uses Gemini embeddings when GEMINI_API_KEY
+    is set, otherwise a local hashed bag-of-words model that needs no network.
+    Vectors are normalized and cached by content hash, so unchanged text is
+    never embedded twice.
+    """
+
+    def __init__(self, api_key: Optional[str] = None, cache_size: int = 20000):
+        self.api_key = api_key or os.getenv("GEMINI_API_KEY")
+        self.cache = LRUCache(max_entries=cache_size)
+        self._client = None
+
+    @property
+    def model_name(self) -> str:
+        return GEMINI_MODEL if self.api_key else f"local-hash-{LOCAL_DIMENSIONS}"
+
+    def _embed_local(self, text: str) -> List[float]:
+        words = [w for w in _TOKEN_RE.findall(text.lower()) if w not in _STOPWORDS]
+        counts: Dict[str, int] = {}
+        # Unigrams plus bigrams, hashed into a fixed number of buckets
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            counts[feature] = counts.get(feature, 0) + 1
+
+        vector = [0.0] * LOCAL_DIMENSIONS
+        for feature, count in counts.items():
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % LOCAL_DIMENSIONS
+            sign = 1.0 if digest[4] & 1 else -1.0
+            # Sublinear term frequency so repeated words don't dominate
+            vector[bucket] += sign * (1.0 + math.log(count))
+        return _normalize(vector)
+
+    def _embed_remote(self, texts: List[str]) -> List[List[float]]:
+        if self._client is None:
+            from google import genai
+            self._client = genai.Client(api_key=self.api_key)
+        response = self._client.models.embed_content(model=GEMINI_MODEL, contents=texts)
+        return [_normalize(list(e.values)) for e in response.embeddings]
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed a batch of texts, only computing the ones not already cached.
+        """
+        keys = [(self.model_name, content_hash(text)) for text in texts]
+        vectors: List[Optional[List[float]]] = [self.cache.get(key) for key in keys]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+
+        if missing:
+            pending = [texts[i] for i in missing]
+            if self.api_key:
+                try:
+                    computed = self._embed_remote(pending)
+                except Exception as e:
+                    logger.error(f"Remote embedding failed for {len(pending)} texts: {str(e)}")
+                    raise
+            else:
+                computed = [self._embed_local(text) for text in pending]
+            for i, vector in zip(missing, computed):
+                vectors[i] = vector
+                self.cache.set(keys[i], vector)
+
+        return vectors
+
+    def embed_one(self, text: str) -> List[float]:
+        return self.embed([text])[0]
+
+
+_embedding_service: Optional[EmbeddingService] = None
+
+
+# Dependency function to get the shared EmbeddingService instance
+def get_embedding_service() -> EmbeddingService:
+    """
+    Dependency function to provide a shared EmbeddingService so its cache is reused.
+    """
+    global _embedding_service
+    if _embedding_service is None:
+        _embedding_service = EmbeddingService()
+    return _embedding_service
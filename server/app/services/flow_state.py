@@ -0,0 +1,59 @@
+from typing import Dict, Any
+
+# Keys inside a React Flow node's ``data`` that point at other nodes or rows
+_NODE_REF_KEYS = ("docId", "linkId", "groupedToFolder")
+_NODE_LIST_KEYS = ("groupedNodes",)
+
+
+def remap_flow_state(flow_state: Dict[str, Any], id_map: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Return a copy of a flow_state with node, edge and row references rewritten
+    through id_map in a single pass. Ids missing from the map are left as-is.
+    """
+    def remap(value):
+        return id_map.get(value, value) if isinstance(value, str) else value
+
+    nodes = []
+    for node in flow_state.get("nodes", []):
+        node = {**node, "id": remap(node.get("id"))}
+        if "parentId" in node:
+            node["parentId"] = remap(node["parentId"])
+
+        data = node.get("data")
+        if isinstance(data, dict):
+            data = dict(data)
+            for key in _NODE_REF_KEYS:
+                if key in data:
+                    data[key] = remap(data[key])
+            for key in _NODE_LIST_KEYS:
+                if isinstance(data.get(key), list):
+                    data[key] = [remap(item) for item in data[key]]
+            node["data"] = data
+
+        nodes.append(node)
+
+    edges = []
+    for edge in flow_state.get("edges", []):
+        edges.append({
+            **edge,
+            "source": remap(edge.get("source")),
+            "target": remap(edge.get("target")),
+        })
+
+    return {**flow_state, "nodes": nodes, "edges": edges}
+
+
+def node_ids_by_row(flow_state: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Map each doc and link row id on the board to the id of the node showing
+    it (the first one, if a row has several).
+    """
+    node_ids: Dict[str, str] = {}
+    for node in (flow_state or {}).get("nodes", []):
+        data = node.get("data")
+        if not isinstance(data, dict) or node.get("id") is None:
+            continue
+        for key in ("docId", "linkId"):
+            if data.get(key):
+                node_ids.setdefault(str(data[key]), str(node["id"]))
+    return node_ids
@@ -0,0 +1,481 @@
+import asyncio
+import weakref
+from collections import Counter, defaultdict
+from typing import Optional, Dict, Any, List, Tuple
+from fastapi import Depends, HTTPException
+import logging
+
+from ..auth import AuthenticatedUser
+from .project_version import project_versions
+from .storage_backend import get_storage_backend, StorageBackend
+from .row_cache import document_cache, link_cache
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+FOLDERS = "folders"
+FOLDER_PATHS = "folder_paths"
+FOLDER_ITEMS = "folder_items"
+
+ITEM_TABLES = {"doc": "docs", "link": "links"}
+ITEM_CACHES = {"doc": document_cache, "link": link_cache}
+
+MAX_FOLDER_DEPTH = 32
+
+# Structural changes to one project's folders are applied one at a time on
+# this worker. A lock is dropped once no change holds or waits on it.
+_project_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def _project_lock(project_id: str) -> asyncio.Lock:
+    lock = _project_locks.get(str(project_id))
+    if lock is None:
+        lock = _project_locks[str(project_id)] = asyncio.Lock()
+    return lock
+
+
+class FoldersDataService:
+    """
+    Service class for a project's folder hierarchy on the configured storage
+    backend. Tables (project_id cascades from projects, like docs and links):
+
+    - folders: id, project_id, user_id, parent_id, title, item_count
+    - folder_paths: the closure table, one row per (ancestor_id,
+      descendant_id) pair with their distance in depth, including each
+      folder with itself at depth 0. A folder's subtree is then one indexed
+      read on ancestor_id, however deeply it nests.
+    - folder_items: item_id, item_type ('doc' or 'link'), folder_id. An item
+      is in at most one folder (item_id is unique).
+
+    item_count caches the number of items directly in a folder and is
+    recounted whenever items move in or out.
+    """
+
+    def __init__(self, storage: StorageBackend):
+        self.storage = storage
+
+    async def _check_project(self, project_id: str, user: AuthenticatedUser):
+        rows = await self.storage.select(
+            "projects", {"id": project_id, "user_id": user.supabase_user_id}, columns="id"
+        )
+        if not rows:
+            raise HTTPException(status_code=404, detail="Project not found")
+
+    async def _get_folder(self, folder_id: str, user: AuthenticatedUser) -> Dict[str, Any]:
+        rows = await self.storage.select(FOLDERS, {"id": folder_id, "user_id": user.supabase_user_id})
+        if not rows:
+            raise HTTPException(status_code=404, detail="Folder not found")
+        return rows[0]
+
+    async def _subtree(self, folder_id: str, user: AuthenticatedUser) -> Dict[str, int]:
+        """
+        Descendant id -> depth below the folder, the folder itself included.
+        """
+        rows = await self.storage.select(
+            FOLDER_PATHS, {"ancestor_id": folder_id, "user_id": user.supabase_user_id},
+            columns="descendant_id, depth"
+        )
+        return {str(row["descendant_id"]): row["depth"] for row in rows}
+
+    async def _ancestors(self, folder_id: str, user: AuthenticatedUser) -> Dict[str, int]:
+        """
+        Ancestor id -> depth above the folder, the folder itself included.
+        """
+        rows = await self.storage.select(
+            FOLDER_PATHS, {"descendant_id": folder_id, "user_id": user.supabase_user_id},
+            columns="ancestor_id, depth"
+        )
+        return {str(row["ancestor_id"]): row["depth"] for row in rows}
+
+    def _paths(self, ancestors: Dict[str, int], descendants: Dict[str, int], folder: Dict[str, Any],
+               user: AuthenticatedUser) -> List[Dict[str, Any]]:
+        """
+        Closure rows linking every ancestor to every descendant, with the
+        ancestors measured from the new parent and the descendants from the
+        folder being placed under it.
+        """
+        return [{
+            "ancestor_id": ancestor_id,
+            "descendant_id": descendant_id,
+            "depth": above + 1 + below,
+            "project_id": folder["project_id"],
+            "user_id": user.supabase_user_id,
+        } for ancestor_id, above in ancestors.items() for descendant_id, below in descendants.items()]
+
+    async def _recount(self, folder_ids, user: AuthenticatedUser):
+        """
+        Refresh the cached item_count of the given folders, one update per
+        distinct count.
+        """
+        folder_ids = {str(folder_id) for folder_id in folder_ids if folder_id}
+        if not folder_ids:
+            return
+        rows = await self.storage.select(
+            FOLDER_ITEMS, {"folder_id": list(folder_ids), "user_id": user.supabase_user_id}, columns="folder_id"
+        )
+        counts = Counter(str(row["folder_id"]) for row in rows)
+        by_count: Dict[int, List[str]] = defaultdict(list)
+        for folder_id in folder_ids:
+            by_count[counts.get(folder_id, 0)].append(folder_id)
+        for count, ids in by_count.items():
+            await self.storage.update(FOLDERS, {"item_count": count}, {"id": ids, "user_id": user.supabase_user_id})
+
+    async def create_folder(
+        self,
+        project_id: str,
+        title: str,
+        user: AuthenticatedUser,
+        parent_id: Optional[str] = None,
+        folder_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Create a folder at the top of a project or inside parent_id. folder_id
+        lets a client keep the id its board already uses for the folder node.
+        """
+        try:
+            async with _project_lock(project_id):
+                await self._check_project(project_id, user)
+
+                ancestors: Dict[str, int] = {}
+                if parent_id is not None:
+                    parent = await self._get_folder(parent_id, user)
+                    if str(parent["project_id"]) != str(project_id):
+                        raise HTTPException(status_code=400, detail="Parent folder belongs to another project")
+                    ancestors = await self._ancestors(parent_id, user)
+                    if max(ancestors.values()) + 1 >= MAX_FOLDER_DEPTH:
+                        raise HTTPException(status_code=422, detail=f"Folders nest at most {MAX_FOLDER_DEPTH} deep")
+
+                row = {
+                    "project_id": project_id,
+                    "user_id": user.supabase_user_id,
+                    "parent_id": parent_id,
+                    "title": title,
+                    "item_count": 0,
+                }
+                if folder_id is not None:
+                    row["id"] = folder_id
+                rows = await self.storage.insert(FOLDERS, [row])
+                if not rows:
+                    raise HTTPException(status_code=500, detail="Failed to create folder - no data returned")
+                folder = rows[0]
+                new_id = str(folder["id"])
+
+                paths = [{
+                    "ancestor_id": new_id,
+                    "descendant_id": new_id,
+                    "depth": 0,
+                    "project_id": project_id,
+                    "user_id": user.supabase_user_id,
+                }] + self._paths(ancestors, {new_id: 0}, folder, user)
+                try:
+                    await self.storage.insert(FOLDER_PATHS, paths)
+                except Exception:
+                    await self.storage.delete(FOLDERS, {"id": new_id, "user_id": user.supabase_user_id})
+                    raise
+
+            logger.debug("Created folder %s in project %s", new_id, project_id)
+            return folder
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+    async def rename_folder(self, folder_id: str, title: str, user: AuthenticatedUser) -> Dict[str, Any]:
+        """
+        Change a folder's title.
+        """
+        try:
+            rows = await self.storage.update(FOLDERS, {"title": title}, {"id": folder_id, "user_id": user.supabase_user_id})
+            if not rows:
+                raise HTTPException(status_code=404, detail="Folder not found")
+            return rows[0]
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+    async def list_folders(self, project_id: str, user: AuthenticatedUser) -> List[Dict[str, Any]]:
+        """
+        All folders of a project, each with total_item_count: its own
+        item_count plus that of every folder below it.
+        """
+        try:
+            await self._check_project(project_id, user)
+            folders = await self.storage.select(
+                FOLDERS, {"project_id": project_id, "user_id": user.supabase_user_id}, order_by="created_at"
+            )
+
+            children: Dict[Optional[str], List[Dict[str, Any]]] = defaultdict(list)
+            for folder in folders:
+                children[str(folder["parent_id"]) if folder.get("parent_id") else None].append(folder)
+
+            # Children before parents, without recursion however deep the tree
+            order, stack = [], list(children[None])
+            while stack:
+                folder = stack.pop()
+                order.append(folder)
+                stack.extend(children.get(str(folder["id"]), ()))
+            for folder in reversed(order):
+                folder["total_item_count"] = (folder.get("item_count") or 0) + sum(
+                    child["total_item_count"] for child in children.get(str(folder["id"]), ())
+                )
+            return folders
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+    async def get_folder_contents(
+        self, folder_id: str, user: AuthenticatedUser, recursive: bool = True
+    ) -> Dict[str, Any]:
+        """
+        A folder with the folders below it (each with its depth) and the items
+        in them; only its direct items and subfolders unless recursive.
+        """
+        try:
+            folder = await self._get_folder(folder_id, user)
+            if recursive:
+                subtree = await self._subtree(folder_id, user)
+                folders = await self.storage.select(
+                    FOLDERS, {"id": [i for i in subtree if i != str(folder_id)], "user_id": user.supabase_user_id}
+                ) if len(subtree) > 1 else []
+                for row in folders:
+                    row["depth"] = subtree[str(row["id"])]
+                folder_ids = list(subtree)
+            else:
+                folders = await self.storage.select(FOLDERS, {"parent_id": folder_id, "user_id": user.supabase_user_id})
+                for row in folders:
+                    row["depth"] = 1
+                folder_ids = [str(folder_id)]
+
+            items = await self.storage.select(
+                FOLDER_ITEMS, {"folder_id": folder_ids, "user_id": user.supabase_user_id},
+                columns="item_id, item_type, folder_id"
+            )
+            return {"folder": folder, "folders": folders, "items": items}
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+    async def move_folder(self, folder_id: str, parent_id: Optional[str], user: AuthenticatedUser) -> Dict[str, Any]:
+        """
+        Move a folder, with everything below it, into parent_id or to the top
+        of its project when parent_id is None. Only the closure rows linking
+        the subtree to its old and new ancestors change.
+        """
+        try:
+            folder = await self._get_folder(folder_id, user)
+            project_id = str(folder["project_id"])
+            async with _project_lock(project_id):
+                subtree = await self._subtree(folder_id, user)
+
+                new_ancestors: Dict[str, int] = {}
+                if parent_id is not None:
+                    if str(parent_id) in subtree:
+                        raise HTTPException(
+                            status_code=422, detail="A folder cannot be moved into itself or one of its subfolders"
+                        )
+                    parent = await self._get_folder(parent_id, user)
+                    if str(parent["project_id"]) != project_id:
+                        raise HTTPException(status_code=400, detail="Parent folder belongs to another project")
+                    new_ancestors = await self._ancestors(parent_id, user)
+                    if max(new_ancestors.values()) + 1 + max(subtree.values()) >= MAX_FOLDER_DEPTH:
+                        raise HTTPException(status_code=422, detail=f"Folders nest at most {MAX_FOLDER_DEPTH} deep")
+
+                old_ancestors = [a for a, depth in (await self._ancestors(folder_id, user)).items() if depth > 0]
+                detached = []
+                if old_ancestors:
+                    detached = await self.storage.delete(FOLDER_PATHS, {
+                        "ancestor_id": old_ancestors,
+                        "descendant_id": list(subtree),
+                        "user_id": user.supabase_user_id,
+                    })
+                try:
+                    paths = self._paths(new_ancestors, subtree, folder, user)
+                    if paths:
+                        await self.storage.insert(FOLDER_PATHS, paths)
+                    try:
+                        rows = await self.storage.update(
+                            FOLDERS, {"parent_id": parent_id}, {"id": folder_id, "user_id": user.supabase_user_id}
+                        )
+                    except Exception:
+                        if paths:
+                            await self.storage.delete(FOLDER_PATHS, {
+                                "ancestor_id": list(new_ancestors),
+                                "descendant_id": list(subtree),
+                                "user_id": user.supabase_user_id,
+                            })
+                        raise
+                except Exception:
+                    if detached:
+                        await self.storage.insert(FOLDER_PATHS, detached)
+                    raise
+
+            logger.debug("Moved folder %s (%d folders) under %s", folder_id, len(subtree), parent_id)
+            return rows[0] if rows else {**folder, "parent_id": parent_id}
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+    async def delete_folder(self, folder_id: str, user: AuthenticatedUser, delete_items: bool = False) -> Dict[str, Any]:
+        """
+        Delete a folder and every folder below it. Their items move up to the
+        deleted folder's parent (or out of any folder), or are deleted along
+        with it when delete_items is set. Like move_folder, the steps up to
+        removing the folders are undone if one fails; items are deleted only
+        after that, so a failure there leaves them in place, out of any folder.
+        """
+        try:
+            folder = await self._get_folder(folder_id, user)
+            project_id = str(folder["project_id"])
+            parent_id = folder.get("parent_id")
+            async with _project_lock(project_id):
+                folder_ids = list(await self._subtree(folder_id, user))
+                owner = {"user_id": user.supabase_user_id}
+                items = await self.storage.select(
+                    FOLDER_ITEMS, {"folder_id": folder_ids, **owner}, columns="item_id, item_type, folder_id"
+                )
+
+                released = bool(items) and bool(parent_id) and not delete_items
+                if released:
+                    await self.storage.update(FOLDER_ITEMS, {"folder_id": parent_id}, {"folder_id": folder_ids, **owner})
+                try:
+                    detached = await self.storage.delete(FOLDER_PATHS, {"descendant_id": folder_ids, **owner})
+                    try:
+                        await self.storage.delete(FOLDERS, {"id": folder_ids, **owner})
+                    except Exception:
+                        if detached:
+                            await self.storage.insert(FOLDER_PATHS, detached)
+                        raise
+                except Exception:
+                    if released:
+                        by_folder: Dict[str, List[str]] = defaultdict(list)
+                        for item in items:
+                            by_folder[str(item["folder_id"])].append(str(item["item_id"]))
+                        for original_id, item_ids in by_folder.items():
+                            await self.storage.update(FOLDER_ITEMS, {"folder_id": original_id}, {"item_id": item_ids, **owner})
+                    raise
+
+                try:
+                    if released:
+                        await self._recount([parent_id], user)
+                    elif items:
+                        # The foreign key already cascaded these in Postgres
+                        await self.storage.delete(FOLDER_ITEMS, {"folder_id": folder_ids, **owner})
+                except Exception as e:
+                    # The folders are gone either way; a stale count fixes itself on the folder's next change
+                    logger.warning("Failed to tidy up after deleting folder %s: %s", folder_id, e)
+
+                deleted_items: List[str] = []
+                if delete_items:
+                    for item_type, table in ITEM_TABLES.items():
+                        ids = [str(item["item_id"]) for item in items if item["item_type"] == item_type]
+                        if ids:
+                            rows = await self.storage.delete(table, {"id": ids, **owner})
+                            deleted_items.extend(str(row["id"]) for row in rows)
+                            await ITEM_CACHES[item_type].invalidate_many(user.supabase_user_id, [str(row["id"]) for row in rows])
+
+            if deleted_items:
+                project_versions.bump(project_id)
+            logger.debug("Deleted folder %s: %d folders, %d items deleted", folder_id, len(folder_ids), len(deleted_items))
+            return {
+                "deleted_folders": folder_ids,
+                "deleted_items": deleted_items,
+                "released_items": 0 if delete_items else len(items),
+            }
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+    async def add_items(self, folder_id: str, items: List[Tuple[str, str]], user: AuthenticatedUser) -> Dict[str, Any]:
+        """
+        Put (item_type, item_id) docs and links into a folder, taking them out
+        of whichever folder they were in.
+        """
+        try:
+            folder = await self._get_folder(folder_id, user)
+            project_id = str(folder["project_id"])
+            owner = {"user_id": user.supabase_user_id}
+
+            for item_type, table in ITEM_TABLES.items():
+                ids = list(dict.fromkeys(item_id for kind, item_id in items if kind == item_type))
+                if not ids:
+                    continue
+                rows = await self.storage.select(table, {"id": ids, **owner}, columns="id, project_id")
+                found = {str(row["id"]) for row in rows if str(row["project_id"]) == project_id}
+                missing = [item_id for item_id in ids if item_id not in found]
+                if missing:
+                    raise HTTPException(status_code=404, detail=f"{item_type.capitalize()} not found in this project: {missing[0]}")
+
+            async with _project_lock(project_id):
+                item_types = {item_id: item_type for item_type, item_id in items}
+                previous = await self.storage.select(
+                    FOLDER_ITEMS, {"item_id": list(item_types), **owner}, columns="folder_id"
+                )
+                await self.storage.upsert(FOLDER_ITEMS, [{
+                    "item_id": item_id,
+                    "item_type": item_type,
+                    "folder_id": folder_id,
+                    "project_id": project_id,
+                    "user_id": user.supabase_user_id,
+                } for item_id, item_type in item_types.items()], on_conflict="item_id")
+                await self._recount({folder_id} | {row["folder_id"] for row in previous}, user)
+
+            return await self._get_folder(folder_id, user)
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+    async def remove_items(self, folder_id: str, item_ids: List[str], user: AuthenticatedUser) -> Dict[str, Any]:
+        """
+        Take items out of a folder, back to the top of the project.
+        """
+        try:
+            folder = await self._get_folder(folder_id, user)
+            async with _project_lock(folder["project_id"]):
+                await self.storage.delete(FOLDER_ITEMS, {
+                    "folder_id": folder_id, "item_id": list(dict.fromkeys(item_ids)), "user_id": user.supabase_user_id
+                })
+                await self._recount([folder_id], user)
+
+            return await self._get_folder(folder_id, user)
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+    async def release_items(self, item_ids: List[str], user: AuthenticatedUser):
+        """
+        Drop deleted docs or links from their folders and fix the counts.
+        Called after the rows themselves are gone; a single delete when they
+        were in no folder.
+        """
+        if not item_ids:
+            return
+        owner = {"user_id": user.supabase_user_id}
+        try:
+            rows = await self.storage.delete(FOLDER_ITEMS, {"item_id": list(dict.fromkeys(item_ids)), **owner})
+            await self._recount({row["folder_id"] for row in rows}, user)
+        except Exception as e:
+            # The items are deleted either way; a stale count fixes itself on the folder's next change
+            logger.warning("Failed to release %d deleted items from their folders: %s", len(item_ids), e)
+
+
+# Dependency function to get FoldersDataService instance
+def get_folders_data_service(storage: StorageBackend = Depends(get_storage_backend)) -> FoldersDataService:
+    """
+    Dependency function to provide FoldersDataService instance.
+    """
+    return FoldersDataService(storage)
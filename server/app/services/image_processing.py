@@ -0,0 +1,122 @@
+import io
+import math
+from typing import Any, Dict, List, Sequence
+
+from PIL import Image, ImageOps, ExifTags, UnidentifiedImageError
+
+# Runs in the image worker processes, so nothing from the app is imported here
+
+# Longest side of each display variant; the last one caps what is ever displayed
+VARIANT_SIZES = (256, 512, 1024, 2048)
+
+# Formats accepted, with the media type the original is served as; MPO is a JPEG with extra frames
+MEDIA_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+    "GIF": "image/gif",
+    "BMP": "image/bmp",
+    "TIFF": "image/tiff",
+    "MPO": "image/jpeg",
+}
+ALLOWED_FORMATS = set(MEDIA_TYPES)
+
+# EXIF fields worth keeping; GPS and maker notes are dropped
+EXIF_FIELDS = {
+    "Make", "Model", "Software", "DateTime", "DateTimeOriginal", "Orientation", "ExposureTime",
+    "FNumber", "ISOSpeedRatings", "FocalLength", "LensModel", "ImageDescription", "Artist", "Copyright",
+}
+
+
+class ImageRejected(ValueError):
+    pass
+
+
+def _plain(value: Any) -> Any:
+    if isinstance(value, bytes):
+        return None
+    if isinstance(value, str):
+        return value.strip("\x00 ").strip() or None
+    if isinstance(value, tuple):
+        return [_plain(item) for item in value]
+    try:
+        # IFDRational and friends
+        return float(value) if not isinstance(value, int) else value
+    except (TypeError, ValueError):
+        return None
+
+
+def _exif(image: Image.Image) -> Dict[str, Any]:
+    exif = image.getexif()
+    if not exif:
+        return {}
+    fields = dict(exif.items())
+    fields.update(exif.get_ifd(ExifTags.IFD.Exif))
+    metadata = {}
+    for tag_id, value in fields.items():
+        name = ExifTags.TAGS.get(tag_id)
+        if name in EXIF_FIELDS:
+            value = _plain(value)
+            if value is not None:
+                metadata[name] = value
+    if exif.get_ifd(ExifTags.IFD.GPSInfo):
+        metadata["HasLocation"] = True
+    return metadata
+
+
+def process_image(data: bytes, sizes: Sequence[int] = VARIANT_SIZES, max_pixels: int = 50_000_000,
+                  quality: int = 80) -> Dict[str, Any]:
+    """
+    Read an uploaded image and encode its display variants as WebP, without
+    metadata and upright per EXIF orientation. Variants are smallest first;
+    the last one is the image itself when it fits within sizes[-1].
+    """
+    # Pillow reads lazily, so a truncated or corrupt file can fail at any
+    # step up to the full decode in convert, EXIF parsing included
+    try:
+        image = Image.open(io.BytesIO(data))
+        if image.format not in ALLOWED_FORMATS:
+            raise ImageRejected(f"Unsupported image format: {image.format}")
+        # Checked before decoding anything, so a decompression bomb costs nothing
+        if image.width * image.height > max_pixels:
+            raise ImageRejected(f"Image is too large ({image.width}x{image.height} pixels)")
+
+        source_format = image.format
+        exif = _exif(image)
+        width, height = image.size
+        if exif.get("Orientation") in (5, 6, 7, 8):
+            width, height = height, width
+        longest = max(width, height)
+        targets = sorted({size for size in sizes if size < longest} | {min(longest, sizes[-1])}, reverse=True)
+
+        # JPEG can decode straight at 1/2, 1/4 or 1/8 scale, which is most of the
+        # cost for a large photo; draft never goes below the size asked for
+        scale = targets[0] / longest
+        image.draft("RGB", (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+        image = ImageOps.exif_transpose(image)
+        has_alpha = image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+        image = image.convert("RGBA" if has_alpha else "RGB")
+    except ImageRejected:
+        raise
+    except UnidentifiedImageError:
+        raise ImageRejected("Not a supported image file")
+    except Image.DecompressionBombError as e:
+        raise ImageRejected(f"Image is too large: {e}")
+    except (OSError, SyntaxError, ValueError) as e:
+        raise ImageRejected(f"Image could not be decoded: {e}")
+
+    variants: List[Dict[str, Any]] = []
+    for size in targets:
+        # Each variant is shrunk from the previous, larger one
+        image.thumbnail((size, size), Image.Resampling.LANCZOS, reducing_gap=2.0)
+        buffer = io.BytesIO()
+        image.save(buffer, "WEBP", quality=quality, method=4)
+        variants.append({"width": image.width, "height": image.height, "data": buffer.getvalue()})
+
+    return {
+        "format": source_format,
+        "width": width,
+        "height": height,
+        "exif": exif,
+        "variants": variants[::-1],
+    }
@@ -0,0 +1,325 @@
+import os
+import uuid
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Tuple
+from fastapi import Depends, HTTPException
+from starlette.concurrency import run_in_threadpool
+import logging
+
+from ..auth import AuthenticatedUser
+from .. import metrics
+from .storage_backend import get_storage_backend, StorageBackend
+from .row_cache import image_cache
+from .image_processing import process_image, ImageRejected, VARIANT_SIZES, MEDIA_TYPES
+from .blob_store import BlobStore
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+IMAGES = "images"
+ORIGINAL = "original"
+
+MAX_IMAGE_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(25 * 1024 * 1024)))
+MAX_IMAGE_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", "50000000"))
+IMAGE_QUALITY = int(os.getenv("IMAGE_WEBP_QUALITY", "80"))
+
+image_processing_seconds = metrics.Histogram(
+    "image_processing_seconds", "Time to decode an upload and encode its variants, queueing included", ("outcome",)
+)
+
+
+def variant_name(variant: Dict[str, Any]) -> str:
+    return f"w{variant['width']}"
+
+
+def media_type(image: Dict[str, Any]) -> str:
+    """
+    The media type of the original, from the format Pillow detected rather
+    than the Content-Type the uploader claimed.
+    """
+    return MEDIA_TYPES.get(image.get("format"), "application/octet-stream")
+
+
+class ImageProcessor:
+    """
+    Runs process_image in a pool of worker processes, so decoding and
+    resizing large photos neither blocks the event loop nor holds the GIL
+    other requests need. IMAGE_WORKERS=0 runs it in the threadpool instead.
+    At most max_pending uploads are processed or queued at once; more get
+    503 with Retry-After.
+    """
+
+    def __init__(self, workers: Optional[int] = None, max_pending: Optional[int] = None):
+        self.workers = workers if workers is not None else int(
+            os.getenv("IMAGE_WORKERS", str(min(4, os.cpu_count() or 1)))
+        )
+        self.max_pending = max_pending or int(os.getenv("IMAGE_MAX_PENDING", str(max(self.workers, 1) * 4)))
+        self.pending = 0
+        self.processed = 0
+        self.rejected = 0
+        self.busy = 0
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn rather than fork: the server process has threads of its own
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                max_tasks_per_child=200,
+            )
+            logger.info("Started %d image worker processes", self.workers)
+        return self._pool
+
+    async def process(self, data: bytes) -> Dict[str, Any]:
+        if self.pending >= self.max_pending:
+            self.busy += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Image processing is busy. Please retry shortly.",
+                headers={"Retry-After": "2"}
+            )
+        self.pending += 1
+        started = asyncio.get_running_loop().time()
+        outcome = "error"
+        try:
+            args = (data, VARIANT_SIZES, MAX_IMAGE_PIXELS, IMAGE_QUALITY)
+            if self.workers <= 0:
+                result = await run_in_threadpool(process_image, *args)
+            else:
+                try:
+                    result = await asyncio.get_running_loop().run_in_executor(self._executor(), process_image, *args)
+                except BrokenProcessPool:
+                    # A worker died (out of memory on a hostile file, killed); start over next time
+                    logger.error("Image worker pool broke; restarting it")
+                    self._pool.shutdown(wait=False, cancel_futures=True)
+                    self._pool = None
+                    raise HTTPException(status_code=500, detail="Image processing failed")
+            outcome = "ok"
+            self.processed += 1
+            return result
+        except ImageRejected as e:
+            outcome = "rejected"
+            self.rejected += 1
+            raise HTTPException(status_code=422, detail=str(e))
+        finally:
+            self.pending -= 1
+            image_processing_seconds.observe(asyncio.get_running_loop().time() - started, outcome)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "started": self._pool is not None,
+            "pending": self.pending,
+            "processed": self.processed,
+            "rejected": self.rejected,
+            "busy": self.busy,
+        }
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+image_processor = ImageProcessor()
+
+
+def close_image_processor():
+    """Stop the image worker processes, if any were started"""
+    image_processor.close()
+
+
+def pick_variant(variants: List[Dict[str, Any]], width: Optional[float] = None,
+                 zoom: float = 1.0, dpr: float = 1.0) -> Dict[str, Any]:
+    """
+    The smallest variant at least as wide as the node is drawn on screen
+    (width in canvas units times zoom times device pixel ratio), or the
+    largest there is. Without a width, the thumbnail.
+    """
+    if not width:
+        return variants[0]
+    # Compared as a float, so an overflow to inf just picks the largest
+    needed = width * max(zoom, 0.01) * max(dpr, 1.0)
+    for variant in variants:
+        if variant["width"] >= needed:
+            return variant
+    return variants[-1]
+
+
+class ImageService:
+    """
+    Service class for image nodes. An upload is kept as sent (for download)
+    next to WebP display variants of up to 2048 px, stripped of metadata;
+    the images row holds dimensions, selected EXIF fields and the variants.
+    The upload is a blob in the BlobStore and its variants are files derived
+    from it, so the same photo in several projects is stored and processed
+    once.
+    """
+
+    def __init__(self, storage: StorageBackend, blobs: Optional[BlobStore] = None):
+        self.storage = storage
+        self.blobs = blobs or BlobStore(storage)
+
+    def path(self, image: Dict[str, Any], name: str) -> Path:
+        if name == ORIGINAL:
+            return self.blobs.path(image["sha256"])
+        return self.blobs.path(image["sha256"], name)
+
+    def _has_files(self, digest: str, variants: List[Dict[str, Any]]) -> bool:
+        return all(self.blobs.path(digest, variant["name"]).exists() for variant in variants)
+
+    @staticmethod
+    async def _process(data: bytes) -> Tuple[Dict[str, Any], Dict[str, bytes]]:
+        """
+        Decode an upload into the derived["image"] record and its variant files.
+        """
+        result = await image_processor.process(data)
+        processed = {
+            "format": result["format"],
+            "width": result["width"],
+            "height": result["height"],
+            "exif": result["exif"],
+            "variants": [{
+                "name": variant_name(variant),
+                "width": variant["width"],
+                "height": variant["height"],
+                "bytes": len(variant["data"]),
+            } for variant in result["variants"]],
+        }
+        return processed, {variant_name(variant): variant["data"] for variant in result["variants"]}
+
+    async def upload_image(self, project_id: str, filename: str, content_type: str, data: bytes,
+                           user: AuthenticatedUser) -> Dict[str, Any]:
+        """
+        Store an uploaded image, processing it unless the same file was
+        processed before, and create its row. Nothing is stored until the
+        image has been read, so a rejected upload leaves no blob behind.
+        """
+        try:
+            if not data:
+                raise HTTPException(status_code=400, detail="No image data provided")
+            if len(data) > MAX_IMAGE_BYTES:
+                raise HTTPException(status_code=413, detail=f"Images are limited to {MAX_IMAGE_BYTES} bytes")
+
+            projects = await self.storage.select(
+                "projects", {"id": project_id, "user_id": user.supabase_user_id}, columns="id"
+            )
+            if not projects:
+                raise HTTPException(status_code=404, detail="Project not found")
+
+            # hashlib releases the GIL, so a large upload hashes off the event loop in parallel
+            digest = await run_in_threadpool(BlobStore.digest, data)
+            known = await self.blobs.get(digest)
+            processed = ((known or {}).get("derived") or {}).get("image")
+            files = None
+            if processed is None or not await run_in_threadpool(self._has_files, digest, processed["variants"]):
+                processed, files = await self._process(data)
+            else:
+                logger.debug("Image upload matches blob %s; reusing its variants", digest)
+
+            blob = await self.blobs.put(data, content_type, digest=digest)
+            if files is None and not (blob.get("derived") or {}).get("image"):
+                # Collected between the read and the put, variants and all
+                processed, files = await self._process(data)
+            if files is not None:
+                await self.blobs.put_derived(digest, "image", processed, files)
+
+            image_id = str(uuid.uuid4())
+            await self.blobs.add_ref(digest, "image", image_id, project_id, user)
+            try:
+                rows = await self.storage.insert(IMAGES, [{
+                    "id": image_id,
+                    "project_id": project_id,
+                    "user_id": user.supabase_user_id,
+                    "filename": filename,
+                    "content_type": content_type,
+                    "sha256": digest,
+                    "format": processed["format"],
+                    "width": processed["width"],
+                    "height": processed["height"],
+                    "bytes": len(data),
+                    "exif": processed["exif"],
+                    "variants": processed["variants"],
+                }])
+                if not rows:
+                    raise HTTPException(status_code=500, detail="Failed to create image - no data returned")
+            except Exception:
+                await self.blobs.release("image", [image_id], user)
+                raise
+
+            logger.debug("Stored image %s (%dx%d, %d variants)", image_id, processed["width"], processed["height"],
+                         len(processed["variants"]))
+            return rows[0]
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+    async def get_image(self, image_id: str, user: AuthenticatedUser) -> Dict[str, Any]:
+        """
+        Get an image's row, served from the row cache when possible.
+        """
+        try:
+            cached = await image_cache.get(user.supabase_user_id, image_id)
+            if cached is not None:
+                return cached
+
+            generation = image_cache.generation()
+            rows = await self.storage.select(IMAGES, {"id": image_id, "user_id": user.supabase_user_id})
+            if not rows:
+                raise HTTPException(status_code=404, detail="Image not found")
+
+            await image_cache.set(user.supabase_user_id, image_id, rows[0], generation)
+            return rows[0]
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+    async def list_images(self, project_id: str, user: AuthenticatedUser) -> List[Dict[str, Any]]:
+        """
+        All images of a project, without their EXIF metadata.
+        """
+        try:
+            return await self.storage.select(
+                IMAGES, {"project_id": project_id, "user_id": user.supabase_user_id},
+                columns="id, project_id, filename, sha256, format, width, height, bytes, variants, created_at",
+                order_by="created_at"
+            )
+
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+    async def delete_image(self, image_id: str, user: AuthenticatedUser) -> bool:
+        """
+        Delete an image's row and release its blob; the files go with the
+        blob once nothing else uses it.
+        """
+        try:
+            rows = await self.storage.delete(IMAGES, {"id": image_id, "user_id": user.supabase_user_id})
+            if not rows:
+                raise HTTPException(status_code=404, detail="Image not found")
+
+            await image_cache.invalidate(user.supabase_user_id, image_id)
+            await self.blobs.release("image", [image_id], user)
+            return True
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+
+# Dependency function to get ImageService instance
+def get_image_service(storage: StorageBackend = Depends(get_storage_backend)) -> ImageService:
+    """
+    Dependency function to provide ImageService instance.
+    """
+    return ImageService(storage)
@@ -0,0 +1,298 @@
+import os
+import json
+import uuid
+import socket
+import asyncio
+import tempfile
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, Any, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+NONE = "none"
+SOCKET = "socket"
+POSTGRES = "postgres"
+
+# Topics
+USER = "user"
+PROJECT_VERSION = "project_version"
+
+DEFAULT_CHANNEL = "cache_invalidation"
+MAX_MESSAGE_BYTES = 8192
+
+
+class _SocketTransport:
+    """
+    Workers on one host each bind a Unix datagram socket in a shared
+    directory, and a publish sends one datagram to every other socket there.
+    There is no broker process to run; delivery is a local syscall.
+    """
+
+    name = SOCKET
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path: Optional[str] = None
+        self.dropped = 0
+        self._receiver: Optional[socket.socket] = None
+        self._sender: Optional[socket.socket] = None
+        self._peers: List[str] = []
+        self._peers_mtime: Optional[int] = None
+        self._lock = threading.Lock()
+        self._loop = None
+
+    async def start(self, deliver: Callable[[str], None], on_reset: Callable[[], None]):
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        self.path = os.path.join(self.directory, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.sock")
+        self._receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._receiver.bind(self.path)
+        self._receiver.setblocking(False)
+        # Non-blocking: publish runs on the event loop, so a peer whose queue
+        # is full misses the message (counted in dropped) rather than stalling it
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sender.setblocking(False)
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(self._receiver.fileno(), self._read, deliver)
+        logger.info("Invalidation bus listening on %s", self.path)
+
+    def _read(self, deliver: Callable[[str], None]):
+        while True:
+            try:
+                data = self._receiver.recv(MAX_MESSAGE_BYTES)
+            except (BlockingIOError, InterruptedError):
+                return
+            deliver(data.decode())
+
+    def _current_peers(self) -> List[str]:
+        # The directory's mtime changes whenever a worker binds or goes away,
+        # so one stat per publish is enough to notice new peers
+        mtime = os.stat(self.directory).st_mtime_ns
+        if mtime != self._peers_mtime:
+            self._peers = [
+                os.path.join(self.directory, name)
+                for name in os.listdir(self.directory)
+                if name.endswith(".sock") and os.path.join(self.directory, name) != self.path
+            ]
+            self._peers_mtime = mtime
+        return self._peers
+
+    def send(self, payload: str):
+        data = payload.encode()
+        with self._lock:
+            for peer in self._current_peers():
+                try:
+                    self._sender.sendto(data, peer)
+                except ConnectionRefusedError:
+                    # Left behind by a worker that exited without cleaning up
+                    logger.info("Removing stale invalidation bus socket %s", peer)
+                    try:
+                        os.unlink(peer)
+                    except FileNotFoundError:
+                        pass
+                except FileNotFoundError:
+                    pass
+                except BlockingIOError:
+                    self.dropped += 1
+                    logger.warning("Invalidation bus peer %s is not reading; message dropped", peer)
+
+    async def stop(self):
+        if self._receiver is not None:
+            self._loop.remove_reader(self._receiver.fileno())
+            self._receiver.close()
+            self._sender.close()
+            self._receiver = self._sender = None
+        if self.path:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"peers": len(self._peers), "dropped": self.dropped}
+
+
+class _PostgresTransport:
+    """
+    LISTEN/NOTIFY on a dedicated asyncpg connection, for workers spread over
+    several hosts. LISTEN needs a session, so point it at a direct or
+    session-mode connection rather than a transaction-mode pooler.
+    """
+
+    name = POSTGRES
+
+    def __init__(self, dsn: str, channel: str):
+        self.dsn = dsn
+        self.channel = channel
+        self.reconnects = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop = None
+
+    async def start(self, deliver: Callable[[str], None], on_reset: Callable[[], None]):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run(deliver, on_reset))
+
+    async def _run(self, deliver, on_reset):
+        import asyncpg
+
+        connected_before = False
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(self.dsn)
+                await connection.add_listener(self.channel, lambda _c, _pid, _ch, payload: deliver(payload))
+                if connected_before:
+                    # Notifications sent while we were disconnected are gone
+                    self.reconnects += 1
+                    on_reset()
+                connected_before = True
+                logger.info(f"Invalidation bus listening on Postgres channel {self.channel}")
+                while True:
+                    try:
+                        payload = await asyncio.wait_for(self._queue.get(), timeout=5)
+                    except asyncio.TimeoutError:
+                        if connection.is_closed():
+                            raise ConnectionError("Listener connection closed")
+                        continue
+                    await connection.execute("SELECT pg_notify($1, $2)", self.channel, payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Invalidation bus connection failed, retrying: {str(e)}")
+                await asyncio.sleep(1)
+            finally:
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+
+    def send(self, payload: str):
+        # Publishers may run in the threadpool, so hand off to the loop
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, payload)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"reconnects": self.reconnects, "queued": self._queue.qsize() if self._queue else 0}
+
+
+class InvalidationBus:
+    """
+    Broadcasts "key changed" events to every worker so in-process caches stay
+    coherent when another worker handles the write. Handlers subscribe to a
+    topic and get the changed key. With INVALIDATION_BUS unset (a single
+    worker) events only reach this process.
+    """
+
+    def __init__(self, transport=None):
+        self.transport = transport
+        self.origin: Optional[str] = None
+        self.published = 0
+        self.received = 0
+        self.errors = 0
+        self._handlers: Dict[str, List[Callable[[str], None]]] = defaultdict(list)
+        self._reset_handlers: List[Callable[[], None]] = []
+
+    def subscribe(self, topic: str, handler: Callable[[str], None]):
+        self._handlers[topic].append(handler)
+
+    def on_reset(self, handler: Callable[[], None]):
+        """
+        Register a callback for when events may have been missed, e.g. after
+        the Postgres listener reconnects; it should drop everything it caches.
+        """
+        self._reset_handlers.append(handler)
+
+    async def start(self):
+        if self.transport is None or self.origin is not None:
+            return
+        # Per-process, so workers forked from one parent still tell each other apart
+        self.origin = uuid.uuid4().hex
+        await self.transport.start(self._receive, self._reset)
+
+    async def stop(self):
+        if self.transport is not None and self.origin is not None:
+            await self.transport.stop()
+            self.origin = None
+
+    def publish(self, topic: str, key: str, local: bool = True):
+        """
+        Announce that key changed. Handlers in this process run right away
+        unless local is False (the caller already applied the change); other
+        workers get the event through the transport. Safe to call from any
+        thread.
+        """
+        self.published += 1
+        if local:
+            self._dispatch(topic, key)
+        if self.origin is None:
+            return
+        try:
+            self.transport.send(json.dumps([self.origin, topic, key]))
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Invalidation bus publish failed for {topic} {key}: {str(e)}")
+
+    def _dispatch(self, topic: str, key: str):
+        for handler in self._handlers.get(topic, ()):
+            try:
+                handler(key)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Invalidation handler failed for {topic} {key}: {str(e)}")
+
+    def _receive(self, payload: str):
+        try:
+            origin, topic, key = json.loads(payload)
+        except ValueError:
+            self.errors += 1
+            logger.warning(f"Ignoring malformed invalidation message: {payload[:200]}")
+            return
+        if origin == self.origin:
+            return
+        self.received += 1
+        self._dispatch(topic, key)
+
+    def _reset(self):
+        for handler in self._reset_handlers:
+            try:
+                handler()
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Invalidation reset handler failed: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "transport": self.transport.name if self.transport else NONE,
+            "running": self.origin is not None,
+            "published": self.published,
+            "received": self.received,
+            "errors": self.errors,
+            **(self.transport.stats() if self.transport else {}),
+        }
+
+
+def _default_transport():
+    kind = os.getenv("INVALIDATION_BUS", NONE).lower()
+    if kind == SOCKET:
+        directory = os.getenv("INVALIDATION_BUS_DIR") or os.path.join(tempfile.gettempdir(), "cache-invalidation-bus")
+        return _SocketTransport(directory)
+    if kind == POSTGRES:
+        dsn = os.getenv("INVALIDATION_BUS_URL") or os.getenv("DATABASE_URL")
+        if not dsn:
+            raise RuntimeError("INVALIDATION_BUS=postgres needs INVALIDATION_BUS_URL or DATABASE_URL")
+        return _PostgresTransport(dsn, os.getenv("INVALIDATION_BUS_CHANNEL", DEFAULT_CHANNEL))
+    if kind != NONE:
+        raise RuntimeError(f"Unknown INVALIDATION_BUS: {kind}")
+    return None
+
+
+invalidation_bus = InvalidationBus(_default_transport())
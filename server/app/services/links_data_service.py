@@ -1,23 +1,27 @@
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from fastapi import Depends, HTTPException
-from supabase import Client
 import logging
 
-from ..auth import get_supabase_client, AuthenticatedUser
+from ..auth import AuthenticatedUser
+from .project_version import project_versions
+from .storage_backend import get_storage_backend, StorageBackend
+from .bulk import run_isolated, update_grouped, item_ok, item_error, error_result
+from .row_cache import link_cache
+from .folders_data_service import FoldersDataService
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
 class LinksDataService:
     """
-    Service class for handling basic link CRUD operations using Supabase.
-    Leverages the Supabase client from auth.py for consistency.
+    Service class for handling basic link CRUD operations on the
+    configured storage backend (PostgREST or asyncpg).
     """
     
-    def __init__(self, supabase_client: Client = Depends(get_supabase_client)):
-        self.supabase = supabase_client
+    def __init__(self, storage: StorageBackend):
+        self.storage = storage
     
-    def create_link(
+    async def create_link(
         self, 
         project_id: str, 
         url: str, 
@@ -28,9 +32,6 @@ class LinksDataService:
         Create a new link in the database.
         """
         try:
-            logger.info(f"Creating link in database for user {user.supabase_user_id}")
-            logger.debug(f"Link data: project_id={project_id}, url={url}, string={string}")
-            
             # Insert link into database
             insert_data = {
                 "project_id": project_id,
@@ -38,17 +39,16 @@ class LinksDataService:
                 "name": string,  # Changed from 'string' to 'name'
                 "user_id": user.supabase_user_id
             }
-            logger.debug(f"Insert data: {insert_data}")
             
-            response = self.supabase.table("links").insert(insert_data).execute()
-            logger.debug(f"Supabase response: {response}")
+            rows = await self.storage.insert("links", [insert_data])
             
-            if not response.data:
-                logger.error(f"No data returned from Supabase. Response: {response}")
+            if not rows:
+                logger.error("No data returned from storage creating link in project %s", project_id)
                 raise HTTPException(status_code=500, detail="Failed to create link - no data returned")
                 
-            logger.info(f"Link created successfully: {response.data[0]}")
-            return response.data[0]
+            logger.debug("Created link %s in project %s", rows[0].get("id"), project_id)
+            project_versions.bump(rows[0]["project_id"])
+            return rows[0]
             
         except HTTPException:
             raise
@@ -56,7 +56,7 @@ class LinksDataService:
             logger.error(f"Database error in create_link: {str(e)}", exc_info=True)
             raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
     
-    def update_link(
+    async def update_link(
         self, 
         link_id: str, 
         url: Optional[str] = None, 
@@ -78,45 +78,57 @@ class LinksDataService:
             if not update_data:
                 raise HTTPException(status_code=400, detail="No update data provided")
             
-            response = self.supabase.table("links").update(update_data).eq("id", link_id).eq("user_id", user.supabase_user_id).execute()
+            rows = await self.storage.update("links", update_data, {"id": link_id, "user_id": user.supabase_user_id})
             
-            if not response.data:
+            if not rows:
                 raise HTTPException(status_code=404, detail="Link not found or update failed")
                 
-            return response.data[0]
+            await link_cache.invalidate(user.supabase_user_id, link_id)
+            project_versions.bump(rows[0]["project_id"])
+            return rows[0]
             
         except HTTPException:
             raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
     
-    def get_link(self, link_id: str, user: AuthenticatedUser) -> Dict[str, Any]:
+    async def get_link(self, link_id: str, user: AuthenticatedUser) -> Dict[str, Any]:
         """
-        Get a link by its ID.
+        Get a link by its ID, served from the row cache when possible.
         """
         try:
-            response = self.supabase.table("links").select("*").eq("id", link_id).eq("user_id", user.supabase_user_id).execute()
+            cached = await link_cache.get(user.supabase_user_id, link_id)
+            if cached is not None:
+                return cached
+            
+            generation = link_cache.generation()
+            rows = await self.storage.select("links", {"id": link_id, "user_id": user.supabase_user_id})
             
-            if not response.data:
+            if not rows:
                 raise HTTPException(status_code=404, detail="Link not found")
                 
-            return response.data[0]
+            await link_cache.set(user.supabase_user_id, link_id, rows[0], generation)
+            return rows[0]
             
         except HTTPException:
             raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
     
-    def delete_link(self, link_id: str, user: AuthenticatedUser) -> bool:
+    async def delete_link(self, link_id: str, user: AuthenticatedUser) -> bool:
         """
         Delete a link by its ID.
         """
         try:
-            response = self.supabase.table("links").delete().eq("id", link_id).eq("user_id", user.supabase_user_id).execute()
+            rows = await self.storage.delete("links", {"id": link_id, "user_id": user.supabase_user_id})
             
-            if not response.data:
+            if not rows:
                 raise HTTPException(status_code=404, detail="Link not found")
                 
+            await link_cache.invalidate(user.supabase_user_id, link_id)
+            for row in rows:
+                project_versions.bump(row["project_id"])
+            await FoldersDataService(self.storage).release_items([link_id], user)
             return True
             
         except HTTPException:
@@ -124,10 +136,84 @@ class LinksDataService:
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
+    async def create_links(self, items: List[Dict[str, Any]], user: AuthenticatedUser) -> List[Dict[str, Any]]:
+        """
+        Create many links with a single insert. Returns one result per item.
+        """
+        rows = [{
+            "project_id": item["project_id"],
+            "url": item["url"],
+            "name": item["string"],
+            "user_id": user.supabase_user_id
+        } for item in items]
+        written = await run_isolated(rows, lambda batch: self.storage.insert("links", batch))
+        for project_id in {row["project_id"] for row in written if not isinstance(row, Exception)}:
+            project_versions.bump(project_id)
+        return [
+            error_result(index, row) if isinstance(row, Exception) else item_ok(index, "link", row)
+            for index, row in enumerate(written)
+        ]
+    
+    async def update_links(self, items: List[Dict[str, Any]], user: AuthenticatedUser) -> List[Dict[str, Any]]:
+        """
+        Apply per-item changes, updating only the changed columns with one
+        statement per distinct change. Returns one result per item; several
+        changes to the same link are merged.
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+        merged: Dict[str, Dict[str, Any]] = {}
+        positions: Dict[str, List[int]] = {}
+        for index, item in enumerate(items):
+            item_id = str(item["id"])
+            changes = {"url": item.get("url"), "name": item.get("string")}
+            changes = {column: value for column, value in changes.items() if value is not None}
+            if not changes:
+                results[index] = item_error(index, 400, "No update data provided")
+            else:
+                merged[item_id] = {**merged.get(item_id, {}), **changes}
+                positions.setdefault(item_id, []).append(index)
+
+        written = await update_grouped(
+            merged,
+            lambda values, ids: self.storage.update("links", values, {"id": ids, "user_id": user.supabase_user_id})
+        )
+        await link_cache.invalidate_many(user.supabase_user_id, merged)
+        for item_id, indexes in positions.items():
+            row = written.get(item_id)
+            for index in indexes:
+                if row is None:
+                    results[index] = item_error(index, 404, "Link not found or update failed")
+                elif isinstance(row, Exception):
+                    results[index] = error_result(index, row)
+                else:
+                    results[index] = item_ok(index, "link", row)
+        for project_id in {row["project_id"] for row in written.values() if not isinstance(row, Exception)}:
+            project_versions.bump(project_id)
+        return results
+    
+    async def delete_links(self, link_ids: List[str], user: AuthenticatedUser) -> List[Dict[str, Any]]:
+        """
+        Delete many links with a single statement. Returns one result per id.
+        """
+        ids = [str(link_id) for link_id in link_ids]
+        try:
+            deleted = await self.storage.delete("links", {"id": list(dict.fromkeys(ids)), "user_id": user.supabase_user_id})
+        except Exception as e:
+            return [error_result(index, e) for index in range(len(ids))]
+
+        for project_id in {row["project_id"] for row in deleted}:
+            project_versions.bump(project_id)
+        found = {str(row["id"]) for row in deleted}
+        await link_cache.invalidate_many(user.supabase_user_id, found)
+        await FoldersDataService(self.storage).release_items(list(found), user)
+        return [
+            item_ok(index, "id", item_id) if item_id in found else item_error(index, 404, "Link not found")
+            for index, item_id in enumerate(ids)
+        ]
 
 # Dependency function to get LinksDataService instance
-def get_links_data_service(supabase_client: Client = Depends(get_supabase_client)) -> LinksDataService:
+def get_links_data_service(storage: StorageBackend = Depends(get_storage_backend)) -> LinksDataService:
     """
     Dependency function to provide LinksDataService instance.
     """
-    return LinksDataService(supabase_client)
\ No newline at end of file
+    return LinksDataService(storage)
\ No newline at end of file
@@ -0,0 +1,387 @@
+import json
+import zlib
+from typing import Optional, Dict, Any, List, Iterator, AsyncIterator, Tuple
+from fastapi import Depends, HTTPException
+from starlette.concurrency import run_in_threadpool
+from supabase import Client
+import logging
+
+from ..auth import get_supabase_client, AuthenticatedUser
+from .flow_state import remap_flow_state
+from .project_version import project_versions, FLOW
+from .projects_data_service import ProjectDataService
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FORMAT = "resource-project"
+ARCHIVE_VERSION = 1
+ARCHIVE_MEDIA_TYPE = "application/gzip"
+
+# Rows read from Supabase per page on export, and rows per insert on import
+PAGE_SIZE = 500
+BATCH_SIZE = 500
+
+# Limits on what an uploaded archive may expand to: one blob (a doc's
+# content), one JSON line (the flow is the largest), and everything inflated
+MAX_BLOB_BYTES = 16 * 1024 * 1024
+MAX_LINE_BYTES = 16 * 1024 * 1024
+MAX_ARCHIVE_BYTES = 512 * 1024 * 1024
+
+# Most bytes one decompress call may return, so a gzip bomb inflates a bit at a time
+INFLATE_CHUNK = 1024 * 1024
+
+# Columns that belong to the source project and are regenerated on import
+_OWNED_COLUMNS = ("id", "user_id", "project_id", "created_at", "updated_at")
+
+
+def _strip_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in row.items() if k not in _OWNED_COLUMNS}
+
+
+def _encode_record(record: Dict[str, Any], blob: Optional[bytes] = None) -> bytes:
+    """
+    Encode one archive record: a JSON line, optionally followed by blob_size raw bytes.
+    """
+    if blob is not None:
+        record = {**record, "blob_size": len(blob)}
+    line = json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n"
+    return line + blob if blob is not None else line
+
+
+class _ArchiveReader:
+    """
+    Incremental parser for the archive stream. Feed decompressed bytes in any
+    chunking and get back (record, blob) pairs as soon as they are complete.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._pending: Optional[Dict[str, Any]] = None
+        self._total = 0
+
+    def feed(self, data: bytes) -> Iterator[Tuple[Dict[str, Any], Optional[bytes]]]:
+        self._total += len(data)
+        if self._total > MAX_ARCHIVE_BYTES:
+            raise ValueError(f"Archive expands to more than {MAX_ARCHIVE_BYTES} bytes")
+        self._buffer.extend(data)
+        while True:
+            if self._pending is not None:
+                size = self._pending["blob_size"]
+                if len(self._buffer) < size:
+                    return
+                blob = bytes(self._buffer[:size])
+                del self._buffer[:size]
+                record, self._pending = self._pending, None
+                yield record, blob
+                continue
+
+            newline = self._buffer.find(b"\n")
+            if newline == -1:
+                if len(self._buffer) > MAX_LINE_BYTES:
+                    raise ValueError(f"Archive record is longer than {MAX_LINE_BYTES} bytes")
+                return
+            line = bytes(self._buffer[:newline])
+            del self._buffer[:newline + 1]
+            if not line.strip():
+                continue
+
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("Archive record is not an object")
+            size = record.get("blob_size")
+            if size is not None and (type(size) is not int or not 0 <= size <= MAX_BLOB_BYTES):
+                raise ValueError(f"Archive blob_size must be a whole number of bytes up to {MAX_BLOB_BYTES}")
+            if size:
+                self._pending = record
+            else:
+                yield record, b"" if "blob_size" in record else None
+
+    def close(self):
+        if self._pending is not None or self._buffer.strip():
+            raise ValueError("Archive is truncated")
+
+
+def _inflate(decompressor, data: bytes) -> Iterator[bytes]:
+    """
+    Decompress data at most INFLATE_CHUNK bytes at a time.
+    """
+    yield decompressor.decompress(data, INFLATE_CHUNK)
+    while decompressor.unconsumed_tail:
+        yield decompressor.decompress(decompressor.unconsumed_tail, INFLATE_CHUNK)
+
+
+class ProjectArchiveService:
+    """
+    Service class for streaming a project (flow, docs and links) to and from a
+    gzip-compressed archive of NDJSON records with attached content blobs.
+    """
+
+    def __init__(self, supabase_client: Client = Depends(get_supabase_client)):
+        self.supabase = supabase_client
+
+    def get_project(self, project_id: str, user: AuthenticatedUser) -> Dict[str, Any]:
+        """
+        Get a project by its ID, raising 404 when the user does not own it.
+        """
+        try:
+            response = self.supabase.table("projects").select("*").eq("id", project_id).eq("user_id", user.supabase_user_id).execute()
+
+            if not response.data:
+                raise HTTPException(status_code=404, detail="Project not found")
+
+            return response.data[0]
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+    def _iter_rows(self, table: str, project_id: str, user: AuthenticatedUser) -> Iterator[Dict[str, Any]]:
+        """
+        Yield every row of a project table, one page at a time.
+        """
+        offset = 0
+        while True:
+            response = self.supabase.table(table).select("*").eq(
+                "project_id", project_id
+            ).eq(
+                "user_id", user.supabase_user_id
+            ).order("id").range(offset, offset + PAGE_SIZE - 1).execute()
+
+            rows = response.data or []
+            yield from rows
+
+            if len(rows) < PAGE_SIZE:
+                return
+            offset += PAGE_SIZE
+
+    def _iter_records(self, project: Dict[str, Any], user: AuthenticatedUser) -> Iterator[bytes]:
+        project_id = project["id"]
+
+        yield _encode_record({"type": "header", "format": ARCHIVE_FORMAT, "version": ARCHIVE_VERSION})
+        yield _encode_record({"type": "project", "project_name": project.get("project_name")})
+
+        for doc in self._iter_rows("docs", project_id, user):
+            content = (doc.get("content") or "").encode("utf-8")
+            row = _strip_row(doc)
+            row.pop("content", None)
+            yield _encode_record({"type": "doc", "id": doc["id"], "row": row}, content)
+
+        for link in self._iter_rows("links", project_id, user):
+            yield _encode_record({"type": "link", "id": link["id"], "row": _strip_row(link)})
+
+        flow = self.supabase.table("flows").select("flow_state").eq(
+            "project_id", project_id
+        ).eq(
+            "user_id", user.supabase_user_id
+        ).execute()
+        if flow.data:
+            yield _encode_record({"type": "flow", "flow_state": flow.data[0]["flow_state"]})
+
+        yield _encode_record({"type": "end"})
+
+    def export_project(self, project: Dict[str, Any], user: AuthenticatedUser) -> Iterator[bytes]:
+        """
+        Stream a project as compressed archive chunks. Rows are paged from the
+        database and compressed as they are produced, so memory stays flat.
+        """
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for record in self._iter_records(project, user):
+            chunk = compressor.compress(record)
+            if chunk:
+                yield chunk
+        yield compressor.flush()
+
+    def _insert_batch(self, table: str, batch: List[Tuple[str, Dict[str, Any]]], id_map: Dict[str, str]):
+        """
+        Insert a batch of rows in one statement and record old -> new ids.
+        """
+        response = self.supabase.table(table).insert([row for _, row in batch]).execute()
+        if not response.data or len(response.data) != len(batch):
+            raise HTTPException(status_code=500, detail=f"Failed to import {table}")
+        for (old_id, _), new_row in zip(batch, response.data):
+            id_map[str(old_id)] = str(new_row["id"])
+        batch.clear()
+
+    def _create_project(self, project_name: str, user: AuthenticatedUser) -> Dict[str, Any]:
+        response = self.supabase.table("projects").insert({
+            "project_name": project_name,
+            "user_id": user.supabase_user_id
+        }).execute()
+        if not response.data:
+            raise HTTPException(status_code=500, detail="Failed to create project")
+        return response.data[0]
+
+    @staticmethod
+    def _created(project: Dict[str, Any], user: AuthenticatedUser):
+        """
+        Tell this worker's caches (and, through the bus, the others') about a
+        project that was written outside the data services.
+        """
+        project_versions.bump(project["id"])
+        project_versions.bump(project["id"], FLOW)
+        ProjectDataService._list_changed(user)
+
+    def _delete_project(self, project_id: str, user: AuthenticatedUser):
+        for table in ("flows", "docs", "links", "projects"):
+            column = "id" if table == "projects" else "project_id"
+            try:
+                self.supabase.table(table).delete().eq(column, project_id).eq("user_id", user.supabase_user_id).execute()
+            except Exception as e:
+                logger.error("Failed to roll back imported %s for project %s: %s", table, project_id, str(e))
+
+    async def import_project(
+        self,
+        chunks: AsyncIterator[bytes],
+        user: AuthenticatedUser,
+        project_name: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Create a new project from an archive stream. Docs and links are inserted
+        in batches and node references in the flow are rewritten to the new ids.
+        """
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        reader = _ArchiveReader()
+        project = None
+        id_map: Dict[str, str] = {}
+        batches: Dict[str, List[Tuple[str, Dict[str, Any]]]] = {"docs": [], "links": []}
+        counts = {"docs": 0, "links": 0}
+        flow_state = None
+        seen_end = False
+
+        async def handle(record: Dict[str, Any], blob: Optional[bytes]):
+            nonlocal project, flow_state, seen_end
+            record_type = record.get("type")
+
+            if record_type == "header":
+                if record.get("format") != ARCHIVE_FORMAT or record.get("version") != ARCHIVE_VERSION:
+                    raise HTTPException(status_code=422, detail="Unsupported archive format")
+                return
+            if record_type == "project":
+                project = await run_in_threadpool(
+                    self._create_project, project_name or record.get("project_name") or "Imported Project", user
+                )
+                return
+            if record_type == "end":
+                seen_end = True
+                return
+            if project is None:
+                raise HTTPException(status_code=422, detail="Archive is missing its project record")
+
+            if record_type in ("doc", "link"):
+                if not isinstance(record.get("row"), dict):
+                    raise HTTPException(status_code=422, detail=f"Invalid archive: {record_type} record has no row")
+                table = f"{record_type}s"
+                row = {**record["row"], "project_id": project["id"], "user_id": user.supabase_user_id}
+                if record_type == "doc":
+                    row["content"] = (blob or b"").decode("utf-8")
+                batches[table].append((record["id"], row))
+                counts[table] += 1
+                if len(batches[table]) >= BATCH_SIZE:
+                    await run_in_threadpool(self._insert_batch, table, batches[table], id_map)
+            elif record_type == "flow":
+                if not isinstance(record.get("flow_state"), dict):
+                    raise HTTPException(status_code=422, detail="Invalid archive: flow record has no flow_state")
+                flow_state = record["flow_state"]
+
+        try:
+            try:
+                async for chunk in chunks:
+                    for data in _inflate(decompressor, chunk):
+                        for record, blob in reader.feed(data):
+                            await handle(record, blob)
+                for record, blob in reader.feed(decompressor.flush()):
+                    await handle(record, blob)
+                reader.close()
+            except (zlib.error, ValueError, KeyError, UnicodeDecodeError) as e:
+                raise HTTPException(status_code=422, detail=f"Invalid archive: {str(e)}")
+
+            if project is None or not seen_end:
+                raise HTTPException(status_code=422, detail="Invalid archive: incomplete project")
+
+            for table, batch in batches.items():
+                if batch:
+                    await run_in_threadpool(self._insert_batch, table, batch, id_map)
+
+            if flow_state is not None:
+                flow_row = {
+                    "user_id": user.supabase_user_id,
+                    "project_id": project["id"],
+                    "flow_state": remap_flow_state(flow_state, id_map),
+                }
+                await run_in_threadpool(lambda: self.supabase.table("flows").insert(flow_row).execute())
+
+            self._created(project, user)
+            return {"project": project, "docs": counts["docs"], "links": counts["links"]}
+
+        except Exception as e:
+            if project is not None:
+                await run_in_threadpool(self._delete_project, project["id"], user)
+            if isinstance(e, HTTPException):
+                raise
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+    def clone_project(
+        self,
+        project: Dict[str, Any],
+        user: AuthenticatedUser,
+        project_name: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Copy a project server-side. Docs and links are copied page by page with
+        one insert per page, carrying over every non-owned column (stored
+        embeddings included) so nothing is recomputed, and the flow's node
+        references are rewritten to the new ids in one pass. Synchronous:
+        call it from the threadpool.
+        """
+        new_project = None
+        try:
+            new_project = self._create_project(
+                project_name or f"{project.get('project_name') or 'Untitled'} (copy)", user
+            )
+            id_map: Dict[str, str] = {}
+            counts = {"docs": 0, "links": 0}
+
+            for table in ("docs", "links"):
+                batch: List[Tuple[str, Dict[str, Any]]] = []
+                for row in self._iter_rows(table, project["id"], user):
+                    batch.append((row["id"], {
+                        **_strip_row(row),
+                        "project_id": new_project["id"],
+                        "user_id": user.supabase_user_id
+                    }))
+                    counts[table] += 1
+                    if len(batch) >= BATCH_SIZE:
+                        self._insert_batch(table, batch, id_map)
+                if batch:
+                    self._insert_batch(table, batch, id_map)
+
+            flow = self.supabase.table("flows").select("flow_state").eq(
+                "project_id", project["id"]
+            ).eq(
+                "user_id", user.supabase_user_id
+            ).execute()
+            if flow.data:
+                self.supabase.table("flows").insert({
+                    "user_id": user.supabase_user_id,
+                    "project_id": new_project["id"],
+                    "flow_state": remap_flow_state(flow.data[0]["flow_state"], id_map),
+                }).execute()
+
+            self._created(new_project, user)
+            return {"project": new_project, **counts}
+
+        except Exception as e:
+            if new_project is not None:
+                self._delete_project(new_project["id"], user)
+            if isinstance(e, HTTPException):
+                raise
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+
+# Dependency function to get ProjectArchiveService instance
+def get_project_archive_service(supabase_client: Client = Depends(get_supabase_client)) -> ProjectArchiveService:
+    """
+    Dependency function to provide ProjectArchiveService instance.
+    """
+    return ProjectArchiveService(supabase_client)
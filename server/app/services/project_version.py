@@ -0,0 +1,56 @@
+import threading
+from typing import Dict, Tuple
+
+from .invalidation_bus import invalidation_bus, PROJECT_VERSION
+
+CONTENT = "content"
+FLOW = "flow"
+
+
+class ProjectVersions:
+    """
+    Per-project version counters, tracked separately for content (docs and
+    links) and for the flow. Every write bumps the matching counter, so caches
+    keyed on (project, version) stop matching as soon as the project changes.
+    Bumps are published on the invalidation bus, so a write handled by another
+    worker moves this worker's counters too.
+    """
+
+    def __init__(self):
+        self._versions: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+        invalidation_bus.subscribe(PROJECT_VERSION, self._observe)
+        invalidation_bus.on_reset(self._bump_all)
+
+    def get(self, project_id: str, kind: str = CONTENT) -> int:
+        return self._versions.get((str(project_id), kind), 0)
+
+    def bump(self, project_id: str, kind: str = CONTENT) -> int:
+        with self._lock:
+            key = (str(project_id), kind)
+            version = self._versions.get(key, 0) + 1
+            self._versions[key] = version
+        invalidation_bus.publish(PROJECT_VERSION, f"{kind}:{project_id}:{version}", local=False)
+        return version
+
+    def _observe(self, message: str):
+        kind, project_id, version = message.split(":", 2)
+        with self._lock:
+            key = (project_id, kind)
+            # Always move forward, even past a concurrent local bump, so
+            # anything cached before the remote write stops matching
+            self._versions[key] = max(self._versions.get(key, 0) + 1, int(version))
+
+    def _bump_all(self):
+        with self._lock:
+            for key in self._versions:
+                self._versions[key] += 1
+
+    def token(self, project_id: str) -> Tuple[int, int]:
+        """
+        Combined version that changes when any doc, link or the flow changes.
+        """
+        return self.get(project_id, CONTENT), self.get(project_id, FLOW)
+
+
+project_versions = ProjectVersions()
@@ -1,19 +1,30 @@
 from typing import Optional, Dict, Any, List
 from fastapi import Depends, HTTPException
-from supabase import Client
 
-from ..auth import get_supabase_client, AuthenticatedUser
+from ..auth import AuthenticatedUser
+from .storage_backend import get_storage_backend, StorageBackend
+from .bulk import run_isolated, update_grouped, item_ok, item_error, error_result
+from .row_cache import project_cache
+from .blob_store import BlobStore
+from .single_flight import SingleFlight
+
+project_list_reads = SingleFlight("get_user_projects")
 
 class ProjectDataService:
     """
-    Service class for handling project CRUD operations using Supabase.
-    Leverages the Supabase client from auth.py for consistency.
+    Service class for handling project CRUD operations on the configured
+    storage backend (PostgREST or asyncpg).
     """
     
-    def __init__(self, supabase_client: Client = Depends(get_supabase_client)):
-        self.supabase = supabase_client
+    def __init__(self, storage: StorageBackend):
+        self.storage = storage
+    
+    @staticmethod
+    def _list_changed(user: AuthenticatedUser):
+        # A project list read already in flight may predate this write
+        project_list_reads.forget((user.supabase_user_id,))
     
-    def create_project(
+    async def create_project(
         self, 
         project_name: str, 
         user: AuthenticatedUser = None
@@ -27,19 +38,20 @@ class ProjectDataService:
                 "user_id": user.supabase_user_id
             }
             
-            response = self.supabase.table("projects").insert(project_data).execute()
+            rows = await self.storage.insert("projects", [project_data])
             
-            if not response.data:
+            if not rows:
                 raise HTTPException(status_code=500, detail="Failed to create project")
                 
-            return response.data[0]
+            self._list_changed(user)
+            return rows[0]
             
         except HTTPException:
             raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
     
-    def update_project(
+    async def update_project(
         self, 
         project_id: str, 
         project_name: str, 
@@ -51,57 +63,75 @@ class ProjectDataService:
         try:
             update_data = {"project_name": project_name}
             
-            response = self.supabase.table("projects").update(update_data).eq("id", project_id).eq("user_id", user.supabase_user_id).execute()
+            rows = await self.storage.update("projects", update_data, {"id": project_id, "user_id": user.supabase_user_id})
             
-            if not response.data:
+            if not rows:
                 raise HTTPException(status_code=404, detail="Project not found or update failed")
                 
-            return response.data[0]
+            await project_cache.invalidate(user.supabase_user_id, project_id)
+            self._list_changed(user)
+            return rows[0]
             
         except HTTPException:
             raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
     
-    def get_project(self, project_id: str, user: AuthenticatedUser) -> Dict[str, Any]:
+    async def get_project(self, project_id: str, user: AuthenticatedUser) -> Dict[str, Any]:
         """
-        Get a project by its ID.
+        Get a project by its ID, served from the row cache when possible.
         """
         try:
-            response = self.supabase.table("projects").select("*").eq("id", project_id).eq("user_id", user.supabase_user_id).execute()
+            cached = await project_cache.get(user.supabase_user_id, project_id)
+            if cached is not None:
+                return cached
             
-            if not response.data:
+            generation = project_cache.generation()
+            rows = await self.storage.select("projects", {"id": project_id, "user_id": user.supabase_user_id})
+            
+            if not rows:
                 raise HTTPException(status_code=404, detail="Project not found")
                 
-            return response.data[0]
+            await project_cache.set(user.supabase_user_id, project_id, rows[0], generation)
+            return rows[0]
             
         except HTTPException:
             raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
     
-    def get_user_projects(self, user: AuthenticatedUser) -> List[Dict[str, Any]]:
+    async def get_user_projects(self, user: AuthenticatedUser) -> List[Dict[str, Any]]:
         """
         Get all projects for a user.
         """
         try:
-            response = self.supabase.table("projects").select("*").eq("user_id", user.supabase_user_id).execute()
+            # Identical list reads in flight at once (several tabs, refetch on
+            # focus) share one query
+            rows = await project_list_reads.do(
+                (user.supabase_user_id,),
+                lambda: self.storage.select("projects", {"user_id": user.supabase_user_id})
+            )
             
-            return response.data if response.data else []
+            return rows if rows else []
             
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
     
-    def delete_project(self, project_id: str, user: AuthenticatedUser) -> bool:
+    async def delete_project(self, project_id: str, user: AuthenticatedUser) -> bool:
         """
         Delete a project by its ID.
         """
         try:
-            response = self.supabase.table("projects").delete().eq("id", project_id).eq("user_id", user.supabase_user_id).execute()
+            blobs = BlobStore(self.storage)
+            digests = await blobs.project_digests([project_id], user)
+            rows = await self.storage.delete("projects", {"id": project_id, "user_id": user.supabase_user_id})
             
-            if not response.data:
+            if not rows:
                 raise HTTPException(status_code=404, detail="Project not found")
                 
+            await project_cache.invalidate(user.supabase_user_id, project_id)
+            self._list_changed(user)
+            await blobs.release_projects([project_id], digests, user)
             return True
             
         except HTTPException:
@@ -109,10 +139,81 @@ class ProjectDataService:
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
+    async def create_projects(self, items: List[Dict[str, Any]], user: AuthenticatedUser) -> List[Dict[str, Any]]:
+        """
+        Create many projects with a single insert. Returns one result per item.
+        """
+        rows = [{
+            "project_name": item["project_name"],
+            "user_id": user.supabase_user_id
+        } for item in items]
+        written = await run_isolated(rows, lambda batch: self.storage.insert("projects", batch))
+        self._list_changed(user)
+        return [
+            error_result(index, row) if isinstance(row, Exception) else item_ok(index, "project", row)
+            for index, row in enumerate(written)
+        ]
+    
+    async def update_projects(self, items: List[Dict[str, Any]], user: AuthenticatedUser) -> List[Dict[str, Any]]:
+        """
+        Apply per-item changes, updating only the changed columns with one
+        statement per distinct change. Returns one result per item; several
+        changes to the same project are merged.
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+        merged: Dict[str, Dict[str, Any]] = {}
+        positions: Dict[str, List[int]] = {}
+        for index, item in enumerate(items):
+            item_id = str(item["id"])
+            changes = {"project_name": item.get("project_name")}
+            changes = {column: value for column, value in changes.items() if value is not None}
+            if not changes:
+                results[index] = item_error(index, 400, "No update data provided")
+            else:
+                merged[item_id] = {**merged.get(item_id, {}), **changes}
+                positions.setdefault(item_id, []).append(index)
+
+        written = await update_grouped(
+            merged,
+            lambda values, ids: self.storage.update("projects", values, {"id": ids, "user_id": user.supabase_user_id})
+        )
+        await project_cache.invalidate_many(user.supabase_user_id, merged)
+        self._list_changed(user)
+        for item_id, indexes in positions.items():
+            row = written.get(item_id)
+            for index in indexes:
+                if row is None:
+                    results[index] = item_error(index, 404, "Project not found or update failed")
+                elif isinstance(row, Exception):
+                    results[index] = error_result(index, row)
+                else:
+                    results[index] = item_ok(index, "project", row)
+        return results
+    
+    async def delete_projects(self, project_ids: List[str], user: AuthenticatedUser) -> List[Dict[str, Any]]:
+        """
+        Delete many projects with a single statement. Returns one result per id.
+        """
+        ids = [str(project_id) for project_id in project_ids]
+        blobs = BlobStore(self.storage)
+        try:
+            digests = await blobs.project_digests(list(dict.fromkeys(ids)), user)
+            deleted = await self.storage.delete("projects", {"id": list(dict.fromkeys(ids)), "user_id": user.supabase_user_id})
+        except Exception as e:
+            return [error_result(index, e) for index in range(len(ids))]
+
+        found = {str(row["id"]) for row in deleted}
+        await project_cache.invalidate_many(user.supabase_user_id, found)
+        self._list_changed(user)
+        await blobs.release_projects(list(found), digests, user)
+        return [
+            item_ok(index, "id", item_id) if item_id in found else item_error(index, 404, "Project not found")
+            for index, item_id in enumerate(ids)
+        ]
 
 # Dependency function to get ProjectDataService instance
-def get_project_data_service(supabase_client: Client = Depends(get_supabase_client)) -> ProjectDataService:
+def get_project_data_service(storage: StorageBackend = Depends(get_storage_backend)) -> ProjectDataService:
     """
     Dependency function to provide ProjectDataService instance.
     """
-    return ProjectDataService(supabase_client)
\ No newline at end of file
+    return ProjectDataService(storage)
\ No newline at end of file
@@ -0,0 +1,166 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple
+from starlette.concurrency import run_in_threadpool
+import logging
+
+from ..auth import AuthenticatedUser
+from .embedding_service import get_embedding_service, EmbeddingService, cosine
+from .project_version import project_versions
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIMILARITY = 0.92
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+
+class CachedResponse:
+    __slots__ = ("entry_id", "scope", "version", "prompt", "vector", "response", "latency_ms", "size", "hits")
+
+    def __init__(self, entry_id: int, scope: Tuple[str, str], version: Tuple[int, int], prompt: str,
+                 vector: List[float], response: str, latency_ms: float):
+        self.entry_id = entry_id
+        self.scope = scope
+        self.version = version
+        self.prompt = prompt
+        self.vector = vector
+        self.response = response
+        self.latency_ms = latency_ms
+        # Rough in-memory footprint: both strings plus the float list
+        self.size = len(prompt.encode("utf-8")) + len(response.encode("utf-8")) + 8 * len(vector) + 200
+        self.hits = 0
+
+
+class SemanticResponseCache:
+    """
+    Cache of model replies looked up by prompt-embedding similarity. Entries
+    are scoped to (user, project) and only match while the project's doc,
+    link and flow versions are unchanged. Eviction is LRU under a byte cap.
+    """
+
+    def __init__(
+        self,
+        embeddings: EmbeddingService,
+        similarity: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        self.embeddings = embeddings
+        self.similarity = similarity or float(os.getenv("CHAT_CACHE_SIMILARITY", DEFAULT_SIMILARITY))
+        self.max_bytes = max_bytes or int(os.getenv("CHAT_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+        self._entries: "OrderedDict[int, CachedResponse]" = OrderedDict()
+        self._by_scope: Dict[Tuple[str, str], Dict[int, CachedResponse]] = {}
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.saved_latency_ms = 0.0
+
+    def _remove(self, entry: CachedResponse):
+        self._entries.pop(entry.entry_id, None)
+        scoped = self._by_scope.get(entry.scope)
+        if scoped is not None:
+            scoped.pop(entry.entry_id, None)
+            if not scoped:
+                del self._by_scope[entry.scope]
+        self.bytes -= entry.size
+
+    @staticmethod
+    def version(project_id: str) -> Tuple[int, int]:
+        """
+        The project's version as of now. Take it before reading the project
+        for a reply, and store the reply under it.
+        """
+        return project_versions.token(project_id)
+
+    async def lookup(self, user: AuthenticatedUser, project_id: str, prompt: str,
+                     version: Tuple[int, int]) -> Optional[CachedResponse]:
+        """
+        Return the most similar cached reply for this project above the
+        similarity threshold, dropping entries from older project versions.
+        """
+        scope = (user.supabase_user_id, str(project_id))
+        # A network call with Gemini embeddings; keep it off the event loop
+        vector = await run_in_threadpool(self.embeddings.embed_one, prompt)
+
+        with self._lock:
+            best, best_score = None, self.similarity
+            for entry in list(self._by_scope.get(scope, {}).values()):
+                if entry.version != version:
+                    self._remove(entry)
+                    self.invalidations += 1
+                    continue
+                score = cosine(vector, entry.vector)
+                if score >= best_score:
+                    best, best_score = entry, score
+
+            if best is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(best.entry_id)
+            best.hits += 1
+            self.hits += 1
+            self.saved_latency_ms += best.latency_ms
+            return best
+
+    async def store(self, user: AuthenticatedUser, project_id: str, prompt: str, response: str, latency_s: float,
+                    version: Tuple[int, int]):
+        """
+        Cache a complete reply under the version the project had when the
+        request started. A reply built from a project that has changed since
+        would never match again, so it is not kept.
+        """
+        if version != project_versions.token(project_id):
+            return
+        scope = (user.supabase_user_id, str(project_id))
+        entry_vector = await run_in_threadpool(self.embeddings.embed_one, prompt)
+
+        with self._lock:
+            self._next_id += 1
+            entry = CachedResponse(
+                self._next_id, scope, version,
+                prompt, entry_vector, response, latency_s * 1000
+            )
+            if entry.size > self.max_bytes:
+                return
+            self._entries[entry.entry_id] = entry
+            self._by_scope.setdefault(scope, {})[entry.entry_id] = entry
+            self.bytes += entry.size
+
+            while self.bytes > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries.values())))
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "similarity": self.similarity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "saved_latency_ms": round(self.saved_latency_ms, 2),
+            }
+
+
+_response_cache: Optional[SemanticResponseCache] = None
+
+
+# Dependency function to get the shared SemanticResponseCache instance
+def get_response_cache() -> SemanticResponseCache:
+    """
+    Dependency function to provide the shared SemanticResponseCache.
+    """
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = SemanticResponseCache(get_embedding_service())
+    return _response_cache
@@ -0,0 +1,252 @@
+import re
+import time
+from typing import Optional, Dict, Any, List
+from fastapi import Depends, HTTPException
+from supabase import Client
+import logging
+
+from ..auth import get_supabase_client, AuthenticatedUser
+from .cache import LRUCache
+from .embedding_service import get_embedding_service, EmbeddingService, content_hash, cosine
+from .project_version import project_versions, FLOW
+from .flow_state import node_ids_by_row
+from .conversation_context_service import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+CHUNK_CHARS = 1200
+CHUNK_OVERLAP = 200
+TOP_K = 8
+MAX_CHUNKS_PER_NODE = 2
+MIN_SCORE = 0.05
+
+# Versions are per worker, so entries also expire to bound cross-worker staleness
+CACHE_TTL_SECONDS = 300
+
+# (user, project, version) -> ProjectIndex
+_index_cache = LRUCache(max_entries=64, ttl_seconds=CACHE_TTL_SECONDS)
+# (user, project, version, prompt hash) -> [(score, Chunk)] ranked for the prompt
+_retrieval_cache = LRUCache(max_entries=2048, ttl_seconds=CACHE_TTL_SECONDS)
+# (user, project, flow version) -> {doc or link row id: board node id}
+_node_id_cache = LRUCache(max_entries=256, ttl_seconds=CACHE_TTL_SECONDS)
+# conversation id -> (version, [Chunk]) retrieved on the previous turn
+_conversation_cache = LRUCache(max_entries=4096, ttl_seconds=1800)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+class Chunk:
+    """
+    A piece of a doc or link, embedded for retrieval.
+    """
+
+    __slots__ = ("row_id", "kind", "title", "index", "text", "tokens", "hash", "vector")
+
+    def __init__(self, row_id: str, kind: str, title: str, index: int, text: str):
+        self.row_id = row_id
+        self.kind = kind
+        self.title = title
+        self.index = index
+        self.text = text
+        self.tokens = estimate_tokens(text)
+        self.hash = content_hash(text)
+        self.vector: Optional[List[float]] = None
+
+    def citation(self, number: int, node_id: str, score: Optional[float] = None) -> Dict[str, Any]:
+        citation = {
+            "ref": number, "node_id": node_id, "row_id": self.row_id, "kind": self.kind, "title": self.title,
+            "chunk": self.index
+        }
+        if score is not None:
+            citation["score"] = round(score, 4)
+        return citation
+
+
+class ProjectIndex:
+    def __init__(self, version: int, chunks: List[Chunk]):
+        self.version = version
+        self.chunks = chunks
+        self.built_at = time.time()
+
+
+class RetrievedContext:
+    """
+    Project context packed for a prompt, with citations back to board node ids.
+    """
+
+    def __init__(self, text: str, citations: List[Dict[str, Any]], chunks: List[Chunk], tokens: int, version: int):
+        self.text = text
+        self.citations = citations
+        self.chunks = chunks
+        self.tokens = tokens
+        self.version = version
+        self.cached = False
+
+
+def chunk_text(text: str, size: int = CHUNK_CHARS, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """
+    Split text into overlapping windows, preferring to break on whitespace.
+    """
+    text = _WHITESPACE_RE.sub(" ", text or "").strip()
+    if len(text) <= size:
+        return [text] if text else []
+
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + size, len(text))
+        if end < len(text):
+            space = text.rfind(" ", start + size // 2, end)
+            if space != -1:
+                end = space
+        chunks.append(text[start:end].strip())
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+
+class RetrievalService:
+    """
+    Service class for retrieving the project docs and links most relevant to a
+    chat prompt. The embedded project index is cached per content version, so
+    follow-up turns only embed the prompt and never re-query the database.
+    """
+
+    def __init__(self, supabase_client: Client, embeddings: EmbeddingService):
+        self.supabase = supabase_client
+        self.embeddings = embeddings
+
+    def _build_index(self, project_id: str, user: AuthenticatedUser, version: int) -> ProjectIndex:
+        docs = self.supabase.table("docs").select("id, doc_name, content").eq(
+            "project_id", project_id
+        ).eq("user_id", user.supabase_user_id).execute()
+        links = self.supabase.table("links").select("id, name, url").eq(
+            "project_id", project_id
+        ).eq("user_id", user.supabase_user_id).execute()
+
+        chunks: List[Chunk] = []
+        for doc in docs.data or []:
+            title = doc.get("doc_name") or "Untitled Document"
+            for i, text in enumerate(chunk_text(f"{title}\n{doc.get('content') or ''}")):
+                chunks.append(Chunk(str(doc["id"]), "doc", title, i, text))
+        for link in links.data or []:
+            title = link.get("name") or link.get("url") or "Link"
+            chunks.append(Chunk(str(link["id"]), "link", title, 0, f"{title} {link.get('url') or ''}".strip()))
+
+        for chunk, vector in zip(chunks, self.embeddings.embed([c.text for c in chunks])):
+            chunk.vector = vector
+
+        logger.info(f"Built retrieval index for project {project_id} v{version}: {len(chunks)} chunks")
+        return ProjectIndex(version, chunks)
+
+    def _get_index(self, project_id: str, user: AuthenticatedUser, version: int) -> ProjectIndex:
+        key = (user.supabase_user_id, str(project_id), version)
+        return _index_cache.get_or_set(key, lambda: self._build_index(project_id, user, version))
+
+    def _load_node_ids(self, project_id: str, user: AuthenticatedUser) -> Dict[str, str]:
+        flows = self.supabase.table("flows").select("flow_state").eq(
+            "project_id", project_id
+        ).eq("user_id", user.supabase_user_id).execute()
+        node_ids: Dict[str, str] = {}
+        for flow in flows.data or []:
+            node_ids.update(node_ids_by_row(flow.get("flow_state")))
+        return node_ids
+
+    def _get_node_ids(self, project_id: str, user: AuthenticatedUser) -> Dict[str, str]:
+        # Keyed on the flow version, so moving nodes around never re-embeds the index
+        key = (user.supabase_user_id, str(project_id), project_versions.get(project_id, FLOW))
+        return _node_id_cache.get_or_set(key, lambda: self._load_node_ids(project_id, user))
+
+    def _pack(self, chunks: List[Chunk], scores: Dict[str, float], max_tokens: int, version: int,
+              node_ids: Dict[str, str]) -> RetrievedContext:
+        """
+        Dedupe chunks (identical text, or too many from one node) and pack up
+        to TOP_K of them in order until the token budget is used. Chunks are
+        cited by board node id; items not on the board keep their row id.
+        """
+        seen = set()
+        per_node: Dict[str, int] = {}
+        parts, citations, packed = [], [], []
+        used = 0
+        for chunk in chunks:
+            if len(citations) >= TOP_K:
+                break
+            if chunk.hash in seen or per_node.get(chunk.row_id, 0) >= MAX_CHUNKS_PER_NODE:
+                continue
+            number = len(citations) + 1
+            node_id = node_ids.get(chunk.row_id, chunk.row_id)
+            part = f"[{number}] {chunk.title} ({chunk.kind} {node_id}):\n{chunk.text}"
+            tokens = estimate_tokens(part)
+            if used + tokens > max_tokens:
+                continue
+            seen.add(chunk.hash)
+            per_node[chunk.row_id] = per_node.get(chunk.row_id, 0) + 1
+            parts.append(part)
+            citations.append(chunk.citation(number, node_id, scores.get(chunk.hash)))
+            packed.append(chunk)
+            used += tokens
+        return RetrievedContext("\n\n".join(parts), citations, packed, used, version)
+
+    def retrieve(
+        self,
+        project_id: str,
+        prompt: str,
+        user: AuthenticatedUser,
+        max_tokens: int,
+        conversation_id: Optional[str] = None
+    ) -> RetrievedContext:
+        """
+        Return packed project context for a prompt. Results are cached on
+        (project version, prompt); within a conversation, chunks retrieved on
+        earlier turns are carried forward while the project is unchanged.
+        """
+        try:
+            version = project_versions.get(project_id)
+            key = (user.supabase_user_id, str(project_id), version, content_hash(prompt.strip().lower()))
+            hit = _retrieval_cache.get(key)
+            if hit is None:
+                index = self._get_index(project_id, user, version)
+                query = self.embeddings.embed_one(prompt)
+                scored = sorted(
+                    ((cosine(query, chunk.vector), chunk) for chunk in index.chunks),
+                    key=lambda pair: pair[0],
+                    reverse=True
+                )
+                top = [(score, chunk) for score, chunk in scored[:TOP_K * 2] if score >= MIN_SCORE]
+                _retrieval_cache.set(key, top)
+            else:
+                top = hit
+
+            scores = {chunk.hash: score for score, chunk in top}
+            candidates = [chunk for _, chunk in top]
+            if conversation_id:
+                previous = _conversation_cache.get(conversation_id)
+                if previous and previous[0] == version:
+                    candidates += previous[1]
+
+            context = self._pack(candidates, scores, max_tokens, version, self._get_node_ids(project_id, user))
+            context.cached = hit is not None
+            if conversation_id:
+                _conversation_cache.set(conversation_id, (version, context.chunks))
+            return context
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Retrieval error: {str(e)}")
+
+
+def retrieval_cache_stats() -> Dict[str, Any]:
+    return {"index": _index_cache.stats(), "retrieval": _retrieval_cache.stats(), "node_ids": _node_id_cache.stats()}
+
+
+# Dependency function to get RetrievalService instance
+def get_retrieval_service(
+    supabase_client: Client = Depends(get_supabase_client),
+    embeddings: EmbeddingService = Depends(get_embedding_service)
+) -> RetrievalService:
+    """
+    Dependency function to provide RetrievalService instance.
+    """
+    return RetrievalService(supabase_client, embeddings)
@@ -0,0 +1,223 @@
+import os
+import json
+import threading
+from typing import Optional, Dict, Any, Hashable, Iterable
+import logging
+
+from .cache import LRUCache
+from .invalidation_bus import invalidation_bus, USER
+
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:
+    redis_asyncio = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_TTL_SECONDS = 60
+
+
+class _LocalBackend:
+    name = "local"
+    shared = False
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.cache = LRUCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self.cache.get(key)
+
+    async def set(self, key: str, row: Dict[str, Any]):
+        self.cache.set(key, row)
+
+    async def delete(self, key: str):
+        self.cache.delete(key)
+
+    def forget(self, key: str):
+        self.cache.delete(key)
+
+    def forget_prefix(self, prefix: str):
+        self.cache.delete_where(lambda key: key.startswith(prefix))
+
+    def clear(self):
+        self.cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.cache.stats()
+        return {"entries": stats["entries"], "max_entries": stats["max_entries"], "evictions": stats["evictions"]}
+
+
+class _RedisBackend:
+    """
+    Shared cache in Redis, so every worker sees the same entries and an
+    invalidation on one worker applies to all of them.
+    """
+
+    name = "redis"
+    shared = True
+
+    def __init__(self, url: str, ttl_seconds: float):
+        if redis_asyncio is None:
+            raise RuntimeError("ROW_CACHE_URL is set but the redis package is not installed")
+        self.client = redis_asyncio.from_url(url)
+        self.ttl_seconds = int(ttl_seconds)
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = await self.client.get(key)
+        return json.loads(value) if value is not None else None
+
+    async def set(self, key: str, row: Dict[str, Any]):
+        await self.client.set(key, json.dumps(row), ex=self.ttl_seconds)
+
+    async def delete(self, key: str):
+        await self.client.delete(key)
+
+    # Redis is shared: the writer's delete already reached every worker, and
+    # anything else expires with the TTL
+    def forget(self, key: str):
+        pass
+
+    def forget_prefix(self, prefix: str):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class RowCache:
+    """
+    Read-through cache of single rows keyed by (user, id). Reads fill it,
+    and the services' update and delete paths invalidate it. Entries live in
+    a bounded in-process LRU with a TTL, or in Redis when ROW_CACHE_URL is
+    set. Invalidations go out on the invalidation bus so every worker drops
+    the key. Cache errors are logged and treated as misses; they never fail a
+    request.
+    """
+
+    def __init__(self, namespace: str, backend=None):
+        self.namespace = namespace
+        self.backend = backend or _default_backend()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.errors = 0
+        # Invalidation clock: a read that started before the latest
+        # invalidation of its key must not write its (possibly stale) row back
+        self._clock = 0
+        self._invalidated = LRUCache(max_entries=DEFAULT_MAX_ENTRIES)
+        self._cleared_at = -1
+        self._lock = threading.Lock()
+        self.topic = f"rowcache:{namespace}"
+        invalidation_bus.subscribe(self.topic, self._forget)
+        invalidation_bus.subscribe(USER, self._forget_user)
+        invalidation_bus.on_reset(self._forget_all)
+
+    def _key(self, user_id: str, row_id: Hashable) -> str:
+        return f"rowcache:{self.namespace}:{user_id}:{row_id}"
+
+    def generation(self) -> int:
+        return self._clock
+
+    async def get(self, user_id: str, row_id: Hashable) -> Optional[Dict[str, Any]]:
+        try:
+            row = await self.backend.get(self._key(user_id, row_id))
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Row cache read failed for {self.namespace}: {str(e)}")
+            row = None
+        if row is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return row
+
+    async def set(self, user_id: str, row_id: Hashable, row: Dict[str, Any], generation: Optional[int] = None):
+        """
+        Store a row read from the database. Pass the generation() taken before
+        the read so a row invalidated in the meantime is not cached.
+        """
+        key = self._key(user_id, row_id)
+        if generation is not None and self._stale(key, user_id, generation):
+            return
+        try:
+            await self.backend.set(key, row)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Row cache write failed for {self.namespace}: {str(e)}")
+
+    def _stale(self, key: str, user_id: str, generation: int) -> bool:
+        return max(
+            self._invalidated.get(key, -1),
+            self._invalidated.get(("user", user_id), -1),
+            self._cleared_at,
+        ) > generation
+
+    def _mark(self, marker: Hashable):
+        with self._lock:
+            self._clock += 1
+            self._invalidated.set(marker, self._clock)
+
+    def _forget(self, key: str):
+        self._mark(key)
+        self.backend.forget(key)
+
+    def _forget_user(self, user_id: str):
+        self._mark(("user", user_id))
+        self.backend.forget_prefix(self._key(user_id, ""))
+
+    def _forget_all(self):
+        with self._lock:
+            self._clock += 1
+            self._cleared_at = self._clock
+        self.backend.clear()
+
+    async def invalidate(self, user_id: str, row_id: Hashable):
+        key = self._key(user_id, row_id)
+        self.invalidations += 1
+        # Drops the key here and on every other worker
+        invalidation_bus.publish(self.topic, key)
+        if not self.backend.shared:
+            return
+        try:
+            await self.backend.delete(key)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Row cache invalidation failed for {key}: {str(e)}")
+
+    async def invalidate_many(self, user_id: str, row_ids: Iterable[Hashable]):
+        for row_id in row_ids:
+            await self.invalidate(user_id, row_id)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.backend.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "invalidations": self.invalidations,
+            "errors": self.errors,
+            **self.backend.stats(),
+        }
+
+
+def _default_backend():
+    ttl_seconds = float(os.getenv("ROW_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS))
+    url = os.getenv("ROW_CACHE_URL")
+    if url:
+        return _RedisBackend(url, ttl_seconds)
+    return _LocalBackend(int(os.getenv("ROW_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)), ttl_seconds)
+
+
+document_cache = RowCache("docs")
+link_cache = RowCache("links")
+project_cache = RowCache("projects")
+image_cache = RowCache("images")
+
+
+def row_cache_stats() -> Dict[str, Any]:
+    return {cache.namespace: cache.stats() for cache in (document_cache, link_cache, project_cache, image_cache)}
@@ -0,0 +1,63 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, TypeVar
+
+T = TypeVar("T")
+
+_flights: List["SingleFlight"] = []
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls: while a call for a key is running,
+    later callers with the same key wait for it and get the same result (or
+    exception) instead of starting their own. Nothing is kept once the call
+    finishes, so this is not a cache. Results are shared between callers and
+    must not be mutated.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.shared = 0
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        _flights.append(self)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._inflight.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            self.calls += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._done(key, done))
+        else:
+            self.shared += 1
+        # One caller going away (client disconnect) must not cancel the call
+        # for everyone else waiting on it
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Mark the exception retrieved in case every caller went away
+            task.exception()
+
+    def forget(self, key: Hashable):
+        """
+        Stop handing out the call in flight for key, e.g. after a write that
+        it may not have seen. Callers already waiting still get its result.
+        """
+        self._inflight.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.calls + self.shared
+        return {
+            "calls": self.calls,
+            "shared": self.shared,
+            "shared_rate": round(self.shared / total, 4) if total else None,
+            "in_flight": len(self._inflight),
+        }
+
+
+def single_flight_stats() -> Dict[str, Any]:
+    return {flight.name: flight.stats() for flight in _flights}
@@ -0,0 +1,345 @@
+import os
+import re
+import abc
+import json
+import asyncio
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+from typing import Optional, Dict, Any, List, Tuple
+from uuid import UUID
+from fastapi import Depends
+from starlette.concurrency import run_in_threadpool
+from supabase import Client
+import logging
+
+from ..auth import get_supabase_client
+from ..metrics import POSTGRES, upstream
+
+logger = logging.getLogger(__name__)
+
+POSTGREST = "postgrest"
+ASYNCPG = "asyncpg"
+
+_IDENTIFIER_RE = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+
+class StorageBackend(abc.ABC):
+    """
+    Table-level storage used by the data services. Filters are column ->
+    value equality; a list, tuple or set value matches any of its items.
+    Rows come back as plain dicts with ids and timestamps as strings,
+    whichever backend is in use.
+    """
+
+    name = ""
+
+    @abc.abstractmethod
+    async def select(
+        self,
+        table: str,
+        filters: Dict[str, Any],
+        columns: str = "*",
+        order_by: Optional[str] = None,
+        descending: bool = False,
+        limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def insert(self, table: str, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def upsert(self, table: str, rows: List[Dict[str, Any]], on_conflict: str = "id") -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def update(self, table: str, values: Dict[str, Any], filters: Dict[str, Any]) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def delete(self, table: str, filters: Dict[str, Any]) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def aclose(self):
+        pass
+
+
+class PostgrestBackend(StorageBackend):
+    """
+    Storage through supabase-py's PostgREST client. The client is synchronous,
+    so calls run in the threadpool instead of blocking the event loop.
+    """
+
+    name = POSTGREST
+
+    def __init__(self, supabase_client: Client):
+        self.supabase = supabase_client
+
+    @staticmethod
+    def _filter(query, filters: Dict[str, Any]):
+        for column, value in filters.items():
+            if isinstance(value, (list, tuple, set)):
+                query = query.in_(column, list(value))
+            else:
+                query = query.eq(column, value)
+        return query
+
+    async def select(self, table, filters, columns="*", order_by=None, descending=False, limit=None):
+        def run():
+            query = self._filter(self.supabase.table(table).select(columns), filters)
+            if order_by:
+                query = query.order(order_by, desc=descending)
+            if limit is not None:
+                query = query.limit(limit)
+            return query.execute().data or []
+        return await run_in_threadpool(run)
+
+    async def insert(self, table, rows):
+        return await run_in_threadpool(lambda: self.supabase.table(table).insert(rows).execute().data or [])
+
+    async def upsert(self, table, rows, on_conflict="id"):
+        return await run_in_threadpool(
+            lambda: self.supabase.table(table).upsert(rows, on_conflict=on_conflict).execute().data or []
+        )
+
+    async def update(self, table, values, filters):
+        return await run_in_threadpool(
+            lambda: self._filter(self.supabase.table(table).update(values), filters).execute().data or []
+        )
+
+    async def delete(self, table, filters):
+        return await run_in_threadpool(
+            lambda: self._filter(self.supabase.table(table).delete(), filters).execute().data or []
+        )
+
+
+def _ident(name: str) -> str:
+    if not _IDENTIFIER_RE.match(name):
+        raise ValueError(f"Invalid identifier: {name!r}")
+    return f'"{name}"'
+
+
+def _columns(columns: str) -> str:
+    if columns.strip() == "*":
+        return "*"
+    return ", ".join(_ident(column.strip()) for column in columns.split(","))
+
+
+def _where(filter_keys: Tuple[Tuple[str, bool], ...], offset: int = 0) -> str:
+    if not filter_keys:
+        return ""
+    clauses = [
+        f"{_ident(column)} = ANY(${offset + i})" if many else f"{_ident(column)} = ${offset + i}"
+        for i, (column, many) in enumerate(filter_keys, start=1)
+    ]
+    return " WHERE " + " AND ".join(clauses)
+
+
+# SQL text depends only on the shape of a call, so the same string comes back
+# for every call of that shape and hits asyncpg's prepared statement cache.
+@lru_cache(maxsize=512)
+def _select_sql(table, columns, filter_keys, order_by, descending, limited) -> str:
+    sql = f"SELECT {_columns(columns)} FROM {_ident(table)}{_where(filter_keys)}"
+    if order_by:
+        sql += f" ORDER BY {_ident(order_by)}{' DESC' if descending else ''}"
+    if limited:
+        sql += f" LIMIT ${len(filter_keys) + 1}"
+    return sql
+
+
+@lru_cache(maxsize=512)
+def _insert_sql(table, columns, count=1, on_conflict=None) -> str:
+    names = ", ".join(_ident(column) for column in columns)
+    width = len(columns)
+    values = ", ".join(
+        "(" + ", ".join(f"${row * width + i}" for i in range(1, width + 1)) + ")"
+        for row in range(count)
+    )
+    sql = f"INSERT INTO {_ident(table)} ({names}) VALUES {values}"
+    if on_conflict:
+        updates = ", ".join(f"{_ident(c)} = EXCLUDED.{_ident(c)}" for c in columns if c != on_conflict)
+        sql += f" ON CONFLICT ({_ident(on_conflict)}) DO UPDATE SET {updates}"
+    return sql + " RETURNING *"
+
+
+@lru_cache(maxsize=512)
+def _update_sql(table, columns, filter_keys) -> str:
+    assignments = ", ".join(f"{_ident(column)} = ${i}" for i, column in enumerate(columns, start=1))
+    return f"UPDATE {_ident(table)} SET {assignments}{_where(filter_keys, len(columns))} RETURNING *"
+
+
+@lru_cache(maxsize=512)
+def _delete_sql(table, filter_keys) -> str:
+    return f"DELETE FROM {_ident(table)}{_where(filter_keys)} RETURNING *"
+
+
+def _filter_args(filters: Dict[str, Any]) -> Tuple[Tuple[Tuple[str, bool], ...], List[Any]]:
+    keys, args = [], []
+    for column, value in filters.items():
+        many = isinstance(value, (list, tuple, set))
+        keys.append((column, many))
+        args.append([_param(column, v) for v in value] if many else _param(column, value))
+    return tuple(keys), args
+
+
+def _param(column: str, value: Any) -> Any:
+    # PostgREST accepts ISO strings for timestamps; asyncpg needs datetimes
+    if isinstance(value, str) and column.endswith("_at"):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return value
+    return value
+
+
+def _value(value: Any) -> Any:
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _row(record) -> Dict[str, Any]:
+    return {key: _value(value) for key, value in record.items()}
+
+
+class AsyncpgBackend(StorageBackend):
+    """
+    Storage on a pooled asyncpg connection straight to Postgres, skipping the
+    PostgREST HTTP hop. Statements are prepared once per connection and reused.
+    Behind a transaction-mode pooler (e.g. Supabase's port 6543) prepared
+    statements can't be kept, so set DATABASE_STATEMENT_CACHE_SIZE=0 there.
+    """
+
+    name = ASYNCPG
+
+    def __init__(
+        self,
+        dsn: Optional[str] = None,
+        min_size: Optional[int] = None,
+        max_size: Optional[int] = None,
+        statement_cache_size: Optional[int] = None
+    ):
+        self.dsn = dsn or os.getenv("DATABASE_URL")
+        if not self.dsn:
+            raise RuntimeError("DATABASE_URL is required for the asyncpg storage backend")
+        self.min_size = min_size if min_size is not None else int(os.getenv("DATABASE_POOL_MIN", "2"))
+        self.max_size = max_size if max_size is not None else int(os.getenv("DATABASE_POOL_MAX", "10"))
+        self.statement_cache_size = (
+            statement_cache_size if statement_cache_size is not None
+            else int(os.getenv("DATABASE_STATEMENT_CACHE_SIZE", "256"))
+        )
+        self._pool = None
+        self._pool_lock = asyncio.Lock()
+
+    @staticmethod
+    async def _init_connection(connection):
+        for type_name in ("json", "jsonb"):
+            await connection.set_type_codec(
+                type_name, encoder=json.dumps, decoder=json.loads, schema="pg_catalog"
+            )
+
+    async def pool(self):
+        if self._pool is None:
+            async with self._pool_lock:
+                if self._pool is None:
+                    import asyncpg
+                    self._pool = await asyncpg.create_pool(
+                        self.dsn,
+                        min_size=self.min_size,
+                        max_size=self.max_size,
+                        statement_cache_size=self.statement_cache_size,
+                        init=self._init_connection,
+                    )
+                    logger.info(f"Opened asyncpg pool ({self.min_size}-{self.max_size} connections)")
+        return self._pool
+
+    async def select(self, table, filters, columns="*", order_by=None, descending=False, limit=None):
+        filter_keys, args = _filter_args(filters)
+        sql = _select_sql(table, columns, filter_keys, order_by, descending, limit is not None)
+        if limit is not None:
+            args.append(limit)
+        pool = await self.pool()
+        with upstream(POSTGRES, "select", table):
+            records = await pool.fetch(sql, *args)
+        return [_row(record) for record in records]
+
+    async def _insert(self, table, rows, on_conflict=None):
+        if not rows:
+            return []
+        # Rows with the same columns go in one multi-row statement
+        groups: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+        for row in rows:
+            groups.setdefault(tuple(row.keys()), []).append(row)
+
+        pool = await self.pool()
+        inserted = []
+        with upstream(POSTGRES, "upsert" if on_conflict else "insert", table):
+            async with pool.acquire() as connection:
+                async with connection.transaction():
+                    for columns, group in groups.items():
+                        sql = _insert_sql(table, columns, len(group), on_conflict)
+                        args = [_param(c, row[c]) for row in group for c in columns]
+                        inserted += [_row(record) for record in await connection.fetch(sql, *args)]
+        return inserted
+
+    async def insert(self, table, rows):
+        return await self._insert(table, rows)
+
+    async def upsert(self, table, rows, on_conflict="id"):
+        return await self._insert(table, rows, on_conflict)
+
+    async def update(self, table, values, filters):
+        columns = tuple(values.keys())
+        filter_keys, args = _filter_args(filters)
+        sql = _update_sql(table, columns, filter_keys)
+        pool = await self.pool()
+        with upstream(POSTGRES, "update", table):
+            records = await pool.fetch(sql, *(_param(c, values[c]) for c in columns), *args)
+        return [_row(record) for record in records]
+
+    async def delete(self, table, filters):
+        filter_keys, args = _filter_args(filters)
+        pool = await self.pool()
+        with upstream(POSTGRES, "delete", table):
+            records = await pool.fetch(_delete_sql(table, filter_keys), *args)
+        return [_row(record) for record in records]
+
+    async def aclose(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+
+_asyncpg_backend: Optional[AsyncpgBackend] = None
+
+
+def storage_backend_name() -> str:
+    return os.getenv("STORAGE_BACKEND", POSTGREST).lower()
+
+
+# Dependency function to get the configured StorageBackend instance
+def get_storage_backend(supabase_client: Client = Depends(get_supabase_client)) -> StorageBackend:
+    """
+    Dependency function to provide the StorageBackend selected by STORAGE_BACKEND
+    (postgrest by default, or asyncpg with DATABASE_URL).
+    """
+    global _asyncpg_backend
+    if storage_backend_name() == ASYNCPG:
+        if _asyncpg_backend is None:
+            _asyncpg_backend = AsyncpgBackend()
+        return _asyncpg_backend
+    return PostgrestBackend(supabase_client)
+
+
+async def close_storage_backend():
+    """Close the asyncpg pool, if STORAGE_BACKEND=asyncpg ever opened one"""
+    global _asyncpg_backend
+    if _asyncpg_backend is not None:
+        await _asyncpg_backend.aclose()
+        _asyncpg_backend = None
@@ -0,0 +1,117 @@
+"""
+The same photos uploaded into several projects, as users do when they reuse
+material across boards: what ends up on disk and how long the first and the
+repeated uploads take, then what garbage collection reclaims once the
+projects are deleted:
+
+    cd server
+    python -m benchmarks.blobs --photos 6 --projects 5
+
+Every photo is uploaded once into each of --projects projects. "Per upload"
+is what storing each upload's original and variants separately (the layout
+before the blob store) would put on disk. Requests go through the real
+FastAPI app in-process against in-memory storage, with images processed in
+the threadpool and files under a temporary BLOB_DIR; auth is replaced with a
+fixed user.
+"""
+import io
+import os
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--photos", type=int, default=6, help="distinct photos")
+    parser.add_argument("--projects", type=int, default=5, help="projects each photo is uploaded into")
+    parser.add_argument("--width", type=int, default=3000)
+    parser.add_argument("--height", type=int, default=2000)
+    return parser.parse_args()
+
+
+def photo(width: int, height: int, seed: int) -> bytes:
+    from PIL import Image
+    noise = Image.effect_noise((width, height), 40 + seed % 20)
+    gradient = Image.linear_gradient("L").resize((width, height))
+    image = Image.merge("RGB", (noise, gradient, Image.eval(gradient, lambda v: 255 - v)))
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=90)
+    return buffer.getvalue() + seed.to_bytes(4, "big")
+
+
+def disk_bytes(root: str) -> int:
+    return sum(os.path.getsize(os.path.join(path, name)) for path, _, names in os.walk(root) for name in names)
+
+
+async def main(args):
+    import httpx
+    from starlette.concurrency import run_in_threadpool
+    from benchmarks.common import memory_storage, percentile, print_table
+    from app.main import app
+    from app.auth import get_current_user_from_cookies, AuthenticatedUser
+    from app.services.storage_backend import get_storage_backend
+    from app.services import image_service
+    from app.services.blob_store import BlobStore
+
+    logging.getLogger().setLevel(logging.ERROR)
+    # Deleting a project takes its image rows and blob refs with it, as in Postgres
+    storage = memory_storage(0, cascades={"projects": [("images", "project_id"), ("blob_refs", "project_id")]})
+    user = AuthenticatedUser(supabase_user_id="benchmark-user", clerk_user_id="benchmark", email="", user_metadata={})
+    app.dependency_overrides[get_current_user_from_cookies] = lambda: user
+    app.dependency_overrides[get_storage_backend] = lambda: storage
+    image_service.image_processor = image_service.ImageProcessor(workers=0)
+
+    projects = await storage.insert("projects", [
+        {"project_name": f"Board {i}", "user_id": user.supabase_user_id} for i in range(args.projects)
+    ])
+    photos = await run_in_threadpool(lambda: [photo(args.width, args.height, i) for i in range(args.photos)])
+
+    first, repeated, per_upload = [], [], 0
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=300) as client:
+        for project in projects:
+            for i, data in enumerate(photos):
+                started = time.perf_counter()
+                response = await client.post(
+                    f"/api/images/upload?project_id={project['id']}&filename=photo{i}.jpg",
+                    content=data, headers={"content-type": "image/jpeg"}
+                )
+                assert response.status_code == 200, response.text
+                (first if project is projects[0] else repeated).append((time.perf_counter() - started) * 1000)
+                image = response.json()["image"]
+                per_upload += image["bytes"] + sum(variant["bytes"] for variant in image["variants"])
+
+        stored = disk_bytes(os.environ["BLOB_DIR"])
+        for project in projects:
+            response = await client.delete(f"/api/projects/delete/{project['id']}")
+            assert response.status_code == 200, response.text
+
+    started = time.perf_counter()
+    collected = await BlobStore(storage).collect_garbage(grace_seconds=0)
+    gc_ms = (time.perf_counter() - started) * 1000
+
+    print(f"{args.photos} photos ({args.width}x{args.height}) uploaded into {args.projects} projects each")
+    print_table([
+        {"upload": "first", "count": len(first), "p50_ms": round(percentile(first, 50), 1),
+         "max_ms": round(max(first), 1)},
+        {"upload": "repeated", "count": len(repeated), "p50_ms": round(percentile(repeated, 50), 1),
+         "max_ms": round(max(repeated), 1) if repeated else 0},
+    ])
+    print(f"\nOn disk: {stored / 1024 / 1024:.1f} MB as blobs, {per_upload / 1024 / 1024:.1f} MB per upload, "
+          f"{len(storage.tables['blobs']) + collected['collected']} blobs for {len(first) + len(repeated)} images")
+    print(f"After deleting the projects, GC removed {collected['collected']} blobs "
+          f"({collected['bytes'] / 1024 / 1024:.1f} MB of originals) in {gc_ms:.1f} ms; "
+          f"{disk_bytes(os.environ['BLOB_DIR'])} bytes left")
+
+
+if __name__ == "__main__":
+    # Only read if a real client ever gets built; the benchmark swaps them out
+    os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+    os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "eyJhbGciOiJIUzI1NiJ9.e30.benchmark")
+    os.environ.setdefault("CLERK_SECRET_KEY", "sk_test_benchmark")
+    os.environ["RATE_LIMIT_ENABLED"] = "0"
+    os.environ["BLOB_GC_INTERVAL_S"] = "0"
+    os.environ["BLOB_DIR"] = tempfile.mkdtemp(prefix="blob-bench-")
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,116 @@
+"""
+Requests, database round trips and wall time for 100-item operations done
+one row per request versus through the bulk endpoints:
+
+    cd server
+    python -m benchmarks.bulk_endpoints --items 100 --round-trip-ms 2
+
+Requests go through the real FastAPI app in-process. Storage is in memory
+with a simulated per-statement round trip, and auth is replaced with a
+fixed user.
+"""
+import os
+import time
+import asyncio
+import argparse
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=100)
+    parser.add_argument("--round-trip-ms", type=float, default=2.0, help="simulated latency per database statement")
+    parser.add_argument("--concurrency", type=int, default=8, help="parallel requests for the one-by-one runs")
+    return parser.parse_args()
+
+
+async def measure(storage, name: str, mode: str, requests):
+    """
+    Run request coroutine factories together and count what they cost.
+    """
+    before = storage.round_trips
+    started = time.perf_counter()
+    await asyncio.gather(*(request() for request in requests))
+    return {
+        "operation": name,
+        "mode": mode,
+        "requests": len(requests),
+        "db_round_trips": storage.round_trips - before,
+        "wall_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+async def main(args):
+    import httpx
+    from benchmarks.common import memory_storage, print_table
+    from app.main import app
+    from app.auth import get_current_user_from_cookies, AuthenticatedUser
+    from app.services.storage_backend import get_storage_backend
+
+    storage = memory_storage(args.round_trip_ms)
+    user = AuthenticatedUser(supabase_user_id="benchmark-user", clerk_user_id="benchmark", email="", user_metadata={})
+    app.dependency_overrides[get_current_user_from_cookies] = lambda: user
+    app.dependency_overrides[get_storage_backend] = lambda: storage
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    rows = []
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        async def call(method: str, url: str, **kwargs):
+            async with semaphore:
+                response = await client.request(method, url, **kwargs)
+                response.raise_for_status()
+                return response.json()
+
+        project = (await call("POST", "/api/projects/create", json={"project_name": "bulk benchmark"}))["project"]
+        n = args.items
+        kinds = (
+            ("docs", "/api/docs", "document", "documents", "doc_ids",
+             lambda i: {"project_id": project["id"], "doc_name": f"Doc {i}", "content": "x" * 200},
+             {"content": "y" * 200}),
+            ("links", "/api/links", "link", "links", "link_ids",
+             lambda i: {"project_id": project["id"], "url": f"https://example.com/{i}", "string": f"Link {i}"},
+             {"string": "renamed"}),
+        )
+
+        for kind, path, key, field, id_field, make, change in kinds:
+            created = []
+
+            async def create_one(i):
+                created.append((await call("POST", f"{path}/create", json=make(i)))[key]["id"])
+
+            rows.append(await measure(storage, f"{kind} create", "one by one", [
+                lambda i=i: create_one(i) for i in range(n)
+            ]))
+            rows.append(await measure(storage, f"{kind} update", "one by one", [
+                lambda item_id=item_id: call("PUT", f"{path}/update/{item_id}", json=change) for item_id in created
+            ]))
+            rows.append(await measure(storage, f"{kind} delete", "one by one", [
+                lambda item_id=item_id: call("DELETE", f"{path}/delete/{item_id}") for item_id in created
+            ]))
+
+            bulk_ids = []
+
+            async def create_bulk():
+                result = await call("POST", f"{path}/bulk/create", json={field: [make(i) for i in range(n)]})
+                bulk_ids.extend(item[key]["id"] for item in result["results"])
+
+            rows.append(await measure(storage, f"{kind} create", "bulk", [create_bulk]))
+            rows.append(await measure(storage, f"{kind} update", "bulk", [
+                lambda: call("PUT", f"{path}/bulk/update", json={field: [{"id": i, **change} for i in bulk_ids]})
+            ]))
+            rows.append(await measure(storage, f"{kind} delete", "bulk", [
+                lambda: call("POST", f"{path}/bulk/delete", json={id_field: bulk_ids})
+            ]))
+
+    print(f"{args.items} items per operation, {args.round_trip_ms} ms per database round trip")
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    # Only read if a real client ever gets built; nothing here talks to them
+    os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+    os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "eyJhbGciOiJIUzI1NiJ9.e30.benchmark")
+    os.environ.setdefault("CLERK_SECRET_KEY", "sk_test_benchmark")
+    # One benchmark user sends far more than any real user may
+    os.environ["RATE_LIMIT_ENABLED"] = "0"
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,99 @@
+"""
+Fairness benchmark for the chat scheduler.
+
+A few light users send requests at a steady pace, first alone and then while
+one heavy user floods the scheduler. With weighted fair queuing the light
+users' p99 should barely move, and the heavy user's overflow is shed with 429:
+
+    cd server
+    python -m benchmarks.chat_scheduler_fairness --concurrency 8 --heavy 400
+"""
+import time
+import asyncio
+import argparse
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=8, help="scheduler concurrency cap")
+    parser.add_argument("--service-ms", type=float, default=50, help="simulated model time per request")
+    parser.add_argument("--light-users", type=int, default=5)
+    parser.add_argument("--light-requests", type=int, default=40, help="requests per light user")
+    parser.add_argument("--light-interval-ms", type=float, default=60)
+    parser.add_argument("--heavy", type=int, default=400, help="requests sent at once by the heavy user")
+    parser.add_argument("--queue-per-user", type=int, default=64)
+    return parser.parse_args()
+
+
+async def run(args, flood: bool):
+    from fastapi import HTTPException
+    from app.services.chat_scheduler import ChatScheduler
+
+    scheduler = ChatScheduler(
+        max_concurrency=args.concurrency,
+        max_queue_per_user=args.queue_per_user,
+        max_queue_total=args.queue_per_user * (args.light_users + 1),
+        queue_timeout_s=60,
+    )
+    latencies = {"light": [], "heavy": []}
+    shed = {"light": 0, "heavy": 0}
+
+    async def request(user_id: str, kind: str):
+        started = time.perf_counter()
+        try:
+            ticket = await scheduler.acquire(user_id)
+        except HTTPException:
+            shed[kind] += 1
+            return
+        try:
+            await asyncio.sleep(args.service_ms / 1000)
+        finally:
+            scheduler.release(ticket)
+        latencies[kind].append((time.perf_counter() - started) * 1000)
+
+    async def heavy_user():
+        # Keep the heavy user's queue full for the whole run
+        pending = set()
+        for _ in range(args.heavy):
+            pending.add(asyncio.create_task(request("heavy", "heavy")))
+            await asyncio.sleep(0)
+            if len(pending) >= args.queue_per_user + args.concurrency:
+                _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        await asyncio.gather(*pending)
+
+    async def light_user(n: int):
+        tasks = []
+        for _ in range(args.light_requests):
+            tasks.append(asyncio.create_task(request(f"light-{n}", "light")))
+            await asyncio.sleep(args.light_interval_ms / 1000)
+        await asyncio.gather(*tasks)
+
+    started = time.perf_counter()
+    jobs = [light_user(n) for n in range(args.light_users)]
+    if flood:
+        jobs.append(heavy_user())
+    await asyncio.gather(*jobs)
+    return latencies, shed, scheduler.stats(), time.perf_counter() - started
+
+
+async def main(args):
+    from benchmarks.common import summarize, print_table
+
+    rows = []
+    for flood in (False, True):
+        latencies, shed, stats, elapsed = await run(args, flood)
+        for kind in ("light", "heavy"):
+            if not latencies[kind] and not shed[kind]:
+                continue
+            rows.append({
+                "scenario": "flood" if flood else "baseline",
+                "user": kind,
+                **summarize(latencies[kind], elapsed),
+                "shed_429": shed[kind],
+                "queue_wait_p99_ms": stats["wait_ms_p99"],
+            })
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,133 @@
+"""
+A bulk user import as Clerk delivers it: a burst of signed user.created
+webhooks, then user.updated for every user, with every event delivered twice
+the way Svix redelivers after a timeout.
+
+    cd server
+    python -m benchmarks.clerk_webhooks --users 500 --concurrency 32 --auth-ms 50
+
+Requests go through the real app and the real signature check. The Supabase
+auth admin API is the fake from benchmarks.fakes, which counts its calls.
+Reported per batch size: how long the endpoint took to answer, how long until
+the queue had applied everything, upstream calls per event, and whether each
+user ended up created exactly once with the latest name.
+"""
+import os
+import time
+import json
+import uuid
+import base64
+import hashlib
+import hmac
+import asyncio
+import logging
+import argparse
+import tempfile
+
+SECRET = "whsec_" + base64.b64encode(b"benchmark-webhook-secret").decode()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--auth-ms", type=float, default=50.0, help="latency of each Supabase auth admin call")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 50])
+    return parser.parse_args()
+
+
+def signed(payload):
+    body = json.dumps(payload).encode()
+    event_id, timestamp = f"msg_{uuid.uuid4().hex}", str(int(time.time()))
+    key = base64.b64decode(SECRET[len("whsec_"):])
+    signature = base64.b64encode(hmac.new(key, f"{event_id}.{timestamp}.".encode() + body, hashlib.sha256).digest())
+    return body, {
+        "svix-id": event_id, "svix-timestamp": timestamp, "svix-signature": f"v1,{signature.decode()}",
+        "content-type": "application/json",
+    }
+
+
+def events(users: int, run: int):
+    created, updated = [], []
+    for i in range(users):
+        data = {
+            "id": f"user_import{run}_{i}", "email_addresses": [{"email_address": f"import{run}.{i}@example.com"}],
+            "first_name": "Imported", "last_name": f"User {i}",
+        }
+        created.append(signed({"type": "user.created", "data": data}))
+        updated.append(signed({"type": "user.updated", "data": {**data, "last_name": f"Renamed {i}"}}))
+    return created, updated
+
+
+async def main(args):
+    os.environ["CLERK_WEBHOOK_SECRET"] = SECRET
+    import httpx
+    from benchmarks.common import percentile, print_table
+    from benchmarks.fakes import FakeSupabase, FakeClerk, Latency, install
+    from app.main import app
+    from app.services.clerk_webhook_service import clerk_webhooks, WebhookStore
+
+    logging.getLogger().setLevel(logging.WARNING)
+    supabase = FakeSupabase(Latency(args.auth_ms))
+    install(supabase, FakeClerk())
+
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+                for run, batch_size in enumerate(args.batch_sizes):
+                    if clerk_webhooks.store is not None:
+                        clerk_webhooks.store.close()
+                    clerk_webhooks.store = WebhookStore(os.path.join(directory, f"queue{run}.sqlite3"))
+                    clerk_webhooks.batch_size = batch_size
+                    created, updated = events(args.users, run)
+                    # Each event twice, the second copy after the first
+                    deliveries = created + updated + created + updated
+                    latencies, errors = [], []
+                    semaphore = asyncio.Semaphore(args.concurrency)
+
+                    async def deliver(body, headers):
+                        async with semaphore:
+                            started = time.perf_counter()
+                            response = await client.post("/users/webhook/clerk", content=body, headers=headers)
+                            latencies.append((time.perf_counter() - started) * 1000)
+                            if response.status_code != 200:
+                                errors.append(response.text)
+
+                    calls_before = supabase.auth_calls
+                    started = time.perf_counter()
+                    await asyncio.gather(*(deliver(body, headers) for body, headers in deliveries))
+                    delivered = time.perf_counter() - started
+                    while (await clerk_webhooks.stats(0))["queue"]["pending"] or \
+                            (await clerk_webhooks.stats(0))["queue"]["processing"]:
+                        await asyncio.sleep(0.05)
+                    drained = time.perf_counter() - started
+
+                    imported = [
+                        user for user in supabase.users.values()
+                        if user.user_metadata.get("clerk_user_id", "").startswith(f"user_import{run}_")
+                    ]
+                    renamed = sum(user.user_metadata.get("last_name", "").startswith("Renamed") for user in imported)
+                    rows.append({
+                        "batch_size": batch_size,
+                        "deliveries": len(deliveries),
+                        "errors": len(errors),
+                        "p50_ms": round(percentile(latencies, 50), 2),
+                        "p99_ms": round(percentile(latencies, 99), 2),
+                        "delivered_s": round(delivered, 2),
+                        "drained_s": round(drained, 2),
+                        "auth_calls_per_event": round((supabase.auth_calls - calls_before) / (2 * args.users), 2),
+                        "users_created": len(imported),
+                        "users_renamed": renamed,
+                    })
+
+    print(f"{args.users} users imported, {args.concurrency} concurrent deliveries, auth {args.auth_ms} ms")
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    # Only read if a real client ever gets built; the benchmark swaps them out
+    os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+    os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "eyJhbGciOiJIUzI1NiJ9.e30.benchmark")
+    os.environ.setdefault("CLERK_SECRET_KEY", "sk_test_benchmark")
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,149 @@
+"""
+Shared helpers for the benchmark scripts in this directory.
+"""
+import copy
+import uuid
+import socket
+import asyncio
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import uvicorn
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(latencies_ms: List[float], elapsed_s: float) -> Dict[str, float]:
+    return {
+        "requests": len(latencies_ms),
+        "rps": round(len(latencies_ms) / elapsed_s, 1) if elapsed_s else 0.0,
+        "p50_ms": round(percentile(latencies_ms, 50), 2),
+        "p95_ms": round(percentile(latencies_ms, 95), 2),
+        "p99_ms": round(percentile(latencies_ms, 99), 2),
+        "max_ms": round(max(latencies_ms), 2) if latencies_ms else 0.0,
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve_in_thread(app, port: int) -> uvicorn.Server:
+    """
+    Run an ASGI app with uvicorn on a background thread and wait until it is up.
+    """
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError("Server did not start")
+        time.sleep(0.01)
+    return server
+
+
+def print_table(rows: List[Dict[str, object]]):
+    if not rows:
+        return
+    columns = list(rows[0].keys())
+    widths = {c: max(len(str(c)), *(len(str(r.get(c, ""))) for r in rows)) for c in columns}
+    print("  ".join(str(c).ljust(widths[c]) for c in columns))
+    for row in rows:
+        print("  ".join(str(row.get(c, "")).ljust(widths[c]) for c in columns))
+
+
+def memory_storage(round_trip_ms: float = 0.0, cascades: Optional[Dict[str, List[Tuple[str, str]]]] = None):
+    """
+    In-memory StorageBackend that counts statements, so benchmarks can report
+    database round trips without a database. round_trip_ms adds a simulated
+    network delay to every statement. cascades maps a table to the (table,
+    column) foreign keys that are deleted along with its rows, like the
+    migrations' on delete cascade.
+    """
+    from app.services.storage_backend import StorageBackend
+
+    class MemoryStorage(StorageBackend):
+        name = "memory"
+
+        def __init__(self):
+            self.tables: Dict[str, Dict[str, Dict[str, Any]]] = {}
+            self.round_trips = 0
+
+        async def _round_trip(self):
+            self.round_trips += 1
+            if round_trip_ms:
+                await asyncio.sleep(round_trip_ms / 1000)
+
+        @staticmethod
+        def _matches(row: Dict[str, Any], filters: Dict[str, Any]) -> bool:
+            return all(str(row.get(column)) in allowed for column, allowed in filters.items())
+
+        def _rows(self, table: str, filters: Dict[str, Any]) -> List[Dict[str, Any]]:
+            filters = {
+                column: {str(v) for v in value} if isinstance(value, (list, tuple, set)) else {str(value)}
+                for column, value in filters.items()
+            }
+            return [row for row in self.tables.get(table, {}).values() if self._matches(row, filters)]
+
+        async def select(self, table, filters, columns="*", order_by=None, descending=False, limit=None):
+            await self._round_trip()
+            rows = self._rows(table, filters)
+            if order_by:
+                rows.sort(key=lambda row: row.get(order_by), reverse=descending)
+            return copy.deepcopy(rows[:limit] if limit is not None else rows)
+
+        async def insert(self, table, rows):
+            await self._round_trip()
+            stored = self.tables.setdefault(table, {})
+            inserted = []
+            for row in rows:
+                row = {"id": str(uuid.uuid4()), "created_at": datetime.now(timezone.utc).isoformat(), **copy.deepcopy(row)}
+                stored[row["id"]] = row
+                inserted.append(copy.deepcopy(row))
+            return inserted
+
+        async def upsert(self, table, rows, on_conflict="id"):
+            await self._round_trip()
+            stored = self.tables.setdefault(table, {})
+            upserted = []
+            for row in rows:
+                existing = next(
+                    (r for r in stored.values() if str(r.get(on_conflict)) == str(row.get(on_conflict))), None
+                ) if on_conflict != "id" else stored.get(str(row["id"]))
+                merged = {"id": str(uuid.uuid4()), **(existing or {}), **copy.deepcopy(row)}
+                stored[str(merged["id"])] = merged
+                upserted.append(copy.deepcopy(merged))
+            return upserted
+
+        async def update(self, table, values, filters):
+            await self._round_trip()
+            rows = self._rows(table, filters)
+            for row in rows:
+                row.update(copy.deepcopy(values))
+            return copy.deepcopy(rows)
+
+        def _delete(self, table: str, filters: Dict[str, Any]) -> List[Dict[str, Any]]:
+            rows = self._rows(table, filters)
+            for row in rows:
+                del self.tables[table][row["id"]]
+            if rows:
+                for child, column in (cascades or {}).get(table, ()):
+                    self._delete(child, {column: [row["id"] for row in rows]})
+            return rows
+
+        async def delete(self, table, filters):
+            await self._round_trip()
+            return self._delete(table, filters)
+
+    return MemoryStorage()
@@ -0,0 +1,339 @@
+"""
+Throughput and latency of every router (flows, docs, links, projects, chat and
+the Clerk webhook) at rising concurrency, fully offline:
+
+    cd server
+    python -m benchmarks.endpoints
+    python -m benchmarks.endpoints --only docs projects --concurrency 1 16
+    python -m benchmarks.endpoints --save-baseline /tmp/endpoints.json
+    python -m benchmarks.endpoints --compare /tmp/endpoints.json   # exits 1 on regression
+
+Requests go through the real app, auth included, over an in-process ASGI
+transport. Supabase and Clerk are the in-memory fakes from benchmarks.fakes
+with injected latency, and chat streams from tools.fake_model_server. Load
+comes from a pool of virtual users, each with a session, a project, docs,
+links, a flow and a conversation.
+
+With --compare, a run fails when an endpoint's p95 is more than --tolerance
+slower than the baseline (and by at least --min-delta-ms), when it returns
+errors the baseline did not, or when it makes more upstream calls per
+request. Call counts barely depend on machine speed, so they catch an extra
+query even on a noisy CI runner.
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import tempfile
+import contextlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+ROUTERS = ["flows", "docs", "links", "projects", "chat", "users"]
+WORDS = (
+    "graph node folder board canvas summary outline research draft source quote idea link note review "
+    "timeline budget risk owner milestone design api schema cache latency index search"
+).split()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=100, help="requests per endpoint per concurrency level")
+    parser.add_argument("--only", nargs="+", choices=ROUTERS, help="routers to run (default: all)")
+    parser.add_argument("--users", type=int, default=16, help="virtual users sharing the load")
+    parser.add_argument("--db-ms", type=float, default=2.0, help="latency of each Supabase table call")
+    parser.add_argument("--auth-ms", type=float, default=5.0, help="latency of each Clerk / Supabase auth admin call")
+    parser.add_argument("--jitter-ms", type=float, default=0.5)
+    parser.add_argument("--first-token-ms", type=float, default=20.0, help="fake model time to first token")
+    parser.add_argument("--token-ms", type=float, default=1.0, help="fake model time per streamed word")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save-baseline", metavar="PATH")
+    parser.add_argument("--compare", metavar="PATH")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed relative p95 slowdown")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0, help="ignore p95 slowdowns smaller than this")
+    return parser.parse_args()
+
+
+def configure_environment(args):
+    """
+    Settings that must be in place before the app is imported.
+    """
+    os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+    os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "eyJhbGciOiJIUzI1NiJ9.e30.benchmark")
+    os.environ.setdefault("CLERK_SECRET_KEY", "sk_test_benchmark")
+    # Virtual users send far more than any real user may
+    os.environ["RATE_LIMIT_ENABLED"] = "0"
+    os.environ["ANTHROPIC_API_KEY"] = "benchmark"
+    # The webhook scenarios post unsigned events
+    os.environ.pop("CLERK_WEBHOOK_SECRET", None)
+    os.environ["CLERK_WEBHOOK_INSECURE"] = "1"
+    # Embeddings fall back to the local hashing model without a key
+    os.environ["GEMINI_API_KEY"] = ""
+    os.environ["STORAGE_BACKEND"] = "postgrest"
+    os.environ["INVALIDATION_BUS"] = "none"
+    os.environ.pop("ROW_CACHE_URL", None)
+    os.environ.pop("CLERK_WEBHOOK_SECRET", None)
+    os.environ["CLERK_WEBHOOK_QUEUE_PATH"] = os.path.join(tempfile.mkdtemp(), "clerk_webhooks.sqlite3")
+    os.environ["FAKE_MODEL_FIRST_TOKEN_MS"] = str(args.first_token_ms)
+    os.environ["FAKE_MODEL_TOKEN_MS"] = str(args.token_ms)
+    os.environ["FAKE_MODEL_ERROR_RATE"] = "0"
+
+
+class VirtualUser:
+    def __init__(self, index: int, supabase, clerk, rng: random.Random):
+        self.index = index
+        self.clerk_user_id = f"user_bench{index:04d}"
+        account = supabase.add_user(f"bench{index}@example.com", self.clerk_user_id)
+        self.supabase_user_id = account.id
+        self.cookie = {"Cookie": f"__session={clerk.add_session(self.clerk_user_id)}"}
+        self.rng = rng
+
+        project = supabase.seed("projects", {"project_name": f"Benchmark {index}", "user_id": self.supabase_user_id})
+        self.project_id = project["id"]
+        self.doc_ids = [
+            supabase.seed("docs", {
+                "project_id": self.project_id, "user_id": self.supabase_user_id,
+                "doc_name": f"Doc {j}", "content": sentence(rng, 120),
+            })["id"]
+            for j in range(20)
+        ]
+        self.link_ids = [
+            supabase.seed("links", {
+                "project_id": self.project_id, "user_id": self.supabase_user_id,
+                "url": f"https://example.com/{index}/{j}", "string": f"Link {j}",
+            })["id"]
+            for j in range(10)
+        ]
+        supabase.seed("flows", {
+            "project_id": self.project_id, "user_id": self.supabase_user_id, "flow_state": self.flow_state(0), "version": 0,
+        })
+        conversation = supabase.seed("conversations", {
+            "project_id": self.project_id, "user_id": self.supabase_user_id,
+            "message_count": 4, "total_tokens": 200, "summary": None, "summarized_through": 0,
+        })
+        self.conversation_id = conversation["id"]
+        for seq in range(4):
+            supabase.seed("conversation_messages", {
+                "conversation_id": self.conversation_id, "user_id": self.supabase_user_id, "seq": seq,
+                "role": "user" if seq % 2 == 0 else "assistant", "content": sentence(rng, 30), "tokens": 50,
+            })
+
+    def flow_state(self, revision: int) -> Dict[str, Any]:
+        nodes = [
+            {"id": f"doc-{doc_id}", "type": "docsNode", "position": {"x": j * 40 + revision, "y": j * 20},
+             "data": {"docId": doc_id, "title": f"Doc {j}"}}
+            for j, doc_id in enumerate(self.doc_ids)
+        ] + [
+            {"id": f"link-{link_id}", "type": "linkNode", "position": {"x": j * 40, "y": 600},
+             "data": {"linkId": link_id, "title": f"Link {j}"}}
+            for j, link_id in enumerate(self.link_ids)
+        ]
+        edges = [{"id": f"e{j}", "source": nodes[j]["id"], "target": nodes[j + 1]["id"]} for j in range(len(nodes) - 1)]
+        return {"nodes": nodes, "edges": edges, "viewport": {"x": 0, "y": 0, "zoom": 1}}
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+Request = Tuple[str, str, Optional[Dict[str, Any]]]
+
+
+def endpoints(supabase) -> List[Tuple[str, str, Callable[[VirtualUser, int], Request]]]:
+    """
+    (router, name, make) where make(user, i) returns (method, url, json body).
+    make runs before the clock starts, so it may seed rows the request needs.
+    """
+    def seeded_doc(user: VirtualUser) -> str:
+        return supabase.seed("docs", {
+            "project_id": user.project_id, "user_id": user.supabase_user_id, "doc_name": "Scratch", "content": "x",
+        })["id"]
+
+    def seeded_link(user: VirtualUser) -> str:
+        return supabase.seed("links", {
+            "project_id": user.project_id, "user_id": user.supabase_user_id, "url": "https://example.com", "string": "x",
+        })["id"]
+
+    def seeded_project(user: VirtualUser) -> str:
+        return supabase.seed("projects", {"project_name": "Scratch", "user_id": user.supabase_user_id})["id"]
+
+    def clerk_event(event_type: str, user: VirtualUser, i: int) -> Dict[str, Any]:
+        if event_type == "user.created":
+            clerk_id = f"user_new{user.index:04d}_{i}_{user.rng.randrange(1 << 30)}"
+            email = f"{clerk_id}@example.com"
+        else:
+            clerk_id, email = user.clerk_user_id, f"bench{user.index}@example.com"
+        return {"type": event_type, "data": {
+            "id": clerk_id, "email_addresses": [{"email_address": email}],
+            "first_name": "Bench", "last_name": f"User {i}",
+        }}
+
+    return [
+        ("flows", "POST /api/flows/save", lambda u, i: (
+            "POST", "/api/flows/save", {"project_id": u.project_id, "flow_state": u.flow_state(i)})),
+        ("flows", "GET /api/flows/load", lambda u, i: ("GET", f"/api/flows/load/{u.project_id}", None)),
+        ("flows", "POST /api/flows/ops", lambda u, i: ("POST", "/api/flows/ops", {"project_id": u.project_id, "ops": [
+            {"op": "move", "node_id": f"doc-{u.doc_ids[i % len(u.doc_ids)]}", "position": {"x": i, "y": i}},
+            {"op": "create_folder", "ref": "folder", "position": {"x": 0, "y": -200}, "title": f"Folder {i}"},
+            {"op": "group", "node_id": f"link-{u.link_ids[i % len(u.link_ids)]}", "folder_id": "folder"},
+        ]})),
+        ("docs", "POST /api/docs/create", lambda u, i: ("POST", "/api/docs/create", {
+            "project_id": u.project_id, "doc_name": f"New {i}", "content": sentence(u.rng, 100)})),
+        ("docs", "GET /api/docs/get", lambda u, i: ("GET", f"/api/docs/get/{u.rng.choice(u.doc_ids)}", None)),
+        ("docs", "PUT /api/docs/update", lambda u, i: (
+            "PUT", f"/api/docs/update/{u.rng.choice(u.doc_ids)}", {"content": sentence(u.rng, 120)})),
+        ("docs", "DELETE /api/docs/delete", lambda u, i: ("DELETE", f"/api/docs/delete/{seeded_doc(u)}", None)),
+        ("docs", "POST /api/docs/bulk/create", lambda u, i: ("POST", "/api/docs/bulk/create", {"documents": [
+            {"project_id": u.project_id, "doc_name": f"Bulk {i}.{j}", "content": sentence(u.rng, 40)} for j in range(10)
+        ]})),
+        ("links", "POST /api/links/create", lambda u, i: ("POST", "/api/links/create", {
+            "project_id": u.project_id, "url": f"https://example.com/new/{i}", "string": f"New {i}"})),
+        ("links", "GET /api/links/get", lambda u, i: ("GET", f"/api/links/get/{u.rng.choice(u.link_ids)}", None)),
+        ("links", "PUT /api/links/update", lambda u, i: (
+            "PUT", f"/api/links/update/{u.rng.choice(u.link_ids)}", {"string": f"Renamed {i}"})),
+        ("links", "DELETE /api/links/delete", lambda u, i: ("DELETE", f"/api/links/delete/{seeded_link(u)}", None)),
+        ("projects", "POST /api/projects/create", lambda u, i: (
+            "POST", "/api/projects/create", {"project_name": f"New {i}"})),
+        ("projects", "GET /api/projects/list", lambda u, i: ("GET", "/api/projects/list", None)),
+        ("projects", "GET /api/projects/get", lambda u, i: ("GET", f"/api/projects/get/{u.project_id}", None)),
+        ("projects", "PUT /api/projects/update", lambda u, i: (
+            "PUT", f"/api/projects/update/{u.project_id}", {"project_name": f"Benchmark {u.index} ({i})"})),
+        ("projects", "DELETE /api/projects/delete", lambda u, i: (
+            "DELETE", f"/api/projects/delete/{seeded_project(u)}", None)),
+        ("projects", "GET /api/projects/export", lambda u, i: ("GET", f"/api/projects/export/{u.project_id}", None)),
+        ("chat", "POST /api/chat/chat-start", lambda u, i: ("POST", "/api/chat/chat-start", {
+            "project_id": u.project_id, "prompt": f"{i}: {sentence(u.rng, 12)}?"})),
+        ("chat", "POST /api/chat/chat-continue", lambda u, i: ("POST", "/api/chat/chat-continue", {
+            "project_id": u.project_id, "conversation_id": u.conversation_id, "prompt": f"{i}: {sentence(u.rng, 12)}?"})),
+        ("chat", "POST /api/chat/chat", lambda u, i: ("POST", "/api/chat/chat", {
+            "project_id": u.project_id, "prompt": f"{i}: {sentence(u.rng, 12)}?"})),
+        ("users", "POST /users/webhook/clerk (created)", lambda u, i: (
+            "POST", "/users/webhook/clerk", clerk_event("user.created", u, i))),
+        ("users", "POST /users/webhook/clerk (updated)", lambda u, i: (
+            "POST", "/users/webhook/clerk", clerk_event("user.updated", u, i))),
+    ]
+
+
+async def run_level(client, supabase, clerk, users, make, requests: int, concurrency: int) -> Dict[str, Any]:
+    from benchmarks.common import summarize
+
+    latencies: List[float] = []
+    errors: List[str] = []
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(i)
+
+    async def worker():
+        while True:
+            try:
+                i = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            user = users[i % len(users)]
+            method, url, body = make(user, i)
+            started = time.perf_counter()
+            response = await client.request(method, url, json=body, headers=user.cookie)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400:
+                errors.append(f"{response.status_code} {response.text[:200]}")
+
+    db_before, auth_before = supabase.calls, supabase.auth_calls + clerk.calls
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    summary = summarize(latencies, elapsed)
+    summary.pop("requests")
+    return {
+        "concurrency": concurrency,
+        **summary,
+        "errors": len(errors),
+        "db_calls": round((supabase.calls - db_before) / requests, 2),
+        "auth_calls": round((supabase.auth_calls + clerk.calls - auth_before) / requests, 2),
+        "_first_error": errors[0] if errors else None,
+    }
+
+
+def compare(rows: List[Dict[str, Any]], baseline: Dict[str, Any], args) -> List[str]:
+    regressions = []
+    for row in rows:
+        key = f"{row['endpoint']}@{row['concurrency']}"
+        base = baseline["results"].get(key)
+        if base is None:
+            continue
+        slower = row["p95_ms"] - base["p95_ms"]
+        if row["p95_ms"] > base["p95_ms"] * (1 + args.tolerance) and slower >= args.min_delta_ms:
+            regressions.append(f"{key}: p95 {base['p95_ms']} -> {row['p95_ms']} ms")
+        if row["errors"] > base["errors"]:
+            regressions.append(f"{key}: errors {base['errors']} -> {row['errors']}")
+        for calls in ("db_calls", "auth_calls"):
+            # Caches and single-flight make counts vary a little with timing
+            if row[calls] > base[calls] * 1.2 + 0.25:
+                regressions.append(f"{key}: {calls} per request {base[calls]} -> {row[calls]}")
+    return regressions
+
+
+async def main(args):
+    configure_environment(args)
+    import httpx
+    from benchmarks.common import free_port, serve_in_thread, print_table
+    from benchmarks.fakes import FakeSupabase, FakeClerk, Latency, install
+    from tools.fake_model_server import app as model_app
+    from app.main import app
+
+    # Several modules log at DEBUG or print per request; keep the report readable
+    logging.getLogger().setLevel(logging.WARNING)
+
+    model_port = free_port()
+    model_server = serve_in_thread(model_app, model_port)
+    os.environ["CLAUDE_API_URL"] = f"http://127.0.0.1:{model_port}"
+
+    rng = random.Random(args.seed)
+    supabase = FakeSupabase(Latency(args.db_ms, args.jitter_ms, seed=args.seed))
+    clerk = FakeClerk(Latency(args.auth_ms, args.jitter_ms, seed=args.seed + 1))
+    install(supabase, clerk)
+    users = [VirtualUser(index, supabase, clerk, rng) for index in range(args.users)]
+
+    selected = [e for e in endpoints(supabase) if not args.only or e[0] in args.only]
+    rows = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60) as client:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for router, name, make in selected:
+                # Warm up imports, pools and lazily built services
+                await run_level(client, supabase, clerk, users, make, 3, 1)
+                for concurrency in args.concurrency:
+                    result = await run_level(client, supabase, clerk, users, make, args.requests, concurrency)
+                    rows.append({"endpoint": name, **result})
+
+    model_server.should_exit = True
+    print(f"{args.requests} requests per endpoint per level, {args.users} users, db {args.db_ms} ms, "
+          f"auth {args.auth_ms} ms, jitter {args.jitter_ms} ms, model first token {args.first_token_ms} ms")
+    print_table([{k: v for k, v in row.items() if not k.startswith("_")} for row in rows])
+    failing = [row for row in rows if row["_first_error"]]
+    for row in failing:
+        print(f"\n{row['endpoint']} @ {row['concurrency']}: {row['errors']} errors, first: {row['_first_error']}")
+
+    results = {f"{row['endpoint']}@{row['concurrency']}": {k: v for k, v in row.items() if not k.startswith("_")}
+               for row in rows}
+    if args.save_baseline:
+        settings = {k: v for k, v in vars(args).items() if k not in ("save_baseline", "compare")}
+        with open(args.save_baseline, "w") as f:
+            json.dump({"settings": settings, "results": results}, f, indent=2)
+        print(f"\nBaseline written to {args.save_baseline}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(rows, baseline, args)
+        if regressions:
+            print("\nRegressions against " + args.compare + ":\n  " + "\n  ".join(regressions))
+            return 1
+        print(f"\nNo regressions against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
@@ -0,0 +1,388 @@
+"""
+In-memory stand-ins for the Supabase client (PostgREST tables and the auth
+admin API) and the Clerk SDK (sessions, JWT verification, user creation), so
+the app can be driven end to end with no network access.
+
+Both take a Latency, which makes every call sleep, like the real blocking
+clients do. Calls are counted so benchmarks can report upstream traffic.
+"""
+import copy
+import time
+import uuid
+import random
+import threading
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+import jwt
+
+SESSION_SIGNING_KEY = "benchmark-session-signing-key-not-a-secret"
+
+
+class Latency:
+    """
+    Simulated round trip: ms on average, spread uniformly by +/- jitter_ms.
+    A fraction tail_rate of calls take tail_ms longer, and every call raises
+    error once it is set, to play an unhealthy upstream.
+    """
+
+    def __init__(self, ms: float = 0.0, jitter_ms: float = 0.0, seed: Optional[int] = None):
+        self.ms = ms
+        self.jitter_ms = jitter_ms
+        self.tail_rate = 0.0
+        self.tail_ms = 0.0
+        self.error: Optional[Exception] = None
+        self._random = random.Random(seed)
+
+    def sleep(self):
+        delay = self.ms + (self._random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0)
+        if self.tail_rate and self._random.random() < self.tail_rate:
+            delay += self.tail_ms
+        if delay > 0:
+            time.sleep(delay / 1000)
+        if self.error is not None:
+            raise self.error
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _sort_key(value: Any):
+    # None sorts last, and mixed types don't raise
+    return (value is None, str(type(value)), value if isinstance(value, (int, float, str)) else str(value))
+
+
+class _Response:
+    def __init__(self, data: List[Dict[str, Any]]):
+        self.data = data
+        self.count = None
+
+
+class _Query:
+    """
+    The subset of postgrest-py's request builder that the app uses.
+    """
+
+    def __init__(self, db: "FakeSupabase", table: str):
+        self.db = db
+        self.table = table
+        self.operation = "select"
+        self.columns: Optional[List[str]] = None
+        self.payload: Any = None
+        self.on_conflict = "id"
+        self.filters: List[Callable[[Dict[str, Any]], bool]] = []
+        self.ordering: List[tuple] = []
+        self.row_range: Optional[tuple] = None
+        self.row_limit: Optional[int] = None
+
+    def select(self, columns: str = "*", **kwargs):
+        self.operation = "select"
+        if columns.strip() != "*":
+            self.columns = [column.strip() for column in columns.split(",")]
+        return self
+
+    def insert(self, payload, **kwargs):
+        self.operation, self.payload = "insert", payload
+        return self
+
+    def upsert(self, payload, on_conflict: str = "id", **kwargs):
+        self.operation, self.payload, self.on_conflict = "upsert", payload, on_conflict or "id"
+        return self
+
+    def update(self, payload, **kwargs):
+        self.operation, self.payload = "update", payload
+        return self
+
+    def delete(self, **kwargs):
+        self.operation = "delete"
+        return self
+
+    def _filter(self, predicate):
+        self.filters.append(predicate)
+        return self
+
+    def eq(self, column, value):
+        return self._filter(lambda row: str(row.get(column)) == str(value))
+
+    def neq(self, column, value):
+        return self._filter(lambda row: str(row.get(column)) != str(value))
+
+    def gt(self, column, value):
+        return self._filter(lambda row: row.get(column) is not None and row.get(column) > value)
+
+    def gte(self, column, value):
+        return self._filter(lambda row: row.get(column) is not None and row.get(column) >= value)
+
+    def lt(self, column, value):
+        return self._filter(lambda row: row.get(column) is not None and row.get(column) < value)
+
+    def lte(self, column, value):
+        return self._filter(lambda row: row.get(column) is not None and row.get(column) <= value)
+
+    def in_(self, column, values):
+        allowed = {str(value) for value in values}
+        return self._filter(lambda row: str(row.get(column)) in allowed)
+
+    def order(self, column, desc: bool = False, **kwargs):
+        self.ordering.append((column, desc))
+        return self
+
+    def range(self, start: int, end: int):
+        self.row_range = (start, end)
+        return self
+
+    def limit(self, count: int, **kwargs):
+        self.row_limit = count
+        return self
+
+    def execute(self) -> _Response:
+        self.db.latency.sleep()
+        with self.db.lock:
+            self.db.calls += 1
+            return _Response(copy.deepcopy(self._run()))
+
+    def _run(self) -> List[Dict[str, Any]]:
+        rows = self.db.tables.setdefault(self.table, {})
+        if self.operation in ("insert", "upsert"):
+            items = self.payload if isinstance(self.payload, list) else [self.payload]
+            written = []
+            for item in items:
+                row = copy.deepcopy(item)
+                existing = None
+                if self.operation == "upsert":
+                    existing = next(
+                        (r for r in rows.values() if str(r.get(self.on_conflict)) == str(row.get(self.on_conflict))),
+                        None
+                    )
+                if existing is not None:
+                    existing.update(row)
+                    existing["updated_at"] = row.get("updated_at", _now())
+                    written.append(existing)
+                    continue
+                row.setdefault("id", str(uuid.uuid4()))
+                row.setdefault("created_at", _now())
+                row.setdefault("updated_at", row["created_at"])
+                if str(row["id"]) in rows:
+                    raise ValueError(f'duplicate key value violates unique constraint "{self.table}_pkey"')
+                rows[str(row["id"])] = row
+                written.append(row)
+            return written
+
+        matched = [row for row in rows.values() if all(predicate(row) for predicate in self.filters)]
+        if self.operation == "update":
+            for row in matched:
+                row.update(copy.deepcopy(self.payload))
+            return matched
+        if self.operation == "delete":
+            for row in matched:
+                del rows[str(row["id"])]
+            return matched
+
+        for column, desc in reversed(self.ordering):
+            matched.sort(key=lambda row: _sort_key(row.get(column)), reverse=desc)
+        if self.row_range:
+            matched = matched[self.row_range[0]:self.row_range[1] + 1]
+        if self.row_limit is not None:
+            matched = matched[:self.row_limit]
+        if self.columns:
+            matched = [{column: row.get(column) for column in self.columns} for row in matched]
+        return matched
+
+
+class _Rpc:
+    def __init__(self, db: "FakeSupabase", function: Callable[[Dict[str, Any]], Any], params: Dict[str, Any]):
+        self.db = db
+        self.function = function
+        self.params = params
+
+    def execute(self) -> _Response:
+        self.db.latency.sleep()
+        with self.db.lock:
+            self.db.calls += 1
+            return _Response(copy.deepcopy(self.function(self.params)))
+
+
+class _AuthAdmin:
+    def __init__(self, db: "FakeSupabase"):
+        self.db = db
+
+    def _call(self):
+        with self.db.lock:
+            self.db.auth_calls += 1
+        self.db.auth_latency.sleep()
+
+    def list_users(self, page: Optional[int] = None, per_page: Optional[int] = None):
+        self._call()
+        with self.db.lock:
+            users = list(self.db.users.values())
+        if per_page:
+            start = ((page or 1) - 1) * per_page
+            users = users[start:start + per_page]
+        return users
+
+    def create_user(self, attributes: Dict[str, Any]):
+        self._call()
+        with self.db.lock:
+            if any(user.email == attributes.get("email") for user in self.db.users.values()):
+                raise ValueError("A user with this email address has already been registered")
+            user = SimpleNamespace(
+                id=str(uuid.uuid4()),
+                email=attributes.get("email"),
+                user_metadata=dict(attributes.get("user_metadata") or {}),
+                created_at=_now(),
+            )
+            self.db.users[user.id] = user
+            return SimpleNamespace(user=user)
+
+    def update_user_by_id(self, user_id: str, attributes: Dict[str, Any]):
+        self._call()
+        with self.db.lock:
+            user = self.db.users[user_id]
+            if "user_metadata" in attributes:
+                user.user_metadata = dict(attributes["user_metadata"])
+            return SimpleNamespace(user=user)
+
+    def delete_user(self, user_id: str, **kwargs):
+        self._call()
+        with self.db.lock:
+            self.db.users.pop(user_id, None)
+
+
+class FakeSupabase:
+    """
+    Tables are dicts of rows keyed by id. Rows get an id and created_at /
+    updated_at when inserted without them, like the real column defaults.
+    Auth admin calls use auth_latency, the table latency unless given.
+    """
+
+    def __init__(self, latency: Optional[Latency] = None, auth_latency: Optional[Latency] = None):
+        self.latency = latency or Latency()
+        self.auth_latency = auth_latency or self.latency
+        self.tables: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.users: Dict[str, SimpleNamespace] = {}
+        self.calls = 0
+        self.auth_calls = 0
+        self.lock = threading.RLock()
+        self.auth = SimpleNamespace(admin=_AuthAdmin(self))
+
+    def table(self, name: str) -> _Query:
+        return _Query(self, name)
+
+    def rpc(self, name: str, params: Dict[str, Any]) -> _Rpc:
+        """
+        The database functions from migrations/, run under the fake's lock
+        as they would run in one transaction.
+        """
+        return _Rpc(self, getattr(self, f"_fn_{name}"), params)
+
+    def _fn_append_conversation_message(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        conversation = self.tables.get("conversations", {}).get(str(params["p_conversation_id"]))
+        if conversation is None or str(conversation.get("user_id")) != str(params["p_user_id"]):
+            raise ValueError("Conversation not found")
+        conversation["message_count"] = (conversation.get("message_count") or 0) + 1
+        conversation["total_tokens"] = (conversation.get("total_tokens") or 0) + params["p_tokens"]
+        message = {
+            "id": str(uuid.uuid4()), "created_at": _now(), "conversation_id": conversation["id"],
+            "user_id": params["p_user_id"], "seq": conversation["message_count"] - 1,
+            "role": params["p_role"], "content": params["p_content"], "tokens": params["p_tokens"],
+        }
+        self.tables.setdefault("conversation_messages", {})[message["id"]] = message
+        return {
+            "message": message,
+            "message_count": conversation["message_count"],
+            "total_tokens": conversation["total_tokens"],
+        }
+
+    def seed(self, table: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Insert a row directly, without latency or counting.
+        """
+        row = {"id": str(uuid.uuid4()), "created_at": _now(), "updated_at": _now(), **row}
+        with self.lock:
+            self.tables.setdefault(table, {})[str(row["id"])] = row
+        return row
+
+    def add_user(self, email: str, clerk_user_id: str) -> SimpleNamespace:
+        user = SimpleNamespace(
+            id=str(uuid.uuid4()), email=email, user_metadata={"clerk_user_id": clerk_user_id}, created_at=_now()
+        )
+        with self.lock:
+            self.users[user.id] = user
+        return user
+
+
+class _Sessions:
+    def __init__(self, clerk: "FakeClerk"):
+        self.clerk = clerk
+
+    def get(self, session_id: str, **kwargs):
+        self.clerk._call()
+        user_id = self.clerk.sessions_by_id.get(session_id)
+        if user_id is None:
+            raise ValueError(f"Session not found: {session_id}")
+        return SimpleNamespace(id=session_id, user_id=user_id, status="active")
+
+
+class _JwtTemplates:
+    def __init__(self, clerk: "FakeClerk"):
+        self.clerk = clerk
+
+    def verify_token(self, token: str) -> Dict[str, Any]:
+        self.clerk._call()
+        payload = jwt.decode(token, SESSION_SIGNING_KEY, algorithms=["HS256"])
+        if payload.get("sid") not in self.clerk.sessions_by_id:
+            raise ValueError("Token is not for an active session")
+        return {"sub": self.clerk.sessions_by_id[payload["sid"]], **payload}
+
+
+class _Users:
+    def __init__(self, clerk: "FakeClerk"):
+        self.clerk = clerk
+
+    def create_user(self, email_address: List[str], password: str = None, **kwargs):
+        self.clerk._call()
+        return SimpleNamespace(id=f"user_{uuid.uuid4().hex[:24]}", first_name=None, last_name=None,
+                               email_addresses=email_address)
+
+
+class FakeClerk:
+    """
+    Sessions map a session id to a Clerk user id. Session cookies are JWTs
+    carrying the session id as "sid", as Clerk's __session cookie does.
+    """
+
+    def __init__(self, latency: Optional[Latency] = None):
+        self.latency = latency or Latency()
+        self.sessions_by_id: Dict[str, str] = {}
+        self.calls = 0
+        self.lock = threading.Lock()
+        self.sessions = _Sessions(self)
+        self.jwt_templates = _JwtTemplates(self)
+        self.users = _Users(self)
+
+    def _call(self):
+        # Counted up front, so calls into an unhealthy upstream count too
+        with self.lock:
+            self.calls += 1
+        self.latency.sleep()
+
+    def add_session(self, clerk_user_id: str) -> str:
+        """
+        Start a session for the user and return its __session cookie value.
+        """
+        session_id = f"sess_{uuid.uuid4().hex[:24]}"
+        self.sessions_by_id[session_id] = clerk_user_id
+        return jwt.encode({"sid": session_id, "sub": clerk_user_id}, SESSION_SIGNING_KEY, algorithm="HS256")
+
+
+def install(supabase: FakeSupabase, clerk: FakeClerk):
+    """
+    Make the app's client registry hand out the fakes instead of building
+    real Clerk and Supabase clients.
+    """
+    from app.clients import clients
+    from app.metrics import InstrumentedSupabase
+
+    clients.override(supabase=InstrumentedSupabase(supabase), clerk=clerk)
@@ -0,0 +1,109 @@
+"""
+Moving and deleting a folder through the folder endpoints, which only touch
+the folder's subtree, versus the client rewriting the whole board through
+POST /api/flows/save as it does for folders kept only in flow_state:
+
+    cd server
+    python -m benchmarks.folders --folders 300 --items-per-folder 10 --round-trip-ms 1
+
+The board is a tree of --folders folders, --fanout children each, with
+--items-per-folder docs in every folder; its flow_state has a node for every
+folder and doc. Requests go through the real FastAPI app in-process against
+in-memory storage with a simulated per-statement round trip; auth is replaced
+with a fixed user.
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+import argparse
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--folders", type=int, default=300)
+    parser.add_argument("--fanout", type=int, default=4, help="child folders per folder")
+    parser.add_argument("--items-per-folder", type=int, default=10)
+    parser.add_argument("--round-trip-ms", type=float, default=1.0, help="simulated latency per database statement")
+    return parser.parse_args()
+
+
+async def main(args):
+    import httpx
+    from benchmarks.common import memory_storage, print_table
+    from app.main import app
+    from app.auth import get_current_user_from_cookies, AuthenticatedUser
+    from app.services.storage_backend import get_storage_backend
+    from app.services.folders_data_service import FoldersDataService
+
+    logging.getLogger().setLevel(logging.WARNING)
+    storage = memory_storage(0)
+    user = AuthenticatedUser(supabase_user_id="benchmark-user", clerk_user_id="benchmark", email="", user_metadata={})
+    app.dependency_overrides[get_current_user_from_cookies] = lambda: user
+    app.dependency_overrides[get_storage_backend] = lambda: storage
+
+    project = (await storage.insert("projects", [{"project_name": "Board", "user_id": user.supabase_user_id}]))[0]
+    project_id = str(project["id"])
+    service = FoldersDataService(storage)
+
+    # Breadth-first, so folder i's parent is (i - 1) // fanout
+    folders, nodes = [], []
+    for i in range(args.folders):
+        parent = folders[(i - 1) // args.fanout] if i else None
+        folder = await service.create_folder(project_id, f"Folder {i}", user, parent_id=parent)
+        folders.append(str(folder["id"]))
+        docs = await storage.insert("docs", [{
+            "project_id": project_id, "doc_name": f"Doc {i}.{j}", "content": "x" * 200, "user_id": user.supabase_user_id
+        } for j in range(args.items_per_folder)])
+        await service.add_items(folders[-1], [("doc", str(doc["id"])) for doc in docs], user)
+        nodes.append({"id": folders[-1], "type": "folderNode", "position": {"x": i, "y": 0},
+                      "data": {"title": f"Folder {i}", "groupedNodes": [str(doc["id"]) for doc in docs]}})
+        nodes.extend({"id": str(doc["id"]), "type": "docsNode", "hidden": True, "position": {"x": i, "y": 1},
+                      "data": {"title": doc["doc_name"], "docId": str(doc["id"]), "groupedToFolder": folders[-1]}}
+                     for doc in docs)
+    flow_body = json.dumps({"project_id": project_id, "flow_state": {"nodes": nodes, "edges": []}})
+    await storage.insert("flows", [{"project_id": project_id, "user_id": user.supabase_user_id, "flow_state": {}, "version": 0}])
+
+    # The moved / deleted subtree: folder 1 and everything below it
+    subtree = len(await service._subtree(folders[1], user))
+    target = folders[2]
+    slow = memory_storage(args.round_trip_ms)
+    slow.tables = storage.tables
+    app.dependency_overrides[get_storage_backend] = lambda: slow
+
+    rows = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=120) as client:
+        async def measure(operation: str, mode: str, method: str, url: str, content: str = None):
+            before = slow.round_trips
+            started = time.perf_counter()
+            response = await client.request(method, url, content=content, headers={"content-type": "application/json"})
+            assert response.status_code == 200, response.text
+            rows.append({
+                "operation": operation,
+                "mode": mode,
+                "request_bytes": len(content or ""),
+                "db_round_trips": slow.round_trips - before,
+                "wall_ms": round((time.perf_counter() - started) * 1000, 1),
+            })
+
+        await measure("move subtree", "rewrite board", "POST", "/api/flows/save", flow_body)
+        await measure("move subtree", "folder endpoint", "POST", f"/api/folders/move/{folders[1]}",
+                      json.dumps({"parent_id": target}))
+        await measure("list folders", "folder endpoint", "GET", f"/api/folders/list/{project_id}")
+        await measure("get subtree", "folder endpoint", "GET", f"/api/folders/get/{folders[1]}")
+        await measure("delete subtree", "rewrite board", "POST", "/api/flows/save", flow_body)
+        await measure("delete subtree", "folder endpoint", "DELETE", f"/api/folders/delete/{folders[1]}?delete_items=true")
+
+    print(f"{args.folders} folders (fanout {args.fanout}), {args.items_per_folder} docs each, "
+          f"subtree of {subtree} folders, {args.round_trip_ms} ms per statement")
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    # Only read if a real client ever gets built; the benchmark swaps them out
+    os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+    os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "eyJhbGciOiJIUzI1NiJ9.e30.benchmark")
+    os.environ.setdefault("CLERK_SECRET_KEY", "sk_test_benchmark")
+    os.environ["RATE_LIMIT_ENABLED"] = "0"
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,145 @@
+"""
+Image uploads processed on the event loop, in the threadpool and in the
+image worker processes, and what other requests see meanwhile; then the
+bytes a board of those images loads as thumbnails versus originals:
+
+    cd server
+    python -m benchmarks.images --images 12 --uploaders 4 --workers 4
+
+Uploads are camera-sized JPEGs (--width x --height, with noise so they
+compress like photos). While they upload, another user keeps fetching a doc;
+its latency shows how much image work gets in the way. Requests go through
+the real app and cookie auth against the in-memory fakes from
+benchmarks.fakes, with files under a temporary BLOB_DIR. Each upload gets a
+few distinct trailing bytes so none of them is deduplicated.
+"""
+import io
+import os
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=12, help="uploads per setup")
+    parser.add_argument("--uploaders", type=int, default=4, help="concurrent uploads")
+    parser.add_argument("--workers", type=int, default=4, help="image worker processes")
+    parser.add_argument("--width", type=int, default=4032)
+    parser.add_argument("--height", type=int, default=3024)
+    return parser.parse_args()
+
+
+def photo(width: int, height: int, seed: int) -> bytes:
+    from PIL import Image
+    noise = Image.effect_noise((width, height), 40 + seed % 20)
+    gradient = Image.linear_gradient("L").resize((width, height))
+    image = Image.merge("RGB", (noise, gradient, Image.eval(gradient, lambda v: 255 - v)))
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+async def main(args):
+    import httpx
+    from starlette.concurrency import run_in_threadpool
+    from benchmarks.common import percentile, print_table
+    from benchmarks.fakes import FakeSupabase, FakeClerk, install
+    from app.main import app
+    from app.services import image_service
+    from app.services.image_processing import process_image
+
+    logging.getLogger().setLevel(logging.ERROR)
+    supabase, clerk = FakeSupabase(), FakeClerk()
+    install(supabase, clerk)
+    uploader = supabase.add_user("uploader@example.com", "user_uploader")
+    reader = supabase.add_user("reader@example.com", "user_reader")
+    project = supabase.seed("projects", {"project_name": "Board", "user_id": uploader.id})
+    other = supabase.seed("projects", {"project_name": "Other", "user_id": reader.id})
+    doc = supabase.seed("docs", {"project_id": other["id"], "doc_name": "Doc", "content": "x" * 2000, "user_id": reader.id})
+    uploader_cookies = {"__session": clerk.add_session("user_uploader")}
+    reader_cookies = {"__session": clerk.add_session("user_reader")}
+
+    started = time.perf_counter()
+    photos = await run_in_threadpool(lambda: [photo(args.width, args.height, i) for i in range(min(args.images, 4))])
+    print(f"Generated test photos in {time.perf_counter() - started:.1f}s, "
+          f"{sum(len(p) for p in photos) // len(photos) // 1024} KB each")
+
+    class OnEventLoop(image_service.ImageProcessor):
+        # What calling Pillow straight from the handler would do
+        async def process(self, data):
+            return process_image(data, image_service.VARIANT_SIZES, image_service.MAX_IMAGE_PIXELS,
+                                 image_service.IMAGE_QUALITY)
+
+    setups = (
+        ("event loop", OnEventLoop(workers=0)),
+        ("threadpool", image_service.ImageProcessor(workers=0)),
+        (f"{args.workers} processes", image_service.ImageProcessor(workers=args.workers)),
+    )
+    rows, uploaded = [], []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=300) as client:
+        for name, processor in setups:
+            image_service.image_processor = processor
+            if processor.workers > 0:
+                # Start the workers outside the measurement
+                await asyncio.get_running_loop().run_in_executor(processor._executor(), sum, [])
+            queue = list(range(len(uploaded), len(uploaded) + args.images))
+            latencies, done = [], asyncio.Event()
+
+            async def upload_loop():
+                while queue:
+                    i = queue.pop()
+                    response = await client.post(
+                        f"/api/images/upload?project_id={project['id']}&filename=photo{i}.jpg",
+                        content=photos[i % len(photos)] + i.to_bytes(4, "big"), cookies=uploader_cookies,
+                        headers={"content-type": "image/jpeg"}
+                    )
+                    assert response.status_code == 200, response.text
+                    uploaded.append(response.json()["image"])
+
+            async def read_loop():
+                while not done.is_set():
+                    before = time.perf_counter()
+                    await client.get(f"/api/docs/get/{doc['id']}", cookies=reader_cookies)
+                    latencies.append((time.perf_counter() - before) * 1000)
+                    await asyncio.sleep(0.01)
+
+            reads = asyncio.ensure_future(read_loop())
+            before = time.perf_counter()
+            await asyncio.gather(*(upload_loop() for _ in range(args.uploaders)))
+            elapsed = time.perf_counter() - before
+            done.set()
+            await reads
+            processor.close()
+            rows.append({
+                "processing": name,
+                "uploads_per_s": round(args.images / elapsed, 2),
+                "wall_s": round(elapsed, 2),
+                "other_user_p50_ms": round(percentile(latencies, 50), 1),
+                "other_user_p99_ms": round(percentile(latencies, 99), 1),
+                "other_user_max_ms": round(max(latencies), 1),
+            })
+
+        board = uploaded[-args.images:]
+        thumbnails = 0
+        for image in board:
+            response = await client.get(f"/api/images/view/{image['id']}", cookies=uploader_cookies)
+            thumbnails += len(response.content)
+
+    print(f"{args.images} uploads of {args.width}x{args.height} JPEGs, {args.uploaders} at a time")
+    print_table(rows)
+    originals = sum(image["bytes"] for image in board)
+    print(f"\nBoard of {len(board)} images: thumbnails {thumbnails / 1024:.0f} KB, "
+          f"originals {originals / 1024 / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    # Only read if a real client ever gets built; the benchmark swaps them out
+    os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+    os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "eyJhbGciOiJIUzI1NiJ9.e30.benchmark")
+    os.environ.setdefault("CLERK_SECRET_KEY", "sk_test_benchmark")
+    os.environ["RATE_LIMIT_ENABLED"] = "0"
+    os.environ["BLOB_DIR"] = tempfile.mkdtemp(prefix="image-bench-")
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,118 @@
+"""
+Delivery latency of the cross-worker invalidation bus: one process publishes,
+N worker processes record how long each event took to reach them.
+
+    cd server
+    python -m benchmarks.invalidation_bus --workers 4 --messages 2000
+    DATABASE_URL=postgresql://... python -m benchmarks.invalidation_bus --transport postgres
+
+Every process runs its own event loop and bus, as uvicorn workers do.
+"""
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+import multiprocessing
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transport", choices=["socket", "postgres"], default="socket")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--interval-us", type=float, default=200, help="pause between publishes")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    return parser.parse_args()
+
+
+def make_bus(args, directory: str):
+    from app.services.invalidation_bus import InvalidationBus, _SocketTransport, _PostgresTransport
+
+    if args.transport == "postgres":
+        return InvalidationBus(_PostgresTransport(args.database_url, "benchmark_invalidation"))
+    return InvalidationBus(_SocketTransport(directory))
+
+
+def worker(args, directory: str, ready, results):
+    async def run():
+        bus = make_bus(args, directory)
+        latencies = []
+        done = asyncio.Event()
+
+        def on_event(key: str):
+            if key == "stop":
+                done.set()
+            else:
+                latencies.append((time.monotonic_ns() - int(key)) / 1e6)
+
+        bus.subscribe("benchmark", on_event)
+        await bus.start()
+        ready.put(os.getpid())
+        await done.wait()
+        await bus.stop()
+        results.put(latencies)
+
+    asyncio.run(run())
+
+
+async def publish(args, directory: str):
+    bus = make_bus(args, directory)
+    await bus.start()
+    # Postgres listeners connect in the background; give them a moment
+    await asyncio.sleep(1 if args.transport == "postgres" else 0.05)
+    publish_us = []
+    for _ in range(args.messages):
+        started = time.monotonic_ns()
+        bus.publish("benchmark", str(started))
+        publish_us.append((time.monotonic_ns() - started) / 1e3)
+        await asyncio.sleep(args.interval_us / 1e6)
+    bus.publish("benchmark", "stop")
+    await asyncio.sleep(0.5)
+    stats = bus.stats()
+    await bus.stop()
+    return publish_us, stats
+
+
+def main(args):
+    from benchmarks.common import percentile, print_table
+
+    if args.transport == "postgres" and not args.database_url:
+        raise SystemExit("--transport postgres needs DATABASE_URL or --database-url")
+    directory = tempfile.mkdtemp(prefix="invalidation-bus-")
+    context = multiprocessing.get_context("spawn")
+    ready, results = context.Queue(), context.Queue()
+    processes = [context.Process(target=worker, args=(args, directory, ready, results)) for _ in range(args.workers)]
+    for process in processes:
+        process.start()
+    for _ in processes:
+        ready.get(timeout=30)
+
+    publish_us, stats = asyncio.run(publish(args, directory))
+    latencies = [results.get(timeout=30) for _ in processes]
+    for process in processes:
+        process.join()
+
+    received = [ms for worker_latencies in latencies for ms in worker_latencies]
+    expected = args.messages * args.workers
+    print(f"{args.transport} transport, {args.workers} workers, {args.messages} messages; publisher stats: {stats}")
+    print_table([
+        {
+            "measure": "delivery to worker (ms)",
+            "count": f"{len(received)}/{expected}",
+            "p50": round(percentile(received, 50), 3),
+            "p99": round(percentile(received, 99), 3),
+            "max": round(max(received), 3) if received else 0,
+        },
+        {
+            "measure": "publish() call (ms)",
+            "count": len(publish_us),
+            "p50": round(percentile(publish_us, 50) / 1000, 3),
+            "p99": round(percentile(publish_us, 99) / 1000, 3),
+            "max": round(max(publish_us) / 1000, 3),
+        },
+    ])
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,101 @@
+"""
+Load test for ClaudeService against the local fake model server.
+
+Measures requests/sec and tail latency of streamed completions at rising
+concurrency, with optional injected 429/529 errors to exercise retries:
+
+    cd server
+    python -m benchmarks.llm_client_load --requests 400 --concurrency 1 8 32 64 --error-rate 0.05
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="requests per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of upstream 429/529 responses")
+    parser.add_argument("--first-token-ms", type=float, default=50)
+    parser.add_argument("--token-ms", type=float, default=2)
+    parser.add_argument("--client-limit", type=int, default=32, help="CLAUDE_MAX_CONCURRENCY per API key")
+    parser.add_argument("--batch-jobs", type=int, default=0, help="also submit this many background batch jobs")
+    return parser.parse_args()
+
+
+async def run_level(service, requests: int, concurrency: int):
+    latencies, ttfts, retries, errors = [], [], 0, 0
+    queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(i)
+
+    async def worker():
+        nonlocal retries, errors
+        while True:
+            try:
+                i = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            started = time.perf_counter()
+            stream = service.stream([{"role": "user", "content": f"load test request {i}"}], max_tokens=32)
+            try:
+                async for _ in stream:
+                    pass
+                latencies.append((time.perf_counter() - started) * 1000)
+                if stream.ttft_ms is not None:
+                    ttfts.append(stream.ttft_ms)
+            except Exception:
+                errors += 1
+            retries += stream.retries
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, ttfts, retries, errors, time.perf_counter() - started
+
+
+async def main(args):
+    from benchmarks.common import free_port, serve_in_thread, summarize, percentile, print_table
+    from tools.fake_model_server import app as fake_app
+    from app.services.claude_service import ClaudeService, HTTP2_AVAILABLE
+
+    port = free_port()
+    server = serve_in_thread(fake_app, port)
+    service = ClaudeService(api_key="load-test", base_url=f"http://127.0.0.1:{port}")
+
+    print(f"fake model server on :{port}, http2 available: {HTTP2_AVAILABLE} "
+          f"(the fake server speaks HTTP/1.1), client limit {args.client_limit}")
+    rows = []
+    for concurrency in args.concurrency:
+        latencies, ttfts, retries, errors, elapsed = await run_level(service, args.requests, concurrency)
+        rows.append({
+            "concurrency": concurrency,
+            **summarize(latencies, elapsed),
+            "ttft_p50_ms": round(percentile(ttfts, 50), 2),
+            "retries": retries,
+            "errors": errors,
+        })
+    print_table(rows)
+
+    if args.batch_jobs:
+        started = time.perf_counter()
+        results = await asyncio.gather(*(
+            service.background([{"role": "user", "content": f"summarize item {i}"}], max_tokens=16)
+            for i in range(args.batch_jobs)
+        ))
+        elapsed = time.perf_counter() - started
+        print(f"\n{len(results)} background jobs in {service.batcher.batches_submitted} batch request(s), {elapsed * 1000:.1f} ms")
+
+    await service.aclose()
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    os.environ["FAKE_MODEL_FIRST_TOKEN_MS"] = str(args.first_token_ms)
+    os.environ["FAKE_MODEL_TOKEN_MS"] = str(args.token_ms)
+    os.environ["FAKE_MODEL_ERROR_RATE"] = str(args.error_rate)
+    os.environ["CLAUDE_MAX_CONCURRENCY"] = str(args.client_limit)
+    sys.exit(asyncio.run(main(args)))
@@ -0,0 +1,122 @@
+"""
+Per-request cost of logging on the hottest authenticated endpoints (cookie
+auth, flow load and save, document read), under different logging setups,
+with everything written to a real file as a container's stdout would be.
+
+    cd server
+    python -m benchmarks.logging_overhead --requests 300 --users 50 --nodes 200
+
+Requests run one at a time through the real FastAPI app, with the in-memory
+Clerk and Supabase fakes at zero latency, so what remains is the app's own
+work. --users sets how many users the Supabase user list holds and --nodes
+the size of the saved flow, the two things the old debug output scaled with.
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300, help="requests per endpoint per setup")
+    parser.add_argument("--users", type=int, default=50, help="users in the Supabase user list")
+    parser.add_argument("--nodes", type=int, default=200, help="nodes in the saved flow")
+    return parser.parse_args()
+
+
+SETUPS = (
+    ("DEBUG, written inline", dict(level="DEBUG", use_queue=False)),
+    ("DEBUG, queued", dict(level="DEBUG")),
+    ("DEBUG 1% sampled, queued", dict(level="DEBUG", debug_sample_rate=0.01)),
+    ("INFO, queued (default)", dict(level="INFO")),
+)
+
+
+async def main(args):
+    import httpx
+    from benchmarks.common import percentile, print_table
+    from benchmarks.fakes import FakeSupabase, FakeClerk, install
+    from app.logging_config import configure_logging, shutdown_logging
+    from app.main import app
+
+    supabase, clerk = FakeSupabase(), FakeClerk()
+    install(supabase, clerk)
+    for i in range(args.users - 1):
+        supabase.add_user(f"user{i}@example.com", f"user_{i}")
+    user_id = supabase.add_user("bench@example.com", "user_bench").id
+    project = supabase.seed("projects", {"project_name": "Bench", "user_id": user_id})
+    doc = supabase.seed("docs", {"project_id": project["id"], "doc_name": "Doc", "content": "x" * 2000, "user_id": user_id})
+    flow_state = {
+        "nodes": [
+            {"id": f"n{i}", "type": "doc", "position": {"x": i * 10, "y": i * 5}, "data": {"label": f"Node {i}"}}
+            for i in range(args.nodes)
+        ],
+        "edges": [{"id": f"e{i}", "source": f"n{i}", "target": f"n{i + 1}"} for i in range(args.nodes - 1)],
+    }
+    cookies = {"__session": clerk.add_session("user_bench")}
+
+    # Save first, so every load returns the full flow
+    calls = (
+        ("POST /api/flows/save", lambda c: c.post(
+            "/api/flows/save", json={"project_id": project["id"], "flow_state": flow_state}, cookies=cookies
+        )),
+        ("GET /api/flows/load", lambda c: c.get(f"/api/flows/load/{project['id']}", cookies=cookies)),
+        ("GET /api/docs/get", lambda c: c.get(f"/api/docs/get/{doc['id']}", cookies=cookies)),
+    )
+
+    rows = []
+    stdout = sys.stdout
+    with tempfile.TemporaryDirectory() as directory:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            for setup, options in SETUPS:
+                path = os.path.join(directory, "log")
+                with open(path, "w") as sink:
+                    # Stray print()s land in the same file as the log records
+                    sys.stdout = sink
+                    configure_logging(stream=sink, **options)
+                    # The benchmark's own HTTP client logs each request at INFO
+                    logging.getLogger("httpx").setLevel(logging.WARNING)
+                    try:
+                        for name, call in calls:
+                            for _ in range(10):
+                                await call(client)
+                            before = sink.tell()
+                            latencies = []
+                            for _ in range(args.requests):
+                                started = time.perf_counter()
+                                response = await call(client)
+                                latencies.append((time.perf_counter() - started) * 1e6)
+                                assert response.status_code == 200, response.text
+                            # Flush the queue so the bytes are counted against this endpoint
+                            shutdown_logging()
+                            written = sink.tell() - before
+                            configure_logging(stream=sink, **options)
+                            rows.append({
+                                "setup": setup,
+                                "endpoint": name,
+                                "mean_us": round(sum(latencies) / len(latencies)),
+                                "p50_us": round(percentile(latencies, 50)),
+                                "p99_us": round(percentile(latencies, 99)),
+                                "log_bytes_per_req": written // args.requests,
+                            })
+                    finally:
+                        shutdown_logging()
+                        sys.stdout = stdout
+
+    configure_logging()
+    print(f"{args.requests} sequential requests per endpoint, {args.users} users, {args.nodes} flow nodes")
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    # Only read if a real client ever gets built; the benchmark swaps them out
+    os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+    os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "eyJhbGciOiJIUzI1NiJ9.e30.benchmark")
+    os.environ.setdefault("CLERK_SECRET_KEY", "sk_test_benchmark")
+    # One benchmark user sends far more than any real user may
+    os.environ["RATE_LIMIT_ENABLED"] = "0"
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,158 @@
+"""
+One client stuck in an autosave loop, hammering POST /api/flows/save from
+several tabs at once, while other users work normally, with the rate
+limiter off and on:
+
+    cd server
+    python -m benchmarks.rate_limit --seconds 5 --runaway-loops 16 --users 8
+
+Requests go through the real app and the real cookie auth. Supabase and
+Clerk are the in-memory fakes from benchmarks.fakes with injected latency.
+Reported per setup: latency of the other users' requests, how many of the
+runaway client's saves got through or were turned away, and the upstream
+calls made on its behalf. Also the limiter's own cost per request.
+"""
+import os
+import json
+import time
+import asyncio
+import contextlib
+import logging
+import argparse
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5.0, help="duration of each setup")
+    parser.add_argument("--runaway-loops", type=int, default=16, help="concurrent save loops of the runaway client")
+    parser.add_argument("--users", type=int, default=8, help="well-behaved users")
+    parser.add_argument("--db-ms", type=float, default=5.0, help="latency of each Supabase table call")
+    parser.add_argument("--auth-ms", type=float, default=20.0, help="latency of each Clerk / Supabase auth call")
+    parser.add_argument("--nodes", type=int, default=200, help="nodes in each saved flow")
+    return parser.parse_args()
+
+
+def flow_state(nodes: int, revision: int):
+    return {
+        "nodes": [
+            {"id": f"n{i}", "type": "doc", "position": {"x": i + revision, "y": i}, "data": {"label": f"Node {i}"}}
+            for i in range(nodes)
+        ],
+        "edges": [],
+    }
+
+
+async def main(args):
+    import httpx
+    from benchmarks.common import percentile, print_table
+    from benchmarks.fakes import FakeSupabase, FakeClerk, Latency, install
+    from app.main import app
+    from app.rate_limit import rate_limiter, RateLimiter, request_identity, client_address
+
+    logging.getLogger().setLevel(logging.WARNING)
+    supabase = FakeSupabase(Latency(args.db_ms))
+    clerk = FakeClerk(Latency(args.auth_ms))
+    install(supabase, clerk)
+
+    accounts = []
+    for i in range(args.users + 1):
+        user = supabase.add_user(f"user{i}@example.com", f"user_{i}")
+        project = supabase.seed("projects", {"project_name": f"Project {i}", "user_id": user.id})
+        doc = supabase.seed("docs", {"project_id": project["id"], "doc_name": "Doc", "content": "x" * 2000, "user_id": user.id})
+        accounts.append({
+            "cookies": {"__session": clerk.add_session(f"user_{i}")}, "project": project["id"], "doc": doc["id"],
+            # Each user on an address of its own, so they don't share the address buckets
+            "client": httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=app, client=(f"10.0.0.{i + 1}", 50000)),
+                base_url="http://bench", timeout=60
+            ),
+        })
+    runaway, others = accounts[0], accounts[1:]
+
+    rows = []
+    async with contextlib.AsyncExitStack() as stack:
+        for account in accounts:
+            await stack.enter_async_context(account["client"])
+        setups = (("no runaway client", True, 0), ("limiter off", False, args.runaway_loops),
+                  ("limiter on", True, args.runaway_loops))
+        for setup, enabled, loops in setups:
+            rate_limiter.enabled = enabled
+            rate_limiter.backend = RateLimiter().backend
+            deadline = time.perf_counter() + args.seconds
+            statuses = {}
+            latencies = []
+            upstream = {"runaway": 0}
+
+            # Encoded once, so the benchmark's own client work stays out of the others' latency
+            runaway_body = json.dumps({"project_id": runaway["project"], "flow_state": flow_state(args.nodes, 0)})
+
+            async def runaway_loop():
+                while time.perf_counter() < deadline:
+                    before = supabase.calls + supabase.auth_calls + clerk.calls
+                    response = await runaway["client"].post(
+                        "/api/flows/save", cookies=runaway["cookies"], content=runaway_body,
+                        headers={"content-type": "application/json"}
+                    )
+                    upstream["runaway"] += supabase.calls + supabase.auth_calls + clerk.calls - before
+                    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                    if response.status_code == 429:
+                        # A client that honours Retry-After would wait longer; a broken loop doesn't
+                        await asyncio.sleep(0.05)
+
+            async def user_loop(account):
+                revision = 0
+                while time.perf_counter() < deadline:
+                    revision += 1
+                    started = time.perf_counter()
+                    await account["client"].get(f"/api/docs/get/{account['doc']}", cookies=account["cookies"])
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    if revision % 5 == 0:
+                        started = time.perf_counter()
+                        await account["client"].post("/api/flows/save", cookies=account["cookies"], json={
+                            "project_id": account["project"], "flow_state": flow_state(args.nodes, revision)
+                        })
+                        latencies.append((time.perf_counter() - started) * 1000)
+                    await asyncio.sleep(0.2)
+
+            await asyncio.gather(
+                *(runaway_loop() for _ in range(loops)),
+                *(user_loop(account) for account in others),
+            )
+            rows.append({
+                "setup": setup,
+                "others_p50_ms": round(percentile(latencies, 50), 1),
+                "others_p99_ms": round(percentile(latencies, 99), 1),
+                "others_requests": len(latencies),
+                "runaway_saved": statuses.get(200, 0),
+                "runaway_429": statuses.get(429, 0),
+                "runaway_upstream_calls": upstream["runaway"],
+            })
+
+    print(f"{args.seconds}s per setup, {args.runaway_loops} runaway save loops, {args.users} other users, "
+          f"db {args.db_ms} ms, auth {args.auth_ms} ms")
+    print_table(rows)
+
+    # The limiter's own cost on an allowed request: identity from the cookie plus the bucket check
+    limiter = RateLimiter()
+    scope = {
+        "type": "http", "method": "PUT", "path": "/api/docs/update/1", "client": ("127.0.0.1", 1),
+        "headers": [(b"cookie", f"__session={others[0]['cookies']['__session']}".encode())],
+    }
+    rule = limiter.match("PUT", "/api/docs/update/1")
+    limiter.user_rate = limiter.user_burst = rule.rate = rule.burst = 10 ** 9
+    n = 20000
+    started = time.perf_counter()
+    for _ in range(n):
+        await limiter.check(
+            request_identity(scope), scope["path"], limiter.match(scope["method"], scope["path"]),
+            address=client_address(scope)
+        )
+    print(f"\nLimiter cost per allowed request: {(time.perf_counter() - started) / n * 1e6:.1f} us")
+
+
+if __name__ == "__main__":
+    # Only read if a real client ever gets built; the benchmark swaps them out
+    os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+    os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "eyJhbGciOiJIUzI1NiJ9.e30.benchmark")
+    os.environ.setdefault("CLERK_SECRET_KEY", "sk_test_benchmark")
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,103 @@
+"""
+Upstream calls made by a refetch storm: bursts of identical concurrent
+requests (one project open in several tabs, refetch on focus) against bursts
+of requests for distinct items, which have nothing to share.
+
+    cd server
+    python -m benchmarks.single_flight --burst 50 --round-trip-ms 5
+
+Requests go through the real FastAPI app and the real cookie auth. Storage is
+in memory with a simulated round trip; Clerk and the Supabase auth admin API
+are the fakes from benchmarks.fakes, which count their calls.
+"""
+import io
+import os
+import time
+import asyncio
+import argparse
+import contextlib
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--burst", type=int, default=50, help="concurrent requests per burst")
+    parser.add_argument("--round-trip-ms", type=float, default=5.0, help="simulated latency per database statement")
+    parser.add_argument("--auth-ms", type=float, default=30.0, help="simulated latency of each Clerk/Supabase admin call")
+    return parser.parse_args()
+
+
+async def main(args):
+    import httpx
+    from benchmarks.common import memory_storage, print_table
+    from benchmarks.fakes import FakeSupabase, FakeClerk, Latency, install
+    from app.main import app
+    from app.services.storage_backend import get_storage_backend
+    from app.services.row_cache import document_cache
+
+    storage = memory_storage(args.round_trip_ms)
+    supabase, clerk = FakeSupabase(Latency(args.auth_ms)), FakeClerk(Latency(args.auth_ms))
+    install(supabase, clerk)
+    user_id = supabase.add_user("bench@example.com", "user_bench").id
+    app.dependency_overrides[get_storage_backend] = lambda: storage
+
+    n = args.burst
+    projects = [
+        {"id": f"p{i}", "project_name": f"Project {i}", "user_id": user_id} for i in range(n)
+    ]
+    storage.tables["projects"] = {p["id"]: p for p in projects}
+    storage.tables["docs"] = {
+        f"d{i}": {"id": f"d{i}", "project_id": "p0", "doc_name": f"Doc {i}", "content": "x" * 2000, "user_id": user_id}
+        for i in range(n)
+    }
+    storage.tables["flows"] = {
+        f"f{i}": {"id": f"f{i}", "project_id": f"p{i}", "user_id": user_id, "flow_state": {"nodes": [], "edges": []}, "version": 0}
+        for i in range(n)
+    }
+    # Tabs of one browser share the Clerk session cookie
+    cookies = {"__session": clerk.add_session("user_bench")}
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        async def burst(name: str, mode: str, urls):
+            before_db, before_auth = storage.round_trips, supabase.auth_calls + clerk.calls
+            started = time.perf_counter()
+            responses = await asyncio.gather(*(
+                client.get(url, cookies=cookies) for url in urls
+            ))
+            elapsed = (time.perf_counter() - started) * 1000
+            assert all(r.status_code == 200 for r in responses), [r.text for r in responses if r.status_code != 200]
+            return {
+                "endpoint": name,
+                "burst": mode,
+                "requests": len(urls),
+                "db_round_trips": storage.round_trips - before_db,
+                "auth_calls": supabase.auth_calls + clerk.calls - before_auth,
+                "wall_ms": round(elapsed, 1),
+            }
+
+        rows = []
+        # Cookie auth prints a line per step; keep the table readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            for name, identical, distinct in (
+                ("GET /api/flows/load", ["/api/flows/load/p0"] * n, [f"/api/flows/load/p{i}" for i in range(n)]),
+                ("GET /api/docs/get", ["/api/docs/get/d0"] * n, [f"/api/docs/get/d{i}" for i in range(n)]),
+                ("GET /api/projects/list", ["/api/projects/list"] * n, None),
+            ):
+                if distinct:
+                    rows.append(await burst(name, "distinct", distinct))
+                # The distinct docs burst left d0 in the row cache; start cold
+                await document_cache.invalidate(user_id, "d0")
+                rows.append(await burst(name, "identical", identical))
+
+    print(f"{n} concurrent requests per burst, {args.round_trip_ms} ms per database statement, "
+          f"{args.auth_ms} ms per auth call")
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    # Only read if a real client ever gets built; the benchmark swaps them out
+    os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+    os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "eyJhbGciOiJIUzI1NiJ9.e30.benchmark")
+    os.environ.setdefault("CLERK_SECRET_KEY", "sk_test_benchmark")
+    # One benchmark user sends far more than any real user may
+    os.environ["RATE_LIMIT_ENABLED"] = "0"
+    asyncio.run(main(parse_args()))
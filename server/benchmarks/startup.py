@@ -0,0 +1,99 @@
+"""
+Cold start of one worker: a fresh interpreter imports the app, runs the
+lifespan startup and serves its first request, as a new uvicorn worker or a
+scaled-up container would.
+
+    cd server
+    python -m benchmarks.startup --runs 10
+
+Each run is a separate process. Reported per phase: importing app.main,
+lifespan startup, the first request (GET /, no upstream calls), and
+ready_ms, wall time from spawning the process to having served that
+request. Also the worker's resident memory and open file descriptors once
+ready, and whether the Clerk and Supabase SDKs had been imported by then.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from statistics import median
+
+CHILD = r"""
+import os, sys, time, json, asyncio, resource
+started = time.perf_counter()
+from app.main import app
+imported = time.perf_counter()
+
+async def run():
+    import httpx
+    async with app.router.lifespan_context(app):
+        up = time.perf_counter()
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            response = await client.get("/")
+            assert response.status_code == 200, response.text
+        served = time.perf_counter()
+        ready_at = time.time()
+        fds = len(os.listdir("/proc/self/fd")) if os.path.isdir("/proc/self/fd") else -1
+    return up, served, ready_at, fds
+
+up, served, ready_at, fds = asyncio.run(run())
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "lifespan_ms": (up - imported) * 1000,
+    "first_request_ms": (served - up) * 1000,
+    "ready_at": ready_at,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "open_fds": fds,
+    "clerk_sdk_loaded": "clerk_backend_api" in sys.modules,
+    "supabase_client_built": "supabase._sync.client" in sys.modules,
+}))
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    return parser.parse_args()
+
+
+def main(args):
+    from benchmarks.common import print_table
+
+    server_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {
+        **os.environ,
+        # Present but unreachable: nothing may call out during startup
+        "SUPABASE_URL": os.getenv("SUPABASE_URL", "http://localhost:54321"),
+        "SUPABASE_SERVICE_ROLE_KEY": os.getenv("SUPABASE_SERVICE_ROLE_KEY", "eyJhbGciOiJIUzI1NiJ9.e30.benchmark"),
+        "CLERK_SECRET_KEY": os.getenv("CLERK_SECRET_KEY", "sk_test_benchmark"),
+        "LOG_LEVEL": "WARNING",
+    }
+    runs = []
+    for _ in range(args.runs):
+        spawned = time.time()
+        result = subprocess.run(
+            [sys.executable, "-c", CHILD], cwd=server_dir, env=env, capture_output=True, text=True, check=True
+        )
+        sample = json.loads(result.stdout.strip().splitlines()[-1])
+        sample["ready_ms"] = (sample.pop("ready_at") - spawned) * 1000
+        runs.append(sample)
+
+    rows = []
+    for key in ("ready_ms", "import_ms", "lifespan_ms", "first_request_ms", "rss_mb", "open_fds"):
+        values = [run[key] for run in runs]
+        rows.append({
+            "measure": key,
+            "median": round(median(values), 1),
+            "min": round(min(values), 1),
+            "max": round(max(values), 1),
+        })
+    print(f"{args.runs} cold starts")
+    print_table(rows)
+    print(f"Clerk SDK imported when ready: {runs[-1]['clerk_sdk_loaded']}; "
+          f"Supabase client module imported when ready: {runs[-1]['supabase_client_built']}")
+
+
+if __name__ == "__main__":
+    main(parse_args())
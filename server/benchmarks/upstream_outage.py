@@ -0,0 +1,130 @@
+"""
+Request latency while Clerk or the Supabase auth admin API misbehaves, with
+the circuit breakers, stale-session fallback and hedged reads on, and with
+them effectively off (as before):
+
+    cd server
+    python -m benchmarks.upstream_outage --seconds 8 --users 16
+
+Every request authenticates through the real cookie auth, which asks Clerk
+for the session and Supabase for the user list. Both are the fakes from
+benchmarks.fakes; each phase changes how they behave:
+
+- healthy: auth calls take --auth-ms
+- clerk slow tail: 5% of Clerk calls take 800 ms longer
+- clerk down: every Clerk call fails with a connection error
+- supabase auth down: every Supabase auth admin call fails the same way
+- clerk hanging: every Clerk call takes --hang-ms
+
+Users keep the session they were given during the healthy phase. Reported per
+phase: latency, how many requests got each status, and the calls made to
+Clerk and to the Supabase auth admin API.
+"""
+import os
+import time
+import asyncio
+import logging
+import argparse
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=8.0, help="duration of each phase")
+    parser.add_argument("--users", type=int, default=16)
+    parser.add_argument("--auth-ms", type=float, default=20.0, help="latency of each healthy Clerk / Supabase auth call")
+    parser.add_argument("--hang-ms", type=float, default=8000.0, help="latency of Clerk in the hanging phase")
+    return parser.parse_args()
+
+
+PHASES = (
+    ("healthy", None, {}),
+    ("clerk slow tail", "clerk", {"tail_rate": 0.05, "tail_ms": 800}),
+    ("clerk down", "clerk", {"error": ConnectionError("connection refused")}),
+    ("supabase auth down", "supabase", {"error": ConnectionError("connection refused")}),
+    ("clerk hanging", "clerk", {"ms": None}),
+)
+
+
+async def main(args):
+    import httpx
+    from benchmarks.common import percentile, print_table
+    from benchmarks.fakes import FakeSupabase, FakeClerk, Latency, install
+    from app.main import app
+    from app import auth
+    from app.services.cache import LRUCache
+    from app.resilience import clerk_breaker, supabase_auth_breaker
+
+    logging.getLogger().setLevel(logging.CRITICAL)
+    breakers = [(breaker, breaker.failure_threshold, breaker.timeout) for breaker in (clerk_breaker, supabase_auth_breaker)]
+    hedges = [(hedge, hedge.min_delay, hedge.max_delay) for hedge in (auth.session_hedge, auth.users_hedge)]
+    rows = []
+    for protected in (False, True):
+        clerk_latency, auth_latency = Latency(args.auth_ms), Latency(args.auth_ms)
+        supabase, clerk = FakeSupabase(Latency(), auth_latency), FakeClerk(clerk_latency)
+        install(supabase, clerk)
+        accounts = []
+        for i in range(args.users):
+            user = supabase.add_user(f"user{i}@example.com", f"user_{i}")
+            project = supabase.seed("projects", {"project_name": "P", "user_id": user.id})
+            doc = supabase.seed("docs", {"project_id": project["id"], "doc_name": "D", "content": "x", "user_id": user.id})
+            accounts.append(({"__session": clerk.add_session(f"user_{i}")}, doc["id"]))
+
+        # Off: never trip, never hedge, nothing to fall back on
+        for breaker, threshold, timeout in breakers:
+            breaker.failure_threshold, breaker.timeout = (threshold, timeout) if protected else (10 ** 9, 3600)
+        for hedge, min_delay, max_delay in hedges:
+            hedge.min_delay, hedge.max_delay = (min_delay, max_delay) if protected else (3600, 3600)
+        auth._verified_sessions = LRUCache(max_entries=10000 if protected else 0, ttl_seconds=auth.SESSION_GRACE_SECONDS)
+        auth.USERS_GRACE_SECONDS = 300 if protected else -1
+
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=120) as client:
+            for phase, target, behaviour in PHASES:
+                latency = clerk_latency if target == "clerk" else auth_latency
+                saved = (latency.ms, latency.tail_rate, latency.tail_ms, latency.error)
+                for key, value in behaviour.items():
+                    setattr(latency, key, args.hang_ms if key == "ms" and value is None else value)
+
+                latencies, statuses = [], {}
+                before = (clerk.calls, supabase.auth_calls)
+                deadline = time.perf_counter() + args.seconds
+
+                async def user_loop(cookies, doc_id):
+                    while time.perf_counter() < deadline:
+                        started = time.perf_counter()
+                        response = await client.get(f"/api/docs/get/{doc_id}", cookies=cookies)
+                        latencies.append((time.perf_counter() - started) * 1000)
+                        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                        await asyncio.sleep(0.05)
+
+                await asyncio.gather(*(user_loop(*account) for account in accounts))
+                rows.append({
+                    "protection": "on" if protected else "off",
+                    "phase": phase,
+                    "requests": len(latencies),
+                    "p50_ms": round(percentile(latencies, 50), 1),
+                    "p99_ms": round(percentile(latencies, 99), 1),
+                    "max_ms": round(max(latencies), 1),
+                    "statuses": " ".join(f"{code}:{count}" for code, count in sorted(statuses.items())),
+                    "clerk_calls": clerk.calls - before[0],
+                    "supabase_auth_calls": supabase.auth_calls - before[1],
+                })
+
+                latency.ms, latency.tail_rate, latency.tail_ms, latency.error = saved
+                # Let open breakers probe and close before the next phase
+                await asyncio.sleep(clerk_breaker.reset_seconds + 0.2)
+                for cookies, doc_id in accounts[:2]:
+                    await client.get(f"/api/docs/get/{doc_id}", cookies=cookies)
+
+    print(f"{args.seconds}s per phase, {args.users} users, auth {args.auth_ms} ms, hang {args.hang_ms} ms")
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    # Only read if a real client ever gets built; the benchmark swaps them out
+    os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+    os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "eyJhbGciOiJIUzI1NiJ9.e30.benchmark")
+    os.environ.setdefault("CLERK_SECRET_KEY", "sk_test_benchmark")
+    # One benchmark user sends far more than any real user may
+    os.environ["RATE_LIMIT_ENABLED"] = "0"
+    os.environ.setdefault("UPSTREAM_BREAKER_RESET_S", "2")
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,65 @@
+-- Stored chat conversations (ConversationDataService)
+-- Apply with psql or the Supabase SQL editor, in file order.
+
+create table if not exists conversations (
+    id uuid primary key default gen_random_uuid(),
+    project_id uuid not null references projects (id) on delete cascade,
+    user_id uuid not null,
+    message_count integer not null default 0,
+    total_tokens integer not null default 0,
+    summary text,
+    summarized_count integer not null default 0,
+    created_at timestamptz not null default now()
+);
+
+create index if not exists conversations_project_idx on conversations (project_id, user_id);
+
+create table if not exists conversation_messages (
+    id uuid primary key default gen_random_uuid(),
+    conversation_id uuid not null references conversations (id) on delete cascade,
+    user_id uuid not null,
+    seq integer not null,
+    role text not null check (role in ('user', 'assistant')),
+    content text not null,
+    tokens integer not null default 0,
+    created_at timestamptz not null default now(),
+    unique (conversation_id, seq)
+);
+
+-- Appends a message with the next seq and bumps the conversation's counters
+-- in one transaction. The update locks the conversation row, so concurrent
+-- turns on one conversation get consecutive seqs and no count is lost.
+create or replace function append_conversation_message(
+    p_conversation_id uuid,
+    p_user_id uuid,
+    p_role text,
+    p_content text,
+    p_tokens integer
+) returns jsonb
+language plpgsql
+as $$
+declare
+    v_conversation conversations;
+    v_message conversation_messages;
+begin
+    update conversations
+       set message_count = message_count + 1,
+           total_tokens = total_tokens + p_tokens
+     where id = p_conversation_id and user_id = p_user_id
+    returning * into v_conversation;
+
+    if not found then
+        raise exception 'Conversation not found' using errcode = 'P0002';
+    end if;
+
+    insert into conversation_messages (conversation_id, user_id, seq, role, content, tokens)
+    values (p_conversation_id, p_user_id, v_conversation.message_count - 1, p_role, p_content, p_tokens)
+    returning * into v_message;
+
+    return jsonb_build_object(
+        'message', to_jsonb(v_message),
+        'message_count', v_conversation.message_count,
+        'total_tokens', v_conversation.total_tokens
+    );
+end;
+$$;
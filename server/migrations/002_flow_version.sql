@@ -0,0 +1,5 @@
+-- Board version stored with the flow (flows router, BoardOpsService).
+-- Every flow write sets version = version + 1 conditionally on the version
+-- it read, so base_version checks hold across workers and restarts.
+
+alter table flows add column if not exists version bigint not null default 0;
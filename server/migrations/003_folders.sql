@@ -0,0 +1,45 @@
+-- Folder hierarchy (FoldersDataService)
+-- Apply with psql or the Supabase SQL editor, in file order.
+
+create table if not exists folders (
+    id uuid primary key default gen_random_uuid(),
+    project_id uuid not null references projects (id) on delete cascade,
+    user_id uuid not null,
+    parent_id uuid references folders (id) on delete cascade,
+    title text not null,
+    item_count integer not null default 0 check (item_count >= 0),
+    created_at timestamptz not null default now(),
+    check (parent_id is distinct from id)
+);
+
+create index if not exists folders_project_idx on folders (project_id, user_id, created_at);
+create index if not exists folders_parent_idx on folders (parent_id);
+
+-- Closure table: one row per (ancestor, descendant) pair, each folder paired
+-- with itself at depth 0. Subtree reads go by ancestor_id (the primary key),
+-- ancestor reads by descendant_id.
+create table if not exists folder_paths (
+    ancestor_id uuid not null references folders (id) on delete cascade,
+    descendant_id uuid not null references folders (id) on delete cascade,
+    depth integer not null check (depth >= 0),
+    project_id uuid not null references projects (id) on delete cascade,
+    user_id uuid not null,
+    primary key (ancestor_id, descendant_id),
+    check ((depth = 0) = (ancestor_id = descendant_id))
+);
+
+create index if not exists folder_paths_descendant_idx on folder_paths (descendant_id);
+
+-- An item is in at most one folder: item_id is the key that add_items
+-- upserts on. It points at docs or links, so there is no foreign key to
+-- them; deleting a doc or link releases it from its folder in the app.
+create table if not exists folder_items (
+    item_id uuid primary key,
+    item_type text not null check (item_type in ('doc', 'link')),
+    folder_id uuid not null references folders (id) on delete cascade,
+    project_id uuid not null references projects (id) on delete cascade,
+    user_id uuid not null,
+    created_at timestamptz not null default now()
+);
+
+create index if not exists folder_items_folder_idx on folder_items (folder_id);
@@ -0,0 +1,23 @@
+-- Image nodes (ImageService)
+-- Apply with psql or the Supabase SQL editor, in file order.
+
+create table if not exists images (
+    id uuid primary key default gen_random_uuid(),
+    project_id uuid not null references projects (id) on delete cascade,
+    user_id uuid not null,
+    filename text not null,
+    -- What the uploader sent; the original is served by format instead
+    content_type text,
+    -- The upload's blob (migrations/005_blobs.sql); held through blob_refs
+    sha256 text not null,
+    format text not null check (format in ('JPEG', 'PNG', 'WEBP', 'GIF', 'BMP', 'TIFF', 'MPO')),
+    width integer not null check (width > 0),
+    height integer not null check (height > 0),
+    bytes bigint not null check (bytes > 0),
+    exif jsonb not null default '{}'::jsonb,
+    variants jsonb not null default '[]'::jsonb,
+    created_at timestamptz not null default now()
+);
+
+create index if not exists images_project_idx on images (project_id, user_id, created_at);
+create index if not exists images_sha256_idx on images (sha256);
@@ -0,0 +1,43 @@
+-- Content-addressed uploads (BlobStore) and the collector's lease
+-- Apply with psql or the Supabase SQL editor, in file order.
+
+create table if not exists blobs (
+    -- The insert race in BlobStore.put relies on this key rejecting the loser
+    sha256 text primary key check (sha256 ~ '^[0-9a-f]{64}$'),
+    size bigint not null check (size >= 0),
+    content_type text,
+    ref_count integer not null default 0 check (ref_count >= 0),
+    referenced_at timestamptz not null default now(),
+    derived jsonb not null default '{}'::jsonb,
+    created_at timestamptz not null default now()
+);
+
+-- Collection candidates only
+create index if not exists blobs_unreferenced_idx on blobs (referenced_at) where ref_count = 0;
+
+-- A blob with a reference cannot be deleted, whatever ref_count says; an
+-- upload whose blob was collected under it fails instead of pointing at
+-- nothing. Deleting a project cascades its references away, so
+-- ProjectDataService reads their digests first and recounts them after.
+create table if not exists blob_refs (
+    id uuid primary key default gen_random_uuid(),
+    sha256 text not null references blobs (sha256) on delete restrict,
+    owner_type text not null,
+    owner_id text not null,
+    project_id uuid not null references projects (id) on delete cascade,
+    user_id uuid not null,
+    created_at timestamptz not null default now(),
+    unique (owner_type, owner_id, sha256)
+);
+
+create index if not exists blob_refs_sha256_idx on blob_refs (sha256);
+create index if not exists blob_refs_owner_idx on blob_refs (owner_type, owner_id);
+create index if not exists blob_refs_project_idx on blob_refs (project_id);
+
+-- One row per background job that must run on a single worker at a time;
+-- taken and renewed with writes conditional on the row as read
+create table if not exists worker_leases (
+    name text primary key,
+    holder text not null,
+    expires_at timestamptz not null
+);
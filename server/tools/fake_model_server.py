@@ -0,0 +1,150 @@
+"""
+Local stand-in for the Anthropic Messages API.
+
+Streams a canned reply word by word using the same SSE event shapes as the
+real API, so chat can be developed and measured offline:
+
+    uvicorn tools.fake_model_server:app --port 8001
+    CLAUDE_API_URL=http://localhost:8001 uvicorn app.main:app
+
+FAKE_MODEL_FIRST_TOKEN_MS and FAKE_MODEL_TOKEN_MS control the simulated latency,
+FAKE_MODEL_ERROR_RATE the fraction of requests answered with 429/529, and
+FAKE_MODEL_MAX_CONCURRENCY how many requests are served before returning 429.
+Message Batches are supported and complete immediately.
+"""
+import os
+import json
+import uuid
+import random
+import asyncio
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse, JSONResponse
+
+app = FastAPI()
+
+FIRST_TOKEN_MS = float(os.getenv("FAKE_MODEL_FIRST_TOKEN_MS", "200"))
+TOKEN_MS = float(os.getenv("FAKE_MODEL_TOKEN_MS", "20"))
+ERROR_RATE = float(os.getenv("FAKE_MODEL_ERROR_RATE", "0"))
+MAX_CONCURRENCY = int(os.getenv("FAKE_MODEL_MAX_CONCURRENCY", "0"))
+
+_in_flight = 0
+_batches = {}
+
+
+def _event(event_type: str, data: dict) -> str:
+    return f"event: {event_type}\ndata: {json.dumps({'type': event_type, **data})}\n\n"
+
+
+def _reply_for(body: dict) -> str:
+    messages = body.get("messages") or [{"content": ""}]
+    prompt = messages[-1].get("content", "")
+    if isinstance(prompt, list):
+        prompt = " ".join(part.get("text", "") for part in prompt)
+    return f"This is a fake model reply to: {prompt}"
+
+
+def _message(body: dict, words: list) -> dict:
+    return {
+        "id": f"msg_{uuid.uuid4().hex}",
+        "type": "message",
+        "role": "assistant",
+        "model": body.get("model"),
+        "content": [{"type": "text", "text": " ".join(words)}],
+        "stop_reason": "end_turn",
+        "usage": {"input_tokens": 0, "output_tokens": len(words)},
+    }
+
+
+def _error(status_code: int, error_type: str) -> JSONResponse:
+    return JSONResponse(
+        {"type": "error", "error": {"type": error_type, "message": "Injected by fake model server"}},
+        status_code=status_code,
+        headers={"retry-after": "0"} if status_code == 429 else None,
+    )
+
+
+@app.post("/v1/messages")
+async def messages(request: Request):
+    global _in_flight
+    body = await request.json()
+    words = _reply_for(body).split(" ")[: body.get("max_tokens", 1024)]
+
+    if ERROR_RATE and random.random() < ERROR_RATE:
+        return _error(529, "overloaded_error") if random.random() < 0.5 else _error(429, "rate_limit_error")
+    if MAX_CONCURRENCY and _in_flight >= MAX_CONCURRENCY:
+        return _error(429, "rate_limit_error")
+
+    if not body.get("stream"):
+        _in_flight += 1
+        try:
+            await asyncio.sleep((FIRST_TOKEN_MS + TOKEN_MS * len(words)) / 1000)
+        finally:
+            _in_flight -= 1
+        return JSONResponse(_message(body, words))
+
+    async def events():
+        global _in_flight
+        _in_flight += 1
+        try:
+            async for event in _stream(body, words):
+                yield event
+        finally:
+            _in_flight -= 1
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+async def _stream(body: dict, words: list):
+    yield _event("message_start", {"message": {"role": "assistant", "model": body.get("model")}})
+    yield _event("content_block_start", {"index": 0, "content_block": {"type": "text", "text": ""}})
+    await asyncio.sleep(FIRST_TOKEN_MS / 1000)
+    for i, word in enumerate(words):
+        if i:
+            await asyncio.sleep(TOKEN_MS / 1000)
+        text = word if i == 0 else f" {word}"
+        yield _event("content_block_delta", {"index": 0, "delta": {"type": "text_delta", "text": text}})
+    yield _event("content_block_stop", {"index": 0})
+    yield _event("message_delta", {"delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": len(words)}})
+    yield _event("message_stop", {})
+
+
+@app.post("/v1/messages/batches")
+async def create_batch(request: Request):
+    body = await request.json()
+    batch_id = f"msgbatch_{uuid.uuid4().hex}"
+    results = []
+    for item in body.get("requests", []):
+        params = item.get("params", {})
+        words = _reply_for(params).split(" ")[: params.get("max_tokens", 1024)]
+        results.append({
+            "custom_id": item.get("custom_id"),
+            "result": {"type": "succeeded", "message": _message(params, words)},
+        })
+    _batches[batch_id] = results
+    return _batch(request, batch_id)
+
+
+@app.get("/v1/messages/batches/{batch_id}")
+async def get_batch(request: Request, batch_id: str):
+    if batch_id not in _batches:
+        return _error(404, "not_found_error")
+    return _batch(request, batch_id)
+
+
+@app.get("/v1/messages/batches/{batch_id}/results")
+async def batch_results(batch_id: str):
+    results = _batches.pop(batch_id, [])
+    return StreamingResponse(
+        (json.dumps(item) + "\n" for item in results),
+        media_type="application/x-jsonl",
+    )
+
+
+def _batch(request: Request, batch_id: str) -> dict:
+    return {
+        "id": batch_id,
+        "type": "message_batch",
+        "processing_status": "ended",
+        "request_counts": {"succeeded": len(_batches[batch_id])},
+        "results_url": str(request.base_url).rstrip("/") + f"/v1/messages/batches/{batch_id}/results",
+    }